@@ -0,0 +1,139 @@
+"""
+Benchmark de la escritura de reservas de stock: ruta ORM fila a fila vs StockWriteBatch.
+
+Simula un ciclo del cron de reservas: N líneas reservadas en K ubicaciones cada
+una → N*K OrderLineStockAssignment + N*K StockMovement + incrementos de
+stock_reservado. Mide filas/segundo de cada ruta.
+
+    - orm:  db.add() por fila + loc.stock_reservado += take (comportamiento anterior)
+    - bulk: StockWriteBatch (INSERT executemany + UPDATE por bloques con CASE)
+
+Por defecto usa SQLite en memoria (sin red: la diferencia real en SQL Server es
+mayor, cada fila del ORM es un round trip). Con --url contra SQL Server usa
+líneas y ubicaciones existentes y hace ROLLBACK al terminar.
+
+Uso:
+    python scripts/benchmark_stock_bulk_writes.py
+    python scripts/benchmark_stock_bulk_writes.py --lines 2000 --locations 3
+    python scripts/benchmark_stock_bulk_writes.py --url "mssql+pyodbc:///?odbc_connect=..."
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import sessionmaker
+
+# Agregar el directorio raíz al path para imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.adapters.secondary.database.orm import (  # noqa: E402
+    OrderLine,
+    OrderLineStockAssignment,
+    ProductLocation,
+    StockMovement,
+)
+from src.services.stock_bulk_writer import StockWriteBatch  # noqa: E402
+
+
+def _prepare(engine, n_lines: int, n_locations: int):
+    """Retorna (line_ids, location_ids) a usar en el benchmark."""
+    if engine.dialect.name == "sqlite":
+        for table in (ProductLocation.__table__, OrderLineStockAssignment.__table__, StockMovement.__table__):
+            table.create(engine, checkfirst=True)
+        with engine.begin() as conn:
+            conn.execute(insert(ProductLocation), [
+                {"almacen_id": 1, "product_id": i + 1, "pasillo": "A", "lado": "IZQ",
+                 "ubicacion": str(i), "altura": 1, "stock_actual": 10_000, "stock_reservado": 0}
+                for i in range(n_locations)
+            ])
+        with engine.connect() as conn:
+            location_ids = list(conn.execute(select(ProductLocation.id)).scalars())
+        return list(range(1, n_lines + 1)), location_ids[:n_locations]
+
+    with engine.connect() as conn:
+        line_ids = list(conn.execute(select(OrderLine.id).limit(n_lines)).scalars())
+        location_ids = list(conn.execute(select(ProductLocation.id).limit(n_locations)).scalars())
+    if not line_ids or not location_ids:
+        raise SystemExit("La BD no tiene order_lines / product_locations para el benchmark")
+    return line_ids, location_ids
+
+
+def _reserve_rows(line_ids, locations, per_line: int):
+    """Genera (line_id, location) de un ciclo: cada línea toma per_line ubicaciones."""
+    for i, line_id in enumerate(line_ids):
+        for j in range(per_line):
+            yield line_id, locations[(i + j) % len(locations)]
+
+
+def run_orm(session, line_ids, locations, per_line: int) -> int:
+    rows = 0
+    for line_id, loc in _reserve_rows(line_ids, locations, per_line):
+        loc.stock_reservado = (loc.stock_reservado or 0) + 1
+        session.add(OrderLineStockAssignment(
+            order_line_id=line_id, product_location_id=loc.id,
+            cantidad_reservada=1, cantidad_servida=0,
+        ))
+        session.add(StockMovement(
+            product_location_id=loc.id, product_id=loc.product_id, order_line_id=line_id,
+            tipo="RESERVE", cantidad=1, stock_antes=loc.stock_actual or 0,
+            stock_despues=loc.stock_actual or 0, notas="benchmark orm",
+        ))
+        rows += 2
+    session.flush()
+    return rows + len(locations)
+
+
+def run_bulk(session, line_ids, locations, per_line: int) -> int:
+    batch = StockWriteBatch()
+    for line_id, loc in _reserve_rows(line_ids, locations, per_line):
+        batch.adjust_location(loc, reservado=1)
+        batch.add_assignment(
+            order_line_id=line_id, product_location_id=loc.id,
+            cantidad_reservada=1, cantidad_servida=0,
+        )
+        batch.add_movement(
+            product_location_id=loc.id, product_id=loc.product_id, order_line_id=line_id,
+            tipo="RESERVE", cantidad=1, stock_antes=loc.stock_actual or 0,
+            stock_despues=loc.stock_actual or 0, notas="benchmark bulk",
+        )
+    return sum(batch.flush(session).values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="sqlite://", help="URL de SQLAlchemy (por defecto SQLite en memoria)")
+    parser.add_argument("--lines", type=int, default=5000, help="Líneas reservadas por ciclo")
+    parser.add_argument("--locations", type=int, default=200, help="Ubicaciones distintas")
+    parser.add_argument("--per-line", type=int, default=2, help="Ubicaciones usadas por línea")
+    args = parser.parse_args()
+
+    engine_kwargs = {} if args.url.startswith("sqlite") else {"fast_executemany": True}
+    engine = create_engine(args.url, **engine_kwargs)
+    line_ids, location_ids = _prepare(engine, args.lines, args.locations)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    print(f"📊 {engine.dialect.name}: {len(line_ids)} líneas × {args.per_line} ubicaciones "
+          f"({len(location_ids)} ubicaciones distintas)")
+
+    results = {}
+    for name, fn in (("orm", run_orm), ("bulk", run_bulk)):
+        session = Session()
+        try:
+            locations = session.query(ProductLocation).filter(ProductLocation.id.in_(location_ids)).all()
+            start = time.perf_counter()
+            rows = fn(session, line_ids, locations, args.per_line)
+            elapsed = time.perf_counter() - start
+        finally:
+            session.rollback()
+            session.close()
+        results[name] = rows / elapsed
+        print(f"   {name:>4}: {rows} filas en {elapsed:.3f}s → {rows / elapsed:,.0f} filas/s")
+
+    print(f"   Mejora: x{results['bulk'] / results['orm']:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark del picking por oleadas (services/wave_planner.py).
+
+Genera un almacén sintético y órdenes B2C pequeñas (sin BD) y compara las
+unidades recogidas por hora de:
+
+    - individual: cada orden en su propio recorrido (start-picking)
+    - oleadas:    órdenes agrupadas por plan_waves y recogidas en un único
+                  recorrido (ruta combinada de plan_route); las que no se
+                  agrupan se recogen solas
+
+El tiempo de cada recorrido es el estimado del modelo de almacén (caminar +
+tiempo por recogida y altura) más un tiempo fijo por recorrido (coger carro,
+dejar en la zona de expedición).
+
+Uso:
+    python scripts/benchmark_wave_picking.py
+    python scripts/benchmark_wave_picking.py --orders 400 --max-lines 4 --totes 8 --tour-overhead 60
+"""
+
+import argparse
+import random
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz al path para imports
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.services.picking_route_engine import plan_route  # noqa: E402
+from src.services.warehouse_layout import WarehouseLayout  # noqa: E402
+from src.services.wave_planner import WaveCandidate, plan_waves  # noqa: E402
+
+
+def build_orders(n_orders: int, aisles: int, slots: int, max_lines: int, seed: int):
+    rng = random.Random(seed)
+    pasillos = [str(i) for i in range(1, aisles + 1)]
+    # Demanda sesgada: los primeros pasillos concentran más recogidas (ABC)
+    weights = [1.0 / (1 + i * 0.3) for i in range(aisles)]
+    orders = []
+    for _ in range(n_orders):
+        stops = []
+        for _ in range(rng.randint(1, max_lines)):
+            pasillo = rng.choices(pasillos, weights)[0]
+            stops.append((pasillo, str(rng.randint(1, slots)), rng.randint(1, 4), rng.randint(1, 3)))
+        orders.append(stops)
+    return pasillos, orders
+
+
+def tour_seconds(layout: WarehouseLayout, stops, overhead: float) -> float:
+    points = [layout.point(p, u, h) for p, u, h, _ in stops]
+    plan = plan_route(layout, points)
+    # Unidades extra de la misma parada: tiempo de recogida adicional
+    extra_units = sum(q - 1 for *_, q in stops)
+    return plan.estimated_seconds + extra_units * layout.config.seconds_per_pick + overhead
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--aisles", type=int, default=20, help="Pasillos del almacén")
+    parser.add_argument("--slots", type=int, default=40, help="Ubicaciones por pasillo")
+    parser.add_argument("--orders", type=int, default=300, help="Órdenes sintéticas")
+    parser.add_argument("--max-lines", type=int, default=3, help="Líneas máximas por orden")
+    parser.add_argument("--totes", type=int, default=8, help="Cubetas del carro (órdenes por oleada)")
+    parser.add_argument("--max-units", type=int, default=120, help="Unidades máximas por oleada")
+    parser.add_argument("--tour-overhead", type=float, default=45.0, help="Segundos fijos por recorrido")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    pasillos, orders = build_orders(args.orders, args.aisles, args.slots, args.max_lines, args.seed)
+    layout = WarehouseLayout((p, str(u)) for p in pasillos for u in range(1, args.slots + 1))
+    units = sum(q for stops in orders for *_, q in stops)
+    print(f"📊 {len(orders)} órdenes, {units} unidades, {args.aisles} pasillos × {args.slots} ubicaciones")
+
+    individual = sum(tour_seconds(layout, stops, args.tour_overhead) for stops in orders)
+
+    slot_ids = {(p, str(u)): i for i, (p, u) in enumerate((p, u) for p in pasillos for u in range(1, args.slots + 1))}
+    candidates = [
+        WaveCandidate(
+            order_id=i,
+            almacen_id=1,
+            location_ids=frozenset(slot_ids[(p, u)] for p, u, _, _ in stops),
+            aisles=frozenset(p for p, *_ in stops),
+            units=sum(q for *_, q in stops),
+            seq=i,
+        )
+        for i, stops in enumerate(orders)
+    ]
+    waves = plan_waves(candidates, max_orders=args.totes, max_units=args.max_units)
+    grouped = {order_id for wave in waves for order_id in wave.order_ids}
+    batched = sum(
+        tour_seconds(layout, [s for order_id in wave.order_ids for s in orders[order_id]], args.tour_overhead)
+        for wave in waves
+    )
+    batched += sum(tour_seconds(layout, orders[i], args.tour_overhead) for i in range(len(orders)) if i not in grouped)
+    tours = len(waves) + len(orders) - len(grouped)
+
+    print(f"\n{'modo':<12}{'recorridos':>12}{'horas':>10}{'uds/hora':>12}")
+    for name, n_tours, seconds in (("individual", len(orders), individual), ("oleadas", tours, batched)):
+        print(f"{name:<12}{n_tours:>12}{seconds / 3600:>10.2f}{units / (seconds / 3600):>12.1f}")
+    print(f"\n🚀 Mejora: {(individual / batched - 1) * 100:.1f}% más unidades por hora "
+          f"({len(grouped)} órdenes en {len(waves)} oleadas)")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,10 @@ Endpoints:
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 
 from src.adapters.secondary.database.config import get_db
-from src.adapters.secondary.database.orm import Almacen, ProductLocation
+from src.adapters.secondary.database.orm import Almacen
+from src.services.dashboard_counters import dashboard_counters
 from src.core.domain.almacen_models import (
     AlmacenResponse,
     AlmacenWithStats
@@ -90,15 +90,8 @@ def get_almacen_stats(
             detail=f"Almacén con ID {almacen_id} no encontrado"
         )
     
-    # Calcular estadísticas
-    stats = db.query(
-        func.count(ProductLocation.id).label('total_ubicaciones'),
-        func.count(func.distinct(ProductLocation.product_id)).label('total_productos'),
-        func.coalesce(func.sum(ProductLocation.stock_actual), 0).label('total_stock')
-    ).filter(
-        ProductLocation.almacen_id == almacen_id,
-        ProductLocation.activa == True
-    ).first()
+    # Estadísticas desde los contadores en memoria (ver services/dashboard_counters.py)
+    stats = dashboard_counters.almacen_stats(db, almacen_id)
     
     # Construir respuesta
     almacen_data = {
@@ -107,9 +100,7 @@ def get_almacen_stats(
         "descripciones": almacen.descripciones,
         "created_at": almacen.created_at,
         "updated_at": almacen.updated_at,
-        "total_ubicaciones": stats.total_ubicaciones if stats else 0,
-        "total_productos": stats.total_productos if stats else 0,
-        "total_stock": stats.total_stock if stats else 0
+        **stats
     }
     
     return AlmacenWithStats(**almacen_data)
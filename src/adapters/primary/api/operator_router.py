@@ -1,7 +1,7 @@
 """
 Router para gestión de operarios.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import case
 from typing import List, Optional
@@ -10,7 +10,24 @@ from datetime import datetime
 from src.adapters.secondary.database.config import get_db, ALMACEN_PICKING_ID
 from src.adapters.secondary.database.orm import (
     Operator, Order, OrderStatus, OrderLine, OrderHistory, 
-    PackingBox, ProductLocation, ProductReference, OrderLineStockAssignment
+    PackingBox, ProductReference
+)
+from src.services.picking_session_service import picking_sessions
+from src.services.order_counters_service import refresh_order_counters
+from src.services.order_graph_service import load_order_graph, best_picking_locations
+from src.services.etag_service import make_etag, etag_matches, not_modified, set_etag, order_version
+from src.services.wave_picking_service import (
+    pending_stops,
+    propose_waves,
+    start_wave,
+    wave_orders,
+    wave_route,
+)
+from src.adapters.primary.websocket.orders_websocket import (
+    orders_manager,
+    order_event_data,
+    EVENT_PICKING_STARTED,
+    EVENT_PROGRESS,
 )
 from src.core.domain.models import (
     OperatorResponse,
@@ -21,7 +38,10 @@ from src.core.domain.models import (
     OrderSummaryResponse,
     OrderLineListItem,
     ResetOrderLineResponse,
-    OperatorStartPickingResponse
+    OperatorStartPickingResponse,
+    WaveStartRequest,
+    WaveResponse,
+    WavePlanResponse,
 )
 
 router = APIRouter(prefix="/operators", tags=["Operators"])
@@ -390,7 +410,6 @@ def get_order_summary(
         )
     
     order = db.query(Order).options(
-        joinedload(Order.order_lines),
         joinedload(Order.status),
         joinedload(Order.caja_activa)
     ).filter(Order.id == order_id).first()
@@ -407,8 +426,9 @@ def get_order_summary(
             detail="Esta orden no está asignada a este operario"
         )
     
-    total_solicitado = sum(line.cantidad_solicitada for line in order.order_lines)
-    total_servido = sum(line.cantidad_servida for line in order.order_lines)
+    # Contadores almacenados en la orden (sin cargar las líneas)
+    total_solicitado = order.total_items
+    total_servido = order.items_completados
     progreso = round((total_servido / total_solicitado * 100) if total_solicitado > 0 else 0, 2)
     
     # Obtener información de la caja activa si existe
@@ -439,6 +459,8 @@ def get_order_summary(
 def list_order_lines(
     operator_codigo: str,
     order_id: int,
+    request: Request,
+    response: Response,
     ultimos: Optional[bool] = Query(False, description="Si es true, retorna solo los últimos 3 registros actualizados"),
     db: Session = Depends(get_db)
 ):
@@ -454,6 +476,8 @@ def list_order_lines(
     - Lista de productos con cantidades y ubicaciones
     - Si `ultimos=true`: Solo los últimos 3 registros actualizados (ordenados por updated_at desc)
     - Si `ultimos=false` o no especificado: Todos los registros de la orden
+    
+    Admite GET condicional (`If-None-Match` → 304) para los refrescos de la PDA.
     """
     # Buscar operario por código
     operator = db.query(Operator).filter(Operator.codigo == operator_codigo).first()
@@ -463,48 +487,48 @@ def list_order_lines(
             detail=f"Operario con código '{operator_codigo}' no encontrado"
         )
     
-    # Verificar que la orden existe y está asignada al operario
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
+    # Versión de la orden: si la PDA ya tiene la respuesta actual, 304 sin montarla
+    version = order_version(db, order_id)
+    if version and version.operator_id == operator.id:
+        etag = make_etag("operator-order-lines", order_id, bool(ultimos), *version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_etag(response, etag)
+    
+    # Orden con sus líneas y asignaciones (si ultimos, solo los 3 últimos registros actualizados)
+    graph = load_order_graph(db, order_id, recent_lines=3 if ultimos else None)
+    if not graph:
         raise HTTPException(
             status_code=404,
             detail=f"Orden con ID {order_id} no encontrada"
         )
     
-    if order.operator_id != operator.id:
+    if graph.order.operator_id != operator.id:
         raise HTTPException(
             status_code=403,
             detail="Esta orden no está asignada a este operario"
         )
     
-    # Obtener líneas de la orden
-    query = db.query(OrderLine).filter(
-        OrderLine.order_id == order_id
+    # Fallback de ubicación para las líneas sin asignaciones, en una sola consulta
+    picking_locations = best_picking_locations(
+        db,
+        [line.product_reference_id for line in graph.lines
+         if line.product_reference_id and not graph.assignments(line.id)],
+        ALMACEN_PICKING_ID,
     )
     
-    # Si se solicita solo los últimos 3 actualizados
-    if ultimos:
-        query = query.order_by(OrderLine.updated_at.desc()).limit(3)
-    
-    lines = query.all()
-    
     # Formatear respuesta
     result = []
-    for line in lines:
+    for line in graph.lines:
         ubicacion_id = None
         ubicacion = None
         asignaciones = []
         
-        # Buscar assignments para esta línea (multi-ubicación)
-        assignments = (
-            db.query(OrderLineStockAssignment)
-            .filter_by(order_line_id=line.id)
-            .all()
-        )
+        # Assignments de esta línea (multi-ubicación), ya cargados con su ubicación
+        assignments = graph.assignments(line.id)
         
         if assignments:
-            for a in assignments:
-                loc = db.get(ProductLocation, a.product_location_id)
+            for a, loc in assignments:
                 if loc:
                     asignaciones.append({
                         "product_location_id": loc.id,
@@ -530,15 +554,8 @@ def list_order_lines(
                     "stock_minimo": None
                 }
         elif line.product_reference_id:
-            # Fallback: buscar la mejor ubicación en el almacén de picking
-            picking_location = db.query(ProductLocation).filter(
-                ProductLocation.product_id == line.product_reference_id,
-                ProductLocation.almacen_id == ALMACEN_PICKING_ID,
-                ProductLocation.activa == True
-            ).order_by(
-                ProductLocation.prioridad.asc(),
-                ProductLocation.stock_actual.desc()
-            ).first()
+            # Fallback: mejor ubicación en el almacén de picking
+            picking_location = picking_locations.get(line.product_reference_id)
             
             if picking_location:
                 ubicacion_id = picking_location.id
@@ -673,8 +690,14 @@ def reset_order_line_quantity(
     )
     db.add(history)
     
+    refresh_order_counters(db, [order_id])
     db.commit()
     db.refresh(order_line)
+    picking_sessions.invalidate_order(order_id)
+    orders_manager.emit(EVENT_PROGRESS, order_id, {
+        "total_items": order.total_items,
+        "items_completados": order.items_completados,
+    })
     
     return {
         "success": True,
@@ -792,6 +815,7 @@ def start_picking(
     
     db.commit()
     db.refresh(order)
+    orders_manager.emit(EVENT_PICKING_STARTED, order.id, order_event_data(order))
     
     return {
         "message": f"Picking {'retomado' if old_status and old_status.codigo == 'STOPPED' else 'iniciado'} correctamente",
@@ -800,3 +824,143 @@ def start_picking(
         "estado": order.status.codigo,
         "fecha_inicio_picking": order.fecha_inicio_picking.isoformat()
     }
+
+
+# ============================================================================
+# PICKING POR OLEADAS (varias órdenes en un recorrido)
+# ============================================================================
+
+def _get_operator_or_404(db: Session, operator_codigo: str) -> Operator:
+    operator = db.query(Operator).filter(Operator.codigo == operator_codigo).first()
+    if not operator:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Operario con código '{operator_codigo}' no encontrado"
+        )
+    return operator
+
+
+def _wave_response(db: Session, orders: list, wave_id: Optional[str] = None, compare_individual: bool = False) -> dict:
+    """Oleada con sus órdenes (en orden de cubeta) y la ruta combinada de lo pendiente."""
+    stops_by_order = pending_stops(db, [o.id for o in orders])
+    totes = {o.id: (o.wave_tote if wave_id else tote) for tote, o in enumerate(orders, start=1)}
+    route = wave_route(db, stops_by_order, totes)
+
+    individual_distance = None
+    if compare_individual:
+        individual_distance = sum(
+            wave_route(db, {o.id: stops_by_order.get(o.id, [])}, {o.id: 1})["total_distance_m"]
+            for o in orders
+        )
+
+    almacen_ids = {stop.location.almacen_id for stops in stops_by_order.values() for stop in stops}
+    return {
+        "wave_id": wave_id,
+        "almacen_id": almacen_ids.pop() if len(almacen_ids) == 1 else (orders[0].almacen_id or 0),
+        "orders": [
+            {
+                "tote": totes[o.id],
+                "order_id": o.id,
+                "numero_orden": o.numero_orden,
+                "prioridad": o.prioridad,
+                "unidades_pendientes": sum(stop.cantidad for stop in stops_by_order.get(o.id, [])),
+                "codigo_caja": o.caja_activa.codigo_caja if o.caja_activa else None,
+            }
+            for o in orders
+        ],
+        "total_units": sum(stop.cantidad for stops in stops_by_order.values() for stop in stops),
+        "total_stops": len(route["stops"]),
+        "total_distance_m": route["total_distance_m"],
+        "individual_distance_m": round(individual_distance, 1) if individual_distance is not None else None,
+        "estimated_time_minutes": route["estimated_time_minutes"],
+        "routing_method": route["routing_method"],
+        "picking_route": route["stops"],
+    }
+
+
+@router.get("/{operator_codigo}/waves/plan", response_model=WavePlanResponse)
+def plan_operator_waves(
+    operator_codigo: str,
+    almacen_id: Optional[int] = Query(None, description="Solo órdenes con paradas en este almacén"),
+    db: Session = Depends(get_db)
+):
+    """
+    Propone oleadas de picking con las órdenes ASSIGNED del operario.
+    
+    Agrupa órdenes del mismo almacén con ubicaciones en común dentro de la
+    capacidad del carro (WAVE_MAX_ORDERS cubetas, WAVE_MAX_UNITS unidades).
+    Las órdenes que no se agrupan con ninguna otra no aparecen (picking
+    individual).
+    
+    **Retorna:** por oleada, las órdenes con su cubeta, la ruta combinada y
+    la distancia frente a recoger cada orden por separado.
+    """
+    operator = _get_operator_or_404(db, operator_codigo)
+    waves, orders_by_id = propose_waves(db, operator.id, almacen_id)
+    
+    return {
+        "operator_codigo": operator_codigo,
+        "total_waves": len(waves),
+        "waves": [
+            _wave_response(db, [orders_by_id[oid] for oid in wave.order_ids], compare_individual=True)
+            for wave in waves
+        ],
+    }
+
+
+@router.post("/{operator_codigo}/waves", response_model=WaveResponse, status_code=201)
+def start_operator_wave(
+    operator_codigo: str,
+    request: Optional[WaveStartRequest] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Inicia una oleada de picking.
+    
+    **Body (opcional):** `{"order_ids": [12, 15, 19]}` en orden de cubeta.
+    Sin body se inicia la primera oleada propuesta por `/waves/plan`.
+    
+    **Acción:**
+    - Las órdenes pasan a IN_PICKING (registrando el historial)
+    - Cada orden recibe el `wave_id` y su cubeta (1..N)
+    
+    **Retorna:** la oleada con la ruta combinada. La PDA escanea con la
+    acción `scan_wave_product` del WebSocket indicando el `wave_id`.
+    """
+    operator = _get_operator_or_404(db, operator_codigo)
+    
+    order_ids = request.order_ids if request and request.order_ids else None
+    if not order_ids:
+        waves, _ = propose_waves(db, operator.id)
+        if not waves:
+            raise HTTPException(
+                status_code=404,
+                detail="No hay órdenes ASSIGNED agrupables en una oleada para este operario"
+            )
+        order_ids = waves[0].order_ids
+    
+    wave_id = start_wave(db, operator, order_ids)
+    orders = wave_orders(db, wave_id, operator.id)
+    for order in orders:
+        picking_sessions.invalidate_order(order.id)
+        orders_manager.emit(EVENT_PICKING_STARTED, order.id, order_event_data(order))
+    
+    return _wave_response(db, orders, wave_id=wave_id)
+
+
+@router.get("/{operator_codigo}/waves/{wave_id}", response_model=WaveResponse)
+def get_operator_wave(
+    operator_codigo: str,
+    wave_id: str,
+    db: Session = Depends(get_db)
+):
+    """
+    Estado de una oleada: órdenes con su cubeta y la ruta de lo que queda
+    por recoger.
+    """
+    operator = _get_operator_or_404(db, operator_codigo)
+    orders = wave_orders(db, wave_id, operator.id)
+    if not orders:
+        raise HTTPException(status_code=404, detail=f"Oleada {wave_id} no encontrada")
+    
+    return _wave_response(db, orders, wave_id=wave_id)
@@ -3,8 +3,8 @@ Router para gestión de órdenes.
 """
 import logging
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
-from sqlalchemy.orm import Session, joinedload, selectinload
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import func
 from typing import List, Optional, Dict, Any
 from datetime import datetime, date
@@ -19,13 +19,29 @@ from src.adapters.secondary.database.orm import (
     ProductReference,
     ProductLocation,
     PackingBox,
-    OrderLineBoxDistribution,
     OrderLineStockAssignment,
 )
 from src.services.stock_reservation_cron_service import (
     deduct_stock_for_order,
     release_stock_for_order,
 )
+from src.services.picking_session_service import picking_sessions
+from src.services.reservation_queue_service import reservation_queue
+from src.services.pagination import COUNT_PATTERN, paginate
+from src.services.dashboard_counters import dashboard_counters
+from src.services.order_graph_service import load_order_graph
+from src.services.etag_service import make_etag, etag_matches, not_modified, set_etag, order_version
+from src.services.warehouse_layout import get_layout, aisle_sort_key
+from src.services.picking_route_engine import plan_route
+from src.adapters.primary.websocket.orders_websocket import (
+    orders_manager,
+    order_event_data,
+    EVENT_OPERATOR_ASSIGNED,
+    EVENT_STATUS_CHANGED,
+    EVENT_PRIORITY_CHANGED,
+    EVENT_PICKING_STARTED,
+    EVENT_PICKING_COMPLETED,
+)
 from src.core.domain.models import (
     OrderListItem, 
     OrderDetailFull, 
@@ -49,6 +65,9 @@ from src.core.domain.models import (
 
 router = APIRouter(prefix="/orders", tags=["Orders"])
 
+# Clave de orden del listado (keyset): más recientes primero, id como desempate
+ORDER_LIST_KEYS = [(Order.fecha_importacion, True), (Order.id, True)]
+
 
 @router.get("/", response_model=List[OrderListItem])
 def list_orders(
@@ -61,6 +80,8 @@ def list_orders(
     fecha_hasta: Optional[date] = Query(None, description="Filtrar órdenes hasta esta fecha (fecha_orden)"),
     type: Optional[str] = Query(None, description="Filtrar por tipo de orden"),
     codigo_operario: Optional[str] = Query(None, description="Filtrar por código de operario asignado"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (cabecera X-Next-Cursor). Si se indica, skip se ignora"),
+    count: str = Query("exact", pattern=COUNT_PATTERN, description="Conteo total: exact, estimate (acotado) o none"),
     db: Session = Depends(get_db),
     response: Response = None,
 ):
@@ -77,6 +98,14 @@ def list_orders(
     - Prioridad
     - Estado
     - Almacén (opcional)
+    
+    **Paginación:**
+    - Offset: `skip` / `limit` (compatibilidad)
+    - Cursor: pasar en `cursor` el valor de la cabecera `X-Next-Cursor` de la
+      página anterior (sin cabecera = última página). Estable aunque entren
+      órdenes nuevas y sin coste creciente en páginas profundas
+    - `X-Total-Count` solo se envía si `count` no es `none`; con `estimate`
+      y la cabecera `X-Total-Count-Estimated: true` el total es una cota inferior
     """
     # Query base para filtrado (sin eager loading para que el COUNT sea eficiente)
     query = db.query(Order)
@@ -103,28 +132,27 @@ def list_orders(
     if codigo_operario:
         query = query.join(Operator).filter(Operator.codigo == codigo_operario)
 
-    # Total real para paginación en el frontend
-    total = query.count()
-    if response is not None:
-        response.headers["X-Total-Count"] = str(total)
-
-    # Aplicar eager loading, orden y paginación para los resultados
-    results = (
+    # Conteo opcional (COUNT sin eager loading) y página por offset o cursor
+    page = paginate(
         query.options(
             joinedload(Order.status),
             joinedload(Order.operator),
-            selectinload(Order.order_lines),
-        )
-        .order_by(Order.fecha_importacion.desc())
-        .offset(skip)
-        .limit(limit)
-        .all()
+        ),
+        ORDER_LIST_KEYS, limit=limit, skip=skip, cursor=cursor, count=count,
     )
+    if response is not None:
+        if page.total is not None:
+            response.headers["X-Total-Count"] = str(page.total)
+            if page.total_is_estimate:
+                response.headers["X-Total-Count-Estimated"] = "true"
+        if page.next_cursor:
+            response.headers["X-Next-Cursor"] = page.next_cursor
+    results = page.rows
     
     # Transformar resultados a modelo Pydantic
     orders = []
     for order in results:
-        # Calcular progreso usando las hybrid_property
+        # Calcular progreso con los contadores almacenados en la orden
         progreso = 0.0
         if order.total_items > 0:
             progreso = round((order.items_completados / order.total_items) * 100, 2)
@@ -134,8 +162,10 @@ def list_orders(
             "numero_orden": order.numero_orden,
             "cliente": order.cliente,
             "nombre_cliente": order.nombre_cliente,
-            "total_items": order.total_items,  # hybrid_property calculada
-            "items_completados": order.items_completados,  # hybrid_property calculada
+            "total_items": order.total_items,
+            "items_completados": order.items_completados,
+            "total_lineas": order.total_lineas,
+            "lineas_completadas": order.lineas_completadas,
             "progreso": progreso,
             "operario_asignado": order.operator.nombre if order.operator else "Sin asignar",
             "prioridad": order.prioridad,
@@ -168,24 +198,28 @@ def get_orders_stats(
     - fecha_desde: Filtrar órdenes desde esta fecha
     - fecha_hasta: Filtrar órdenes hasta esta fecha
     """
-    # Una sola query GROUP BY status_code — usa el índice compuesto idx_status_fecha
-    filters = []
-    if almacen_id:
-        filters.append(Order.almacen_id == almacen_id)
-    if fecha_desde:
-        filters.append(Order.fecha_orden >= fecha_desde)
-    if fecha_hasta:
-        filters.append(Order.fecha_orden <= fecha_hasta)
+    if not fecha_desde and not fecha_hasta:
+        # Contadores en memoria (ver services/dashboard_counters.py)
+        counts = dashboard_counters.order_counts(db, almacen_id)
+    else:
+        # Con rango de fechas: una sola query GROUP BY status_code — usa el índice compuesto idx_status_fecha
+        filters = []
+        if almacen_id:
+            filters.append(Order.almacen_id == almacen_id)
+        if fecha_desde:
+            filters.append(Order.fecha_orden >= fecha_desde)
+        if fecha_hasta:
+            filters.append(Order.fecha_orden <= fecha_hasta)
 
-    rows = (
-        db.query(OrderStatus.codigo, func.count(Order.id).label('cnt'))
-        .join(Order, Order.status_id == OrderStatus.id)
-        .filter(*filters)
-        .group_by(OrderStatus.codigo)
-        .all()
-    )
+        rows = (
+            db.query(OrderStatus.codigo, func.count(Order.id).label('cnt'))
+            .join(Order, Order.status_id == OrderStatus.id)
+            .filter(*filters)
+            .group_by(OrderStatus.codigo)
+            .all()
+        )
+        counts = {row.codigo: row.cnt for row in rows}
 
-    counts = {row.codigo: row.cnt for row in rows}
     total = sum(counts.values())
 
     return OrderStatsResponse(
@@ -236,6 +270,8 @@ def list_order_history(
 @router.get("/{order_id}", response_model=OrderDetailFull)
 def get_order_detail(
     order_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
@@ -257,27 +293,49 @@ def get_order_detail(
       - EAN
       - Cantidades solicitadas y servidas
       - Estado de la línea
-    """
-    # Buscar la orden con eager loading de relaciones
-    order = db.query(Order).options(
-        joinedload(Order.order_lines).joinedload(OrderLine.product_reference),
-        joinedload(Order.order_lines).joinedload(OrderLine.product_location),
-        joinedload(Order.packing_boxes)
-    ).filter(Order.id == order_id).first()
     
-    if not order:
+    Admite GET condicional: responde 304 si el `If-None-Match` coincide con
+    el `ETag` actual de la orden.
+    """
+    version = order_version(db, order_id)
+    if not version:
         raise HTTPException(status_code=404, detail=f"Orden con ID {order_id} no encontrada")
     
-    # Obtener el estado
-    status = db.query(OrderStatus).filter(OrderStatus.id == order.status_id).first()
+    etag = make_etag("order-detail", order_id, *version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    
+    return _build_order_detail(order_id, db)
+
+
+def _build_order_detail(order_id: int, db: Session) -> OrderDetailFull:
+    """
+    Construye el detalle completo de una orden (sin ETag).
+
+    Lo usan el GET de detalle y los endpoints de escritura que devuelven la
+    orden actualizada.
+
+    Args:
+        order_id: ID de la orden
+        db: Sesión de base de datos
+
+    Returns:
+        Detalle de la orden
+
+    Raises:
+        HTTPException 404 si la orden no existe
+    """
+    # Orden, líneas, asignaciones con ubicación y cajas en un número fijo de consultas
+    graph = load_order_graph(db, order_id, boxes=True)
     
-    # Obtener el operario si existe
-    operator = None
-    if order.operator_id:
-        operator = db.query(Operator).filter(Operator.id == order.operator_id).first()
+    if not graph:
+        raise HTTPException(status_code=404, detail=f"Orden con ID {order_id} no encontrada")
     
-    # Las líneas ya están cargadas por el joinedload
-    order_lines = order.order_lines
+    order = graph.order
+    status = order.status
+    operator = order.operator
+    order_lines = graph.lines
     
     # Construir lista de productos usando las relaciones
     productos = []
@@ -298,17 +356,12 @@ def get_order_detail(
                 stock_actual=location.stock_actual,
             )
         
-        # Cargar asignaciones multi-ubicación
+        # Asignaciones multi-ubicación (ya cargadas con su ubicación)
         asignaciones = None
-        assignments = (
-            db.query(OrderLineStockAssignment)
-            .filter_by(order_line_id=line.id)
-            .all()
-        )
+        assignments = graph.assignments(line.id)
         if assignments:
             asignaciones = []
-            for a in assignments:
-                loc = db.get(ProductLocation, a.product_location_id)
+            for a, loc in assignments:
                 if loc:
                     asignaciones.append(StockAssignmentDetail(
                         ubicacion=UbicacionDetail(
@@ -362,18 +415,16 @@ def get_order_detail(
         progreso = round((order.items_completados / order.total_items) * 100, 2)
     
     # Contar cajas de la orden
-    num_cajas = len(order.packing_boxes) if order.packing_boxes else 0
+    num_cajas = len(graph.boxes)
     # total cajas
     total_cajas_str = f"{num_cajas} caja{'s' if num_cajas != 1 else ''}" if num_cajas > 0 else "Sin cajas"
     
-    # Obtener información de caja activa
+    # Información de caja activa (cargada con la orden)
     caja_activa_id = None
     caja_activa_codigo = None
-    if order.caja_activa_id:
-        active_box = db.query(PackingBox).filter(PackingBox.id == order.caja_activa_id).first()
-        if active_box:
-            caja_activa_id = active_box.id
-            caja_activa_codigo = active_box.codigo_caja
+    if order.caja_activa:
+        caja_activa_id = order.caja_activa.id
+        caja_activa_codigo = order.caja_activa.codigo_caja
     
     # Construir respuesta
     order_detail = OrderDetailFull(
@@ -478,9 +529,12 @@ def assign_operator_to_order(
     # Guardar cambios
     db.commit()
     db.refresh(order)
+    orders_manager.emit(EVENT_OPERATOR_ASSIGNED, order.id, order_event_data(
+        order, operator_codigo=operator.codigo, operator_nombre=operator.nombre
+    ))
     
     # Retornar detalle actualizado de la orden
-    return get_order_detail(order_id, db)
+    return _build_order_detail(order_id, db)
 
 
 @router.put("/{order_id}/status", response_model=OrderDetailFull)
@@ -542,7 +596,7 @@ def update_order_status(
     
     # No hacer nada si el estado es el mismo
     if status_anterior_id == new_status.id:
-        return get_order_detail(order_id, db)
+        return _build_order_detail(order_id, db)
     
     # Actualizar el estado
     order.status_id = new_status.id
@@ -593,9 +647,14 @@ def update_order_status(
     # Guardar cambios
     db.commit()
     db.refresh(order)
+    picking_sessions.invalidate_order(order_id)
+    orders_manager.emit(EVENT_STATUS_CHANGED, order.id, order_event_data(order))
+    if stock_metadata.get("stock_releases"):
+        # Stock liberado por la cancelación: otras órdenes pueden reservarlo ya
+        reservation_queue.notify_products(line.product_reference_id for line in order.order_lines)
     
     # Retornar detalle actualizado
-    return get_order_detail(order_id, db)
+    return _build_order_detail(order_id, db)
 
 
 @router.put("/{order_id}/priority", response_model=OrderDetailFull)
@@ -643,7 +702,7 @@ def update_order_priority(
     
     # No hacer nada si la prioridad es la misma
     if prioridad_anterior == prioridad_upper:
-        return get_order_detail(order_id, db)
+        return _build_order_detail(order_id, db)
     
     # Actualizar la prioridad
     order.prioridad = prioridad_upper
@@ -671,9 +730,10 @@ def update_order_priority(
     # Guardar cambios
     db.commit()
     db.refresh(order)
+    orders_manager.emit(EVENT_PRIORITY_CHANGED, order.id, order_event_data(order))
     
     # Retornar detalle actualizado
-    return get_order_detail(order_id, db)
+    return _build_order_detail(order_id, db)
 
 
 @router.post("/{order_id}/optimize-picking-route", response_model=PickingRouteResponse)
@@ -685,77 +745,58 @@ def optimize_picking_route(
     Optimiza la ruta de picking para una orden usando ubicaciones reales.
     
     **Algoritmo:**
-    1. Agrupa líneas por pasillo
-    2. Ordena por prioridad + altura dentro de cada pasillo
-    3. Genera secuencia optimizada
+    1. Sitúa cada parada en el modelo geométrico del almacén (pasillos,
+       posición en el pasillo, altura) construido a partir de sus ubicaciones
+    2. Construye la ruta con S-shape y largest gap y se queda con la más corta
+    3. La mejora con 2-opt (distancia a pie real entre paradas)
     
     **Retorna:**
     - Ruta optimizada con secuencia de recogida
     - Pasillos a visitar
-    - Tiempo estimado
+    - Distancia a pie y tiempo estimado (recorrido + recogidas)
     """
-    order = db.query(Order).options(
-        joinedload(Order.order_lines).joinedload(OrderLine.product_location),
-        joinedload(Order.order_lines).joinedload(OrderLine.product_reference)
-    ).filter(Order.id == order_id).first()
+    graph = load_order_graph(db, order_id)
     
-    if not order:
+    if not graph:
         raise HTTPException(status_code=404, detail=f"Orden con ID {order_id} no encontrada")
     
-    if not order.order_lines:
+    if not graph.lines:
         raise HTTPException(status_code=400, detail="La orden no tiene líneas de productos")
     
+    order = graph.order
+    
     # Construir lista de paradas: 1 parada por assignment (multi-ubicación)
     # Fallback: 1 parada por línea usando product_location_id
-    stops_by_aisle: Dict[str, list] = {}
+    stops: list = []
     lines_without_location = []
     
-    for line in order.order_lines:
+    def _stop(line, producto_nombre, cantidad, loc):
+        return {
+            "order_line_id": line.id,
+            "producto": producto_nombre,
+            "cantidad": cantidad,
+            "ubicacion": loc.codigo_ubicacion,
+            "pasillo": loc.pasillo,
+            "lado": loc.lado,
+            "altura": loc.altura,
+            "prioridad": loc.prioridad,
+            "stock_disponible": loc.stock_actual,
+        }, loc
+    
+    for line in graph.lines:
         product = line.product_reference
         producto_nombre = product.nombre_producto if product else "Producto desconocido"
         
-        # Buscar assignments para esta línea
-        assignments = (
-            db.query(OrderLineStockAssignment)
-            .filter_by(order_line_id=line.id)
-            .all()
-        )
+        # Assignments de esta línea (ya cargados con su ubicación)
+        assignments = graph.assignments(line.id)
         
         if assignments:
-            for assignment in assignments:
-                loc = db.get(ProductLocation, assignment.product_location_id)
+            for assignment, loc in assignments:
                 if not loc or not loc.activa:
                     continue
-                pasillo = loc.pasillo
-                if pasillo not in stops_by_aisle:
-                    stops_by_aisle[pasillo] = []
-                stops_by_aisle[pasillo].append({
-                    "order_line_id": line.id,
-                    "producto": producto_nombre,
-                    "cantidad": assignment.cantidad_reservada,
-                    "ubicacion": loc.codigo_ubicacion,
-                    "pasillo": loc.pasillo,
-                    "lado": loc.lado,
-                    "altura": loc.altura,
-                    "prioridad": loc.prioridad,
-                    "stock_disponible": loc.stock_actual,
-                })
+                stops.append(_stop(line, producto_nombre, assignment.cantidad_reservada, loc))
         elif line.product_location and line.product_location.activa:
-            loc = line.product_location
-            pasillo = loc.pasillo
-            if pasillo not in stops_by_aisle:
-                stops_by_aisle[pasillo] = []
-            stops_by_aisle[pasillo].append({
-                "order_line_id": line.id,
-                "producto": producto_nombre,
-                "cantidad": line.cantidad_solicitada,
-                "ubicacion": loc.codigo_ubicacion,
-                "pasillo": loc.pasillo,
-                "lado": loc.lado,
-                "altura": loc.altura,
-                "prioridad": loc.prioridad,
-                "stock_disponible": loc.stock_actual,
-            })
+            stops.append(_stop(line, producto_nombre, line.cantidad_solicitada, line.product_location))
         else:
             lines_without_location.append({
                 "line_id": line.id,
@@ -763,27 +804,36 @@ def optimize_picking_route(
                 "ean": line.ean
             })
     
+    # Una ruta por almacén (normalmente todo está en el de picking)
+    stops_by_almacen: Dict[int, list] = {}
+    for stop, loc in stops:
+        stops_by_almacen.setdefault(loc.almacen_id, []).append((stop, loc))
+    
     picking_route = []
-    secuencia = 1
-
-    def _aisle_sort_key(p: str):
-        # Numeric aisles first (1,2,3...), then alphabetic (A,B,C...)
-        p = p or ""
-        return (0, int(p), "") if p.isdigit() else (1, 0, p.upper())
-
-    for pasillo in sorted(stops_by_aisle.keys(), key=_aisle_sort_key):
-        # Within each aisle: ascending by ubicacion
-        for stop in sorted(stops_by_aisle[pasillo], key=lambda s: s.get("ubicacion") or ""):
-            stop["secuencia"] = secuencia
-            picking_route.append(stop)
-            secuencia += 1
+    total_distance = 0.0
+    total_seconds = 0.0
+    methods = []
+    for almacen_id in sorted(stops_by_almacen):
+        almacen_stops = stops_by_almacen[almacen_id]
+        layout = get_layout(db, almacen_id)
+        points = [layout.point(loc.pasillo, loc.ubicacion, loc.altura) for _, loc in almacen_stops]
+        plan = plan_route(layout, points)
+        picking_route.extend(almacen_stops[i][0] for i in plan.sequence)
+        total_distance += plan.distance_m
+        total_seconds += plan.estimated_seconds
+        methods.append(plan.method)
+    
+    for secuencia, stop in enumerate(picking_route, start=1):
+        stop["secuencia"] = secuencia
     
     return {
         "order_id": order_id,
         "numero_orden": order.numero_orden,
         "total_stops": len(picking_route),
-        "aisles_to_visit": sorted(stops_by_aisle.keys()),
-        "estimated_time_minutes": round(len(picking_route) * 1.5, 1),
+        "aisles_to_visit": sorted({stop["pasillo"] for stop in picking_route if stop["pasillo"]}, key=aisle_sort_key),
+        "estimated_time_minutes": round(total_seconds / 60, 1),
+        "total_distance_m": round(total_distance, 1),
+        "routing_method": ",".join(methods) if methods else None,
         "picking_route": picking_route,
         "warnings": {
             "lines_without_location": len(lines_without_location),
@@ -1025,6 +1075,9 @@ def start_picking_with_box(
                 # Hacer commit de cambios
                 db.commit()
                 db.refresh(order)
+                orders_manager.emit(EVENT_PICKING_STARTED, order.id, order_event_data(
+                    order, caja_activa_id=current_active_box.id
+                ))
                 
                 # Retornar - ya está todo configurado
                 total_cajas = db.query(PackingBox).filter(PackingBox.order_id == order_id).count()
@@ -1157,6 +1210,9 @@ def start_picking_with_box(
     db.commit()
     db.refresh(order)
     db.refresh(active_box)
+    orders_manager.emit(EVENT_PICKING_STARTED, order.id, order_event_data(
+        order, caja_activa_id=active_box.id
+    ))
     
     logger.info(f"START-PICKING SUCCESS: Orden {order_id} con caja '{codigo_caja}' ({'nueva' if is_new_box else 'existente'})")
     
@@ -1312,7 +1368,17 @@ def complete_picking_with_boxes(
     db.add(history_status)
     
     db.commit()
+    picking_sessions.invalidate_order(order_id)
     db.refresh(order)
+    if deductions:
+        # Lo reservado y no servido vuelve a estar disponible
+        reservation_queue.notify_products(line.product_reference_id for line in order.order_lines)
+    orders_manager.emit(EVENT_PICKING_COMPLETED, order.id, order_event_data(
+        order,
+        total_cajas=total_cajas,
+        total_items=order.total_items,
+        items_completados=order.items_completados,
+    ))
     boxes_summary = [
         {
             "numero_caja": box.numero_caja,
@@ -1369,27 +1435,19 @@ def get_order_packing_distribution(
     - Auditoría de empaque
     - Reporte de cajas para logística
     """
-    # Obtener orden con cajas
-    order = db.query(Order).options(
-        joinedload(Order.status),
-        joinedload(Order.operator)
-    ).filter(Order.id == order_id).first()
+    # Orden, líneas, cajas y distribuciones en un número fijo de consultas
+    graph = load_order_graph(db, order_id, assignments=False, boxes=True, distributions=True)
     
-    if not order:
+    if not graph:
         raise HTTPException(
             status_code=404,
             detail=f"Orden con ID {order_id} no encontrada"
         )
     
-    # Obtener todas las cajas de la orden
-    cajas = db.query(PackingBox).filter(
-        PackingBox.order_id == order_id
-    ).order_by(PackingBox.numero_caja.asc()).all()
-    
-    # Obtener todas las líneas de la orden para cálculos
-    order_lines = db.query(OrderLine).filter(
-        OrderLine.order_id == order_id
-    ).all()
+    order = graph.order
+    cajas = graph.boxes
+    order_lines = graph.lines
+    lines_by_id = graph.lines_by_id
     
     total_productos = sum(line.cantidad_solicitada for line in order_lines)
     productos_empacados = sum(line.cantidad_servida for line in order_lines)
@@ -1401,17 +1459,10 @@ def get_order_packing_distribution(
     productos_distribuidos_set = set()
     
     for caja in cajas:
-        # Obtener distribuciones de esta caja
-        distributions = db.query(OrderLineBoxDistribution).options(
-            joinedload(OrderLineBoxDistribution.order_line).joinedload(OrderLine.product_reference)
-        ).filter(
-            OrderLineBoxDistribution.packing_box_id == caja.id
-        ).all()
-        
         # Construir lista de productos en esta caja
         productos_en_caja = []
-        for dist in distributions:
-            order_line = dist.order_line
+        for dist in graph.distributions(caja.id):
+            order_line = lines_by_id[dist.order_line_id]
             product_ref = order_line.product_reference
             
             # Calcular porcentaje de esta línea en esta caja
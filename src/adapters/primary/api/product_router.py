@@ -5,7 +5,7 @@ Endpoints diseñados para cumplir con los requerimientos
 del componente Products.jsx del frontend React.
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import or_, func
 from typing import Optional
@@ -13,7 +13,7 @@ from datetime import datetime, timedelta
 import math
 
 from src.adapters.secondary.database.config import ALMACEN_PICKING_ID, ALMACEN_REPOSICION_ID, get_db
-from src.adapters.secondary.database.orm import ProductReference, ProductLocation, EAN, StockMovement, OrderLine, Order, OrderStatus, ReplenishmentRequest
+from src.adapters.secondary.database.orm import ProductReference, ProductLocation, ProductStockSummary, EAN, StockMovement, OrderLine, Order, OrderStatus, ReplenishmentRequest
 from src.core.domain.models import ProductLocationCreate, ProductLocationResponse
 from src.core.domain.product_api_models import (
     ProductListResponse,
@@ -29,7 +29,13 @@ from src.core.domain.product_api_models import (
     StaleProductItem,
     OutOfStockResponse,
     OutOfStockItem,
+    SlottingRecommendationsResponse,
 )
+from src.services.etag_service import make_etag, etag_matches, not_modified, set_etag, product_version
+from src.services.warehouse_layout import invalidate_layout
+from src.services.slotting_service import slotting_recommendations
+from src.services.product_search_service import product_search
+from src.services.stock_summary_service import stock_totals_subquery
 
 
 router = APIRouter(prefix="/products", tags=["products"])
@@ -177,6 +183,13 @@ def list_products(
     - `status`: all, active (stock >= 50), low (stock 1-49), out (stock = 0)
     - `search`: Busca en nombre, SKU, categoría (descripción_color) o referencia
     - `almacen_id`: Filtra productos por almacén específico
+
+    **Búsqueda:** con `search` se usa el índice en memoria
+    (services/product_search_service.py) y los resultados salen por
+    relevancia. Si además se filtra por `status` o `almacen_id`, se leen en
+    una consulta los IDs que cumplen el filtro y se cruzan en memoria con
+    todos los resultados, manteniendo el orden de relevancia. Si el índice
+    aún no está listo se usa ILIKE, ordenado por ID.
     
     **Respuesta:**
     - Lista de productos con ubicaciones limitadas (primeras 2 + "+X más")
@@ -184,20 +197,9 @@ def list_products(
     - Stock total calculado
     - Estado calculado automáticamente
     """
-    # Subconsulta para calcular stock total por producto (optimizado)
-    stock_subquery_filters = [ProductLocation.activa == True]
-    if almacen_id:
-        stock_subquery_filters.append(ProductLocation.almacen_id == almacen_id)
-    
-    stock_subquery = (
-        db.query(
-            ProductLocation.product_id,
-            func.coalesce(func.sum(ProductLocation.stock_actual), 0).label('total_stock')
-        )
-        .filter(*stock_subquery_filters)
-        .group_by(ProductLocation.product_id)
-        .subquery()
-    )
+    # Stock total por producto desde el resumen materializado (product_stock_summary):
+    # con almacen_id el filtro de estado es un rango sobre (almacen_id, stock_actual)
+    stock_subquery = stock_totals_subquery(almacen_id)
     
     # Query base con stock calculado en SQL
     if almacen_id:
@@ -217,8 +219,9 @@ def list_products(
             stock_subquery, ProductReference.id == stock_subquery.c.product_id
         )
     
-    # Aplicar búsqueda
-    if search:
+    # Aplicar búsqueda: índice en memoria (por relevancia) o ILIKE si no está listo
+    ranked_ids = product_search.search(db, search) if search else None
+    if ranked_ids is None and search:
         search_pattern = f"%{search}%"
         ean_exists = db.query(EAN.id).filter(
             EAN.product_reference_id == ProductReference.id,
@@ -245,18 +248,35 @@ def list_products(
     elif status == ProductStatusFilter.ACTIVE:
         query = query.filter(func.coalesce(stock_subquery.c.total_stock, 0) >= 50)
     
-    # Contar total - método eficiente sin envolver en subquery
-    total = query.with_entities(func.count(ProductReference.id)).scalar()
-    
-    # Aplicar ordenamiento
-    query = query.order_by(ProductReference.id.asc())
-    
-    # Aplicar paginación
     offset = (page - 1) * per_page
-    results = query.with_entities(
-        ProductReference, 
-        func.coalesce(stock_subquery.c.total_stock, 0).label('stock_total')
-    ).offset(offset).limit(per_page).all()
+    if ranked_ids is not None:
+        if ranked_ids and (status != ProductStatusFilter.ALL or almacen_id):
+            # Filtros de stock/almacén: IDs que los cumplen (una consulta, sin IN)
+            # cruzados con todos los resultados en orden de relevancia
+            allowed = {
+                product_id for (product_id,) in query.with_entities(ProductReference.id).all()
+            }
+            ranked_ids = [product_id for product_id in ranked_ids if product_id in allowed]
+        total = len(ranked_ids)
+        page_ids = ranked_ids[offset:offset + per_page]
+        rows = query.with_entities(
+            ProductReference,
+            func.coalesce(stock_subquery.c.total_stock, 0).label('stock_total')
+        ).filter(ProductReference.id.in_(page_ids)).all() if page_ids else []
+        position = {product_id: index for index, product_id in enumerate(page_ids)}
+        results = sorted(rows, key=lambda row: position[row[0].id])
+    else:
+        # Contar total - método eficiente sin envolver en subquery
+        total = query.with_entities(func.count(ProductReference.id)).scalar()
+
+        # Aplicar ordenamiento
+        query = query.order_by(ProductReference.id.asc())
+
+        # Aplicar paginación
+        results = query.with_entities(
+            ProductReference,
+            func.coalesce(stock_subquery.c.total_stock, 0).label('stock_total')
+        ).offset(offset).limit(per_page).all()
     
     # Obtener IDs de productos para cargar ubicaciones eficientemente
     product_ids = [product.id for product, _ in results]
@@ -314,6 +334,8 @@ def list_products(
 @router.get("/{product_id}", response_model=ProductDetail)
 def get_product(
     product_id: int,
+    request: Request,
+    response: Response,
     almacen_id: Optional[int] = Query(None, description="Filtrar ubicaciones por almacén"),
     db: Session = Depends(get_db)
 ):
@@ -325,7 +347,19 @@ def get_product(
     - Todas las ubicaciones (filtradas por almacén si se especifica)
     - Stock total calculado (del almacén especificado)
     - Estado calculado
+    
+    Admite GET condicional: responde 304 si el `If-None-Match` coincide con
+    el `ETag` actual del producto.
     """
+    version = product_version(db, product_id)
+    if not version:
+        raise HTTPException(status_code=404, detail=f"Producto con ID {product_id} no encontrado")
+    
+    etag = make_etag("product-detail", product_id, almacen_id, *version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    
     product = db.query(ProductReference).options(
         joinedload(ProductReference.locations),
         joinedload(ProductReference.eans)
@@ -583,6 +617,8 @@ def create_product_location(
     db.add(new_location)
     db.commit()
     db.refresh(new_location)
+    # Hueco nuevo → la matriz de distancias se recalcula en la próxima ruta
+    invalidate_layout(new_location.almacen_id)
     
     # Convertir a response model
     return ProductLocationResponse(
@@ -683,6 +719,29 @@ def get_stale_products(
     )
 
 
+# ============================================================================
+# ENDPOINT: SLOTTING POR ROTACIÓN
+# ============================================================================
+
+@router.get("/slotting/recommendations", response_model=SlottingRecommendationsResponse)
+def get_slotting_recommendations(
+    almacen_id: int = Query(default=ALMACEN_PICKING_ID, description="Almacén a optimizar"),
+    max_moves: int = Query(default=50, ge=1, le=500, description="Máximo de movimientos"),
+    min_saving: float = Query(default=0.0, ge=0, description="Ahorro mínimo (segundos/día) por movimiento"),
+    db: Session = Depends(get_db),
+):
+    """
+    Movimientos recomendados para que los productos de más rotación (recogidas
+    DEDUCT del último año, ponderando lo reciente) ocupen las ubicaciones más
+    accesibles (cerca del depósito y a baja altura).
+
+    Cada movimiento indica el origen, el destino y, si el destino está
+    ocupado, el producto con el que se intercambia. Ver services/slotting_engine.py.
+    """
+    result = slotting_recommendations(db, almacen_id, max_moves, min_saving)
+    return SlottingRecommendationsResponse(almacen_id=almacen_id, **result)
+
+
 # ============================================================================
 # ENDPOINT: PRODUCTOS SIN STOCK PARA CUMPLIR ÓRDENES
 # ============================================================================
@@ -729,21 +788,24 @@ def get_out_of_stock_for_orders(
     if not unreserved:
         return OutOfStockResponse(total=0, items=[])
     
-    # 3. Para cada producto, verificar stock total en TODOS los almacenes
-    items = []
-    for row in unreserved:
-        product_id = row.product_reference_id
-        
-        total_stock = (
-            db.query(func.coalesce(func.sum(ProductLocation.stock_actual), 0))
+    # 3. Productos con stock en algún almacén (una consulta al resumen materializado)
+    pending_ids = [row.product_reference_id for row in unreserved]
+    in_stock_ids = set()
+    for start in range(0, len(pending_ids), 1000):
+        in_stock_ids.update(
+            product_id for (product_id,) in db.query(ProductStockSummary.product_id)
             .filter(
-                ProductLocation.product_id == product_id,
-                ProductLocation.activa == True,
+                ProductStockSummary.product_id.in_(pending_ids[start:start + 1000]),
+                ProductStockSummary.stock_actual > 0,
             )
-            .scalar()
+            .distinct()
         )
+    
+    items = []
+    for row in unreserved:
+        product_id = row.product_reference_id
         
-        if total_stock > 0:
+        if product_id in in_stock_ids:
             continue
         
         # Sin stock en ningún almacén
@@ -16,6 +16,9 @@ from src.adapters.secondary.database.orm import (
     ReplenishmentRequest, ProductLocation, ProductReference, Operator, StockMovement
 )
 from sqlalchemy import func as sa_func
+from src.services.reservation_queue_service import reservation_queue
+from src.services.pagination import COUNT_PATTERN, paginate
+from src.services.dashboard_counters import dashboard_counters
 from src.core.domain.replenishment_models import (
     ReplenishmentRequestListItem,
     ReplenishmentRequestListResponse,
@@ -33,6 +36,13 @@ from src.core.domain.replenishment_models import (
 
 router = APIRouter(prefix="/replenishment", tags=["replenishment"])
 
+# Sort key for the list (keyset): priority, oldest first, id as tie-breaker
+REQUEST_LIST_KEYS = [
+    (ReplenishmentRequest.priority, True),
+    (ReplenishmentRequest.requested_at, False),
+    (ReplenishmentRequest.id, False),
+]
+
 
 
 def calculate_time_waiting(requested_at: datetime) -> str:
@@ -63,6 +73,8 @@ def list_replenishment_requests(
     sku: Optional[str] = Query(None, description="Filter by product SKU"),
     page: int = Query(1, ge=1, description="Page number"),
     per_page: int = Query(20, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="Cursor from the previous response (next_cursor). When set, page is ignored"),
+    count: str = Query("exact", pattern=COUNT_PATTERN, description="Total count: exact, estimate (capped) or none"),
     db: Session = Depends(get_db)
 ):
     """
@@ -77,6 +89,11 @@ def list_replenishment_requests(
     - `ubicacion`: Filter by location code (searches in origin or destination)
     - `sku`: Filter by product SKU
     
+    **Pagination:**
+    - Offset: `page` / `per_page` (compatibility)
+    - Cursor: pass the previous `next_cursor` as `cursor` (null = last page)
+    - `count=none` skips the total; `count=estimate` caps it (`total_is_estimate`)
+    
     **Response:**
     - Paginated list of replenishment requests
     - Includes product, location, operator information
@@ -134,8 +151,8 @@ def list_replenishment_requests(
             dest_loc_alias,
             ReplenishmentRequest.location_destino_id == dest_loc_alias.id
         ).filter(
-            (origin_loc_alias.codigo_ubicacion.ilike(f"%{ubicacion}%")) |
-            (dest_loc_alias.codigo_ubicacion.ilike(f"%{ubicacion}%"))
+            (origin_loc_alias.codigo.ilike(f"%{ubicacion}%")) |
+            (dest_loc_alias.codigo.ilike(f"%{ubicacion}%"))
         )
     
     # Filter by SKU
@@ -148,18 +165,13 @@ def list_replenishment_requests(
             product_alias.sku.ilike(f"%{sku}%")
         )
     
-    # Count total
-    total = query.count()
-    
-    # Order by priority and date
-    query = query.order_by(
-        ReplenishmentRequest.priority.desc(),
-        ReplenishmentRequest.requested_at.asc()
+    # Count (optional), order by priority and date, paginate by offset or cursor
+    result_page = paginate(
+        query, REQUEST_LIST_KEYS, limit=per_page,
+        skip=(page - 1) * per_page, cursor=cursor, count=count,
     )
-    
-    # Paginate
-    offset = (page - 1) * per_page
-    requests = query.offset(offset).limit(per_page).all()
+    total = result_page.total
+    requests = result_page.rows
     
     # Build response
     items = []
@@ -181,15 +193,12 @@ def list_replenishment_requests(
             time_waiting=calculate_time_waiting(req.requested_at)
         ))
     
-    total_pages = math.ceil(total / per_page) if total > 0 else 0
-    
-    # Count by status (global, ignoring filters)
-    counts_rows = db.query(
-        ReplenishmentRequest.status,
-        sa_func.count(ReplenishmentRequest.id)
-    ).group_by(ReplenishmentRequest.status).all()
+    total_pages = None
+    if total is not None:
+        total_pages = math.ceil(total / per_page) if total > 0 else 0
     
-    counts_dict = {row[0]: row[1] for row in counts_rows}
+    # Count by status and priority (global, ignoring filters) from the in-memory dashboard counters
+    counts_dict, priority_dict = dashboard_counters.replenishment_counts(db)
     
     status_counts = StatusCounts(
         READY=counts_dict.get("READY", 0),
@@ -198,13 +207,6 @@ def list_replenishment_requests(
         REJECTED=counts_dict.get("REJECTED", 0),
     )
     
-    # Count by priority (global, ignoring filters)
-    priority_rows = db.query(
-        ReplenishmentRequest.priority,
-        sa_func.count(ReplenishmentRequest.id)
-    ).group_by(ReplenishmentRequest.priority).all()
-    
-    priority_dict = {row[0]: row[1] for row in priority_rows}
     priority_counts = PriorityCounts(
         URGENT=priority_dict.get("URGENT", 0),
         HIGH=priority_dict.get("HIGH", 0),
@@ -212,6 +214,8 @@ def list_replenishment_requests(
     
     return ReplenishmentRequestListResponse(
         total=total,
+        total_is_estimate=result_page.total_is_estimate,
+        next_cursor=result_page.next_cursor,
         page=page,
         per_page=per_page,
         total_pages=total_pages,
@@ -382,6 +386,8 @@ def complete_replenishment(
     ))
     
     db.commit()
+    # El stock llegó a picking: reservar ya las líneas que esperaban este producto
+    reservation_queue.notify_products([request.product_id])
     
     return {
         "success": True,
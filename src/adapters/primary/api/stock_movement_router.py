@@ -11,6 +11,8 @@ from src.adapters.secondary.database.config import get_db
 from src.adapters.secondary.database.orm import (
     StockMovement, ProductLocation, ProductReference, Order, OrderLine
 )
+from src.services.pagination import COUNT_PATTERN, paginate
+from src.services.dashboard_counters import dashboard_counters
 from src.core.domain.stock_movement_models import (
     StockMovementResponse,
     StockMovementListResponse,
@@ -19,6 +21,9 @@ from src.core.domain.stock_movement_models import (
 
 router = APIRouter(prefix="/stock-movements", tags=["Stock Movements"])
 
+# Clave de orden del listado (keyset): más recientes primero, id como desempate
+MOVEMENT_LIST_KEYS = [(StockMovement.created_at, True), (StockMovement.id, True)]
+
 
 @router.get("", response_model=StockMovementListResponse)
 def list_stock_movements(
@@ -30,6 +35,8 @@ def list_stock_movements(
     order_id: Optional[int] = Query(None, description="Filtrar por orden específica"),
     limit: int = Query(100, ge=1, le=1000, description="Límite de resultados"),
     offset: int = Query(0, ge=0, description="Offset para paginación"),
+    cursor: Optional[str] = Query(None, description="Cursor de la página siguiente (next_cursor). Si se indica, offset se ignora"),
+    count: str = Query("exact", pattern=COUNT_PATTERN, description="Conteo total: exact, estimate (acotado) o none"),
     db: Session = Depends(get_db)
 ):
     """
@@ -50,6 +57,13 @@ def list_stock_movements(
     - Por producto específico
     - Por orden específica
     
+    **Paginación:**
+    - Offset: `limit` / `offset` (compatibilidad)
+    - Cursor: pasar `next_cursor` de la respuesta anterior en `cursor`
+      (null = última página)
+    - `count=none` omite el total y las estadísticas (solo la página);
+      `count=estimate` acota el conteo (`total_is_estimate`)
+    
     **Retorna:**
     - Lista de movimientos con información completa
     - Estadísticas por tipo de movimiento
@@ -89,11 +103,9 @@ def list_stock_movements(
     if filters:
         query = query.filter(and_(*filters))
     
-    # Contar total antes de paginación
-    total = query.count()
-    
-    # Aplicar ordenamiento y paginación
-    movements = query.order_by(StockMovement.created_at.desc()).limit(limit).offset(offset).all()
+    # Conteo opcional, ordenamiento y paginación (offset o cursor)
+    page = paginate(query, MOVEMENT_LIST_KEYS, limit=limit, skip=offset, cursor=cursor, count=count)
+    movements = page.rows
     
     # Formatear respuesta
     movimientos_response = []
@@ -116,17 +128,19 @@ def list_stock_movements(
             order_line_id=mov.order_line_id
         ))
     
-    # Calcular estadísticas por tipo
-    estadisticas_query = db.query(
-        StockMovement.tipo,
-        func.count(StockMovement.id).label('count'),
-        func.sum(StockMovement.cantidad).label('total_cantidad')
-    )
-    
-    if filters:
-        estadisticas_query = estadisticas_query.filter(and_(*filters))
-    
-    stats = estadisticas_query.group_by(StockMovement.tipo).all()
+    # Calcular estadísticas por tipo (mismo coste que un conteo: no con count=none)
+    stats = []
+    if count != "none":
+        estadisticas_query = db.query(
+            StockMovement.tipo,
+            func.count(StockMovement.id).label('count'),
+            func.sum(StockMovement.cantidad).label('total_cantidad')
+        )
+        
+        if filters:
+            estadisticas_query = estadisticas_query.filter(and_(*filters))
+        
+        stats = estadisticas_query.group_by(StockMovement.tipo).all()
     
     estadisticas = {}
     for stat in stats:
@@ -136,7 +150,9 @@ def list_stock_movements(
         }
     
     return StockMovementListResponse(
-        total=total,
+        total=page.total,
+        total_is_estimate=page.total_is_estimate,
+        next_cursor=page.next_cursor,
         movimientos=movimientos_response,
         estadisticas=estadisticas
     )
@@ -167,7 +183,18 @@ def get_movement_stats_summary(
     - Total de movimientos por tipo
     - Suma de cantidades por tipo
     - Total general de movimientos
+    
+    Sin filtro de fechas se sirve desde los contadores en memoria.
     """
+    if not fecha_desde and not fecha_hasta:
+        stats_por_tipo = dashboard_counters.movement_stats(db)
+        return {
+            "total_movimientos": sum(stat["count"] for stat in stats_por_tipo.values()),
+            "fecha_desde": None,
+            "fecha_hasta": None,
+            "estadisticas_por_tipo": stats_por_tipo
+        }
+
     query = db.query(StockMovement)
     
     # Aplicar filtros de fecha
@@ -0,0 +1,218 @@
+"""
+Bus de mensajes entre workers para los WebSocket de operarios.
+
+ConnectionManager guarda las conexiones en un dict por proceso. Con varios
+workers de uvicorn (o varios hosts detrás del proxy) un mensaje dirigido a un
+operario o un broadcast solo llegaría a las PDAs conectadas a ESE proceso.
+
+El bus resuelve dos cosas:
+    - Fan-out: cada nodo publica sus mensajes en un canal común y entrega
+      localmente solo a sus propias conexiones (coste O(suscriptores locales)).
+    - Presencia: qué operario está conectado y en qué nodo.
+
+Backends:
+    - InMemoryBus: loopback dentro del proceso (por defecto y para tests).
+      Varias instancias que comparten un InMemoryHub simulan varios workers.
+    - RedisBus: Redis pub/sub + hash de presencia con heartbeat por nodo.
+
+Se elige con WS_BUS_BACKEND ("memory" | "redis") y REDIS_URL.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from src.adapters.secondary.database.config import REDIS_URL, WS_BUS_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# Canal de fan-out y claves de presencia
+BUS_CHANNEL = "ws:operators"
+ORDERS_FEED_CHANNEL = "ws:orders:events"
+PRESENCE_KEY = "ws:operators:presence"
+NODE_KEY_PREFIX = "ws:operators:node:"
+NODE_HEARTBEAT_SECONDS = 10
+NODE_TTL_SECONDS = 30
+
+BusHandler = Callable[[dict], Awaitable[None]]
+
+
+class MessageBus(ABC):
+    """
+    Interfaz del bus. Los mensajes son envelopes dict serializables a JSON:
+    {"origin": node_id, "target": codigo|None, "exclude": codigo|None, "message": {...}}
+    """
+
+    def __init__(self, node_id: Optional[str] = None):
+        self.node_id = node_id or uuid.uuid4().hex
+
+    @abstractmethod
+    async def start(self, handler: BusHandler) -> None:
+        ...
+
+    @abstractmethod
+    async def stop(self) -> None:
+        ...
+
+    @abstractmethod
+    async def publish(self, envelope: dict) -> None:
+        ...
+
+    @abstractmethod
+    async def set_presence(self, codigo_operario: str) -> None:
+        ...
+
+    @abstractmethod
+    async def clear_presence(self, codigo_operario: str) -> None:
+        ...
+
+    @abstractmethod
+    async def get_presence(self, codigo_operario: str) -> Optional[str]:
+        """Retorna el node_id donde está conectado el operario, o None."""
+
+
+class InMemoryHub:
+    """Estado compartido entre InMemoryBus (simula Redis dentro del proceso)."""
+
+    def __init__(self):
+        self.handlers: Dict[str, BusHandler] = {}
+        self.presence: Dict[str, str] = {}
+
+
+class InMemoryBus(MessageBus):
+    """Backend loopback: entrega a los handlers registrados en el mismo hub."""
+
+    def __init__(self, hub: Optional[InMemoryHub] = None, node_id: Optional[str] = None):
+        super().__init__(node_id)
+        self.hub = hub or InMemoryHub()
+
+    async def start(self, handler: BusHandler) -> None:
+        self.hub.handlers[self.node_id] = handler
+
+    async def stop(self) -> None:
+        self.hub.handlers.pop(self.node_id, None)
+        for codigo in [c for c, n in self.hub.presence.items() if n == self.node_id]:
+            del self.hub.presence[codigo]
+
+    async def publish(self, envelope: dict) -> None:
+        # Serializar igual que Redis para detectar payloads no serializables en tests
+        data = json.loads(json.dumps(envelope))
+        for node_id, handler in list(self.hub.handlers.items()):
+            if node_id == envelope.get("origin"):
+                continue
+            try:
+                await handler(data)
+            except Exception as e:
+                logger.error(f"[WS-BUS] Error entregando mensaje al nodo {node_id}: {e}")
+
+    async def set_presence(self, codigo_operario: str) -> None:
+        self.hub.presence[codigo_operario] = self.node_id
+
+    async def clear_presence(self, codigo_operario: str) -> None:
+        if self.hub.presence.get(codigo_operario) == self.node_id:
+            del self.hub.presence[codigo_operario]
+
+    async def get_presence(self, codigo_operario: str) -> Optional[str]:
+        return self.hub.presence.get(codigo_operario)
+
+
+class RedisBus(MessageBus):
+    """
+    Backend Redis.
+
+    - Pub/sub en BUS_CHANNEL (o el canal indicado; cada nodo ignora sus propios mensajes).
+    - Presencia en el hash PRESENCE_KEY {codigo_operario: node_id}.
+    - Cada nodo mantiene NODE_KEY_PREFIX+node_id con TTL; si un nodo muere,
+      su presencia deja de considerarse válida al expirar la clave.
+    """
+
+    def __init__(self, url: str, node_id: Optional[str] = None, channel: str = BUS_CHANNEL):
+        super().__init__(node_id)
+        import redis.asyncio as aioredis
+        self.channel = channel
+        self.redis = aioredis.Redis.from_url(url, decode_responses=True)
+        self._pubsub = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._local_presence: Set[str] = set()
+
+    async def start(self, handler: BusHandler) -> None:
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        await self.redis.set(NODE_KEY_PREFIX + self.node_id, "1", ex=NODE_TTL_SECONDS)
+        self._tasks.add(asyncio.create_task(self._reader(handler)))
+        self._tasks.add(asyncio.create_task(self._heartbeat()))
+        logger.info(f"[WS-BUS] Redis bus iniciado (nodo {self.node_id})")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks.clear()
+        try:
+            if self._local_presence:
+                await self.redis.hdel(PRESENCE_KEY, *self._local_presence)
+            await self.redis.delete(NODE_KEY_PREFIX + self.node_id)
+            if self._pubsub:
+                await self._pubsub.unsubscribe(self.channel)
+                await self._pubsub.aclose()
+            await self.redis.aclose()
+        except Exception as e:
+            logger.warning(f"[WS-BUS] Error cerrando Redis bus: {e}")
+
+    async def _reader(self, handler: BusHandler) -> None:
+        while True:
+            try:
+                msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not msg:
+                    continue
+                envelope = json.loads(msg["data"])
+                if envelope.get("origin") == self.node_id:
+                    continue
+                await handler(envelope)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"[WS-BUS] Error leyendo del canal: {e}")
+                await asyncio.sleep(1)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            try:
+                await self.redis.set(NODE_KEY_PREFIX + self.node_id, "1", ex=NODE_TTL_SECONDS)
+                if self._local_presence:
+                    await self.redis.hset(
+                        PRESENCE_KEY, mapping={c: self.node_id for c in self._local_presence}
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[WS-BUS] Heartbeat fallido: {e}")
+            await asyncio.sleep(NODE_HEARTBEAT_SECONDS)
+
+    async def publish(self, envelope: dict) -> None:
+        await self.redis.publish(self.channel, json.dumps(envelope))
+
+    async def set_presence(self, codigo_operario: str) -> None:
+        self._local_presence.add(codigo_operario)
+        await self.redis.hset(PRESENCE_KEY, codigo_operario, self.node_id)
+
+    async def clear_presence(self, codigo_operario: str) -> None:
+        self._local_presence.discard(codigo_operario)
+        # Solo borrar si la presencia sigue siendo de este nodo (pudo reconectar en otro)
+        if await self.redis.hget(PRESENCE_KEY, codigo_operario) == self.node_id:
+            await self.redis.hdel(PRESENCE_KEY, codigo_operario)
+
+    async def get_presence(self, codigo_operario: str) -> Optional[str]:
+        node_id = await self.redis.hget(PRESENCE_KEY, codigo_operario)
+        if node_id and await self.redis.exists(NODE_KEY_PREFIX + node_id):
+            return node_id
+        return None
+
+
+def create_bus(channel: str = BUS_CHANNEL) -> MessageBus:
+    """Crea el backend configurado en WS_BUS_BACKEND sobre el canal indicado."""
+    if WS_BUS_BACKEND == "redis":
+        return RedisBus(REDIS_URL, channel=channel)
+    return InMemoryBus()
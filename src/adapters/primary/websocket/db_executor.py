@@ -0,0 +1,45 @@
+"""
+Ejecución del trabajo de base de datos de los WebSocket fuera del event loop.
+
+SQLAlchemy + pyodbc es síncrono: cada round trip a SQL Server bloquea el hilo
+que lo ejecuta. Si ese hilo es el del event loop de uvicorn, una consulta lenta
+congela a todas las PDAs conectadas y a todas las peticiones HTTP del worker.
+
+Los handlers de operator_websocket.py separan su parte síncrona (abrir sesión,
+consultar, commit, construir _result) en una función normal y la ejecutan con
+run_db(), que la lanza en un pool de hilos acotado (WS_DB_WORKERS) dimensionado
+contra el pool de conexiones del engine. Cuando todos los hilos están ocupados,
+las siguientes operaciones esperan en cola sin bloquear el event loop.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+from src.adapters.secondary.database.config import WS_DB_WORKERS
+
+db_executor = ThreadPoolExecutor(
+    max_workers=WS_DB_WORKERS,
+    thread_name_prefix="ws-db",
+)
+
+
+async def run_db(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta una función síncrona de BD en el pool dedicado y espera su resultado.
+
+    Args:
+        func: Función síncrona que abre/cierra su propia sesión
+        *args, **kwargs: Argumentos para la función
+
+    Returns:
+        Lo que retorne func (las excepciones se propagan al llamador)
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(db_executor, partial(func, *args, **kwargs))
+
+
+def shutdown_db_executor() -> None:
+    """Detiene el pool esperando a que terminen las operaciones en curso."""
+    db_executor.shutdown(wait=True)
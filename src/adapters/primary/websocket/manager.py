@@ -3,95 +3,285 @@ WebSocket Connection Manager para operarios de PDA.
 
 Gestiona las conexiones WebSocket persistentes de los operarios
 para recibir escaneos de productos en tiempo real.
+
+Las conexiones viven en el proceso que las aceptó; los mensajes a operarios
+conectados a otros workers/hosts y los broadcasts viajan por el bus
+(ver bus.py), así la app puede correr con varios workers detrás del proxy.
+
+Cada conexión tiene una cola de salida acotada que vacía su propia tarea
+escritora: enviar o hacer broadcast solo encola (el JSON se serializa una vez
+por mensaje), de modo que una PDA con la ventana TCP atascada no retrasa al
+resto ni a los handlers que hacen el broadcast.
 """
 
-from typing import Dict
+import asyncio
+import json
+from typing import Dict, Optional
 from fastapi import WebSocket
 
+from src.adapters.secondary.database.config import WS_OUTBOUND_QUEUE_SIZE, WS_OVERFLOW_POLICY
+from .bus import MessageBus, create_bus
+
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DISCONNECT = "disconnect"
+
+
+def serialize_message(message: dict) -> str:
+    """Serializa un mensaje igual que WebSocket.send_json (una sola vez por mensaje)."""
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+class OutboundConnection:
+    """
+    Conexión de un operario con su cola de salida acotada y su tarea escritora.
+
+    La cola contiene texto JSON ya serializado. Si se llena se aplica la
+    política de overflow: descartar el mensaje más antiguo o desconectar
+    al consumidor lento.
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, overflow_policy: str):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.overflow_policy = overflow_policy
+        self.dropped = 0
+        self.writer: Optional[asyncio.Task] = None
+
+    def enqueue(self, text: str) -> bool:
+        """
+        Encola un mensaje serializado sin esperar.
+
+        Returns:
+            False si la conexión debe cerrarse (overflow con política disconnect)
+        """
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            if self.overflow_policy == OVERFLOW_DISCONNECT:
+                return False
+            # drop_oldest: sacar el más antiguo y meter el nuevo
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.put_nowait(text)
+            self.dropped += 1
+            return True
+
 
 class ConnectionManager:
     """
     Gestor de conexiones WebSocket para operarios.
-    
+
     Mantiene un diccionario simple: {codigo_operario: websocket}
     Cada operario puede tener una conexión activa a la vez.
     """
-    
-    def __init__(self):
-        # Conexiones activas: {codigo_operario: WebSocket}
+
+    def __init__(
+        self,
+        bus: Optional[MessageBus] = None,
+        max_queue: int = WS_OUTBOUND_QUEUE_SIZE,
+        overflow_policy: str = WS_OVERFLOW_POLICY,
+    ):
+        # Conexiones activas EN ESTE NODO: {codigo_operario: WebSocket}
         self.connections: Dict[str, WebSocket] = {}
-    
+        # Cola de salida + tarea escritora por conexión
+        self.outbound: Dict[str, OutboundConnection] = {}
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        # Bus de fan-out/presencia entre nodos
+        self.bus = bus or create_bus()
+        # Referencias a tareas en segundo plano (evita que el GC las cancele)
+        self._background_tasks = set()
+
+    async def start(self):
+        """Suscribe este nodo al bus (llamar en el arranque de la app)."""
+        await self.bus.start(self._on_bus_message)
+
+    async def stop(self):
+        """Cierra la suscripción al bus, limpia la presencia y detiene los escritores."""
+        await self.bus.stop()
+        for conn in self.outbound.values():
+            if conn.writer:
+                conn.writer.cancel()
+
     async def connect(self, websocket: WebSocket, codigo_operario: str):
         """
         Conecta un operario al WebSocket.
-        
+
         Args:
             websocket: Instancia de WebSocket
             codigo_operario: Código del operario (ej: OP001)
         """
         await websocket.accept()
+        # Reconexión: cerrar el escritor de la conexión anterior
+        previous = self.outbound.pop(codigo_operario, None)
+        if previous and previous.writer:
+            previous.writer.cancel()
+
+        conn = OutboundConnection(websocket, self.max_queue, self.overflow_policy)
+        conn.writer = asyncio.create_task(self._writer(codigo_operario, conn))
         self.connections[codigo_operario] = websocket
+        self.outbound[codigo_operario] = conn
+        try:
+            await self.bus.set_presence(codigo_operario)
+        except Exception as e:
+            print(f"⚠️ No se pudo registrar presencia de {codigo_operario}: {e}")
         print(f"✅ Operario {codigo_operario} conectado al WebSocket")
-    
+
     def disconnect(self, codigo_operario: str):
         """
         Desconecta un operario del WebSocket.
-        
+
         Args:
             codigo_operario: Código del operario a desconectar
         """
         if codigo_operario in self.connections:
             del self.connections[codigo_operario]
+            conn = self.outbound.pop(codigo_operario, None)
+            if conn and conn.writer and conn.writer is not asyncio.current_task():
+                conn.writer.cancel()
+            self._spawn(self._clear_presence(codigo_operario))
             print(f"❌ Operario {codigo_operario} desconectado del WebSocket")
-    
+
     async def send_message(self, codigo_operario: str, message: dict):
         """
         Envía un mensaje JSON a un operario específico.
-        
+
+        Si el operario no está conectado a este nodo, el mensaje se publica
+        en el bus y lo entrega el nodo que tenga su conexión.
+
         Args:
             codigo_operario: Código del operario
             message: Diccionario con el mensaje a enviar
         """
         if codigo_operario in self.connections:
-            try:
-                await self.connections[codigo_operario].send_json(message)
-            except Exception as e:
-                print(f"Error enviando mensaje a operario {codigo_operario}: {e}")
-                # Si falla, desconectar
-                self.disconnect(codigo_operario)
-    
+            self._enqueue(codigo_operario, serialize_message(message))
+        else:
+            await self._publish({"target": codigo_operario, "message": message})
+
     def is_connected(self, codigo_operario: str) -> bool:
         """
-        Verifica si un operario está conectado.
-        
+        Verifica si un operario está conectado a este nodo.
+
         Args:
             codigo_operario: Código del operario
-            
+
         Returns:
             True si está conectado, False en caso contrario
         """
         return codigo_operario in self.connections
-    
+
+    async def is_online(self, codigo_operario: str) -> bool:
+        """
+        Verifica si un operario está conectado en cualquier nodo (presencia del bus).
+
+        Args:
+            codigo_operario: Código del operario
+        """
+        if codigo_operario in self.connections:
+            return True
+        try:
+            return await self.bus.get_presence(codigo_operario) is not None
+        except Exception as e:
+            print(f"⚠️ No se pudo consultar presencia de {codigo_operario}: {e}")
+            return False
+
     async def broadcast(self, message: dict, exclude: str = None):
         """
-        Envía un mensaje a todos los operarios conectados.
-        
+        Envía un mensaje a todos los operarios conectados (en todos los nodos).
+
         Args:
             message: Diccionario con el mensaje a enviar
             exclude: Código de operario a excluir del broadcast (opcional)
         """
-        disconnected = []
-        for codigo, ws in self.connections.items():
+        await self._broadcast_local(message, exclude)
+        await self._publish({"target": None, "exclude": exclude, "message": message})
+
+    async def _broadcast_local(self, message: dict, exclude: str = None):
+        """Encola un mensaje para los operarios conectados a este nodo (serializado una vez)."""
+        text = serialize_message(message)
+        for codigo in list(self.connections):
             if codigo == exclude:
                 continue
+            self._enqueue(codigo, text)
+
+    def _enqueue(self, codigo_operario: str, text: str):
+        conn = self.outbound.get(codigo_operario)
+        if not conn:
+            return
+        if not conn.enqueue(text):
+            print(f"⚠️ Operario {codigo_operario}: cola de salida llena ({self.max_queue}), desconectando consumidor lento")
+            self.disconnect(codigo_operario)
+            self._spawn(self._close_socket(conn.websocket, 1013, "Consumidor lento"))
+        elif conn.dropped and conn.dropped % self.max_queue == 1:
+            print(f"⚠️ Operario {codigo_operario}: cola de salida llena, {conn.dropped} mensajes descartados")
+
+    async def _writer(self, codigo_operario: str, conn: OutboundConnection):
+        """Tarea escritora: vacía la cola de una conexión en orden."""
+        while True:
+            text = await conn.queue.get()
             try:
-                await ws.send_json(message)
+                await conn.websocket.send_text(text)
             except Exception as e:
-                print(f"Error en broadcast a operario {codigo}: {e}")
-                disconnected.append(codigo)
-        
-        for codigo in disconnected:
-            self.disconnect(codigo)
+                print(f"Error enviando mensaje a operario {codigo_operario}: {e}")
+                # Si falla, desconectar (solo si sigue siendo la conexión vigente)
+                if self.outbound.get(codigo_operario) is conn:
+                    self.disconnect(codigo_operario)
+                return
+            finally:
+                conn.queue.task_done()
+
+    async def drain(self, codigo_operario: Optional[str] = None):
+        """Espera a que se vacíen las colas de salida (de un operario o de todos)."""
+        conns = (
+            [self.outbound[codigo_operario]] if codigo_operario in self.outbound
+            else [] if codigo_operario else list(self.outbound.values())
+        )
+        for conn in conns:
+            await conn.queue.join()
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket, code: int, reason: str):
+        try:
+            await websocket.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+    async def _publish(self, envelope: dict):
+        envelope["origin"] = self.bus.node_id
+        try:
+            await self.bus.publish(envelope)
+        except Exception as e:
+            print(f"⚠️ Error publicando en el bus WebSocket: {e}")
+
+    async def _clear_presence(self, codigo_operario: str):
+        # Si reconectó a este mismo nodo entretanto, conservar la presencia
+        if codigo_operario in self.connections:
+            return
+        try:
+            await self.bus.clear_presence(codigo_operario)
+        except Exception as e:
+            print(f"⚠️ No se pudo limpiar presencia de {codigo_operario}: {e}")
+
+    async def _on_bus_message(self, envelope: dict):
+        """Entrega localmente un mensaje recibido de otro nodo."""
+        target = envelope.get("target")
+        message = envelope.get("message")
+        if target:
+            if target in self.connections:
+                self._enqueue(target, serialize_message(message))
+        else:
+            await self._broadcast_local(message, envelope.get("exclude"))
+
+    def _spawn(self, coro):
+        """Lanza una corrutina en segundo plano si hay event loop (disconnect es síncrono)."""
+        try:
+            task = asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            coro.close()
+            return
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
 
 
 # Instancia global del manager
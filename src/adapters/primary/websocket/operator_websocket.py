@@ -11,9 +11,14 @@ from datetime import datetime
 from sqlalchemy import case
 
 from .manager import manager
+from .db_executor import run_db
+from .orders_websocket import orders_manager, EVENT_PROGRESS
 from src.adapters.secondary.database.orm import Operator, Order, OrderLine, OrderLineBoxDistribution, PackingBox, ReplenishmentRequest, ProductLocation, ProductReference, StockMovement, OrderLineStockAssignment
 from src.adapters.secondary.database.config import ALMACEN_PICKING_ID, ALMACEN_REPOSICION_ID, SessionLocal
 from src.services.replenishment_service import create_or_upgrade_replenishment
+from src.services.picking_session_service import picking_sessions, validate_session, apply_scan, apply_scan_batch, StaleSessionError
+from src.services.reservation_queue_service import reservation_queue
+from src.services.wave_picking_service import wave_sessions, validate_wave_session, select_wave_target
 
 
 router = APIRouter()
@@ -46,23 +51,16 @@ async def operator_websocket_endpoint(
     """
 
     # 1. Validar que el operario existe y está activo (usar sesión temporal)
-    from ...secondary.database.config import SessionLocal
-    db = SessionLocal()
-    try:
-        operator = db.query(Operator).filter_by(codigo=codigo_operario).first()
-
-        if not operator:
-            await websocket.close(code=4004, reason="Operario no encontrado")
-            return
+    operator_info = await run_db(_load_operator_sync, codigo_operario)
 
-        if not operator.activo:
-            await websocket.close(code=4003, reason="Operario inactivo")
-            return
+    if not operator_info:
+        await websocket.close(code=4004, reason="Operario no encontrado")
+        return
 
-        operator_id = operator.id
-        operator_name = operator.nombre
-    finally:
-        db.close()
+    operator_id, operator_name, operator_activo = operator_info
+    if not operator_activo:
+        await websocket.close(code=4003, reason="Operario inactivo")
+        return
 
     # 2. Conectar al operario
     await manager.connect(websocket, codigo_operario)
@@ -94,6 +92,20 @@ async def operator_websocket_endpoint(
                     codigo_operario,  # Código para respuestas
                     data.get("data", {})
                 )
+            elif action == "scan_batch":
+                await handle_scan_batch(
+                    websocket,
+                    operator_id,
+                    codigo_operario,
+                    data.get("data", {})
+                )
+            elif action == "scan_wave_product":
+                await handle_scan_wave_product(
+                    websocket,
+                    operator_id,
+                    codigo_operario,
+                    data.get("data", {})
+                )
             elif action == "request_replenishment":
                 await handle_request_replenishment(
                     websocket,
@@ -173,17 +185,34 @@ async def operator_websocket_endpoint(
 
     except WebSocketDisconnect:
         manager.disconnect(codigo_operario)
-        print(f"Operario {codigo_operario} ({operator.nombre}) desconectado")
+        picking_sessions.invalidate_operator(codigo_operario)
+        wave_sessions.invalidate_operator(codigo_operario)
+        print(f"Operario {codigo_operario} ({operator_name}) desconectado")
 
     except Exception as e:
         print(f"Error en WebSocket de operario {codigo_operario}: {e}")
         manager.disconnect(codigo_operario)
+        picking_sessions.invalidate_operator(codigo_operario)
+        wave_sessions.invalidate_operator(codigo_operario)
         try:
             await websocket.close(code=1011, reason="Error interno del servidor")
         except:
             pass
 
 
+def _load_operator_sync(codigo_operario: str):
+    """Retorna (id, nombre, activo) del operario o None si no existe."""
+    from ...secondary.database.config import SessionLocal
+    db = SessionLocal()
+    try:
+        operator = db.query(Operator).filter_by(codigo=codigo_operario).first()
+        if not operator:
+            return None
+        return operator.id, operator.nombre, operator.activo
+    finally:
+        db.close()
+
+
 async def handle_scan_product(
     websocket: WebSocket,
     operator_id: int,
@@ -202,6 +231,24 @@ async def handle_scan_product(
         codigo_operario: Código del operario (para respuestas)
         data: Datos del escaneo (order_id o numero_orden, ean, ubicacion)
     """
+    _result = await run_db(_handle_scan_product_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_scan_product_sync(operator_id: int, codigo_operario: str, data: dict):
+    """
+    Parte síncrona (BD) de handle_scan_product. Se ejecuta en el pool de BD y retorna _result.
+
+    Usa la sesión de picking en memoria del operario (picking_session_service):
+    la primera vez carga la orden completa; después cada escaneo es 1 lectura
+    de validación + escrituras. Si la sesión quedó obsoleta se recarga y se
+    reintenta una vez.
+    """
     # Crear sesión de base de datos para esta operación
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
@@ -220,165 +267,439 @@ async def handle_scan_product(
         elif not ean:
             _result = ("error", "MISSING_EAN", "Falta el código EAN")
         else:
-            # 1. Validar que la orden existe y está asignada al operario
-            if order_id:
-                order = db.query(Order).filter_by(id=order_id).first()
-            else:
-                order = db.query(Order).filter_by(numero_orden=numero_orden).first()
-
-            if not order:
-                _result = ("error", "ORDER_NOT_FOUND", "Orden no encontrada")
-            elif order.operator_id != operator_id:
-                _result = ("error", "ORDER_NOT_ASSIGNED", "Esta orden no está asignada a ti")
-            elif order.status.codigo != "IN_PICKING":
-                _result = ("error", "ORDER_WRONG_STATUS", f"La orden está en estado {order.status.codigo}. Debe estar en IN_PICKING")
-            else:
+            for _attempt in range(2):
+                # 1. Sesión de picking en memoria (validada contra la BD en 1 consulta)
+                session = picking_sessions.get(codigo_operario, order_id, numero_orden)
+                fresh_session = False
+                if session:
+                    try:
+                        validate_session(db, session)
+                    except StaleSessionError:
+                        picking_sessions.invalidate_operator(codigo_operario)
+                        session = None
+
+                if not session:
+                    # 2. Validar que la orden existe y está asignada al operario
+                    if order_id:
+                        order = db.query(Order).filter_by(id=order_id).first()
+                    else:
+                        order = db.query(Order).filter_by(numero_orden=numero_orden).first()
+
+                    if not order:
+                        _result = ("error", "ORDER_NOT_FOUND", "Orden no encontrada")
+                        break
+                    elif order.operator_id != operator_id:
+                        _result = ("error", "ORDER_NOT_ASSIGNED", "Esta orden no está asignada a ti")
+                        break
+                    elif order.status.codigo != "IN_PICKING":
+                        _result = ("error", "ORDER_WRONG_STATUS", f"La orden está en estado {order.status.codigo}. Debe estar en IN_PICKING")
+                        break
+                    session = picking_sessions.load(db, codigo_operario, order)
+                    fresh_session = True
+
                 # 3. Buscar el producto por EAN en las líneas de la orden
-                line = db.query(OrderLine).filter(
-                    OrderLine.order_id == order.id,
-                    OrderLine.ean == ean
-                ).first()
+                line = session.lines_by_ean.get(ean)
 
                 if not line:
                     _result = ("error", "EAN_NOT_IN_ORDER", f"El EAN {ean} no pertenece a esta orden")
+                    break
                 elif line.cantidad_servida >= line.cantidad_solicitada:
+                    if not fresh_session:
+                        # Confirmar contra la BD (la línea pudo resetearse desde otro proceso)
+                        picking_sessions.invalidate_operator(codigo_operario)
+                        continue
                     _result = ("error", "MAX_QUANTITY_REACHED", f"Ya se completó la cantidad solicitada ({line.cantidad_solicitada})")
-                else:
-                    # 5. Incrementar cantidad servida en +1
-                    line.cantidad_servida += 1
-
-                    # 5.0. Actualizar assignment.cantidad_servida (tracking multi-ubicación)
-                    assignments = (
-                        db.query(OrderLineStockAssignment)
-                        .filter_by(order_line_id=line.id)
-                        .order_by(OrderLineStockAssignment.id)
-                        .all()
-                    )
-                    if assignments:
-                        target_assignment = None
-                        # Si PDA envía ubicación, intentar matchear
-                        if ubicacion:
-                            for a in assignments:
-                                if a.cantidad_servida < a.cantidad_reservada:
-                                    loc = db.get(ProductLocation, a.product_location_id)
-                                    if loc and loc.codigo_ubicacion == ubicacion:
-                                        target_assignment = a
-                                        break
-                        # Fallback: primer assignment con espacio disponible
-                        if not target_assignment:
-                            for a in assignments:
-                                if a.cantidad_servida < a.cantidad_reservada:
-                                    target_assignment = a
-                                    break
-                        if target_assignment:
-                            target_assignment.cantidad_servida += 1
-
-                    # 5.1. EMPAQUE AUTOMÁTICO en caja activa usando OrderLineBoxDistribution
-                    if order.caja_activa_id:
-                        # Buscar distribución existente para esta línea en esta caja
-                        distribution = db.query(OrderLineBoxDistribution).filter(
-                            OrderLineBoxDistribution.order_line_id == line.id,
-                            OrderLineBoxDistribution.packing_box_id == order.caja_activa_id
-                        ).first()
+                    break
+
+                # 4. Incrementar cantidad servida en +1 (línea, asignación, caja) y commit
+                try:
+                    apply_scan(db, session, line, ubicacion)
+                except StaleSessionError:
+                    # La línea cambió en BD (reset, otro worker...) → recargar y reintentar
+                    picking_sessions.invalidate_operator(codigo_operario)
+                    continue
+
+                # 5. Calcular progreso
+                progreso_linea = (
+                    (line.cantidad_servida / line.cantidad_solicitada * 100)
+                    if line.cantidad_solicitada > 0 else 0
+                )
 
-                        if distribution:
-                            # Ya existe, incrementar cantidad
-                            distribution.quantity_in_box += 1
-                        else:
-                            # Crear nueva distribución
-                            distribution = OrderLineBoxDistribution(
-                                order_line_id=line.id,
-                                packing_box_id=order.caja_activa_id,
-                                quantity_in_box=1,
-                                fecha_empacado=datetime.utcnow()
-                            )
-                            db.add(distribution)
+                progreso_orden = (
+                    (session.items_completados / session.total_items * 100)
+                    if session.total_items > 0 else 0
+                )
 
-                        # Actualizar contador de items en la caja
-                        box = db.query(PackingBox).filter(
-                            PackingBox.id == order.caja_activa_id
-                        ).first()
-                        if box:
-                            box.total_items += 1
-
-                        # Marcar la línea como empacada si se completó
-                        if line.cantidad_servida >= line.cantidad_solicitada:
-                            line.packing_box_id = order.caja_activa_id
-                            line.fecha_empacado = datetime.utcnow()
-
-                    # 6. Actualizar estado de la línea
-                    if line.cantidad_servida == line.cantidad_solicitada:
-                        line.estado = "COMPLETED"
-                    elif line.cantidad_servida > 0:
-                        line.estado = "PARTIAL"
-
-                    # 7. Guardar cambios
-                    # NOTA: items_completados se calcula automáticamente desde order_lines (hybrid_property)
-                    db.commit()
+                print(f"✅ Operario {codigo_operario} escaneó EAN {ean} - Orden {session.numero_orden} - Progreso: {round(progreso_orden, 2)}%")
 
-                    # 9. Calcular progreso
-                    progreso_linea = (
-                        (line.cantidad_servida / line.cantidad_solicitada * 100)
-                        if line.cantidad_solicitada > 0 else 0
-                    )
-
-                    progreso_orden = (
-                        (order.items_completados / order.total_items * 100)
-                        if order.total_items > 0 else 0
-                    )
-
-                    # 10. Obtener info del producto
-                    producto_nombre = "Producto"
-                    if line.product_reference:
-                        producto_nombre = line.product_reference.nombre_producto
-                        if line.product_reference.nombre_color:
-                            producto_nombre += f" {line.product_reference.nombre_color}"
-                        if line.product_reference.talla:
-                            producto_nombre += f" {line.product_reference.talla}"
-
-                    print(f"✅ Operario {codigo_operario} escaneó EAN {ean} - Orden {order.numero_orden} - Progreso: {round(progreso_orden, 2)}%")
-
-                    # 11. Build response payload (sent after db.close())
-                    _result = ("ok", {
-                        "action": "scan_confirmed",
-                        "data": {
-                            "line_id": line.id,
-                            "producto": producto_nombre,
-                            "ean": ean,
-                            "ubicacion": ubicacion,
-                            "cantidad_actual": line.cantidad_servida,
-                            "cantidad_solicitada": line.cantidad_solicitada,
-                            "cantidad_pendiente": line.cantidad_solicitada - line.cantidad_servida,
-                            "progreso_linea": round(progreso_linea, 2),
-                            "estado_linea": line.estado,
-                            "progreso_orden": {
-                                "order_id": order.id,
-                                "numero_orden": order.numero_orden,
-                                "total_items": order.total_items,
-                                "items_completados": order.items_completados,
-                                "progreso_porcentaje": round(progreso_orden, 2)
-                            },
-                            "mensaje": "✅ Producto escaneado correctamente",
-                            "timestamp": datetime.utcnow().isoformat()
-                        }
-                    })
+                # 6. Build response payload (sent after db.close())
+                _result = ("ok", {
+                    "action": "scan_confirmed",
+                    "data": {
+                        "line_id": line.id,
+                        "producto": line.producto_nombre,
+                        "ean": ean,
+                        "ubicacion": ubicacion,
+                        "cantidad_actual": line.cantidad_servida,
+                        "cantidad_solicitada": line.cantidad_solicitada,
+                        "cantidad_pendiente": line.cantidad_solicitada - line.cantidad_servida,
+                        "progreso_linea": round(progreso_linea, 2),
+                        "estado_linea": line.estado,
+                        "progreso_orden": {
+                            "order_id": session.order_id,
+                            "numero_orden": session.numero_orden,
+                            "total_items": session.total_items,
+                            "items_completados": session.items_completados,
+                            "progreso_porcentaje": round(progreso_orden, 2)
+                        },
+                        "mensaje": "✅ Producto escaneado correctamente",
+                        "timestamp": datetime.utcnow().isoformat()
+                    }
+                })
+                # Feed de órdenes (los escaneos seguidos se agrupan en un evento)
+                orders_manager.emit(EVENT_PROGRESS, session.order_id, _result[1]["data"]["progreso_orden"])
+                break
+
+            if _result is None:
+                _result = ("error", "CONCURRENT_UPDATE", "La línea fue modificada por otro proceso. Vuelve a escanear")
 
     except Exception as e:
         print(f"❌ Error en handle_scan_product: {e}")
         import traceback
         traceback.print_exc()
         db.rollback()
+        picking_sessions.invalidate_operator(codigo_operario)
         _result = ("error", "INTERNAL_ERROR", f"Error interno: {str(e)}")
     finally:
         db.close()
 
-    # All awaits happen after db.close()
+    return _result
+
+
+# Máximo de escaneos aceptados en un solo mensaje scan_batch
+MAX_SCAN_BATCH = 200
+
+
+async def handle_scan_batch(
+    websocket: WebSocket,
+    operator_id: int,
+    codigo_operario: str,
+    data: dict
+):
+    """
+    Procesa un lote de escaneos encolados por la PDA (Wi-Fi débil).
+
+    Aplica los N escaneos de una orden en una sola transacción y responde
+    con un único payload de progreso agregado y el resultado por escaneo.
+    Si la PDA reenvía un lote cuyo ack se perdió, los seq ya procesados
+    devuelven su resultado anterior ("duplicado": true) sin volver a sumarse.
+    La PDA envía un "epoch" nuevo cada vez que reinicia su contador de seq.
+
+    Mensaje esperado:
+    {
+        "action": "scan_batch",
+        "data": {
+            "order_id": 35,                    // o "numero_orden"
+            "epoch": "a1b2c3",                 // opcional: id del contador de seq
+            "scans": [
+                {"seq": 101, "ean": "8445962763983", "ubicacion": "A-IZQ-12-H2"},
+                {"seq": 102, "ean": "8445962763983"}
+            ]
+        }
+    }
+
+    Args:
+        websocket: Conexión WebSocket
+        operator_id: ID numérico del operario (para validaciones)
+        codigo_operario: Código del operario (para respuestas)
+        data: Datos del lote (order_id o numero_orden, epoch, scans)
+    """
+    _result = await run_db(_handle_scan_batch_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
     if _result[0] == "error":
         await send_error(websocket, _result[1], _result[2])
     else:
         await manager.send_message(codigo_operario, _result[1])
 
 
+def _handle_scan_batch_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_scan_batch. Se ejecuta en el pool de BD y retorna _result."""
+    from ...secondary.database.config import SessionLocal
+    db = SessionLocal()
+    _result = None
+
+    try:
+        order_id = data.get("order_id")
+        numero_orden = data.get("numero_orden") or data.get("order_number")
+        scans = data.get("scans") or []
+
+        # Validaciones de entrada
+        if not order_id and not numero_orden:
+            _result = ("error", "MISSING_ORDER_NUMBER", "Falta el ID o número de orden")
+        elif not isinstance(scans, list) or not scans:
+            _result = ("error", "MISSING_SCANS", "El lote no contiene escaneos")
+        elif len(scans) > MAX_SCAN_BATCH:
+            _result = ("error", "BATCH_TOO_LARGE", f"Máximo {MAX_SCAN_BATCH} escaneos por lote")
+        else:
+            for _attempt in range(2):
+                # 1. Sesión de picking en memoria (validada contra la BD en 1 consulta)
+                session = picking_sessions.get(codigo_operario, order_id, numero_orden)
+                if session:
+                    try:
+                        validate_session(db, session)
+                    except StaleSessionError:
+                        picking_sessions.invalidate_operator(codigo_operario)
+                        session = None
+
+                if not session:
+                    if order_id:
+                        order = db.query(Order).filter_by(id=order_id).first()
+                    else:
+                        order = db.query(Order).filter_by(numero_orden=numero_orden).first()
+
+                    if not order:
+                        _result = ("error", "ORDER_NOT_FOUND", "Orden no encontrada")
+                        break
+                    elif order.operator_id != operator_id:
+                        _result = ("error", "ORDER_NOT_ASSIGNED", "Esta orden no está asignada a ti")
+                        break
+                    elif order.status.codigo != "IN_PICKING":
+                        _result = ("error", "ORDER_WRONG_STATUS", f"La orden está en estado {order.status.codigo}. Debe estar en IN_PICKING")
+                        break
+                    session = picking_sessions.load(db, codigo_operario, order)
+
+                # 2. Validar en memoria y aplicar todo en una transacción
+                try:
+                    resultados = apply_scan_batch(db, session, scans, epoch=data.get("epoch"))
+                except StaleSessionError:
+                    picking_sessions.invalidate_operator(codigo_operario)
+                    continue
+
+                # Los seq ya procesados (lote reenviado) no cuentan como aplicados
+                duplicados = sum(1 for r in resultados if r.get("duplicado"))
+                aplicados = sum(1 for r in resultados if r["status"] == "ok" and not r.get("duplicado"))
+                lineas_ids = {r["line_id"] for r in resultados if r["status"] == "ok" and r.get("line_id")}
+                lineas = [
+                    {
+                        "line_id": line.id,
+                        "producto": line.producto_nombre,
+                        "ean": line.ean,
+                        "cantidad_actual": line.cantidad_servida,
+                        "cantidad_solicitada": line.cantidad_solicitada,
+                        "cantidad_pendiente": line.cantidad_solicitada - line.cantidad_servida,
+                        "estado_linea": line.estado,
+                    }
+                    for line in session.lines_by_ean.values() if line.id in lineas_ids
+                ]
+                progreso_orden = (
+                    (session.items_completados / session.total_items * 100)
+                    if session.total_items > 0 else 0
+                )
+
+                print(f"✅ Operario {codigo_operario} lote de {len(scans)} escaneos ({aplicados} aplicados) - Orden {session.numero_orden} - Progreso: {round(progreso_orden, 2)}%")
+
+                _result = ("ok", {
+                    "action": "scan_batch_confirmed",
+                    "data": {
+                        "total_recibidos": len(scans),
+                        "aplicados": aplicados,
+                        "duplicados": duplicados,
+                        "rechazados": len(scans) - aplicados - duplicados,
+                        "resultados": resultados,
+                        "lineas": lineas,
+                        "progreso_orden": {
+                            "order_id": session.order_id,
+                            "numero_orden": session.numero_orden,
+                            "total_items": session.total_items,
+                            "items_completados": session.items_completados,
+                            "progreso_porcentaje": round(progreso_orden, 2)
+                        },
+                        "timestamp": datetime.utcnow().isoformat()
+                    }
+                })
+                if aplicados:
+                    orders_manager.emit(EVENT_PROGRESS, session.order_id, _result[1]["data"]["progreso_orden"])
+                break
+
+            if _result is None:
+                _result = ("error", "CONCURRENT_UPDATE", "La orden fue modificada por otro proceso. Reenvía el lote")
+
+    except Exception as e:
+        print(f"❌ Error en handle_scan_batch: {e}")
+        import traceback
+        traceback.print_exc()
+        db.rollback()
+        picking_sessions.invalidate_operator(codigo_operario)
+        _result = ("error", "INTERNAL_ERROR", f"Error interno: {str(e)}")
+    finally:
+        db.close()
+
+    return _result
+
+
+async def handle_scan_wave_product(
+    websocket: WebSocket,
+    operator_id: int,
+    codigo_operario: str,
+    data: dict
+):
+    """
+    Procesa el escaneo de un producto dentro de una oleada (varias órdenes
+    en un recorrido, ver services/wave_picking_service.py).
+
+    El servidor decide a qué orden de la oleada se imputa la unidad y la
+    respuesta indica la cubeta (y la caja activa de esa orden) donde dejarla.
+
+    Mensaje esperado:
+    {
+        "action": "scan_wave_product",
+        "data": {
+            "wave_id": "3F9A1C0B2D4E",
+            "ean": "8445962763983",
+            "ubicacion": "A-IZQ-12-H2",        // opcional: prioriza la orden con esa ubicación
+            "tote": 3                          // opcional: fuerza la cubeta
+        }
+    }
+
+    Args:
+        websocket: Conexión WebSocket
+        operator_id: ID numérico del operario (para validaciones)
+        codigo_operario: Código del operario (para respuestas)
+        data: Datos del escaneo (wave_id, ean, ubicacion, tote)
+    """
+    _result = await run_db(_handle_scan_wave_product_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_scan_wave_product_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_scan_wave_product. Se ejecuta en el pool de BD y retorna _result."""
+    from ...secondary.database.config import SessionLocal
+    db = SessionLocal()
+    _result = None
+
+    wave_errors = {
+        "EAN_NOT_IN_WAVE": "El EAN {ean} no pertenece a ninguna orden de la oleada",
+        "TOTE_NOT_IN_WAVE": "La cubeta {tote} no pertenece a la oleada",
+        "EAN_NOT_IN_TOTE": "El EAN {ean} no pertenece a la orden de la cubeta {tote}",
+        "MAX_QUANTITY_REACHED": "Ya se completó la cantidad solicitada del EAN {ean} en la oleada",
+    }
+
+    try:
+        wave_id = data.get("wave_id")
+        ean = data.get("ean")
+        ubicacion = data.get("ubicacion")
+        tote = data.get("tote")
+
+        # Validaciones de entrada
+        if not wave_id:
+            _result = ("error", "MISSING_WAVE_ID", "Falta el ID de la oleada")
+        elif not ean:
+            _result = ("error", "MISSING_EAN", "Falta el código EAN")
+        elif tote is not None and not isinstance(tote, int):
+            _result = ("error", "INVALID_TOTE", "La cubeta debe ser un número")
+        else:
+            for _attempt in range(2):
+                # 1. Sesión de la oleada en memoria (validada contra la BD en 1 consulta)
+                wave = wave_sessions.get(codigo_operario, wave_id)
+                fresh_session = False
+                if wave:
+                    try:
+                        validate_wave_session(db, wave)
+                    except StaleSessionError:
+                        wave_sessions.invalidate_operator(codigo_operario)
+                        wave = None
+
+                if not wave:
+                    wave = wave_sessions.load(db, codigo_operario, operator_id, wave_id)
+                    fresh_session = True
+                    if not wave:
+                        _result = ("error", "WAVE_NOT_FOUND", f"Oleada {wave_id} no encontrada o sin órdenes en picking")
+                        break
+
+                # 2. Orden (cubeta) de la oleada a la que se imputa la unidad
+                target_tote, line, error = select_wave_target(wave, ean, ubicacion, tote)
+                if error == "MAX_QUANTITY_REACHED" and not fresh_session:
+                    # Confirmar contra la BD (la línea pudo resetearse desde otro proceso)
+                    wave_sessions.invalidate_operator(codigo_operario)
+                    continue
+                if error:
+                    _result = ("error", error, wave_errors[error].format(ean=ean, tote=tote))
+                    break
+
+                # 3. Incrementar cantidad servida en +1 (línea, asignación, caja) y commit
+                session = wave.sessions_by_tote[target_tote]
+                try:
+                    apply_scan(db, session, line, ubicacion)
+                except StaleSessionError:
+                    wave_sessions.invalidate_operator(codigo_operario)
+                    continue
+
+                progreso_orden = (
+                    (session.items_completados / session.total_items * 100)
+                    if session.total_items > 0 else 0
+                )
+                progreso_oleada = (
+                    (wave.items_completados / wave.total_items * 100)
+                    if wave.total_items > 0 else 0
+                )
+
+                print(f"✅ Operario {codigo_operario} escaneó EAN {ean} - Oleada {wave_id} cubeta {target_tote} (orden {session.numero_orden}) - Progreso oleada: {round(progreso_oleada, 2)}%")
+
+                _result = ("ok", {
+                    "action": "wave_scan_confirmed",
+                    "data": {
+                        "wave_id": wave_id,
+                        "tote": target_tote,
+                        "codigo_caja": wave.box_codes.get(target_tote),
+                        "line_id": line.id,
+                        "producto": line.producto_nombre,
+                        "ean": ean,
+                        "ubicacion": ubicacion,
+                        "cantidad_actual": line.cantidad_servida,
+                        "cantidad_solicitada": line.cantidad_solicitada,
+                        "cantidad_pendiente": line.cantidad_solicitada - line.cantidad_servida,
+                        "estado_linea": line.estado,
+                        "progreso_orden": {
+                            "order_id": session.order_id,
+                            "numero_orden": session.numero_orden,
+                            "total_items": session.total_items,
+                            "items_completados": session.items_completados,
+                            "progreso_porcentaje": round(progreso_orden, 2)
+                        },
+                        "progreso_oleada": {
+                            "total_items": wave.total_items,
+                            "items_completados": wave.items_completados,
+                            "progreso_porcentaje": round(progreso_oleada, 2)
+                        },
+                        "mensaje": f"✅ Dejar en cubeta {target_tote}",
+                        "timestamp": datetime.utcnow().isoformat()
+                    }
+                })
+                orders_manager.emit(EVENT_PROGRESS, session.order_id, _result[1]["data"]["progreso_orden"])
+                break
+
+            if _result is None:
+                _result = ("error", "CONCURRENT_UPDATE", "La línea fue modificada por otro proceso. Vuelve a escanear")
+
+    except Exception as e:
+        print(f"❌ Error en handle_scan_wave_product: {e}")
+        import traceback
+        traceback.print_exc()
+        db.rollback()
+        wave_sessions.invalidate_operator(codigo_operario)
+        _result = ("error", "INTERNAL_ERROR", f"Error interno: {str(e)}")
+    finally:
+        db.close()
+
+    return _result
+
+
 async def handle_request_replenishment(
     websocket: WebSocket,
     operator_id: int,
@@ -397,6 +718,21 @@ async def handle_request_replenishment(
         codigo_operario: Código del operario (para respuestas)
         data: Datos de la solicitud (location_destino_id, product_id, order_id opcional)
     """
+    _result = await run_db(_handle_request_replenishment_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    elif _result[0] in ("ok", "ok_no_stock"):
+        await manager.send_message(codigo_operario, _result[1])
+    elif _result[0] == "ok_created":
+        await manager.send_message(codigo_operario, _result[1]["main_msg"])
+        # 7. Broadcast alerta a todos los operarios conectados
+        await manager.broadcast(_result[1]["broadcast_msg"], exclude=codigo_operario)
+
+
+def _handle_request_replenishment_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_request_replenishment. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
     _result = None
@@ -532,15 +868,7 @@ async def handle_request_replenishment(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    elif _result[0] in ("ok", "ok_no_stock"):
-        await manager.send_message(codigo_operario, _result[1])
-    elif _result[0] == "ok_created":
-        await manager.send_message(codigo_operario, _result[1]["main_msg"])
-        # 7. Broadcast alerta a todos los operarios conectados
-        await manager.broadcast(_result[1]["broadcast_msg"], exclude=codigo_operario)
+    return _result
 
 
 async def handle_request_replenishment_urgent(
@@ -561,6 +889,21 @@ async def handle_request_replenishment_urgent(
         codigo_operario: Código del operario (para respuestas)
         data: { location_destino_id, product_id, order_id, requested_quantity }
     """
+    _result = await run_db(_handle_request_replenishment_urgent_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    elif _result[0] == "ok":
+        await manager.send_message(codigo_operario, _result[1])
+    elif _result[0] == "ok_created":
+        await manager.send_message(codigo_operario, _result[1]["main_msg"])
+        # 8. Broadcast alerta
+        await manager.broadcast(_result[1]["broadcast_msg"], exclude=codigo_operario)
+
+
+def _handle_request_replenishment_urgent_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_request_replenishment_urgent. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
     _result = None
@@ -719,15 +1062,7 @@ async def handle_request_replenishment_urgent(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    elif _result[0] == "ok":
-        await manager.send_message(codigo_operario, _result[1])
-    elif _result[0] == "ok_created":
-        await manager.send_message(codigo_operario, _result[1]["main_msg"])
-        # 8. Broadcast alerta
-        await manager.broadcast(_result[1]["broadcast_msg"], exclude=codigo_operario)
+    return _result
 
 
 async def handle_get_next_replenishment(
@@ -752,6 +1087,17 @@ async def handle_get_next_replenishment(
         codigo_operario: Operator code (for responses)
         data: {} (no input needed)
     """
+    _result = await run_db(_handle_get_next_replenishment_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_get_next_replenishment_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_get_next_replenishment. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     from ...secondary.database.orm import EAN as EANModel, ProductReference
     db = SessionLocal()
@@ -846,11 +1192,7 @@ async def handle_get_next_replenishment(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    else:
-        await manager.send_message(codigo_operario, _result[1])
+    return _result
 
 
 async def handle_scan_origin_location(
@@ -871,6 +1213,17 @@ async def handle_scan_origin_location(
         codigo_operario: Operator code (for responses)
         data: { request_id, location_code }
     """
+    _result = await run_db(_handle_scan_origin_location_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_scan_origin_location_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_scan_origin_location. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
     _result = None
@@ -944,11 +1297,7 @@ async def handle_scan_origin_location(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    else:
-        await manager.send_message(codigo_operario, _result[1])
+    return _result
 
 
 async def handle_scan_destination_location(
@@ -968,6 +1317,17 @@ async def handle_scan_destination_location(
         codigo_operario: Operator code (for responses)
         data: { request_id, location_code }
     """
+    _result = await run_db(_handle_scan_destination_location_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_scan_destination_location_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_scan_destination_location. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
     _result = None
@@ -1025,11 +1385,7 @@ async def handle_scan_destination_location(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    else:
-        await manager.send_message(codigo_operario, _result[1])
+    return _result
 
 
 async def handle_confirm_replenishment(
@@ -1049,6 +1405,17 @@ async def handle_confirm_replenishment(
         codigo_operario: Operator code (for responses)
         data: { request_id, ean, cantidad_servida }
     """
+    _result = await run_db(_handle_confirm_replenishment_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_confirm_replenishment_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_confirm_replenishment. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
     _result = None
@@ -1134,6 +1501,8 @@ async def handle_confirm_replenishment(
                     ))
 
                     db.commit()
+                    # El stock llegó a picking: reservar ya las líneas que esperaban este producto
+                    reservation_queue.notify_products([request.product_id])
 
                     print(f"✅ Reposición #{request.id} completada por operario {codigo_operario} - Cantidad: {cantidad_servida}")
 
@@ -1175,11 +1544,7 @@ async def handle_confirm_replenishment(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    else:
-        await manager.send_message(codigo_operario, _result[1])
+    return _result
 
 
 WAREHOUSE_NAMES = {
@@ -1194,7 +1559,8 @@ def _get_warehouse_name(almacen_id: int) -> str:
 
 def _find_location_by_code(db, location_code: str, product_id: int = None, active_only: bool = True):
     """
-    Busca ProductLocation por codigo_ubicacion (propiedad computada).
+    Busca ProductLocation por código de ubicación usando la columna
+    persistida e indexada ProductLocation.codigo.
     Si product_id se proporciona, filtra por ese producto.
     Retorna la primera coincidencia.
     """
@@ -1204,7 +1570,14 @@ def _find_location_by_code(db, location_code: str, product_id: int = None, activ
     if active_only:
         query = query.filter(ProductLocation.activa == True)
 
-    for loc in query.all():
+    location = query.filter(
+        ProductLocation.codigo == location_code
+    ).order_by(ProductLocation.id).first()
+    if location:
+        return location
+
+    # Fallback: filas antiguas aún sin código persistido (pendientes de backfill)
+    for loc in query.filter(ProductLocation.codigo == None).order_by(ProductLocation.id).all():
         if loc.codigo_ubicacion == location_code:
             return loc
     return None
@@ -1212,17 +1585,10 @@ def _find_location_by_code(db, location_code: str, product_id: int = None, activ
 
 def _find_any_location_by_code(db, location_code: str, active_only: bool = True):
     """
-    Busca cualquier ProductLocation activa por codigo_ubicacion.
+    Busca cualquier ProductLocation activa por código de ubicación.
     Retorna la primera coincidencia (sin filtro de producto).
     """
-    query = db.query(ProductLocation)
-    if active_only:
-        query = query.filter(ProductLocation.activa == True)
-
-    for loc in query.all():
-        if loc.codigo_ubicacion == location_code:
-            return loc
-    return None
+    return _find_location_by_code(db, location_code, active_only=active_only)
 
 
 async def handle_move_stock_scan_product(
@@ -1242,6 +1608,17 @@ async def handle_move_stock_scan_product(
         codigo_operario: Código del operario
         data: { ean }
     """
+    _result = await run_db(_handle_move_stock_scan_product_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_move_stock_scan_product_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_move_stock_scan_product. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     from ...secondary.database.orm import EAN as EANModel, ProductReference
     db = SessionLocal()
@@ -1311,11 +1688,7 @@ async def handle_move_stock_scan_product(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    else:
-        await manager.send_message(codigo_operario, _result[1])
+    return _result
 
 
 async def handle_move_stock_scan_origin(
@@ -1335,6 +1708,17 @@ async def handle_move_stock_scan_origin(
         codigo_operario: Código del operario
         data: { product_id, location_code }
     """
+    _result = await run_db(_handle_move_stock_scan_origin_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_move_stock_scan_origin_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_move_stock_scan_origin. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
     _result = None
@@ -1385,11 +1769,7 @@ async def handle_move_stock_scan_origin(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    else:
-        await manager.send_message(codigo_operario, _result[1])
+    return _result
 
 
 async def handle_move_stock_scan_destination(
@@ -1409,6 +1789,17 @@ async def handle_move_stock_scan_destination(
         codigo_operario: Código del operario
         data: { product_id, origin_location_id, location_code }
     """
+    _result = await run_db(_handle_move_stock_scan_destination_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_move_stock_scan_destination_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_move_stock_scan_destination. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
     _result = None
@@ -1481,11 +1872,7 @@ async def handle_move_stock_scan_destination(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    else:
-        await manager.send_message(codigo_operario, _result[1])
+    return _result
 
 
 async def handle_move_stock_confirm(
@@ -1506,6 +1893,17 @@ async def handle_move_stock_confirm(
         codigo_operario: Código del operario
         data: { product_id, origin_location_id, destination_location_code }
     """
+    _result = await run_db(_handle_move_stock_confirm_sync, operator_id, codigo_operario, data)
+
+    # All awaits happen after the DB work finished (off the event loop)
+    if _result[0] == "error":
+        await send_error(websocket, _result[1], _result[2])
+    else:
+        await manager.send_message(codigo_operario, _result[1])
+
+
+def _handle_move_stock_confirm_sync(operator_id: int, codigo_operario: str, data: dict):
+    """Parte síncrona (BD) de handle_move_stock_confirm. Se ejecuta en el pool de BD y retorna _result."""
     from ...secondary.database.config import SessionLocal
     db = SessionLocal()
     _result = None
@@ -1607,6 +2005,7 @@ async def handle_move_stock_confirm(
                         db.add(move_out)
                         db.add(move_in)
                         db.commit()
+                        reservation_queue.notify_products([product_id])
 
                         print(
                             f"✅ [MOVE] Operario {codigo_operario}: {cantidad} uds movidas "
@@ -1651,11 +2050,7 @@ async def handle_move_stock_confirm(
     finally:
         db.close()
 
-    # All awaits happen after db.close()
-    if _result[0] == "error":
-        await send_error(websocket, _result[1], _result[2])
-    else:
-        await manager.send_message(codigo_operario, _result[1])
+    return _result
 
 
 async def send_error(websocket: WebSocket, error_code: str, message: str):
@@ -2,65 +2,353 @@
 WebSocket para actualizaciones en tiempo real de órdenes.
 
 Permite a los clientes frontend suscribirse a cambios en órdenes
-sin necesidad de hacer polling constante.
+sin necesidad de hacer polling constante de GET /orders y /orders/stats/summary.
+
+Flujo:
+    1. Los routers, los handlers de PDA y el servicio B2B llaman a
+       orders_manager.emit(...) tras hacer commit. emit() es síncrono y
+       thread-safe (se usa desde endpoints sync y desde el pool de hilos de BD).
+    2. Los eventos de una misma orden se agrupan (coalescing) durante la
+       ventana ORDER_FEED_DEBOUNCE_MS: 30 escaneos seguidos generan un único
+       evento con los datos más recientes.
+    3. Al vaciar la ventana cada evento recibe un número de secuencia y un
+       cursor "{epoch}:{seq}", se guarda en un histórico circular y se encola
+       en la cola de salida acotada de cada cliente (ver manager.py).
+    4. Un cliente que reconecta con ?cursor=... recibe los eventos posteriores;
+       si el cursor ya no está en el histórico (o es de otro proceso) recibe
+       "resync_required" y debe recargar por REST.
+
+Con varios workers los eventos se propagan por el bus (canal propio) y cada
+nodo los numera en su propio histórico.
 """
 
-from typing import Dict, Set
-from fastapi import WebSocket, WebSocketDisconnect
-import json
+import asyncio
+import threading
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+
+from src.adapters.secondary.database.config import (
+    ORDER_FEED_DEBOUNCE_MS,
+    ORDER_FEED_HISTORY_SIZE,
+    WS_OUTBOUND_QUEUE_SIZE,
+    WS_OVERFLOW_POLICY,
+)
+from .bus import ORDERS_FEED_CHANNEL, MessageBus, create_bus
+from .manager import OutboundConnection, serialize_message
+
+router = APIRouter()
+
+# Tipos de evento emitidos. No hay evento de orden creada: las órdenes
+# entran por el ETL externo y el cargador CSV, que corren fuera del proceso
+# de la API (los dashboards las ven al recargar por REST).
+EVENT_ORDER_UPDATED = "order_updated"
+EVENT_STATUS_CHANGED = "status_changed"
+EVENT_OPERATOR_ASSIGNED = "operator_assigned"
+EVENT_PRIORITY_CHANGED = "priority_changed"
+EVENT_PICKING_STARTED = "picking_started"
+EVENT_PROGRESS = "progress"
+EVENT_PICKING_COMPLETED = "picking_completed"
 
 
 class OrdersConnectionManager:
     """
     Gestor de conexiones WebSocket para actualizaciones de órdenes.
-    
+
     Los clientes se suscriben y reciben actualizaciones cuando:
     - Se crea una nueva orden
     - Cambia el estado de una orden
     - Se asigna un operario
+    - Avanza el picking (escaneos)
     - Se completa el picking
     """
-    
-    def __init__(self):
-        # Set de conexiones activas
-        self.connections: Set[WebSocket] = set()
-    
-    async def connect(self, websocket: WebSocket):
-        """Conecta un cliente al WebSocket de órdenes."""
-        await websocket.accept()
-        self.connections.add(websocket)
-        print(f"✅ Cliente conectado a orders WebSocket (total: {len(self.connections)})")
-    
-    def disconnect(self, websocket: WebSocket):
-        """Desconecta un cliente del WebSocket."""
-        self.connections.discard(websocket)
-        print(f"❌ Cliente desconectado de orders WebSocket (total: {len(self.connections)})")
-    
+
+    def __init__(
+        self,
+        bus: Optional[MessageBus] = None,
+        debounce_ms: int = ORDER_FEED_DEBOUNCE_MS,
+        history_size: int = ORDER_FEED_HISTORY_SIZE,
+        max_queue: int = WS_OUTBOUND_QUEUE_SIZE,
+        overflow_policy: str = WS_OVERFLOW_POLICY,
+    ):
+        # Conexiones activas en este nodo: {id(websocket): OutboundConnection}
+        self.connections: Dict[int, OutboundConnection] = {}
+        self.bus = bus or create_bus(ORDERS_FEED_CHANNEL)
+        self.debounce = debounce_ms / 1000
+        self.max_queue = max_queue
+        self.overflow_policy = overflow_policy
+        # Identifica el histórico de este proceso: un cursor de otro epoch no es reanudable
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._history: deque = deque(maxlen=history_size)  # (seq, texto JSON)
+        # Eventos pendientes de la ventana actual: {order_id: evento agrupado}
+        self._pending: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        """Arranca la tarea de vaciado y la suscripción al bus (llamar en el arranque)."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop())
+        await self.bus.start(self._on_bus_message)
+
+    async def stop(self):
+        """Vacía los eventos pendientes y detiene la tarea de vaciado y los escritores."""
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        await self.bus.stop()
+        for conn in self.connections.values():
+            if conn.writer:
+                conn.writer.cancel()
+        self._loop = None
+
+    # ------------------------------------------------------------------
+    # Emisión (sync, thread-safe)
+    # ------------------------------------------------------------------
+
+    def emit(self, event_type: str, order_id: int, data: Optional[dict] = None):
+        """
+        Registra un cambio de una orden para el próximo envío.
+
+        Se puede llamar desde cualquier hilo. Los eventos de la misma orden
+        dentro de la ventana de debounce se agrupan: los datos se mezclan
+        (gana el valor más reciente) y se conserva la lista de tipos ocurridos.
+
+        Args:
+            event_type: Tipo de evento (status_changed, progress, etc.)
+            order_id: ID de la orden afectada
+            data: Campos actualizados de la orden (serializables a JSON)
+        """
+        if self._loop is None:
+            # Feed no iniciado (tests, scripts, crons fuera de la app): nadie escucha
+            return
+        with self._lock:
+            event = self._pending.get(order_id)
+            if event is None:
+                event = {"order_id": order_id, "events": [], "data": {}}
+                self._pending[order_id] = event
+            if event_type not in event["events"]:
+                event["events"].append(event_type)
+            event["type"] = event_type
+            if data:
+                event["data"].update(data)
+            event["timestamp"] = datetime.now().isoformat()
+        try:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        except RuntimeError:
+            # Event loop cerrado (apagado de la app)
+            pass
+
     async def broadcast_order_update(self, event_type: str, order_data: dict):
         """
         Envía actualización de orden a todos los clientes conectados.
-        
+
+        Args:
+            event_type: Tipo de evento (order_updated, status_changed, etc.)
+            order_data: Datos de la orden (debe incluir "id" u "order_id")
+        """
+        order_id = order_data.get("order_id", order_data.get("id"))
+        self.emit(event_type, order_id, order_data)
+
+    # ------------------------------------------------------------------
+    # Vaciado de la ventana y entrega
+    # ------------------------------------------------------------------
+
+    async def _flush_loop(self):
+        while True:
+            await self._wakeup.wait()
+            # Ventana de debounce: dejar que se acumulen los eventos de la ráfaga
+            await asyncio.sleep(self.debounce)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Error enviando eventos de órdenes: {e}")
+
+    async def flush(self):
+        """Envía ya los eventos pendientes (local + resto de nodos)."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for event in pending.values():
+            self._deliver(event)
+            try:
+                await self.bus.publish({"origin": self.bus.node_id, "message": event})
+            except Exception as e:
+                print(f"⚠️ Error publicando evento de orden en el bus: {e}")
+
+    async def _on_bus_message(self, envelope: dict):
+        """Entrega localmente un evento emitido en otro nodo."""
+        self._deliver(envelope.get("message") or {})
+
+    def _deliver(self, event: dict):
+        """Numera el evento, lo guarda en el histórico y lo encola a los clientes."""
+        self._seq += 1
+        message = dict(event, cursor=self.cursor)
+        text = serialize_message(message)
+        self._history.append((self._seq, text))
+        for key in list(self.connections):
+            self._enqueue(key, text)
+
+    @property
+    def cursor(self) -> str:
+        """Cursor del último evento entregado por este nodo."""
+        return f"{self.epoch}:{self._seq}"
+
+    def events_after(self, cursor: Optional[str]) -> Optional[List[str]]:
+        """
+        Eventos del histórico posteriores a un cursor.
+
+        Args:
+            cursor: Cursor "{epoch}:{seq}" recibido por el cliente
+
+        Returns:
+            Lista de mensajes serializados, o None si el cursor no es reanudable
+            (otro proceso, futuro o ya fuera del histórico)
+        """
+        try:
+            epoch, seq_text = (cursor or "").split(":", 1)
+            seq = int(seq_text)
+        except ValueError:
+            return None
+        if epoch != self.epoch or seq > self._seq:
+            return None
+        oldest = self._history[0][0] if self._history else self._seq + 1
+        if seq < oldest - 1:
+            return None
+        return [text for s, text in self._history if s > seq]
+
+    # ------------------------------------------------------------------
+    # Conexiones
+    # ------------------------------------------------------------------
+
+    async def connect(self, websocket: WebSocket, cursor: Optional[str] = None):
+        """
+        Conecta un cliente al WebSocket de órdenes.
+
         Args:
-            event_type: Tipo de evento (order_created, order_updated, status_changed, etc.)
-            order_data: Datos de la orden
+            websocket: Instancia de WebSocket
+            cursor: Último cursor recibido (reconexión) o None (suscripción nueva)
         """
-        message = {
-            "type": event_type,
-            "data": order_data
-        }
-        
-        disconnected = []
-        for connection in self.connections:
+        await websocket.accept()
+        conn = OutboundConnection(websocket, self.max_queue, self.overflow_policy)
+        key = id(websocket)
+        conn.writer = asyncio.create_task(self._writer(key, conn))
+        self.connections[key] = conn
+
+        # Registro + replay sin ceder el event loop: ningún evento queda entre medias
+        if cursor is None:
+            conn.enqueue(serialize_message({"type": "subscribed", "cursor": self.cursor}))
+        else:
+            replay = self.events_after(cursor)
+            if replay is None or len(replay) >= self.max_queue:
+                conn.enqueue(serialize_message({"type": "resync_required", "cursor": self.cursor}))
+            else:
+                for text in replay:
+                    conn.enqueue(text)
+        print(f"✅ Cliente conectado a orders WebSocket (total: {len(self.connections)})")
+
+    def disconnect(self, websocket: WebSocket):
+        """Desconecta un cliente del WebSocket."""
+        conn = self.connections.pop(id(websocket), None)
+        if conn is None:
+            return
+        if conn.writer and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        print(f"❌ Cliente desconectado de orders WebSocket (total: {len(self.connections)})")
+
+    def _enqueue(self, key: int, text: str):
+        conn = self.connections.get(key)
+        if conn and not conn.enqueue(text):
+            print("⚠️ Cliente de orders WebSocket lento, desconectando")
+            self.disconnect(conn.websocket)
+            asyncio.create_task(self._close_socket(conn.websocket))
+
+    async def _writer(self, key: int, conn: OutboundConnection):
+        """Tarea escritora: vacía la cola de un cliente en orden."""
+        while True:
+            text = await conn.queue.get()
             try:
-                await connection.send_json(message)
+                await conn.websocket.send_text(text)
             except Exception as e:
                 print(f"Error enviando actualización a cliente: {e}")
-                disconnected.append(connection)
-        
-        # Limpiar conexiones caídas
-        for connection in disconnected:
-            self.disconnect(connection)
+                if self.connections.get(key) is conn:
+                    self.disconnect(conn.websocket)
+                return
+            finally:
+                conn.queue.task_done()
+
+    async def drain(self):
+        """Espera a que se vacíen las colas de salida de todos los clientes."""
+        for conn in list(self.connections.values()):
+            await conn.queue.join()
+
+    @staticmethod
+    async def _close_socket(websocket: WebSocket):
+        try:
+            await websocket.close(code=1013, reason="Consumidor lento")
+        except Exception:
+            pass
 
 
 # Instancia global del manager
 orders_manager = OrdersConnectionManager()
+
+
+def order_event_data(order, **extra) -> dict:
+    """
+    Campos de una orden que se envían en los eventos del feed.
+
+    Args:
+        order: Instancia de Order (con status cargable)
+        **extra: Campos adicionales (ej: items_completados, progreso)
+
+    Returns:
+        Diccionario serializable a JSON
+    """
+    data = {
+        "numero_orden": order.numero_orden,
+        "status_id": order.status_id,
+        "estado_codigo": order.status.codigo if order.status else None,
+        "operator_id": order.operator_id,
+        "prioridad": order.prioridad,
+    }
+    data.update(extra)
+    return data
+
+
+@router.websocket("/ws/orders/events")
+async def orders_events_endpoint(
+    websocket: WebSocket,
+    cursor: Optional[str] = Query(None, description="Último cursor recibido para reanudar"),
+):
+    """
+    Feed de cambios de órdenes para dashboards.
+
+    **Mensajes enviados:**
+    - `{"type": "subscribed", "cursor": ...}` al conectar sin cursor
+    - `{"type": "resync_required", "cursor": ...}` si el cursor no es reanudable
+    - `{"type": <evento>, "events": [...], "order_id": ..., "data": {...}, "cursor": ..., "timestamp": ...}`
+
+    El cliente guarda el último `cursor` y lo envía al reconectar.
+    """
+    await orders_manager.connect(websocket, cursor)
+    try:
+        while True:
+            # Los clientes solo escuchan; se lee para detectar la desconexión
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        orders_manager.disconnect(websocket)
@@ -3,6 +3,7 @@ from sqlalchemy.orm import sessionmaker, declarative_base
 import urllib
 import os
 import logging
+import tempfile
 from dotenv import load_dotenv
 
 # Configurar logger
@@ -32,6 +33,110 @@ ALMACEN_REPOSICION_ID = int(os.getenv('ALMACEN_REPOSICION_ID', '3'))  # Zona de
 CRON_INTERVAL_MINUTES = int(os.getenv('CRON_INTERVAL_MINUTES', '10'))  # Frecuencia de ejecución de crons
 SYSTEM_OPERATOR_CODE = os.getenv('SYSTEM_OPERATOR_CODE', 'SYSTEM')  # Código del operador sistema
 
+# Cron de reservas incremental: solo revisa órdenes/productos cambiados desde la
+# última pasada; cada STOCK_CRON_FULL_INTERVAL_MINUTES hace una pasada completa
+STOCK_CRON_INCREMENTAL = os.getenv('STOCK_CRON_INCREMENTAL', 'true').lower() in ('1', 'true', 'yes')
+STOCK_CRON_FULL_INTERVAL_MINUTES = int(os.getenv('STOCK_CRON_FULL_INTERVAL_MINUTES', '60'))
+# Solape al leer cambios (relojes de distintos servidores, transacciones largas)
+STOCK_CRON_WATERMARK_OVERLAP_SECONDS = int(os.getenv('STOCK_CRON_WATERMARK_OVERLAP_SECONDS', '120'))
+
+# Reserva particionada por producto (product_id % STOCK_CRON_PARTITIONS): cada
+# partición tiene su propio sp_getapplock y su propia transacción corta, y se
+# procesan en paralelo con STOCK_CRON_WORKERS hilos. Debe ser igual en todos los workers.
+STOCK_CRON_PARTITIONS = max(1, int(os.getenv('STOCK_CRON_PARTITIONS', '8')))
+STOCK_CRON_WORKERS = max(1, int(os.getenv('STOCK_CRON_WORKERS', '4')))
+# Las ubicaciones libres de picking son compartidas entre particiones: su
+# asignación se serializa con otro sp_getapplock, que se espera hasta este tiempo
+STOCK_CRON_SLOT_LOCK_TIMEOUT_MS = int(os.getenv('STOCK_CRON_SLOT_LOCK_TIMEOUT_MS', '10000'))
+
+# Políticas del motor de asignación de reservas (services/reservation_allocation.py):
+# orden de servicio "priority" | "fifo" y elección de ubicación "largest_first" | "fewest_locations"
+STOCK_RESERVATION_ORDER_POLICY = os.getenv('STOCK_RESERVATION_ORDER_POLICY', 'priority').lower()
+STOCK_RESERVATION_LOCATION_POLICY = os.getenv('STOCK_RESERVATION_LOCATION_POLICY', 'largest_first').lower()
+
+# Dónde corren las tareas programadas: "embedded" (scheduler en cada worker de
+# uvicorn) o "worker" (solo en el proceso dedicado: python -m src.worker)
+SCHEDULER_MODE = os.getenv('SCHEDULER_MODE', 'embedded').lower()
+# Worker dedicado: reintento de elección de líder y puerto de métricas (0 = sin servidor)
+WORKER_LEADER_RETRY_SECONDS = int(os.getenv('WORKER_LEADER_RETRY_SECONDS', '15'))
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', '9100'))
+
+# Reconciliación de los contadores almacenados de órdenes (total_items,
+# items_completados, total_lineas, lineas_completadas) contra order_lines
+ORDER_COUNTERS_RECONCILE_MINUTES = int(os.getenv('ORDER_COUNTERS_RECONCILE_MINUTES', '5'))
+
+# Reconciliación de product_stock_summary (totales de stock por producto y
+# almacén) contra product_locations
+STOCK_SUMMARY_RECONCILE_MINUTES = int(os.getenv('STOCK_SUMMARY_RECONCILE_MINUTES', '30'))
+
+# Reserva por eventos (reposición completada, stock movido, líneas nuevas...):
+# agrupa los productos afectados durante la ventana y reserva solo esos
+RESERVATION_QUEUE_ENABLED = os.getenv('RESERVATION_QUEUE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RESERVATION_QUEUE_DEBOUNCE_SECONDS = float(os.getenv('RESERVATION_QUEUE_DEBOUNCE_SECONDS', '5'))
+
+# Pool de conexiones de la BD principal
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '20'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+# executemany nativo de pyodbc (un round trip por lote en vez de por fila) para
+# las escrituras en bloque de stock (ver services/stock_bulk_writer.py)
+DB_FAST_EXECUTEMANY = os.getenv('DB_FAST_EXECUTEMANY', 'true').lower() in ('1', 'true', 'yes')
+
+# Hilos dedicados al trabajo de BD de los WebSocket de PDA.
+# Se limita a DB_POOL_SIZE para que HTTP y crons siempre tengan conexiones libres.
+WS_DB_WORKERS = min(int(os.getenv('WS_DB_WORKERS', '10')), DB_POOL_SIZE)
+
+# Bus entre workers para los WebSocket de operarios: "memory" (un solo proceso) o "redis"
+WS_BUS_BACKEND = os.getenv('WS_BUS_BACKEND', 'memory').lower()
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+# Cola de salida por conexión WebSocket: tamaño y política si se llena
+# ("drop_oldest" descarta el mensaje más antiguo, "disconnect" cierra al consumidor lento)
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv('WS_OUTBOUND_QUEUE_SIZE', '100'))
+WS_OVERFLOW_POLICY = os.getenv('WS_OVERFLOW_POLICY', 'drop_oldest').lower()
+
+# Feed de cambios de órdenes (/ws/orders/events): ventana de agrupación de eventos
+# por orden y nº de eventos recientes que se guardan para reanudar con cursor
+ORDER_FEED_DEBOUNCE_MS = int(os.getenv('ORDER_FEED_DEBOUNCE_MS', '500'))
+ORDER_FEED_HISTORY_SIZE = int(os.getenv('ORDER_FEED_HISTORY_SIZE', '1000'))
+
+# Listados paginados con count=estimate: tope del COUNT(*) acotado
+PAGINATION_COUNT_CAP = int(os.getenv('PAGINATION_COUNT_CAP', '10000'))
+
+# Contadores del dashboard en memoria: antigüedad máxima antes de reconciliarlos
+# con las tablas origen (recoge escrituras de otros procesos y del ETL)
+DASHBOARD_COUNTERS_MAX_AGE_SECONDS = int(os.getenv('DASHBOARD_COUNTERS_MAX_AGE_SECONDS', '60'))
+
+# Geometría del almacén para el cálculo de rutas de picking (pasillos paralelos
+# con pasillo transversal delante y detrás; la salida está delante del primer pasillo)
+PICKING_AISLE_PITCH_M = float(os.getenv('PICKING_AISLE_PITCH_M', '3.0'))  # Entre ejes de pasillos contiguos
+PICKING_SLOT_WIDTH_M = float(os.getenv('PICKING_SLOT_WIDTH_M', '1.2'))  # Ancho de una ubicación a lo largo del pasillo
+PICKING_CROSS_AISLE_M = float(os.getenv('PICKING_CROSS_AISLE_M', '1.5'))  # Fondo de cada pasillo transversal
+PICKING_WALK_SPEED_MPS = float(os.getenv('PICKING_WALK_SPEED_MPS', '1.0'))
+PICKING_SECONDS_PER_PICK = float(os.getenv('PICKING_SECONDS_PER_PICK', '12'))
+PICKING_SECONDS_PER_LEVEL = float(os.getenv('PICKING_SECONDS_PER_LEVEL', '4'))  # Extra por nivel por encima de altura 1
+WAREHOUSE_LAYOUT_TTL_SECONDS = int(os.getenv('WAREHOUSE_LAYOUT_TTL_SECONDS', '300'))
+
+# Matriz de distancias precalculada entre huecos (pasillo, ubicacion) del almacén:
+# directorio de los ficheros (uno por almacén, abiertos con mmap y compartidos entre workers)
+DISTANCE_MATRIX_DIR = os.getenv('DISTANCE_MATRIX_DIR', os.path.join(tempfile.gettempdir(), 's4t_sms_distance_matrix'))
+
+# Picking por oleadas: capacidad del carro (cubetas = órdenes y unidades totales),
+# tamaño máximo de una orden para agruparla y afinidad mínima de ubicaciones (0..1)
+WAVE_MAX_ORDERS = int(os.getenv('WAVE_MAX_ORDERS', '8'))
+WAVE_MAX_UNITS = int(os.getenv('WAVE_MAX_UNITS', '120'))
+WAVE_MAX_ORDER_UNITS = int(os.getenv('WAVE_MAX_ORDER_UNITS', '30'))
+WAVE_MIN_AFFINITY = float(os.getenv('WAVE_MIN_AFFINITY', '0.0'))
+
+# Slotting por rotación: asignar ubicaciones libres de picking según la rotación
+# del producto (los más rápidos a las más accesibles) y caché de las rotaciones
+SLOTTING_PREFERRED_SLOTS = os.getenv('SLOTTING_PREFERRED_SLOTS', 'true').lower() in ('1', 'true', 'yes')
+SLOTTING_VELOCITY_TTL_SECONDS = int(os.getenv('SLOTTING_VELOCITY_TTL_SECONDS', '3600'))
+
+# Índice de búsqueda de productos en memoria (GET /products?search=): activarlo
+# y antigüedad máxima antes de reconstruirlo en segundo plano
+PRODUCT_SEARCH_INDEX_ENABLED = os.getenv('PRODUCT_SEARCH_INDEX_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PRODUCT_SEARCH_MAX_AGE_SECONDS = int(os.getenv('PRODUCT_SEARCH_MAX_AGE_SECONDS', '900'))
+
 # Log de configuración cargada (sin información sensible)
 logger.info("=" * 60)
 logger.info("📋 Configuración de Base de Datos y Almacenes")
@@ -47,6 +152,10 @@ logger.info("")
 logger.info("⚙️  Configuración de Servicios Cron")
 logger.info(f"   ⏰ Intervalo Cron: {CRON_INTERVAL_MINUTES} minuto(s)")
 logger.info(f"   🤖 Operador Sistema: {SYSTEM_OPERATOR_CODE}")
+logger.info(f"   🗓️  Tareas programadas: {SCHEDULER_MODE}")
+logger.info(f"   🔁 Cron reservas: {'incremental' if STOCK_CRON_INCREMENTAL else 'completo'} (pasada completa cada {STOCK_CRON_FULL_INTERVAL_MINUTES} min, {STOCK_CRON_PARTITIONS} particiones / {STOCK_CRON_WORKERS} hilos)")
+logger.info(f"   🔌 Pool BD: {DB_POOL_SIZE} (+{DB_MAX_OVERFLOW} overflow) — hilos WS: {WS_DB_WORKERS}")
+logger.info(f"   📡 Bus WebSocket: {WS_BUS_BACKEND}")
 logger.info("=" * 60)
 # Try ODBC Driver 18 (default for Ubuntu 22.04+), fall back manually if needed
 DRIVER = '{ODBC Driver 18 for SQL Server}'
@@ -58,12 +167,13 @@ DATABASE_URL = f"mssql+pyodbc:///?odbc_connect={params}"
 
 engine = create_engine(
     DATABASE_URL,
-    pool_size=20,
-    max_overflow=20,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
     pool_timeout=30,
     pool_recycle=1800,
     pool_pre_ping=True,
     pool_use_lifo=True,
+    fast_executemany=DB_FAST_EXECUTEMANY,
     echo=False
 )
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
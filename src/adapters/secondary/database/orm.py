@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Float, Boolean, Text, DateTime, Date, ForeignKey, ForeignKeyConstraint, JSON, UniqueConstraint, Index, func, select
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime, timezone
@@ -238,9 +239,31 @@ class Order(Base):
         index=True
     )
     
-    # === CONTADORES (calculados dinámicamente) ===
-    # NOTA: total_items e items_completados ahora son propiedades calculadas
-    # Se definen como @hybrid_property después de las relationships
+    # === CONTADORES (almacenados) ===
+    # Agregados de order_lines guardados en la orden para que los listados y
+    # las respuestas de escaneo lean una sola fila por orden. Los mantienen las
+    # rutas de escritura (escaneo, reset de línea, actualizaciones B2B) y un job
+    # de reconciliación (ver services/order_counters_service.py).
+
+    # Total de UNIDADES solicitadas (suma de cantidad_solicitada)
+    # Ejemplo: 3 líneas con cantidades [5, 10, 3] = total_items: 18
+    total_items = Column(Integer, default=0, nullable=False)
+
+    # UNIDADES servidas hasta ahora (suma de cantidad_servida)
+    # Permite calcular progreso rápidamente: items_completados/total_items * 100
+    items_completados = Column(Integer, default=0, nullable=False)
+
+    # Número de líneas y líneas completas (cantidad_servida >= cantidad_solicitada)
+    total_lineas = Column(Integer, default=0, nullable=False)
+    lineas_completadas = Column(Integer, default=0, nullable=False)
+
+    # === PICKING POR OLEADAS ===
+    # Oleada multi-orden en la que se está recogiendo la orden junto con otras
+    # del mismo operario (ver services/wave_picking_service.py).
+    # NULL = picking individual
+    wave_id = Column(String(36), nullable=True, index=True)
+    # Cubeta del carro asignada a la orden dentro de la oleada (1..N)
+    wave_tote = Column(Integer, nullable=True)
     
     # === METADATOS ===
     # Notas o comentarios adicionales sobre la orden
@@ -270,55 +293,10 @@ class Order(Base):
         Index('idx_status_operator', 'status_id', 'operator_id'),
         Index('idx_status_fecha', 'status_id', 'fecha_orden'),
         Index('idx_fecha_importacion', 'fecha_importacion'),
+        # Cambios desde la última pasada del cron incremental de reservas
+        Index('idx_order_updated_at', 'updated_at'),
     )
 
-    # === PROPIEDADES CALCULADAS DINÁMICAMENTE ===
-    
-    @hybrid_property
-    def total_items(self):
-        """
-        Total de UNIDADES solicitadas en la orden (suma de cantidad_solicitada de todas las líneas).
-        Calculado dinámicamente desde order_lines.
-        
-        Ejemplo: 3 líneas con cantidades [5, 10, 3] = total_items: 18
-        """
-        if not self.order_lines:
-            return 0
-        return sum(line.cantidad_solicitada for line in self.order_lines)
-    
-    @total_items.expression
-    def total_items(cls):
-        """Expresión SQL para usar en queries con total_items."""
-        return (
-            select(func.coalesce(func.sum(OrderLine.cantidad_solicitada), 0))
-            .where(OrderLine.order_id == cls.id)
-            .correlate_except(OrderLine)
-            .scalar_subquery()
-        )
-    
-    @hybrid_property
-    def items_completados(self):
-        """
-        Cuántas UNIDADES han sido servidas hasta ahora (suma de cantidad_servida de todas las líneas).
-        Calculado dinámicamente desde order_lines.
-        
-        Ejemplo: 3 líneas con cantidades servidas [5, 7, 3] = items_completados: 15
-        Permite calcular progreso rápidamente: items_completados/total_items * 100
-        """
-        if not self.order_lines:
-            return 0
-        return sum(line.cantidad_servida for line in self.order_lines)
-    
-    @items_completados.expression
-    def items_completados(cls):
-        """Expresión SQL para usar en queries con items_completados."""
-        return (
-            select(func.coalesce(func.sum(OrderLine.cantidad_servida), 0))
-            .where(OrderLine.order_id == cls.id)
-            .correlate_except(OrderLine)
-            .scalar_subquery()
-        )
-
 
 class PackingBox(Base):
     """
@@ -577,6 +555,7 @@ class OrderLine(Base):
 
     __table_args__ = (
         Index('idx_order_estado', 'order_id', 'estado'),
+        Index('idx_order_line_updated_at', 'updated_at'),
     )
 
 
@@ -961,6 +940,25 @@ class Almacen(Base):
     orders = relationship("Order", back_populates="almacen")
 
 
+def build_location_code(pasillo, lado, ubicacion, altura) -> str:
+    """
+    Construye el código legible de una ubicación ("A-IZQ-12-H2").
+
+    Es la única fuente del formato: la usan ProductLocation.codigo_ubicacion
+    y el listener que mantiene la columna persistida ProductLocation.codigo.
+    """
+    parts = []
+    if pasillo:
+        parts.append(pasillo)
+    if lado:
+        parts.append(lado[:3].upper())  # IZQ, DER
+    if ubicacion:
+        parts.append(ubicacion)
+    if altura:
+        parts.append(f"H{altura}")
+    return "-".join(parts) if parts else "SIN-UBICACION"
+
+
 class ProductLocation(Base):
     """
     Ubicaciones físicas de productos en el almacén.
@@ -1013,6 +1011,12 @@ class ProductLocation(Base):
     # 1 = Nivel más bajo (fácil acceso)
     # 5 = Nivel más alto (requiere escalera/elevador)
     altura = Column(Integer, nullable=True, index=True)
+
+    # Código legible persistido ("A-IZQ-12-H2"), mismo formato que codigo_ubicacion.
+    # Se recalcula automáticamente en before_insert/before_update (ver listeners abajo)
+    # para que los escaneos de la PDA resuelvan la ubicación con un lookup indexado.
+    # NULL solo en filas antiguas pendientes de backfill_location_codes().
+    codigo = Column(String(60), nullable=True)
     
     # === GESTIÓN DE STOCK ===
     
@@ -1067,6 +1071,10 @@ class ProductLocation(Base):
         Index('idx_stock_bajo', 'stock_actual', 'stock_minimo'),
         # Índice para ubicaciones activas con prioridad
         Index('idx_activa_prioridad', 'activa', 'prioridad'),
+        # Índice para resolver escaneos por código de ubicación
+        Index('idx_location_codigo', 'codigo', 'activa'),
+        # Cambios de stock por almacén (cron incremental de reservas)
+        Index('idx_location_almacen_updated', 'almacen_id', 'updated_at'),
         # Una posición física + producto solo puede existir una vez por almacén
         UniqueConstraint('almacen_id', 'product_id', 'pasillo', 'lado', 'ubicacion', 'altura', 
                         name='uq_slot_location'),
@@ -1075,16 +1083,7 @@ class ProductLocation(Base):
     @property
     def codigo_ubicacion(self):
         """Genera código legible de la ubicación completa"""
-        parts = []
-        if self.pasillo:
-            parts.append(self.pasillo)
-        if self.lado:
-            parts.append(self.lado[:3].upper())  # IZQ, DER
-        if self.ubicacion:
-            parts.append(self.ubicacion)
-        if self.altura:
-            parts.append(f"H{self.altura}")
-        return "-".join(parts) if parts else "SIN-UBICACION"
+        return build_location_code(self.pasillo, self.lado, self.ubicacion, self.altura)
     
     @property
     def stock_disponible(self):
@@ -1132,6 +1131,38 @@ class ProductLocation(Base):
         return not has_active_request
 
 
+@event.listens_for(ProductLocation, "before_insert")
+@event.listens_for(ProductLocation, "before_update")
+def _sync_location_codigo(mapper, connection, target):
+    """Mantiene ProductLocation.codigo sincronizado con pasillo/lado/ubicacion/altura."""
+    target.codigo = target.codigo_ubicacion
+
+
+class ProductStockSummary(Base):
+    """
+    Totales de stock materializados por producto y almacén.
+
+    Suma de las ubicaciones activas de product_locations; la mantiene
+    src/services/stock_summary_service.py en la misma transacción que cada
+    cambio de stock, y una tarea periódica corrige cualquier deriva.
+    """
+    __tablename__ = "product_stock_summary"
+
+    product_id = Column(Integer, ForeignKey("product_references.id", ondelete="CASCADE"), primary_key=True)
+    almacen_id = Column(Integer, ForeignKey("almacenes.id", ondelete="CASCADE"), primary_key=True)
+    stock_actual = Column(Integer, default=0, nullable=False)
+    stock_reservado = Column(Integer, default=0, nullable=False)
+    # Ubicaciones activas del producto en el almacén
+    num_ubicaciones = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        # Filtros de estado por stock (listado de productos) como rango indexado
+        Index('idx_stock_summary_almacen_stock', 'almacen_id', 'stock_actual'),
+        Index('idx_stock_summary_stock', 'stock_actual'),
+    )
+
+
 class ReplenishmentRequest(Base):
     """
     Stock replenishment requests between locations.
@@ -1188,6 +1219,7 @@ class ReplenishmentRequest(Base):
         Index('idx_status_priority_date', 'status', 'priority', 'requested_at'),
         Index('idx_product_destination', 'product_id', 'location_destino_id'),
         Index('idx_requester_status', 'requester_id', 'status'),
+        Index('idx_replenishment_completed_at', 'completed_at'),
     )
     
     def __repr__(self):
@@ -1433,6 +1465,27 @@ class StockMovement(Base):
     )
 
 
+class CronWatermark(Base):
+    """
+    Marca de agua (high-water mark) de los procesos programados.
+
+    Guarda hasta qué instante ha procesado cambios cada job, para que la
+    siguiente ejecución solo revise lo modificado desde entonces. Se comparte
+    entre workers (el job ya se serializa con sp_getapplock).
+    """
+    __tablename__ = "cron_watermarks"
+
+    job_name = Column(String(100), primary_key=True)
+    # Instante (UTC) hasta el que se procesaron cambios
+    watermark = Column(DateTime, nullable=True)
+    # Última pasada completa (red de seguridad del modo incremental)
+    last_full_run = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<CronWatermark {self.job_name} {self.watermark}>"
+
+
 # ============================================================
 # PACKING PRO - Supplier merchandise reception
 # ============================================================
@@ -14,6 +14,7 @@ from src.adapters.secondary.database.config import get_db, get_db_koroshi
 from src.adapters.secondary.database.orm import Customer, EAN, ProductReference as ProductReferenceORM, StockSemanaTotal
 from sqlalchemy import func as sa_func
 from src.api_service.auth import verify_customer_api_key
+from src.services.pagination import COUNT_PATTERN
 from src.api_service.schemas import (
     OrderListItem,
     OrdersListResponse,
@@ -80,6 +81,8 @@ def list_b2b_orders(
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=500, description="Max records to return"),
     viewed: Optional[bool] = Query(None, description="Filter by view status: true=viewed, false=not viewed, null=all"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (skip is ignored when set)"),
+    count: str = Query("exact", pattern=COUNT_PATTERN, description="Total count: exact, estimate (capped) or none"),
     customer: Customer = Depends(verify_customer_api_key),
     db: Session = Depends(get_db)
 ):
@@ -91,7 +94,9 @@ def list_b2b_orders(
     
     **Authentication:** Requires X-Api-Key header
     
-    **Pagination:** Use skip and limit parameters
+    **Pagination:** Use skip and limit parameters, or pass `next_cursor`
+    from the previous response as `cursor` (stable while orders are marked
+    as viewed). `count=none` skips the total count.
     
     **Filters:** Use viewed parameter to filter by view status
     
@@ -118,7 +123,7 @@ def list_b2b_orders(
     }
     ```
     """
-    return get_customer_b2b_orders(customer, db, skip, limit, viewed)
+    return get_customer_b2b_orders(customer, db, skip, limit, viewed, cursor, count)
 
 
 @router.get("/orders/b2c", response_model=OrdersListResponse, tags=["Orders"])
@@ -126,6 +131,8 @@ def list_b2c_orders(
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=500, description="Max records to return"),
     viewed: Optional[bool] = Query(None, description="Filter by view status: true=viewed, false=not viewed, null=all"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page (skip is ignored when set)"),
+    count: str = Query("exact", pattern=COUNT_PATTERN, description="Total count: exact, estimate (capped) or none"),
     customer: Customer = Depends(verify_customer_api_key),
     db: Session = Depends(get_db)
 ):
@@ -137,7 +144,9 @@ def list_b2c_orders(
     
     **Authentication:** Requires X-Api-Key header
     
-    **Pagination:** Use skip and limit parameters
+    **Pagination:** Use skip and limit parameters, or pass `next_cursor`
+    from the previous response as `cursor` (stable while orders are marked
+    as viewed). `count=none` skips the total count.
     
     **Filters:** Use viewed parameter to filter by view status
     
@@ -164,7 +173,7 @@ def list_b2c_orders(
     }
     ```
     """
-    return get_customer_b2c_orders(customer, db, skip, limit, viewed)
+    return get_customer_b2c_orders(customer, db, skip, limit, viewed, cursor, count)
 
 
 @router.get(
@@ -633,6 +642,8 @@ def get_stock_weekly(
     week: Optional[str] = Query(None, description="Filtrar por semana, p.ej. '10'"),
     almacen_id: Optional[str] = Query(None, description="Filtrar por almacén"),
     articulo_id: Optional[str] = Query(None, description="Filtrar por artículo"),
+    cursor: Optional[str] = Query(None, description="next_cursor de la página anterior (skip se ignora)"),
+    count: str = Query("exact", pattern=COUNT_PATTERN, description="Conteo total: exact, estimate (acotado) o none"),
     customer: Customer = Depends(verify_customer_api_key),
     db: Session = Depends(get_db_koroshi),
 ):
@@ -649,7 +660,9 @@ def get_stock_weekly(
     | `almacen_id` | Código de almacén |
     | `articulo_id` | Código de artículo |
 
-    **Paginación:** `skip` / `limit` (máximo 5000 por llamada)
+    **Paginación:** `skip` / `limit` (máximo 5000 por llamada), o por cursor:
+    pasar `next_cursor` de la respuesta anterior en `cursor` (null = última
+    página). `count=none` omite el conteo total.
 
     **Authentication:** Requires `X-Api-Key` header.
 
@@ -687,6 +700,8 @@ def get_stock_weekly(
         week=week,
         almacen_id=almacen_id,
         articulo_id=articulo_id,
+        cursor=cursor,
+        count=count,
     )
 
 
@@ -58,7 +58,9 @@ class OrderListItem(BaseModel):
 
 class OrdersListResponse(BaseModel):
     """Paginated response for orders list"""
-    total_count: int
+    total_count: Optional[int] = Field(None, description="Total matching orders (null when count=none)")
+    total_is_estimate: bool = Field(False, description="True when total_count is a capped lower bound (count=estimate)")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (null on the last page)")
     skip: int
     limit: int
     orders: List[OrderListItem]
@@ -441,7 +443,9 @@ class StockSemanaItem(BaseModel):
 class StockSemanaListResponse(BaseModel):
     """Paginated response for weekly stock"""
     year: str
-    total_count: int
+    total_count: Optional[int] = Field(None, description="Total matching rows (null when count=none)")
+    total_is_estimate: bool = Field(False, description="True when total_count is a capped lower bound (count=estimate)")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page (null on the last page)")
     skip: int
     limit: int
     items: List[StockSemanaItem]
@@ -39,6 +39,14 @@ from src.adapters.secondary.database.orm import (
     PackingPro, PackingProLine, XpoExpedicion, Client, APIBoxValidation, APIBoxValidationLine, StockSemanaTotal
 )
 from src.api_service.auth import get_customer_almacenes, verify_warehouse_access
+from src.services.reservation_queue_service import reservation_queue
+from src.services.order_counters_service import refresh_order_counters
+from src.services.pagination import paginate
+from src.adapters.primary.websocket.orders_websocket import (
+    orders_manager,
+    EVENT_ORDER_UPDATED,
+    EVENT_STATUS_CHANGED,
+)
 from src.api_service.schemas import (
     OrderListItem, OrderLineSimple, OrderLinesResponse, UpdateOrderResponse,
     OrdersListResponse, OrderLineUpdate, BatchUpdateOrderResponse, RegisterStockRequest, RegisterStockResponse,
@@ -55,13 +63,24 @@ logger = logging.getLogger(__name__)
 # External API configuration
 EXTERNAL_API_KEY = os.getenv('EXTERNAL_API_KEY', 'T3sT3')
 
+# Keyset sort keys for the paginated lists (newest first, unique tie-breaker last)
+CUSTOMER_ORDER_KEYS = [(Order.created_at, True), (Order.id, True)]
+STOCK_SEMANA_KEYS = [
+    (StockSemanaTotal.fldWeek, False),
+    (StockSemanaTotal.fldIdAlmacen, False),
+    (StockSemanaTotal.fldIdArticulo, False),
+    (StockSemanaTotal.fldIdColor, False),
+]
+
 
 def get_customer_b2b_orders(
     customer: Customer,
     db: Session,
     skip: int = 0,
     limit: int = 100,
-    viewed: Optional[bool] = False
+    viewed: Optional[bool] = False,
+    cursor: Optional[str] = None,
+    count: str = "exact",
 ) -> OrdersListResponse:
     """
     Get B2B orders for customer filtered by assigned warehouses.
@@ -73,6 +92,8 @@ def get_customer_b2b_orders(
         skip: Pagination offset
         limit: Max results to return
         viewed: Optional filter by view status (True=viewed, False=not viewed, None=all)
+        cursor: Keyset cursor from the previous page (skip is ignored when set)
+        count: Total count mode: exact, estimate (capped) or none
         
     Returns:
         OrdersListResponse with pagination metadata
@@ -109,11 +130,10 @@ def get_customer_b2b_orders(
             # Only not viewed orders (customer_viewed_at IS NULL)
             base_query = base_query.filter(Order.customer_viewed_at.is_(None))
     
-    # Get total count with filters applied
-    total_count = base_query.count()
-    
-    # Get orders with pagination
-    orders = base_query.order_by(Order.created_at.desc()).offset(skip).limit(limit).all()
+    # Optional total count and page (offset or keyset cursor, newest first).
+    # The cursor keeps pages stable while orders drop out of viewed=false.
+    page = paginate(base_query, CUSTOMER_ORDER_KEYS, limit=limit, skip=skip, cursor=cursor, count=count)
+    orders = page.rows
     
     # Update customer_viewed_at timestamp only on first view (if NULL)
     now = datetime.utcnow()
@@ -146,7 +166,9 @@ def get_customer_b2b_orders(
         orders_with_lines.append(order_dict)
 
     return OrdersListResponse(
-        total_count=total_count,
+        total_count=page.total,
+        total_is_estimate=page.total_is_estimate,
+        next_cursor=page.next_cursor,
         skip=skip,
         limit=limit,
         orders=orders_with_lines
@@ -158,7 +180,9 @@ def get_customer_b2c_orders(
     db: Session,
     skip: int = 0,
     limit: int = 100,
-    viewed: Optional[bool] = False
+    viewed: Optional[bool] = False,
+    cursor: Optional[str] = None,
+    count: str = "exact",
 ) -> OrdersListResponse:
     """
     Get B2C orders for customer filtered by assigned warehouses.
@@ -170,6 +194,8 @@ def get_customer_b2c_orders(
         skip: Pagination offset
         limit: Max results to return
         viewed: Optional filter by view status (True=viewed, False=not viewed, None=all)
+        cursor: Keyset cursor from the previous page (skip is ignored when set)
+        count: Total count mode: exact, estimate (capped) or none
         
     Returns:
         OrdersListResponse with pagination metadata
@@ -206,11 +232,10 @@ def get_customer_b2c_orders(
             # Only not viewed orders (customer_viewed_at IS NULL)
             base_query = base_query.filter(Order.customer_viewed_at.is_(None))
     
-    # Get total count with filters applied
-    total_count = base_query.count()
-    
-    # Get orders with pagination
-    orders = base_query.order_by(Order.created_at.desc()).offset(skip).limit(limit).all()
+    # Optional total count and page (offset or keyset cursor, newest first).
+    # The cursor keeps pages stable while orders drop out of viewed=false.
+    page = paginate(base_query, CUSTOMER_ORDER_KEYS, limit=limit, skip=skip, cursor=cursor, count=count)
+    orders = page.rows
     
     # Update customer_viewed_at timestamp only on first view (if NULL)
     now = datetime.utcnow()
@@ -243,7 +268,9 @@ def get_customer_b2c_orders(
         orders_with_lines.append(order_dict)
 
     return OrdersListResponse(
-        total_count=total_count,
+        total_count=page.total,
+        total_is_estimate=page.total_is_estimate,
+        next_cursor=page.next_cursor,
         skip=skip,
         limit=limit,
         orders=orders_with_lines
@@ -405,6 +432,7 @@ def update_order_quantity(
     ).first()
     
     previous_cantidad = 0
+    new_line = order_line is None
     if order_line:
         previous_cantidad = order_line.cantidad_servida
     else:
@@ -470,7 +498,15 @@ def update_order_quantity(
             order_line.fecha_empacado = datetime.utcnow()
             packing_box.total_items += 1
     
+    refresh_order_counters(db, [order.id])
     db.commit()
+    if new_line:
+        reservation_queue.notify_products([product.id])
+    orders_manager.emit(EVENT_ORDER_UPDATED, order.id, {
+        "numero_orden": order.numero_orden,
+        "total_items": order.total_items,
+        "items_completados": order.items_completados,
+    })
     
     return UpdateOrderResponse(
         status="success",
@@ -685,6 +721,7 @@ def batch_update_order(
     
     # Flush changes to DB before counting
     db.flush()
+    refresh_order_counters(db, [order.id])
 
 
 
@@ -805,6 +842,11 @@ def batch_update_order(
                 order.status_id = ready_status.id
             logger.info("External Packing API returned 201 with success=true - Success!")
             db.commit()
+            orders_manager.emit(EVENT_STATUS_CHANGED, order.id, {
+                "numero_orden": order.numero_orden,
+                "status_id": order.status_id,
+                "estado_codigo": "READY",
+            })
         
         # Always return external API response
         logger.info(f"External Packing API response: {external_api_response}")
@@ -932,6 +974,11 @@ def batch_update_picked_order(
 
         db.commit()
         logger.info(f"Order {order_number} marked as READY after successful external API response")
+        orders_manager.emit(EVENT_STATUS_CHANGED, order.id, {
+            "numero_orden": order.numero_orden,
+            "status_id": order.status_id,
+            "estado_codigo": "READY",
+        })
 
         # 9. Send expedition to XPO
         fecha_now  = datetime.now()
@@ -1654,6 +1701,8 @@ def get_stock_semana(
     week: Optional[str] = None,
     almacen_id: Optional[str] = None,
     articulo_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    count: str = "exact",
 ) -> StockSemanaListResponse:
     """
     Return weekly stock rows for a given year from tbdStockSemanaTotal.
@@ -1663,6 +1712,9 @@ def get_stock_semana(
         week       – optional, e.g. '10'
         almacen_id – optional warehouse filter
         articulo_id– optional article filter
+
+    Pagination: skip/limit, or the keyset `cursor` from the previous page
+    (next_cursor). `count` = exact | estimate | none.
     """
     logger.info(
         "get_stock_semana | year=%s week=%s almacen_id=%s articulo_id=%s skip=%d limit=%d",
@@ -1681,21 +1733,18 @@ def get_stock_semana(
         query = query.filter(StockSemanaTotal.fldIdArticulo == articulo_id)
         logger.debug("Filtro aplicado: articulo_id=%s", articulo_id)
 
-    total_count = query.count()
-    logger.info("Total registros encontrados: %d (year=%s week=%s)", total_count, year, week)
-
-    rows = (
-        query
-        .order_by(StockSemanaTotal.fldWeek, StockSemanaTotal.fldIdAlmacen, StockSemanaTotal.fldIdArticulo)
-        .offset(skip)
-        .limit(limit)
-        .all()
+    page = paginate(query, STOCK_SEMANA_KEYS, limit=limit, skip=skip, cursor=cursor, count=count)
+    rows = page.rows
+    logger.info(
+        "Filas retornadas: %d de %s (skip=%d limit=%d cursor=%s)",
+        len(rows), page.total if page.total is not None else "?", skip, limit, bool(cursor),
     )
-    logger.info("Filas retornadas: %d (skip=%d limit=%d)", len(rows), skip, limit)
 
     return StockSemanaListResponse(
         year=year,
-        total_count=total_count,
+        total_count=page.total,
+        total_is_estimate=page.total_is_estimate,
+        next_cursor=page.next_cursor,
         skip=skip,
         limit=limit,
         items=rows,
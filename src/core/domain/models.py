@@ -257,6 +257,8 @@ class OrderListItem(BaseModel):
     nombre_cliente: Optional[str] = None
     total_items: int = Field(description="Total de unidades solicitadas")
     items_completados: int = Field(default=0, description="Total de unidades servidas")
+    total_lineas: int = Field(default=0, description="Número de líneas de la orden")
+    lineas_completadas: int = Field(default=0, description="Líneas con todas sus unidades servidas")
     progreso: float = Field(default=0.0, description="Porcentaje de progreso (0-100)")
     operario_asignado: Optional[str] = Field(default="Sin asignar", description="Nombre del operario o 'Sin asignar'")
     prioridad: str
@@ -851,6 +853,57 @@ class OperatorStartPickingResponse(BaseModel):
     fecha_inicio_picking: Optional[str] = None
 
 
+class WaveStartRequest(BaseModel):
+    """Petición de inicio de oleada (sin order_ids → la primera oleada propuesta)."""
+    order_ids: Optional[List[int]] = Field(None, description="Órdenes en orden de cubeta (1..N)")
+
+
+class WaveOrderInfo(BaseModel):
+    """Orden de una oleada y su cubeta/caja destino."""
+    tote: int
+    order_id: int
+    numero_orden: str
+    prioridad: Optional[str] = None
+    unidades_pendientes: int
+    codigo_caja: Optional[str] = None
+
+
+class WaveRouteStop(BaseModel):
+    """Parada de la ruta combinada de una oleada."""
+    secuencia: int
+    order_id: int
+    tote: int
+    order_line_id: int
+    producto: str
+    ean: Optional[str] = None
+    cantidad: int
+    ubicacion: str
+    pasillo: Optional[str] = None
+    lado: Optional[str] = None
+    altura: Optional[int] = None
+
+
+class WaveResponse(BaseModel):
+    """Oleada (propuesta o iniciada) con su ruta combinada."""
+    wave_id: Optional[str] = None
+    almacen_id: int
+    orders: List[WaveOrderInfo]
+    total_units: int
+    total_stops: int
+    total_distance_m: float
+    individual_distance_m: Optional[float] = Field(None, description="Suma de las rutas de cada orden por separado")
+    estimated_time_minutes: float
+    routing_method: Optional[str] = None
+    picking_route: List[WaveRouteStop]
+
+
+class WavePlanResponse(BaseModel):
+    """Oleadas propuestas para un operario."""
+    operator_codigo: str
+    total_waves: int
+    waves: List[WaveResponse]
+
+
 # ============================================================================
 # MODELOS DE RESPUESTA PARA ENDPOINTS DE ÓRDENES (WORKFLOW)
 # ============================================================================
@@ -882,6 +935,8 @@ class PickingRouteResponse(BaseModel):
     total_stops: int
     aisles_to_visit: List[str]
     estimated_time_minutes: float
+    total_distance_m: Optional[float] = None
+    routing_method: Optional[str] = None
     picking_route: List[PickingRouteStop]
     warnings: PickingRouteWarnings
 
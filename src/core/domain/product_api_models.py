@@ -253,6 +253,28 @@ class OutOfStockResponse(BaseModel):
     items: List[OutOfStockItem] = []
 
 
+class SlottingMoveItem(BaseModel):
+    """Movimiento recomendado de un producto a una ubicación más accesible."""
+    product_id: int
+    clase: str = Field(description="Clase ABC por rotación")
+    picks_dia: float = Field(description="Rotación ponderada (recogidas por día)")
+    from_location_id: int
+    from_codigo: Optional[str] = None
+    to_location_id: int
+    to_codigo: Optional[str] = None
+    swap_product_id: Optional[int] = Field(None, description="Producto que ocupa el destino y pasa al origen (None = destino libre)")
+    ahorro_segundos_dia: float = Field(description="Segundos de recorrido ahorrados por día")
+
+
+class SlottingRecommendationsResponse(BaseModel):
+    """Respuesta del endpoint /products/slotting/recommendations."""
+    almacen_id: int
+    productos_con_rotacion: int
+    ubicaciones: int
+    ahorro_total_segundos_dia: float
+    moves: List[SlottingMoveItem] = []
+
+
 def format_location_code(pasillo: str, lado: str, ubicacion: str, altura: int) -> str:
     """
     Formatea un código de ubicación según el formato esperado por el frontend.
@@ -97,10 +97,12 @@ class StatusCounts(BaseModel):
 
 class ReplenishmentRequestListResponse(BaseModel):
     """Paginated list response"""
-    total: int
+    total: Optional[int]
+    total_is_estimate: bool = False
+    next_cursor: Optional[str] = None
     page: int
     per_page: int
-    total_pages: int
+    total_pages: Optional[int]
     status_counts: StatusCounts
     priority_counts: PriorityCounts
     requests: list[ReplenishmentRequestListItem]
@@ -42,7 +42,9 @@ class TipoEstadistica(BaseModel):
 
 class StockMovementListResponse(BaseModel):
     """Respuesta con lista de movimientos y estadísticas."""
-    total: int = Field(description="Total de movimientos encontrados")
+    total: Optional[int] = Field(description="Total de movimientos encontrados (None con count=none)")
+    total_is_estimate: bool = Field(default=False, description="True si el total es una cota inferior (count=estimate)")
+    next_cursor: Optional[str] = Field(default=None, description="Cursor de la página siguiente (None = última página)")
     movimientos: List[StockMovementResponse] = Field(description="Lista de movimientos")
     estadisticas: Dict[str, TipoEstadistica] = Field(description="Estadísticas por tipo de movimiento")
 
@@ -7,7 +7,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import sentry_sdk
-from src.adapters.secondary.database.config import engine, Base
+from src.adapters.secondary.database.config import engine, Base, SCHEDULER_MODE, ALMACEN_PICKING_ID
 
 logger = logging.getLogger(__name__)
 
@@ -25,6 +25,7 @@ from src.adapters.primary.api.almacen_router import router as almacen_router
 from src.adapters.primary.api.stock_movement_router import router as stock_movement_router
 from src.adapters.primary.api.websockets import ws_router
 from src.adapters.primary.websocket.operator_websocket import router as operator_ws_router
+from src.adapters.primary.websocket.orders_websocket import router as orders_ws_router
 from src.api_service.routes import router as api_service_router
 
 # Create tables (for demo purposes)
@@ -33,6 +34,13 @@ from src.api_service.routes import router as api_service_router
 
 from src.core.logging_config import setup_logging
 from src.services.stock_reservation_cron_service import start_stock_reservation_scheduler
+from src.services.location_code_service import backfill_location_codes
+from src.services.warehouse_layout import warm_layouts
+from src.services.product_search_service import product_search
+from src.services.reservation_queue_service import start_reservation_queue
+from src.adapters.primary.websocket.db_executor import shutdown_db_executor
+from src.adapters.primary.websocket.manager import manager as operator_ws_manager
+from src.adapters.primary.websocket.orders_websocket import orders_manager
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -48,9 +56,32 @@ async def lifespan(app: FastAPI):
         logger.critical("   Revisa DB_SERVER, DB_NAME, DB_USER, DB_PASSWORD en el archivo .env")
         raise RuntimeError(f"Database connection failed: {e}") from e
 
-    stock_scheduler = start_stock_reservation_scheduler()
+    try:
+        backfill_location_codes()
+    except Exception as e:
+        logger.error(f"❌ No se pudo completar el código persistido de ubicaciones: {e}")
+
+    try:
+        warm_layouts([ALMACEN_PICKING_ID])
+    except Exception as e:
+        logger.error(f"❌ No se pudo preparar la matriz de distancias del almacén de picking: {e}")
+
+    # Índice de búsqueda de productos: se construye en segundo plano (hasta entonces, ILIKE)
+    product_search.start_background_build()
+
+    # Con SCHEDULER_MODE=worker los crons corren en el proceso dedicado (python -m src.worker)
+    stock_scheduler = start_stock_reservation_scheduler() if SCHEDULER_MODE == "embedded" else None
+    reservation_queue = start_reservation_queue()
+    await operator_ws_manager.start()
+    await orders_manager.start()
     yield
-    stock_scheduler.shutdown()
+    await orders_manager.stop()
+    await operator_ws_manager.stop()
+    if reservation_queue:
+        reservation_queue.stop()
+    if stock_scheduler:
+        stock_scheduler.shutdown()
+    shutdown_db_executor()
 
 app = FastAPI(title="FastAPI Hexagonal ODBC", lifespan=lifespan)
 
@@ -81,7 +112,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
     allow_headers=["*"],
-    expose_headers=["X-Total-Count"],
+    expose_headers=["X-Total-Count", "X-Total-Count-Estimated", "X-Next-Cursor", "ETag"],
     max_age=600,
 )
 
@@ -95,6 +126,7 @@ app.include_router(almacen_router, prefix="/api/v1")
 app.include_router(stock_movement_router, prefix="/api/v1")
 app.include_router(ws_router)
 app.include_router(operator_ws_router, tags=["WebSocket PDA"])
+app.include_router(orders_ws_router, tags=["WebSocket Orders"])
 app.include_router(api_service_router, prefix="/api/service", tags=["B2B Service API"])
 
 MEDIA_DIR = os.path.join(os.path.dirname(__file__), "..", "media")
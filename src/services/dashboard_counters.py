@@ -0,0 +1,346 @@
+"""
+Dashboard Counters
+
+Contadores en memoria para los endpoints de estadísticas del dashboard, que
+antes lanzaban un GROUP BY sobre las tablas origen en cada refresco:
+
+    - GET /orders/stats/summary          → órdenes por (almacén, estado)
+    - GET /stock-movements/stats/summary → movimientos y cantidad por tipo
+    - GET /replenishment/requests        → reposiciones por estado y prioridad
+    - GET /almacenes/{id}/stats          → ubicaciones activas, productos
+                                           distintos y stock por almacén
+
+Mantenimiento incremental:
+    - Un listener after_flush de la sesión calcula, para cada Order,
+      StockMovement, ReplenishmentRequest y ProductLocation nuevo, modificado
+      o borrado, su aportación antes/después a los contadores y la deja
+      pendiente en session.info.
+    - after_commit aplica lo pendiente; un rollback lo descarta. Así los
+      contadores solo reflejan datos confirmados.
+    - Las escrituras set-based que no pasan por el ORM (StockWriteBatch)
+      registran sus deltas con stage().
+
+Reconciliación:
+    Cada proceso (worker de uvicorn) tiene sus propios contadores, y hay
+    escrituras que no ve (otros procesos, el ETL externo, UPDATEs masivos).
+    Por eso se recalculan desde las tablas origen cuando tienen más de
+    DASHBOARD_COUNTERS_MAX_AGE_SECONDS, o en la siguiente lectura si un
+    cambio no se pudo traducir a delta (valor anterior no cargado).
+
+Las consultas con filtro de fechas siguen yendo a la BD (los contadores no
+se guardan por día).
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from src.adapters.secondary.database.config import (
+    SessionLocal,
+    DASHBOARD_COUNTERS_MAX_AGE_SECONDS,
+)
+from src.adapters.secondary.database.orm import (
+    Order,
+    OrderStatus,
+    ProductLocation,
+    ProductStockSummary,
+    ReplenishmentRequest,
+    StockMovement,
+)
+
+logger = logging.getLogger(__name__)
+
+# Clave en session.info de los deltas pendientes de commit
+_PENDING_KEY = "dashboard_counter_deltas"
+
+# Atributos que determinan la aportación de cada entidad a los contadores
+_TRACKED = {
+    Order: ("almacen_id", "status_id"),
+    ReplenishmentRequest: ("status", "priority"),
+    ProductLocation: ("activa", "almacen_id", "product_id", "stock_actual"),
+}
+
+
+class _UnknownPreviousValue(Exception):
+    """El valor anterior de un atributo modificado no estaba cargado."""
+
+
+class DashboardCounters:
+    """
+    Agregados del dashboard en memoria, protegidos por un lock.
+
+    Deltas admitidos por apply():
+        ("order", almacen_id, status_id, n)
+        ("movement", tipo, n, cantidad)
+        ("replenishment", status, priority, n)
+        ("location", almacen_id, product_id, n, stock)
+    """
+
+    def __init__(self, max_age_seconds: float = DASHBOARD_COUNTERS_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.RLock()
+        self._reconciled_at: Optional[float] = None
+        self._stale = True
+        self._status_codes: Dict[int, str] = {}
+        self._orders: Counter = Counter()
+        self._movements: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        self._replenishment_status: Counter = Counter()
+        self._replenishment_priority: Counter = Counter()
+        self._location_count: Counter = Counter()
+        self._location_stock: Counter = Counter()
+        self._location_products: Dict[int, Counter] = defaultdict(Counter)
+
+    # === Mantenimiento ===
+
+    def mark_stale(self):
+        """Fuerza la reconciliación en la siguiente lectura."""
+        self._stale = True
+
+    def apply(self, deltas: List[tuple]):
+        """Aplica deltas ya confirmados en BD."""
+        with self._lock:
+            if self._reconciled_at is None:
+                # Aún no cargados: la primera lectura los calcula desde la BD
+                return
+            for delta in deltas:
+                kind = delta[0]
+                if kind == "order":
+                    _, almacen_id, status_id, n = delta
+                    self._orders[(almacen_id, status_id)] += n
+                elif kind == "movement":
+                    _, tipo, n, cantidad = delta
+                    self._movements[tipo][0] += n
+                    self._movements[tipo][1] += cantidad
+                elif kind == "replenishment":
+                    _, status, priority, n = delta
+                    self._replenishment_status[status] += n
+                    self._replenishment_priority[priority] += n
+                elif kind == "location":
+                    _, almacen_id, product_id, n, stock = delta
+                    self._location_count[almacen_id] += n
+                    self._location_stock[almacen_id] += stock
+                    if n and product_id is not None:
+                        # Un hueco libre cuenta como ubicación, no como producto
+                        products = self._location_products[almacen_id]
+                        products[product_id] += n
+                        if products[product_id] <= 0:
+                            del products[product_id]
+
+    def reconcile(self, db: Optional[Session] = None):
+        """
+        Recalcula todos los contadores desde las tablas origen.
+
+        Args:
+            db: Sesión opcional (si no se pasa, se abre y se cierra una propia)
+        """
+        owns_session = db is None
+        db = db or SessionLocal()
+        start = time.perf_counter()
+        try:
+            status_codes = dict(db.query(OrderStatus.id, OrderStatus.codigo).all())
+            orders = Counter({
+                (row.almacen_id, row.status_id): row.cnt
+                for row in db.query(
+                    Order.almacen_id, Order.status_id, func.count(Order.id).label("cnt")
+                ).group_by(Order.almacen_id, Order.status_id)
+            })
+            movements = defaultdict(lambda: [0, 0])
+            for row in db.query(
+                StockMovement.tipo,
+                func.count(StockMovement.id).label("cnt"),
+                func.coalesce(func.sum(StockMovement.cantidad), 0).label("cantidad"),
+            ).group_by(StockMovement.tipo):
+                movements[row.tipo] = [row.cnt, int(row.cantidad)]
+            replenishment_status = Counter()
+            replenishment_priority = Counter()
+            for row in db.query(
+                ReplenishmentRequest.status,
+                ReplenishmentRequest.priority,
+                func.count(ReplenishmentRequest.id).label("cnt"),
+            ).group_by(ReplenishmentRequest.status, ReplenishmentRequest.priority):
+                replenishment_status[row.status] += row.cnt
+                replenishment_priority[row.priority] += row.cnt
+            # Ubicaciones activas desde product_locations: el resumen no tiene
+            # filas para los huecos libres (product_id NULL) y sí cuentan
+            location_count = Counter({
+                row.almacen_id: row.cnt
+                for row in db.query(
+                    ProductLocation.almacen_id, func.count(ProductLocation.id).label("cnt")
+                ).filter(ProductLocation.activa == True).group_by(ProductLocation.almacen_id)
+            })
+            location_stock = Counter()
+            location_products = defaultdict(Counter)
+            # Productos y stock por almacén desde el resumen materializado
+            # (ver services/stock_summary_service.py)
+            for row in db.query(
+                ProductStockSummary.almacen_id,
+                ProductStockSummary.product_id,
+                ProductStockSummary.num_ubicaciones,
+                ProductStockSummary.stock_actual,
+            ).filter(ProductStockSummary.num_ubicaciones > 0):
+                location_stock[row.almacen_id] += row.stock_actual
+                location_products[row.almacen_id][row.product_id] = row.num_ubicaciones
+        finally:
+            if owns_session:
+                db.close()
+
+        with self._lock:
+            self._status_codes = status_codes
+            self._orders = orders
+            self._movements = movements
+            self._replenishment_status = replenishment_status
+            self._replenishment_priority = replenishment_priority
+            self._location_count = location_count
+            self._location_stock = location_stock
+            self._location_products = location_products
+            self._reconciled_at = time.monotonic()
+            self._stale = False
+        logger.debug(f"  [DASHBOARD] Contadores reconciliados en {time.perf_counter() - start:.3f}s")
+
+    def _ensure_fresh(self, db: Session):
+        with self._lock:
+            expired = (
+                self._stale
+                or self._reconciled_at is None
+                or time.monotonic() - self._reconciled_at > self.max_age_seconds
+            )
+            if expired:
+                self.reconcile(db)
+
+    # === Lecturas ===
+
+    def order_counts(self, db: Session, almacen_id: Optional[int] = None) -> Dict[str, int]:
+        """Órdenes por código de estado (opcionalmente de un almacén)."""
+        self._ensure_fresh(db)
+        counts: Counter = Counter()
+        with self._lock:
+            for (order_almacen_id, status_id), n in self._orders.items():
+                if n and (almacen_id is None or order_almacen_id == almacen_id):
+                    counts[self._status_codes.get(status_id, "UNKNOWN")] += n
+        return dict(counts)
+
+    def movement_stats(self, db: Session) -> Dict[str, dict]:
+        """Movimientos por tipo: {tipo: {"count", "total_cantidad"}}."""
+        self._ensure_fresh(db)
+        with self._lock:
+            return {
+                tipo: {"count": n, "total_cantidad": cantidad}
+                for tipo, (n, cantidad) in self._movements.items() if n
+            }
+
+    def replenishment_counts(self, db: Session) -> Tuple[Dict[str, int], Dict[str, int]]:
+        """Reposiciones por estado y por prioridad."""
+        self._ensure_fresh(db)
+        with self._lock:
+            return dict(self._replenishment_status), dict(self._replenishment_priority)
+
+    def almacen_stats(self, db: Session, almacen_id: int) -> Dict[str, int]:
+        """Ubicaciones activas, productos distintos y stock total de un almacén."""
+        self._ensure_fresh(db)
+        with self._lock:
+            return {
+                "total_ubicaciones": self._location_count.get(almacen_id, 0),
+                "total_productos": len(self._location_products.get(almacen_id, ())),
+                "total_stock": self._location_stock.get(almacen_id, 0),
+            }
+
+
+# Contadores globales del proceso
+dashboard_counters = DashboardCounters()
+
+
+def stage(db: Session, deltas: List[tuple]):
+    """
+    Registra deltas de una escritura que no pasa por el ORM; se aplican al
+    hacer commit de la transacción de db.
+    """
+    db.info.setdefault(_PENDING_KEY, []).extend(deltas)
+
+
+def _contribution(obj, attrs, previous: bool):
+    """Valores de los atributos rastreados antes (previous) o después del flush."""
+    values = []
+    for attr in attrs:
+        history = get_history(obj, attr)
+        if previous and history.has_changes():
+            if not history.deleted:
+                raise _UnknownPreviousValue()
+            values.append(history.deleted[0])
+        elif previous and history.unchanged:
+            values.append(history.unchanged[0])
+        elif history.added:
+            values.append(history.added[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(obj, attr))
+    return tuple(values)
+
+
+def _deltas_for(obj, before: Optional[tuple], after: Optional[tuple]) -> List[tuple]:
+    if before == after:
+        return []
+    deltas = []
+    for values, n in ((before, -1), (after, 1)):
+        if values is None:
+            continue
+        if isinstance(obj, Order):
+            deltas.append(("order", values[0], values[1], n))
+        elif isinstance(obj, ReplenishmentRequest):
+            deltas.append(("replenishment", values[0], values[1], n))
+        elif isinstance(obj, ProductLocation):
+            activa, almacen_id, product_id, stock = values
+            if activa:
+                deltas.append(("location", almacen_id, product_id, n, n * (stock or 0)))
+    return deltas
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_deltas(session, flush_context):
+    deltas = []
+    try:
+        for obj in session.new:
+            if isinstance(obj, StockMovement):
+                deltas.append(("movement", obj.tipo, 1, obj.cantidad or 0))
+                continue
+            attrs = _TRACKED.get(type(obj))
+            if attrs:
+                deltas.extend(_deltas_for(obj, None, _contribution(obj, attrs, previous=False)))
+        for obj in session.dirty:
+            attrs = _TRACKED.get(type(obj))
+            if attrs and session.is_modified(obj, include_collections=False):
+                deltas.extend(_deltas_for(
+                    obj,
+                    _contribution(obj, attrs, previous=True),
+                    _contribution(obj, attrs, previous=False),
+                ))
+        for obj in session.deleted:
+            if isinstance(obj, StockMovement):
+                deltas.append(("movement", obj.tipo, -1, -(obj.cantidad or 0)))
+                continue
+            attrs = _TRACKED.get(type(obj))
+            if attrs:
+                deltas.extend(_deltas_for(obj, _contribution(obj, attrs, previous=True), None))
+    except _UnknownPreviousValue:
+        dashboard_counters.mark_stale()
+        return
+    if deltas:
+        stage(session, deltas)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_deltas(session):
+    deltas = session.info.pop(_PENDING_KEY, None)
+    if deltas:
+        dashboard_counters.apply(deltas)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_deltas(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,215 @@
+"""
+Distance Matrix Service
+
+Matriz precalculada de distancias a pie entre los huecos (pasillo, ubicacion)
+de un almacén, para que rutas y slotting consulten distancias en O(1) sin
+recalcular la geometría a partir de las cadenas de ProductLocation.
+
+    - Nivel hueco, no ubicación: las ubicaciones que comparten pasillo y
+      ubicacion (distinto lado / altura / producto) están en el mismo punto
+      del recorrido, así la matriz es mucho menor y no cambia al dar de alta
+      una ubicación en un hueco existente. El nodo 0 es el depósito.
+    - Triangular superior condensada de float32: n·(n-1)/2 valores
+      (2.000 huecos ≈ 8 MB).
+    - En disco en DISTANCE_MATRIX_DIR (un fichero por almacén) y abierta con
+      mmap: los workers comparten las páginas y un reinicio no recalcula.
+      La cabecera lleva una huella de los huecos y de la geometría
+      (LayoutConfig); si no coincide con la actual se reconstruye y se
+      reemplaza el fichero de forma atómica.
+
+Formato del fichero (orden de bytes nativo, incluido en la huella):
+
+    MAGIC (8) | huella sha1 (20) | n nodos (uint32) | bytes de claves (uint32)
+    claves "pasillo\\x1fubicacion" separadas por \\x1e (UTF-8), alineado a 4
+    distancias float32 condensadas
+
+warehouse_layout.get_layout() construye / abre la matriz y la conecta al
+modelo del almacén (WarehouseLayout.distance la usa automáticamente).
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from dataclasses import astuple
+from typing import Dict, Optional, Sequence, Tuple
+
+from src.adapters.secondary.database.config import DISTANCE_MATRIX_DIR
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SMSLDM01"
+_HEADER = struct.Struct("<8s20sII")
+_KEY_SEP = "\x1f"
+_ROW_SEP = "\x1e"
+
+SlotKey = Tuple[str, str]
+
+
+def slots_fingerprint(slot_keys: Sequence[SlotKey], config) -> bytes:
+    """Huella (sha1) de los huecos, la geometría y el orden de bytes."""
+    digest = hashlib.sha1(sys.byteorder.encode())
+    digest.update(repr(astuple(config)).encode())
+    for pasillo, ubicacion in slot_keys:
+        digest.update(f"{pasillo}{_KEY_SEP}{ubicacion}{_ROW_SEP}".encode("utf-8"))
+    return digest.digest()
+
+
+class DistanceMatrix:
+    """Distancias entre huecos de un almacén (nodo 0 = depósito)."""
+
+    def __init__(self, slot_keys: Sequence[SlotKey], data, fingerprint: bytes, path: Optional[str] = None):
+        """
+        Args:
+            slot_keys: Huecos en orden de nodo (nodo i + 1 = slot_keys[i])
+            data: Distancias condensadas (array('f') o memoryview float32 sobre mmap)
+            fingerprint: Huella de los huecos y la geometría
+            path: Fichero del que se abrió (None si solo está en memoria)
+        """
+        self.size = len(slot_keys) + 1
+        self.fingerprint = fingerprint
+        self.path = path
+        self._data = data
+        self._nodes: Dict[SlotKey, int] = {key: node for node, key in enumerate(slot_keys, start=1)}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def node(self, pasillo: str, ubicacion: str) -> int:
+        """Nodo de un hueco (-1 si no está en la matriz)."""
+        return self._nodes.get((pasillo, ubicacion), -1)
+
+    def distance(self, a: int, b: int) -> float:
+        """Metros entre dos nodos."""
+        if a == b:
+            return 0.0
+        if a > b:
+            a, b = b, a
+        return self._data[a * (2 * self.size - a - 1) // 2 + b - a - 1]
+
+    @classmethod
+    def build(cls, layout, slot_keys: Sequence[SlotKey], fingerprint: bytes) -> "DistanceMatrix":
+        """
+        Calcula la matriz con la métrica del modelo del almacén.
+
+        Args:
+            layout: WarehouseLayout sin matriz (point() y distance() geométricos)
+            slot_keys: Huecos a incluir
+            fingerprint: Huella de slots_fingerprint()
+        """
+        points = [layout.depot] + [layout.point(pasillo, ubicacion) for pasillo, ubicacion in slot_keys]
+        data = array("f")
+        for i, a in enumerate(points):
+            data.extend(layout.distance(a, b) for b in points[i + 1:])
+        return cls(slot_keys, data, fingerprint)
+
+    def save(self, path: str) -> None:
+        """Escribe la matriz en disco (fichero temporal + os.replace)."""
+        keys = _ROW_SEP.join(f"{p}{_KEY_SEP}{u}" for p, u in sorted(self._nodes, key=self._nodes.get)).encode("utf-8")
+        padding = b"\0" * (-(_HEADER.size + len(keys)) % 4)
+        data = self._data if isinstance(self._data, array) else array("f", self._data)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as fh:
+            fh.write(_HEADER.pack(MAGIC, self.fingerprint, self.size, len(keys)))
+            fh.write(keys)
+            fh.write(padding)
+            data.tofile(fh)
+        os.replace(tmp_path, path)
+        self.path = path
+
+    @classmethod
+    def open(cls, path: str, fingerprint: Optional[bytes] = None) -> Optional["DistanceMatrix"]:
+        """
+        Abre una matriz de disco con mmap (sin copiarla a memoria).
+
+        Returns:
+            La matriz, o None si no existe, está dañada o su huella no coincide
+        """
+        try:
+            with open(path, "rb") as fh:
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            magic, stored, size, keys_len = _HEADER.unpack_from(mapped, 0)
+            if magic != MAGIC or (fingerprint is not None and stored != fingerprint):
+                raise ValueError("huella distinta")
+            offset = _HEADER.size + keys_len
+            offset += -offset % 4
+            entries = size * (size - 1) // 2
+            if len(mapped) != offset + entries * 4:
+                raise ValueError("tamaño incorrecto")
+            keys = mapped[_HEADER.size:_HEADER.size + keys_len].decode("utf-8")
+            slot_keys = [tuple(row.split(_KEY_SEP, 1)) for row in keys.split(_ROW_SEP)] if keys else []
+            if len(slot_keys) + 1 != size:
+                raise ValueError("claves incorrectas")
+            data = memoryview(mapped)[offset:].cast("f")
+        except (struct.error, ValueError, UnicodeDecodeError):
+            mapped.close()
+            return None
+        return cls(slot_keys, data, stored, path)
+
+
+def matrix_path(almacen_id: int) -> str:
+    return os.path.join(DISTANCE_MATRIX_DIR, f"almacen_{almacen_id}.ldm")
+
+
+class DistanceMatrixStore:
+    """Matriz vigente por almacén: memoria → disco (mmap) → cálculo."""
+
+    def __init__(self):
+        self._matrices: Dict[int, DistanceMatrix] = {}
+        self._lock = threading.Lock()
+
+    def get(self, almacen_id: int, layout, slot_keys: Sequence[SlotKey]) -> DistanceMatrix:
+        """
+        Matriz del almacén para estos huecos y esta geometría.
+
+        Args:
+            almacen_id: ID del almacén
+            layout: WarehouseLayout (sin matriz) de esos huecos
+            slot_keys: Huecos ordenados
+        """
+        fingerprint = slots_fingerprint(slot_keys, layout.config)
+        with self._lock:
+            current = self._matrices.get(almacen_id)
+            if current and current.fingerprint == fingerprint:
+                return current
+
+            path = matrix_path(almacen_id)
+            matrix = DistanceMatrix.open(path, fingerprint)
+            if matrix is None:
+                start = time.perf_counter()
+                matrix = DistanceMatrix.build(layout, slot_keys, fingerprint)
+                try:
+                    matrix.save(path)
+                    # Reabrir desde disco: las páginas se comparten entre workers
+                    matrix = DistanceMatrix.open(path, fingerprint) or matrix
+                except OSError as e:
+                    logger.warning(f"⚠️ [DISTANCE MATRIX] No se pudo guardar {path}: {e}")
+                logger.info(
+                    f"📐 [DISTANCE MATRIX] Almacén {almacen_id}: {len(slot_keys)} huecos "
+                    f"calculados en {time.perf_counter() - start:.2f}s"
+                )
+            self._matrices[almacen_id] = matrix
+            return matrix
+
+    def invalidate(self, almacen_id: Optional[int] = None) -> None:
+        """Olvida la matriz en memoria (la de disco se reutiliza si la huella coincide)."""
+        with self._lock:
+            if almacen_id is None:
+                self._matrices.clear()
+            else:
+                self._matrices.pop(almacen_id, None)
+
+
+# Matrices globales del proceso
+distance_matrices = DistanceMatrixStore()
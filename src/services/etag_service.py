@@ -0,0 +1,174 @@
+"""
+ETag Service
+
+GET condicional (ETag / If-None-Match → 304) para las lecturas que las PDAs
+y el dashboard refrescan en bucle aunque no haya cambios:
+
+    - GET /orders/{id}
+    - GET /operators/{codigo}/orders/{id}/lines
+    - GET /products/{id}
+
+El ETag se deriva de una "versión" del agregado calculada con UNA consulta
+de agregados (updated_at, COUNT, SUM) sobre las tablas que alimentan la
+respuesta, filtradas por índice (order_id / product_id). Si coincide con el
+If-None-Match del cliente se responde 304 sin cargar el grafo ni serializar.
+
+    version = order_version(db, order_id)
+    etag = make_etag("order-detail", order_id, *version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    ... montaje normal ...
+
+Las tablas sin updated_at (asignaciones de stock, cajas, EANs) entran en la
+versión por COUNT/SUM de las columnas que se muestran. Las escrituras del
+ORM y los UPDATE set-based de SQLAlchemy actualizan updated_at (onupdate);
+una escritura externa en SQL plano que no lo toque no cambia el ETag hasta
+la siguiente modificación del agregado.
+
+Los ETags son débiles (W/"..."): la respuesta es semánticamente la misma,
+no necesariamente idéntica byte a byte.
+"""
+
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import func, or_, select
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.orm import (
+    EAN,
+    Order,
+    OrderLine,
+    OrderLineBoxDistribution,
+    OrderLineStockAssignment,
+    PackingBox,
+    ProductLocation,
+    ProductReference,
+)
+
+# Los clientes deben revalidar siempre (la respuesta puede cambiar en cualquier momento)
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """
+    ETag débil a partir del recurso, sus parámetros y su versión.
+
+    Args:
+        parts: Nombre del recurso, parámetros que cambian la representación
+               y valores de la versión
+    """
+    digest = hashlib.sha1("|".join(repr(p) for p in parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest[:20]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True si el If-None-Match del cliente incluye el ETag (comparación débil)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    """Respuesta 304 sin cuerpo."""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str):
+    """Añade ETag y Cache-Control a una respuesta 200."""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+
+def order_version(db: Session, order_id: int) -> Optional[Row]:
+    """
+    Versión del agregado orden (cabecera, líneas, productos, asignaciones,
+    ubicaciones, cajas y distribuciones) en una sola consulta.
+
+    Args:
+        db: Sesión de base de datos
+        order_id: ID de la orden
+
+    Returns:
+        Fila con la versión (incluye operator_id para validar el acceso antes
+        de responder 304) o None si la orden no existe
+    """
+    lines = select(OrderLine.id).where(OrderLine.order_id == order_id)
+    products = select(OrderLine.product_reference_id).where(OrderLine.order_id == order_id)
+    assigned_locations = select(OrderLineStockAssignment.product_location_id).where(
+        OrderLineStockAssignment.order_line_id.in_(lines)
+    )
+    boxes = select(PackingBox.id).where(PackingBox.order_id == order_id)
+
+    return db.execute(
+        select(
+            Order.updated_at,
+            Order.operator_id,
+            select(func.count(OrderLine.id))
+            .where(OrderLine.order_id == order_id).scalar_subquery().label("lines"),
+            select(func.max(OrderLine.updated_at))
+            .where(OrderLine.order_id == order_id).scalar_subquery().label("lines_at"),
+            select(func.max(ProductReference.updated_at))
+            .where(ProductReference.id.in_(products)).scalar_subquery().label("products_at"),
+            select(func.count(OrderLineStockAssignment.id))
+            .where(OrderLineStockAssignment.order_line_id.in_(lines)).scalar_subquery().label("assignments"),
+            select(func.sum(OrderLineStockAssignment.cantidad_reservada))
+            .where(OrderLineStockAssignment.order_line_id.in_(lines)).scalar_subquery().label("reservado"),
+            select(func.sum(OrderLineStockAssignment.cantidad_servida))
+            .where(OrderLineStockAssignment.order_line_id.in_(lines)).scalar_subquery().label("servido"),
+            # Ubicaciones asignadas y de fallback (las de los productos de la orden)
+            select(func.max(ProductLocation.updated_at))
+            .where(or_(
+                ProductLocation.id.in_(assigned_locations),
+                ProductLocation.product_id.in_(products),
+            )).scalar_subquery().label("locations_at"),
+            select(func.count(PackingBox.id))
+            .where(PackingBox.order_id == order_id).scalar_subquery().label("boxes"),
+            select(func.sum(PackingBox.total_items))
+            .where(PackingBox.order_id == order_id).scalar_subquery().label("boxes_items"),
+            select(func.max(PackingBox.fecha_cierre))
+            .where(PackingBox.order_id == order_id).scalar_subquery().label("boxes_closed_at"),
+            select(func.count(OrderLineBoxDistribution.id))
+            .where(OrderLineBoxDistribution.packing_box_id.in_(boxes)).scalar_subquery().label("distributions"),
+            select(func.max(OrderLineBoxDistribution.updated_at))
+            .where(OrderLineBoxDistribution.packing_box_id.in_(boxes)).scalar_subquery().label("distributions_at"),
+        ).where(Order.id == order_id)
+    ).first()
+
+
+def product_version(db: Session, product_id: int) -> Optional[Row]:
+    """
+    Versión del agregado producto (referencia, ubicaciones y EANs) en una
+    sola consulta.
+
+    Returns:
+        Fila con la versión o None si el producto no existe
+    """
+    return db.execute(
+        select(
+            ProductReference.updated_at,
+            select(func.count(ProductLocation.id))
+            .where(ProductLocation.product_id == product_id).scalar_subquery().label("locations"),
+            select(func.max(ProductLocation.updated_at))
+            .where(ProductLocation.product_id == product_id).scalar_subquery().label("locations_at"),
+            select(func.sum(ProductLocation.stock_actual))
+            .where(ProductLocation.product_id == product_id).scalar_subquery().label("stock"),
+            select(func.count(EAN.id))
+            .where(EAN.product_reference_id == product_id).scalar_subquery().label("eans"),
+            select(func.max(EAN.id))
+            .where(EAN.product_reference_id == product_id).scalar_subquery().label("eans_max_id"),
+        ).where(ProductReference.id == product_id)
+    ).first()
@@ -0,0 +1,225 @@
+"""
+Job Registry
+
+Registro central de las tareas periódicas del backend y de sus métricas.
+
+Cada servicio registra sus tareas al importarse (ver el final de
+stock_reservation_cron_service.py):
+
+    job_registry.register(
+        "stock_reservation_cron", _run_stock_reservation_cron,
+        minutes=CRON_INTERVAL_MINUTES, backlog=count_reservation_backlog,
+    )
+
+y quien las ejecuta construye el scheduler desde el registro:
+    - SCHEDULER_MODE=embedded → main.lifespan, en cada worker de uvicorn
+    - SCHEDULER_MODE=worker   → solo el proceso dedicado (python -m src.worker),
+                                con elección de líder entre réplicas
+
+Métricas por tarea (JobMetrics): ejecuciones, fallos, duración de la última
+ejecución / media / máxima, instante de la última ejecución y backlog
+(trabajo pendiente que reporta la propia tarea tras cada ejecución).
+metrics_text() las exporta en formato de texto de Prometheus.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class JobMetrics:
+    """Métricas acumuladas de una tarea."""
+    runs: int = 0
+    failures: int = 0
+    running: bool = False
+    last_started_at: Optional[datetime] = None
+    last_duration_seconds: float = 0.0
+    total_duration_seconds: float = 0.0
+    max_duration_seconds: float = 0.0
+    last_error: Optional[str] = None
+    backlog: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "running": self.running,
+            "last_started_at": self.last_started_at.isoformat() if self.last_started_at else None,
+            "last_duration_seconds": round(self.last_duration_seconds, 3),
+            "avg_duration_seconds": round(self.total_duration_seconds / self.runs, 3) if self.runs else 0.0,
+            "max_duration_seconds": round(self.max_duration_seconds, 3),
+            "last_error": self.last_error,
+            "backlog": self.backlog,
+        }
+
+
+@dataclass
+class ScheduledJob:
+    """Tarea periódica registrada."""
+    name: str
+    func: Callable[[], None]
+    minutes: float
+    description: str = ""
+    # Función sin argumentos que retorna el trabajo pendiente (o None)
+    backlog: Optional[Callable[[], Optional[int]]] = None
+    metrics: JobMetrics = field(default_factory=JobMetrics)
+
+
+class JobRegistry:
+    """
+    Registro de tareas periódicas.
+
+    Responsabilidades:
+        - Guardar las tareas con su intervalo
+        - Ejecutarlas midiendo duración, fallos y backlog
+        - Construir el BackgroundScheduler de APScheduler con todas ellas
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, ScheduledJob] = {}
+        self._lock = threading.Lock()
+
+    def register(
+        self,
+        name: str,
+        func: Callable[[], None],
+        minutes: float,
+        description: str = "",
+        backlog: Optional[Callable[[], Optional[int]]] = None,
+    ) -> ScheduledJob:
+        """
+        Registra (o reemplaza) una tarea periódica.
+
+        Args:
+            name: Identificador único (también es el id del job en APScheduler)
+            func: Función a ejecutar en cada intervalo
+            minutes: Intervalo en minutos
+            description: Nombre legible para logs
+            backlog: Función que mide el trabajo pendiente tras cada ejecución
+
+        Returns:
+            La tarea registrada
+        """
+        job = ScheduledJob(name=name, func=func, minutes=minutes,
+                           description=description or name, backlog=backlog)
+        with self._lock:
+            self._jobs[name] = job
+        return job
+
+    def jobs(self) -> List[ScheduledJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def get(self, name: str) -> Optional[ScheduledJob]:
+        return self._jobs.get(name)
+
+    def run_job(self, name: str):
+        """
+        Ejecuta una tarea registrada actualizando sus métricas.
+
+        Los errores se registran en las métricas y en el log, nunca se propagan
+        (un fallo no debe parar el scheduler).
+        """
+        job = self._jobs[name]
+        metrics = job.metrics
+        metrics.running = True
+        metrics.last_started_at = datetime.utcnow()
+        start = time.perf_counter()
+        try:
+            job.func()
+            metrics.last_error = None
+        except Exception as e:
+            metrics.failures += 1
+            metrics.last_error = str(e)
+            logger.error(f"❌ [JOBS] Error en tarea {name}: {e}", exc_info=True)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.running = False
+            metrics.runs += 1
+            metrics.last_duration_seconds = elapsed
+            metrics.total_duration_seconds += elapsed
+            metrics.max_duration_seconds = max(metrics.max_duration_seconds, elapsed)
+
+        if job.backlog is not None:
+            try:
+                metrics.backlog = job.backlog()
+            except Exception as e:
+                logger.warning(f"⚠️  [JOBS] No se pudo medir el backlog de {name}: {e}")
+
+        logger.info(
+            f"🗓️  [JOBS] {name}: {elapsed:.2f}s"
+            + (f", backlog={metrics.backlog}" if metrics.backlog is not None else "")
+        )
+
+    def build_scheduler(self):
+        """
+        Crea un BackgroundScheduler (sin arrancar) con todas las tareas registradas.
+
+        Returns:
+            BackgroundScheduler instance
+        """
+        from apscheduler.schedulers.background import BackgroundScheduler
+
+        scheduler = BackgroundScheduler()
+        for job in self.jobs():
+            scheduler.add_job(
+                self.run_job,
+                "interval",
+                args=[job.name],
+                minutes=job.minutes,
+                id=job.name,
+                name=job.description,
+                max_instances=1,
+                replace_existing=True,
+                coalesce=True,           # Si se acumulan disparos perdidos, ejecutar solo una vez
+                misfire_grace_time=60,   # Tolerar hasta 60s de retraso antes de cancelar el disparo
+            )
+        return scheduler
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Métricas de todas las tareas (para health checks y logs)."""
+        return {job.name: {"minutes": job.minutes, **job.metrics.to_dict()} for job in self.jobs()}
+
+    def metrics_text(self, extra: Optional[Dict[str, float]] = None) -> str:
+        """
+        Métricas en formato de texto de Prometheus.
+
+        Args:
+            extra: Métricas adicionales sin etiquetas (p.ej. worker_is_leader)
+        """
+        lines = []
+        series = [
+            ("job_runs_total", "counter", "Ejecuciones de la tarea", lambda m: m.runs),
+            ("job_failures_total", "counter", "Ejecuciones fallidas", lambda m: m.failures),
+            ("job_running", "gauge", "1 si la tarea se está ejecutando", lambda m: int(m.running)),
+            ("job_last_duration_seconds", "gauge", "Duración de la última ejecución",
+             lambda m: round(m.last_duration_seconds, 3)),
+            ("job_max_duration_seconds", "gauge", "Duración máxima observada",
+             lambda m: round(m.max_duration_seconds, 3)),
+            ("job_last_run_timestamp_seconds", "gauge", "Inicio de la última ejecución (epoch)",
+             lambda m: int((m.last_started_at - datetime(1970, 1, 1)).total_seconds()) if m.last_started_at else 0),
+            ("job_backlog", "gauge", "Trabajo pendiente reportado por la tarea",
+             lambda m: m.backlog),
+        ]
+        jobs = self.jobs()
+        for metric, kind, help_text, getter in series:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for job in jobs:
+                value = getter(job.metrics)
+                if value is not None:
+                    lines.append(f'{metric}{{job="{job.name}"}} {value}')
+        for metric, value in (extra or {}).items():
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Registro global de tareas
+job_registry = JobRegistry()
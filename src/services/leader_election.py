@@ -0,0 +1,126 @@
+"""
+Leader Election
+
+Elección de líder entre réplicas del worker de tareas programadas usando un
+sp_getapplock de sesión en SQL Server (sin dependencias extra: la BD ya es
+el punto común de todos los procesos).
+
+    - El líder mantiene una conexión dedicada (fuera de las sesiones del ORM)
+      con el lock 'Exclusive' de sesión tomado mientras viva el proceso
+    - El resto de réplicas reintentan cada WORKER_LEADER_RETRY_SECONDS
+    - Si la conexión del líder se pierde, SQL Server libera el lock y otra
+      réplica lo toma; el líder lo detecta en el siguiente heartbeat
+      (APPLOCK_MODE) y deja de ejecutar tareas
+"""
+
+import logging
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+
+logger = logging.getLogger(__name__)
+
+# Recurso del lock de liderazgo
+LEADER_LOCK_RESOURCE = "scheduler_worker_leader"
+
+
+class LeaderLock:
+    """
+    Lock de liderazgo sobre una conexión dedicada.
+
+    Uso:
+        lock = LeaderLock(engine)
+        if lock.acquire():
+            while lock.is_held():
+                ...
+            lock.release()
+    """
+
+    def __init__(self, engine: Engine, resource: str = LEADER_LOCK_RESOURCE):
+        self.engine = engine
+        self.resource = resource
+        self._conn: Optional[Connection] = None
+
+    @property
+    def held(self) -> bool:
+        return self._conn is not None
+
+    def acquire(self) -> bool:
+        """
+        Intenta tomar el liderazgo sin esperar.
+
+        Returns:
+            True si este proceso es ahora el líder
+        """
+        if self._conn is not None:
+            return self.is_held()
+        conn = self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            # sp_getapplock usa RETURN value (no result set), hay que capturarlo con DECLARE.
+            row = conn.execute(
+                text(
+                    "DECLARE @ret INT; "
+                    "EXEC @ret = sp_getapplock "
+                    "  @Resource = :resource, "
+                    "  @LockMode = 'Exclusive', "
+                    "  @LockOwner = 'Session', "
+                    "  @LockTimeout = 0; "
+                    "SELECT @ret AS lock_result;"
+                ),
+                {"resource": self.resource},
+            ).fetchone()
+        except Exception as e:
+            logger.warning(f"⚠️  [WORKER] No se pudo intentar el lock de líder: {e}")
+            conn.invalidate()
+            conn.close()
+            return False
+
+        if row is None or row[0] < 0:
+            conn.close()
+            return False
+        self._conn = conn
+        return True
+
+    def is_held(self) -> bool:
+        """Heartbeat: comprueba que la conexión sigue viva y conserva el lock."""
+        if self._conn is None:
+            return False
+        try:
+            mode = self._conn.execute(
+                text("SELECT APPLOCK_MODE('public', :resource, 'Session')"),
+                {"resource": self.resource},
+            ).scalar()
+        except Exception as e:
+            logger.error(f"❌ [WORKER] Conexión del líder perdida: {e}")
+            self._drop()
+            return False
+        if mode != "Exclusive":
+            logger.error(f"❌ [WORKER] Lock de líder perdido (modo={mode})")
+            self._drop()
+            return False
+        return True
+
+    def release(self):
+        """Cede el liderazgo (al parar el worker)."""
+        if self._conn is None:
+            return
+        try:
+            self._conn.execute(
+                text("EXEC sp_releaseapplock @Resource = :resource, @LockOwner = 'Session'"),
+                {"resource": self.resource},
+            )
+            self._conn.close()
+        except Exception as e:
+            logger.warning(f"⚠️  [WORKER] Error liberando el lock de líder: {e}")
+            self._drop()
+        self._conn = None
+
+    def _drop(self):
+        # La conexión no vuelve al pool: podría conservar el lock de sesión
+        try:
+            self._conn.invalidate()
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
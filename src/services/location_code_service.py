@@ -0,0 +1,69 @@
+"""
+Servicio de mantenimiento del código persistido de ubicaciones.
+
+ProductLocation.codigo guarda el código legible ("A-IZQ-12-H2") para que los
+escaneos de la PDA resuelvan la ubicación con un lookup indexado en lugar de
+cargar toda la tabla y comparar la propiedad computada en Python.
+
+Las escrituras vía ORM mantienen la columna automáticamente (listener
+before_insert/before_update en orm.py). Este servicio completa las filas
+antiguas que aún tienen codigo NULL.
+
+SQL para añadir la columna en la BD existente:
+
+    ALTER TABLE product_locations ADD codigo NVARCHAR(60) NULL;
+    CREATE INDEX idx_location_codigo ON product_locations (codigo, activa);
+"""
+
+import logging
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.config import SessionLocal
+from src.adapters.secondary.database.orm import ProductLocation
+
+logger = logging.getLogger(__name__)
+
+
+def backfill_location_codes(db: Optional[Session] = None, batch_size: int = 1000) -> int:
+    """
+    Rellena ProductLocation.codigo en las filas que aún no lo tienen.
+
+    Procesa en lotes por id para no cargar la tabla completa en memoria.
+
+    Args:
+        db: Sesión de base de datos (opcional, se crea una si no se provee)
+        batch_size: Número de ubicaciones por lote
+
+    Returns:
+        Número de ubicaciones actualizadas
+    """
+    own_session = db is None
+    db = db or SessionLocal()
+    updated = 0
+    try:
+        last_id = 0
+        while True:
+            batch = db.query(ProductLocation).filter(
+                ProductLocation.codigo == None,
+                ProductLocation.id > last_id,
+            ).order_by(ProductLocation.id).limit(batch_size).all()
+            if not batch:
+                break
+
+            for loc in batch:
+                loc.codigo = loc.codigo_ubicacion
+            last_id = batch[-1].id
+            updated += len(batch)
+            db.commit()
+
+        if updated:
+            logger.info(f"[LOCATION-CODES] {updated} ubicaciones con código persistido")
+        return updated
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
@@ -0,0 +1,193 @@
+"""
+Order Counters Service
+
+Mantiene los contadores agregados almacenados en `orders`:
+
+    - total_items         → suma de cantidad_solicitada de sus líneas
+    - items_completados   → suma de cantidad_servida
+    - total_lineas        → número de líneas
+    - lineas_completadas  → líneas con cantidad_servida >= cantidad_solicitada
+
+Antes eran hybrid_property: cada listado sumaba order_lines en memoria (con
+selectinload de todas las líneas) o con subconsultas correlacionadas por
+fila. Ahora se leen como columnas normales y se actualizan en las rutas de
+escritura:
+
+    - Escaneo de la PDA (picking_session_service._persist_increments):
+      incremento atómico en el mismo UPDATE/commit que las líneas
+    - Reset de línea, cambios de cantidad, batch update B2B y órdenes
+      importadas desde CSV (order_loader_service): refresh_order_counters()
+      antes del commit
+    - Órdenes importadas por el ETL externo (escribe directamente en
+      order_lines) y cualquier deriva: reconcile_order_counters(), tarea
+      periódica del registro de jobs (ORDER_COUNTERS_RECONCILE_MINUTES)
+
+Migración (SQL Server):
+
+    ALTER TABLE orders ADD
+        total_items        INT NOT NULL CONSTRAINT DF_orders_total_items DEFAULT 0,
+        items_completados  INT NOT NULL CONSTRAINT DF_orders_items_completados DEFAULT 0,
+        total_lineas       INT NOT NULL CONSTRAINT DF_orders_total_lineas DEFAULT 0,
+        lineas_completadas INT NOT NULL CONSTRAINT DF_orders_lineas_completadas DEFAULT 0;
+
+    UPDATE o SET
+        total_items        = a.total_items,
+        items_completados  = a.items_completados,
+        total_lineas       = a.total_lineas,
+        lineas_completadas = a.lineas_completadas
+    FROM orders o
+    JOIN (
+        SELECT order_id,
+               SUM(cantidad_solicitada) AS total_items,
+               SUM(cantidad_servida)    AS items_completados,
+               COUNT(*)                 AS total_lineas,
+               SUM(CASE WHEN cantidad_servida >= cantidad_solicitada THEN 1 ELSE 0 END) AS lineas_completadas
+        FROM order_lines GROUP BY order_id
+    ) a ON a.order_id = o.id;
+"""
+
+import logging
+from typing import Iterable, List, Optional
+
+from sqlalchemy import case, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.config import (
+    SessionLocal,
+    ORDER_COUNTERS_RECONCILE_MINUTES,
+)
+from src.adapters.secondary.database.orm import Order, OrderLine, OrderStatus
+from src.services.job_registry import job_registry
+
+logger = logging.getLogger(__name__)
+
+# Columnas de orders mantenidas por este servicio
+COUNTER_FIELDS = ["total_items", "items_completados", "total_lineas", "lineas_completadas"]
+
+# Estados cuyas líneas ya no cambian: fuera de la reconciliación periódica
+FINAL_STATUS_CODES = ("SHIPPED", "CANCELLED")
+
+# Tamaño de los IN (SQL Server admite ~2100 parámetros por sentencia)
+_CHUNK_SIZE = 1000
+
+RECONCILE_JOB_NAME = "order_counters_reconcile"
+
+
+def _line_completed():
+    return case((OrderLine.cantidad_servida >= OrderLine.cantidad_solicitada, 1), else_=0)
+
+
+def _line_aggregate(expr):
+    """Subconsulta correlacionada con orders: agregado de sus líneas (0 si no tiene)."""
+    return (
+        select(func.coalesce(expr, 0))
+        .where(OrderLine.order_id == Order.id)
+        .correlate(Order)
+        .scalar_subquery()
+    )
+
+
+def refresh_order_counters(db: Session, order_ids: Iterable[int]) -> None:
+    """
+    Recalcula los contadores de las órdenes indicadas desde order_lines.
+
+    Un UPDATE set-based por bloque de órdenes, dentro de la transacción del
+    llamador (no hace commit). Hace flush antes para incluir los cambios
+    pendientes de las líneas y expira los contadores de las instancias Order
+    ya cargadas en la sesión para que la siguiente lectura vea el valor nuevo.
+
+    Args:
+        db: Sesión de base de datos
+        order_ids: IDs de las órdenes modificadas
+    """
+    ids = sorted({order_id for order_id in order_ids if order_id is not None})
+    if not ids:
+        return
+
+    db.flush()
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        chunk = ids[start:start + _CHUNK_SIZE]
+        db.execute(
+            update(Order)
+            .where(Order.id.in_(chunk))
+            .values(
+                total_items=_line_aggregate(func.sum(OrderLine.cantidad_solicitada)),
+                items_completados=_line_aggregate(func.sum(OrderLine.cantidad_servida)),
+                total_lineas=_line_aggregate(func.count(OrderLine.id)),
+                lineas_completadas=_line_aggregate(func.sum(_line_completed())),
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    id_set = set(ids)
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Order) and obj.id in id_set:
+            db.expire(obj, COUNTER_FIELDS)
+
+
+def find_drifted_orders(db: Session) -> List[int]:
+    """
+    Órdenes abiertas cuyos contadores almacenados no coinciden con sus líneas.
+
+    Returns:
+        Lista de IDs de orden a recalcular
+    """
+    totals = (
+        select(
+            OrderLine.order_id.label("order_id"),
+            func.sum(OrderLine.cantidad_solicitada).label("total_items"),
+            func.sum(OrderLine.cantidad_servida).label("items_completados"),
+            func.count(OrderLine.id).label("total_lineas"),
+            func.sum(_line_completed()).label("lineas_completadas"),
+        )
+        .group_by(OrderLine.order_id)
+        .subquery()
+    )
+    drift = [
+        getattr(Order, field) != func.coalesce(getattr(totals.c, field), 0)
+        for field in COUNTER_FIELDS
+    ]
+    rows = db.execute(
+        select(Order.id)
+        .join(OrderStatus, OrderStatus.id == Order.status_id)
+        .outerjoin(totals, totals.c.order_id == Order.id)
+        .where(OrderStatus.codigo.notin_(FINAL_STATUS_CODES), or_(*drift))
+    ).all()
+    return [row.id for row in rows]
+
+
+def reconcile_order_counters(db: Optional[Session] = None) -> int:
+    """
+    Corrige los contadores de las órdenes abiertas que se hayan desviado
+    (ETL externo, escrituras fuera de las rutas instrumentadas...).
+
+    Args:
+        db: Sesión opcional (si no se pasa, se abre y se cierra una propia)
+
+    Returns:
+        Número de órdenes corregidas
+    """
+    owns_session = db is None
+    db = db or SessionLocal()
+    try:
+        order_ids = find_drifted_orders(db)
+        if order_ids:
+            refresh_order_counters(db, order_ids)
+        db.commit()
+        if order_ids:
+            logger.info(f"🔢 [ORDER-COUNTERS] Contadores corregidos en {len(order_ids)} órdenes")
+        return len(order_ids)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if owns_session:
+            db.close()
+
+
+job_registry.register(
+    RECONCILE_JOB_NAME,
+    reconcile_order_counters,
+    minutes=ORDER_COUNTERS_RECONCILE_MINUTES,
+    description="Order Counters Reconciliation",
+)
@@ -0,0 +1,188 @@
+"""
+Order Graph Service
+
+Carga en bloque del "grafo" de una orden para los endpoints de detalle:
+líneas (con producto y ubicación principal), asignaciones de stock con su
+ubicación, cajas y distribuciones en caja.
+
+Antes cada endpoint montaba el grafo a su manera y hacía consultas por
+línea (OrderLineStockAssignment por línea + db.get(ProductLocation) por
+asignación, distribuciones por caja...): una orden de 300 líneas costaba
+cientos de round trips. load_order_graph() hace un número fijo de
+consultas set-based, sin IN por línea (se filtra por order_id con JOIN):
+
+    1. Orden + estado + operario + caja activa
+    2. Líneas + producto + ubicación principal
+    3. Asignaciones + ubicación            (assignments=True)
+    4. Cajas                               (boxes=True)
+    5. Distribuciones en caja              (distributions=True)
+
+Usado por GET /orders/{id}, POST /orders/{id}/optimize-picking-route,
+GET /orders/{id}/packing-distribution y
+GET /operators/{codigo}/orders/{id}/lines.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, joinedload
+
+from src.adapters.secondary.database.orm import (
+    Order,
+    OrderLine,
+    OrderLineBoxDistribution,
+    OrderLineStockAssignment,
+    PackingBox,
+    ProductLocation,
+)
+
+# Tamaño de los IN (SQL Server admite ~2100 parámetros por sentencia)
+_CHUNK_SIZE = 1000
+
+
+@dataclass
+class OrderGraph:
+    """Orden con sus entidades relacionadas ya cargadas."""
+    order: Order
+    lines: List[OrderLine] = field(default_factory=list)
+    # order_line_id → [(asignación, ubicación o None)] en orden de id
+    assignments_by_line: Dict[int, List[Tuple[OrderLineStockAssignment, Optional[ProductLocation]]]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+    boxes: List[PackingBox] = field(default_factory=list)
+    # packing_box_id → distribuciones en orden de id
+    distributions_by_box: Dict[int, List[OrderLineBoxDistribution]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+
+    @property
+    def lines_by_id(self) -> Dict[int, OrderLine]:
+        return {line.id: line for line in self.lines}
+
+    def assignments(self, line_id: int) -> List[Tuple[OrderLineStockAssignment, Optional[ProductLocation]]]:
+        return self.assignments_by_line.get(line_id, [])
+
+    def distributions(self, box_id: int) -> List[OrderLineBoxDistribution]:
+        return self.distributions_by_box.get(box_id, [])
+
+
+def load_order_graph(
+    db: Session,
+    order_id: int,
+    assignments: bool = True,
+    boxes: bool = False,
+    distributions: bool = False,
+    recent_lines: Optional[int] = None,
+) -> Optional[OrderGraph]:
+    """
+    Carga una orden y las partes del grafo pedidas.
+
+    Args:
+        db: Sesión de base de datos
+        order_id: ID de la orden
+        assignments: Cargar asignaciones de stock con su ubicación
+        boxes: Cargar las cajas (ordenadas por numero_caja)
+        distributions: Cargar las distribuciones en caja
+        recent_lines: Solo las N líneas actualizadas más recientemente
+                      (orden updated_at desc); None = todas, por id
+
+    Returns:
+        OrderGraph o None si la orden no existe
+    """
+    order = (
+        db.query(Order)
+        .options(
+            joinedload(Order.status),
+            joinedload(Order.operator),
+            joinedload(Order.caja_activa),
+        )
+        .filter(Order.id == order_id)
+        .first()
+    )
+    if not order:
+        return None
+
+    graph = OrderGraph(order=order)
+
+    lines_query = (
+        db.query(OrderLine)
+        .options(
+            joinedload(OrderLine.product_reference),
+            joinedload(OrderLine.product_location),
+        )
+        .filter(OrderLine.order_id == order_id)
+    )
+    if recent_lines:
+        lines_query = lines_query.order_by(OrderLine.updated_at.desc()).limit(recent_lines)
+    else:
+        lines_query = lines_query.order_by(OrderLine.id)
+    graph.lines = lines_query.all()
+
+    if assignments and graph.lines:
+        rows = (
+            db.query(OrderLineStockAssignment, ProductLocation)
+            .join(OrderLine, OrderLine.id == OrderLineStockAssignment.order_line_id)
+            .outerjoin(ProductLocation, ProductLocation.id == OrderLineStockAssignment.product_location_id)
+            .filter(OrderLine.order_id == order_id)
+        )
+        if recent_lines:
+            rows = rows.filter(OrderLineStockAssignment.order_line_id.in_([line.id for line in graph.lines]))
+        for assignment, location in rows.order_by(OrderLineStockAssignment.id):
+            graph.assignments_by_line[assignment.order_line_id].append((assignment, location))
+
+    if boxes:
+        graph.boxes = (
+            db.query(PackingBox)
+            .filter(PackingBox.order_id == order_id)
+            .order_by(PackingBox.numero_caja.asc())
+            .all()
+        )
+
+    if distributions:
+        rows = (
+            db.query(OrderLineBoxDistribution)
+            .join(PackingBox, PackingBox.id == OrderLineBoxDistribution.packing_box_id)
+            .filter(PackingBox.order_id == order_id)
+            .order_by(OrderLineBoxDistribution.id)
+        )
+        for distribution in rows:
+            graph.distributions_by_box[distribution.packing_box_id].append(distribution)
+
+    return graph
+
+
+def best_picking_locations(db: Session, product_ids, almacen_id: int) -> Dict[int, ProductLocation]:
+    """
+    Mejor ubicación activa de cada producto en un almacén (menor prioridad,
+    luego más stock), en una sola consulta.
+
+    Args:
+        db: Sesión de base de datos
+        product_ids: IDs de producto
+        almacen_id: Almacén (normalmente ALMACEN_PICKING_ID)
+
+    Returns:
+        product_id → ProductLocation
+    """
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return {}
+    best: Dict[int, ProductLocation] = {}
+    for start in range(0, len(product_ids), _CHUNK_SIZE):
+        locations = (
+            db.query(ProductLocation)
+            .filter(
+                ProductLocation.product_id.in_(product_ids[start:start + _CHUNK_SIZE]),
+                ProductLocation.almacen_id == almacen_id,
+                ProductLocation.activa == True,
+            )
+            .order_by(
+                ProductLocation.product_id,
+                ProductLocation.prioridad.asc(),
+                ProductLocation.stock_actual.desc(),
+            )
+        )
+        for location in locations:
+            best.setdefault(location.product_id, location)
+    return best
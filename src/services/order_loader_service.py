@@ -25,6 +25,7 @@ from adapters.secondary.database.orm import (
     Operator, ProductReference, EAN, 
     Almacen, Client, Address
 )
+from src.services.order_counters_service import refresh_order_counters
 
 logger = logging.getLogger(__name__)
 
@@ -229,6 +230,10 @@ class OrderLoaderService:
             self._create_order_line(new_order, line_data)
             self.stats['lines_created'] += 1
         
+        # Contadores almacenados (total_items, items_completados, total_lineas,
+        # lineas_completadas) recalculados a partir de las líneas recién creadas
+        refresh_order_counters(self.db, [new_order.id])
+        
         # 5. Crear registro en historial
         self._create_history_record(new_order, status)
         
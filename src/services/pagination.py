@@ -0,0 +1,188 @@
+"""
+Pagination
+
+Paginación por cursor (keyset / seek) para los listados grandes (órdenes,
+movimientos de stock, reposiciones, stock semanal, órdenes B2B/B2C).
+
+Con OFFSET/LIMIT la BD recorre y descarta todas las filas anteriores: las
+páginas profundas son cada vez más lentas y, si entran o cambian filas entre
+peticiones (órdenes nuevas, órdenes que dejan de estar "no vistas"...), se
+repiten o se saltan registros. Con keyset cada página continúa desde la
+última fila de la anterior:
+
+    WHERE (fecha_importacion, id) < (:ultima_fecha, :ultimo_id)
+    ORDER BY fecha_importacion DESC, id DESC
+
+El cursor es opaco para el cliente (base64 de los valores de la clave de
+orden de la última fila). Uso desde un endpoint:
+
+    page = paginate(query, ORDER_LIST_KEYS, limit=limit, skip=skip,
+                    cursor=cursor, count=count)
+    page.rows, page.next_cursor, page.total, page.total_is_estimate
+
+Compatibilidad: sin `cursor` se pagina con skip/limit como antes; la
+respuesta incluye ya el cursor de la página siguiente para poder continuar
+en modo cursor (entonces skip se ignora).
+
+Conteo (`count`):
+    - exact    → COUNT(*) completo (comportamiento anterior, por defecto)
+    - estimate → COUNT(*) acotado a PAGINATION_COUNT_CAP filas; si se alcanza
+                 el tope, total = tope y total_is_estimate = True
+    - none     → sin conteo (total = None)
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Query
+
+from src.adapters.secondary.database.config import PAGINATION_COUNT_CAP
+
+# Modos de conteo admitidos (parámetro `count` de los endpoints)
+COUNT_MODES = ("exact", "estimate", "none")
+COUNT_PATTERN = "^(exact|estimate|none)$"
+
+# Clave de orden: [(columna, descendente)], siempre terminando en una columna única
+SortKeys = Sequence[Tuple[Any, bool]]
+
+
+@dataclass
+class Page:
+    """Resultado de una página."""
+    rows: list
+    next_cursor: Optional[str]
+    total: Optional[int]
+    total_is_estimate: bool = False
+
+
+def _key_signature(keys: SortKeys) -> str:
+    return ",".join(column.key for column, _ in keys)
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(keys: SortKeys, values: Sequence[Any]) -> str:
+    """
+    Cursor opaco con los valores de la clave de orden de una fila.
+
+    Args:
+        keys: Clave de orden del listado
+        values: Valores de esa clave en la última fila de la página
+    """
+    payload = {"k": _key_signature(keys), "v": [_encode_value(v) for v in values]}
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(keys: SortKeys, cursor: str) -> List[Any]:
+    """
+    Valores de la clave de orden contenidos en un cursor.
+
+    Raises:
+        HTTPException 400: Si el cursor no es válido o es de otro listado
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [_decode_value(v) for v in payload["v"]]
+        valid = payload["k"] == _key_signature(keys) and len(values) == len(keys)
+    except (ValueError, KeyError, TypeError):
+        valid = False
+    if not valid:
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+    return values
+
+
+def keyset_condition(keys: SortKeys, values: Sequence[Any]):
+    """
+    Condición "fila posterior al cursor" para una clave de orden con
+    direcciones mixtas:
+
+        (k0 > v0) OR (k0 = v0 AND k1 > v1) OR ...   (< en columnas DESC)
+    """
+    branches = []
+    for i, (column, descending) in enumerate(keys):
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        step = column < values[i] if descending else column > values[i]
+        branches.append(and_(*equal_prefix, step))
+    return or_(*branches)
+
+
+def count_rows(query: Query, count: str = "exact") -> Tuple[Optional[int], bool]:
+    """
+    Total de filas de un listado según el modo de conteo.
+
+    Returns:
+        (total o None, True si el total es una cota inferior)
+    """
+    if count == "none":
+        return None, False
+    query = query.order_by(None)
+    if count == "estimate":
+        total = query.limit(PAGINATION_COUNT_CAP).count()
+        return total, total >= PAGINATION_COUNT_CAP
+    return query.count(), False
+
+
+def paginate(
+    query: Query,
+    keys: SortKeys,
+    limit: int,
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    count: str = "exact",
+) -> Page:
+    """
+    Pagina un query por offset o por cursor con la misma clave de orden.
+
+    Args:
+        query: Query ya filtrado (sin order_by ni paginación)
+        keys: Clave de orden [(columna, descendente)]; la última debe ser única
+        limit: Tamaño de página
+        skip: Offset (solo si no hay cursor)
+        cursor: Cursor de la página anterior (next_cursor)
+        count: "exact" | "estimate" | "none"
+
+    Returns:
+        Page con las filas, el cursor siguiente (None en la última página) y el total
+    """
+    total, total_is_estimate = count_rows(query, count)
+
+    page_query = query
+    if cursor:
+        page_query = page_query.filter(keyset_condition(keys, decode_cursor(keys, cursor)))
+    page_query = page_query.order_by(
+        *(column.desc() if descending else column.asc() for column, descending in keys)
+    )
+    if not cursor and skip:
+        page_query = page_query.offset(skip)
+
+    # Una fila extra indica si hay página siguiente
+    rows = page_query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(keys, [getattr(last, column.key) for column, _ in keys])
+
+    return Page(rows=rows, next_cursor=next_cursor, total=total, total_is_estimate=total_is_estimate)
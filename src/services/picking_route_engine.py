@@ -0,0 +1,191 @@
+"""
+Picking Route Engine
+
+Secuenciación de paradas de picking sobre el modelo de almacén
+(services/warehouse_layout.py) minimizando la distancia a pie. Puro: sin
+ORM ni BD.
+
+Heurísticas de construcción (clásicas para almacenes de pasillos paralelos):
+
+    - S-shape: se recorren enteros los pasillos con recogidas, alternando
+      delante→detrás y detrás→delante. Buena con muchas recogidas por pasillo.
+    - Largest gap: el primer y el último pasillo se recorren enteros; en los
+      intermedios se entra por delante y por detrás hasta el mayor hueco entre
+      recogidas, sin cruzarlo. Mejor con pocas recogidas por pasillo.
+
+Sobre la mejor de las dos se aplica una mejora 2-opt (invertir tramos
+mientras acorte la ruta) con la métrica del modelo. La ruta sale y vuelve al
+depósito (delante del primer pasillo).
+
+El tiempo estimado es distancia / PICKING_WALK_SPEED_MPS más el tiempo de
+cada recogida (con extra por altura), en lugar de un fijo por parada.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Sequence
+
+from src.services.warehouse_layout import PickPoint, WarehouseLayout
+
+METHOD_S_SHAPE = "s_shape"
+METHOD_LARGEST_GAP = "largest_gap"
+METHODS = (METHOD_S_SHAPE, METHOD_LARGEST_GAP)
+
+# Por encima de este número de paradas no se aplica 2-opt (coste O(n²) por pasada)
+TWO_OPT_MAX_STOPS = 400
+TWO_OPT_MAX_PASSES = 20
+
+
+@dataclass
+class RoutePlan:
+    """Ruta calculada: índices de los puntos de entrada en orden de visita."""
+    sequence: List[int]
+    distance_m: float
+    estimated_seconds: float
+    method: str
+
+
+def route_distance(layout: WarehouseLayout, points: Sequence[PickPoint], sequence: Sequence[int]) -> float:
+    """Metros de la ruta depósito → puntos en orden → depósito."""
+    total = 0.0
+    previous = layout.depot
+    for index in sequence:
+        total += layout.distance(previous, points[index])
+        previous = points[index]
+    return total + layout.distance(previous, layout.depot)
+
+
+def estimate_seconds(layout: WarehouseLayout, points: Sequence[PickPoint], distance_m: float) -> float:
+    """Tiempo estimado: recorrido a pie más recogidas."""
+    walking = distance_m / layout.config.walk_speed_mps
+    return walking + sum(layout.pick_seconds(point) for point in points)
+
+
+def _by_aisle(points: Sequence[PickPoint]) -> Dict[int, List[int]]:
+    aisles: Dict[int, List[int]] = defaultdict(list)
+    for index, point in enumerate(points):
+        aisles[point.aisle].append(index)
+    for indices in aisles.values():
+        indices.sort(key=lambda i: points[i].y)
+    return aisles
+
+
+def s_shape(layout: WarehouseLayout, points: Sequence[PickPoint]) -> List[int]:
+    """Secuencia S-shape (serpentina por los pasillos con recogidas)."""
+    sequence: List[int] = []
+    aisles = _by_aisle(points)
+    for turn, aisle in enumerate(sorted(aisles)):
+        indices = aisles[aisle]
+        sequence.extend(indices if turn % 2 == 0 else reversed(indices))
+    return sequence
+
+
+def largest_gap(layout: WarehouseLayout, points: Sequence[PickPoint]) -> List[int]:
+    """Secuencia largest gap."""
+    aisles = _by_aisle(points)
+    order = sorted(aisles)
+    if len(order) == 1:
+        return list(aisles[order[0]])
+
+    from_back: List[int] = []
+    from_front: List[List[int]] = []
+    for aisle in order[1:-1]:
+        indices = aisles[aisle]
+        ys = [0.0] + [points[i].y for i in indices] + [layout.length_m]
+        # Hueco k = entre ys[k] y ys[k + 1]; se cruza el mayor y no se recorre
+        gaps = [ys[k + 1] - ys[k] for k in range(len(ys) - 1)]
+        split = max(range(len(gaps)), key=gaps.__getitem__)
+        from_front.append(indices[:split])
+        from_back.extend(reversed(indices[split:]))
+
+    # Primer pasillo entero hacia detrás, tramos traseros de izquierda a
+    # derecha, último pasillo entero hacia delante y, de vuelta por el
+    # transversal delantero, los tramos delanteros de derecha a izquierda
+    sequence = list(aisles[order[0]])
+    sequence.extend(from_back)
+    sequence.extend(reversed(aisles[order[-1]]))
+    for indices in reversed(from_front):
+        sequence.extend(indices)
+    return sequence
+
+
+def two_opt(
+    layout: WarehouseLayout,
+    points: Sequence[PickPoint],
+    sequence: List[int],
+    max_passes: int = TWO_OPT_MAX_PASSES,
+) -> List[int]:
+    """
+    Mejora 2-opt de una secuencia (extremos fijos en el depósito).
+
+    Returns:
+        Nueva secuencia, nunca más larga que la de entrada
+    """
+    n = len(sequence)
+    if n < 3 or n > TWO_OPT_MAX_STOPS:
+        return list(sequence)
+
+    # Nodo 0 y n + 1 = depósito; matriz de distancias de la ruta
+    nodes = [layout.depot] + [points[i] for i in sequence] + [layout.depot]
+    dist = [[layout.distance(a, b) for b in nodes] for a in nodes]
+    route = list(range(n + 2))
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n):
+            a, b = route[i - 1], route[i]
+            for j in range(i + 1, n + 1):
+                c, d = route[j], route[j + 1]
+                if dist[a][c] + dist[b][d] < dist[a][b] + dist[c][d] - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    b = route[i]
+                    improved = True
+        if not improved:
+            break
+
+    return [sequence[node - 1] for node in route[1:-1]]
+
+
+def plan_route(
+    layout: WarehouseLayout,
+    points: Sequence[PickPoint],
+    method: str = "auto",
+    improve: bool = True,
+) -> RoutePlan:
+    """
+    Calcula la ruta de recogida de un conjunto de puntos.
+
+    Args:
+        layout: Modelo del almacén
+        points: Puntos de recogida (uno por parada)
+        method: "auto" (la mejor de las heurísticas), "s_shape" o "largest_gap"
+        improve: Aplicar 2-opt sobre la secuencia construida
+
+    Returns:
+        RoutePlan con la secuencia, la distancia y el tiempo estimado
+    """
+    if not points:
+        return RoutePlan(sequence=[], distance_m=0.0, estimated_seconds=0.0, method=method)
+
+    builders = {METHOD_S_SHAPE: s_shape, METHOD_LARGEST_GAP: largest_gap}
+    candidates = METHODS if method == "auto" else (method,)
+    best_method, best_sequence, best_distance = None, None, None
+    for name in candidates:
+        sequence = builders[name](layout, points)
+        distance = route_distance(layout, points, sequence)
+        if best_distance is None or distance < best_distance:
+            best_method, best_sequence, best_distance = name, sequence, distance
+
+    if improve:
+        improved = two_opt(layout, points, best_sequence)
+        improved_distance = route_distance(layout, points, improved)
+        if improved_distance < best_distance - 1e-9:
+            best_method = f"{best_method}+2opt"
+            best_sequence, best_distance = improved, improved_distance
+
+    return RoutePlan(
+        sequence=best_sequence,
+        distance_m=round(best_distance, 2),
+        estimated_seconds=round(estimate_seconds(layout, points, best_distance), 1),
+        method=best_method,
+    )
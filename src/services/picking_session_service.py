@@ -0,0 +1,570 @@
+"""
+Picking Session Cache
+
+Sesión de picking en memoria por operario para el escaneo de la PDA
+(acción scan_product del WebSocket de operarios).
+
+Antes, cada escaneo +1 volvía a consultar la orden, su estado, la línea por
+EAN, todas las asignaciones de stock, cada ProductLocation, la distribución
+en caja y la caja activa (~8 round trips). Ahora:
+
+    - La primera vez que el operario escanea una orden se carga una sesión
+      con el mapa EAN→línea, las asignaciones con su código de ubicación y
+      la distribución en la caja activa.
+    - En cada escaneo se hace UNA lectura de validación (estado, operario,
+      caja activa y unidades servidas de la orden) y solo escrituras
+      (UPDATEs condicionados + commit, incluidos los contadores almacenados
+      de la orden). Sin SELECTs de líneas/asignaciones.
+
+Consistencia:
+    - La línea se actualiza con guarda optimista (cantidad_servida esperada).
+      Si otro proceso la modificó (reset, otro worker...), la sesión se
+      descarta, se recarga desde BD y se reintenta una vez.
+    - Si cambian el estado, el operario o la caja activa de la orden, la
+      sesión se recarga antes de validar.
+    - Lotes de escaneos (scan_batch): la PDA reenvía el lote si pierde el
+      ack. ScanSeqLog recuerda los seq ya procesados por (operario, orden,
+      epoch del contador de la PDA), fuera de la sesión para que sobreviva
+      a recargas y reconexiones, y apply_scan_batch() devuelve el resultado
+      anterior en vez de volver a sumar la unidad. Es memoria del proceso: con varios workers el
+      reenvío debe llegar al mismo (la conexión WebSocket es del worker).
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import case, update
+from sqlalchemy.orm import Session, selectinload
+
+from src.adapters.secondary.database.orm import (
+    Order, OrderLine, OrderLineBoxDistribution, OrderLineStockAssignment,
+    PackingBox, ProductLocation,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PickingAssignment:
+    """Asignación de stock de una línea (ubicación desde la que se sirve)."""
+    id: int
+    location_code: Optional[str]
+    cantidad_reservada: int
+    cantidad_servida: int
+
+
+@dataclass
+class PickingLine:
+    """Estado en memoria de una línea de la orden."""
+    id: int
+    ean: str
+    cantidad_solicitada: int
+    cantidad_servida: int
+    estado: str
+    producto_nombre: str
+    assignments: List[PickingAssignment] = field(default_factory=list)
+    # Distribución de esta línea en la caja activa (None si aún no existe)
+    box_distribution_id: Optional[int] = None
+
+
+@dataclass
+class PickingSession:
+    """Sesión de picking de un operario sobre una orden IN_PICKING."""
+    order_id: int
+    numero_orden: str
+    operator_id: int
+    in_picking_status_id: int
+    caja_activa_id: Optional[int]
+    total_items: int
+    # Unidades servidas en la orden; se refresca en cada validate_session()
+    items_completados: int
+    lines_by_ean: Dict[str, PickingLine]
+    loaded_at: datetime = field(default_factory=datetime.utcnow)
+
+    def matches(self, order_id: Optional[int], numero_orden: Optional[str]) -> bool:
+        if order_id:
+            return self.order_id == int(order_id)
+        return self.numero_orden == numero_orden
+
+
+class StaleSessionError(Exception):
+    """La sesión en memoria ya no coincide con la BD y debe recargarse."""
+
+
+class PickingSessionCache:
+    """
+    Sesiones de picking indexadas por código de operario.
+
+    Un operario procesa sus mensajes WebSocket de uno en uno, así que una
+    sesión nunca se muta en paralelo; el lock protege solo el diccionario
+    frente a invalidaciones desde peticiones HTTP.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, PickingSession] = {}
+        self._lock = threading.Lock()
+
+    def get(self, codigo_operario: str, order_id=None, numero_orden=None) -> Optional[PickingSession]:
+        with self._lock:
+            session = self._sessions.get(codigo_operario)
+        if session and session.matches(order_id, numero_orden):
+            return session
+        return None
+
+    def put(self, codigo_operario: str, session: PickingSession) -> None:
+        with self._lock:
+            self._sessions[codigo_operario] = session
+
+    def invalidate_operator(self, codigo_operario: str) -> None:
+        with self._lock:
+            self._sessions.pop(codigo_operario, None)
+
+    def invalidate_order(self, order_id: int) -> None:
+        with self._lock:
+            for codigo in [c for c, s in self._sessions.items() if s.order_id == order_id]:
+                del self._sessions[codigo]
+
+    def load(self, db: Session, codigo_operario: str, order: Order) -> PickingSession:
+        """
+        Carga la sesión de picking de una orden ya validada (IN_PICKING y
+        asignada al operario) y la guarda como sesión del operario.
+        """
+        session = build_session(db, order)
+        self.put(codigo_operario, session)
+        logger.debug(f"[PICKING-SESSION] Sesión cargada: {codigo_operario} → orden {order.numero_orden} ({len(session.lines_by_ean)} EANs)")
+        return session
+
+
+def build_session(db: Session, order: Order) -> PickingSession:
+    """
+    Construye la sesión de picking de una orden con 3 consultas:
+    líneas+producto, asignaciones con ubicación y distribuciones en la caja
+    activa. No la guarda en ninguna caché.
+    """
+    lines = (
+        db.query(OrderLine)
+        .options(selectinload(OrderLine.product_reference))
+        .filter(OrderLine.order_id == order.id)
+        .order_by(OrderLine.id)
+        .all()
+    )
+
+    lines_by_id: Dict[int, PickingLine] = {}
+    lines_by_ean: Dict[str, PickingLine] = {}
+    total_items = 0
+    items_completados = 0
+    for line in lines:
+        producto_nombre = "Producto"
+        if line.product_reference:
+            producto_nombre = line.product_reference.nombre_producto
+            if line.product_reference.nombre_color:
+                producto_nombre += f" {line.product_reference.nombre_color}"
+            if line.product_reference.talla:
+                producto_nombre += f" {line.product_reference.talla}"
+
+        picking_line = PickingLine(
+            id=line.id,
+            ean=line.ean,
+            cantidad_solicitada=line.cantidad_solicitada,
+            cantidad_servida=line.cantidad_servida or 0,
+            estado=line.estado,
+            producto_nombre=producto_nombre,
+        )
+        lines_by_id[line.id] = picking_line
+        # Igual que el filtro original por EAN: la primera línea gana
+        lines_by_ean.setdefault(line.ean, picking_line)
+        total_items += line.cantidad_solicitada
+        items_completados += line.cantidad_servida or 0
+
+    if lines_by_id:
+        rows = (
+            db.query(OrderLineStockAssignment, ProductLocation)
+            .outerjoin(ProductLocation, OrderLineStockAssignment.product_location_id == ProductLocation.id)
+            .filter(OrderLineStockAssignment.order_line_id.in_(lines_by_id.keys()))
+            .order_by(OrderLineStockAssignment.id)
+            .all()
+        )
+        for assignment, loc in rows:
+            lines_by_id[assignment.order_line_id].assignments.append(PickingAssignment(
+                id=assignment.id,
+                location_code=loc.codigo_ubicacion if loc else None,
+                cantidad_reservada=assignment.cantidad_reservada,
+                cantidad_servida=assignment.cantidad_servida or 0,
+            ))
+
+        if order.caja_activa_id:
+            distributions = db.query(
+                OrderLineBoxDistribution.id, OrderLineBoxDistribution.order_line_id
+            ).filter(
+                OrderLineBoxDistribution.packing_box_id == order.caja_activa_id,
+                OrderLineBoxDistribution.order_line_id.in_(lines_by_id.keys()),
+            ).all()
+            for dist_id, line_id in distributions:
+                lines_by_id[line_id].box_distribution_id = dist_id
+
+    return PickingSession(
+        order_id=order.id,
+        numero_orden=order.numero_orden,
+        operator_id=order.operator_id,
+        in_picking_status_id=order.status_id,
+        caja_activa_id=order.caja_activa_id,
+        total_items=total_items,
+        items_completados=items_completados,
+        lines_by_ean=lines_by_ean,
+    )
+
+
+def validate_session(db: Session, session: PickingSession) -> None:
+    """
+    Lectura de validación por escaneo (1 round trip). Refresca también
+    session.items_completados con el valor real de la BD.
+
+    Raises:
+        StaleSessionError: Si cambió el estado, el operario o la caja activa
+    """
+    row = db.query(
+        Order.status_id,
+        Order.operator_id,
+        Order.caja_activa_id,
+        Order.items_completados.label("items_completados"),
+    ).filter(Order.id == session.order_id).first()
+
+    if (
+        not row
+        or row.status_id != session.in_picking_status_id
+        or row.operator_id != session.operator_id
+        or row.caja_activa_id != session.caja_activa_id
+    ):
+        raise StaleSessionError()
+    session.items_completados = row.items_completados or 0
+
+
+def _line_estado(cantidad_servida: int, cantidad_solicitada: int, estado_actual: str) -> str:
+    """Estado de la línea tras servir unidades (misma regla que el escaneo original)."""
+    if cantidad_servida == cantidad_solicitada:
+        return "COMPLETED"
+    elif cantidad_servida > 0:
+        return "PARTIAL"
+    return estado_actual
+
+
+def _select_assignment(
+    line: PickingLine,
+    ubicacion: Optional[str],
+    pending: Dict[int, int],
+) -> Optional[PickingAssignment]:
+    """
+    Elige la asignación a la que imputar una unidad servida.
+
+    Args:
+        line: Línea escaneada
+        ubicacion: Código de ubicación enviado por la PDA (opcional)
+        pending: Unidades ya imputadas en este lote por assignment.id (aún sin persistir)
+    """
+    def has_room(a: PickingAssignment) -> bool:
+        return a.cantidad_servida + pending.get(a.id, 0) < a.cantidad_reservada
+
+    # Si PDA envía ubicación, intentar matchear
+    if ubicacion:
+        for a in line.assignments:
+            if has_room(a) and a.location_code == ubicacion:
+                return a
+    # Fallback: primer assignment con espacio disponible
+    for a in line.assignments:
+        if has_room(a):
+            return a
+    return None
+
+
+def _persist_increments(
+    db: Session,
+    session: PickingSession,
+    line_units: Dict[int, int],
+    assignment_units: Dict[int, int],
+) -> None:
+    """
+    Persiste en una transacción las unidades servidas por línea y asignación
+    con UPDATEs set-based (un statement por tabla, CASE por id) y actualiza
+    la sesión en memoria tras el commit.
+
+    Raises:
+        StaleSessionError: Si alguna línea cambió en BD desde que se cargó la sesión
+    """
+    lines = {l.id: l for l in session.lines_by_ean.values() if l.id in line_units}
+    assignments = {
+        a.id: a for l in lines.values() for a in l.assignments if a.id in assignment_units
+    }
+    now = datetime.utcnow()
+
+    new_qty = {lid: lines[lid].cantidad_servida + units for lid, units in line_units.items()}
+    new_estado = {
+        lid: _line_estado(new_qty[lid], lines[lid].cantidad_solicitada, lines[lid].estado)
+        for lid in line_units
+    }
+
+    # 1. Líneas, con guarda optimista sobre la cantidad servida esperada
+    line_values = {
+        "cantidad_servida": case(new_qty, value=OrderLine.id),
+        "estado": case(new_estado, value=OrderLine.id),
+    }
+    # Marcar como empacadas las líneas que se completan
+    packed_ids = [
+        lid for lid in line_units
+        if session.caja_activa_id and new_qty[lid] >= lines[lid].cantidad_solicitada
+    ]
+    if packed_ids:
+        line_values["packing_box_id"] = case(
+            (OrderLine.id.in_(packed_ids), session.caja_activa_id), else_=OrderLine.packing_box_id
+        )
+        line_values["fecha_empacado"] = case(
+            (OrderLine.id.in_(packed_ids), now), else_=OrderLine.fecha_empacado
+        )
+
+    result = db.execute(
+        update(OrderLine)
+        .where(
+            OrderLine.id.in_(line_units.keys()),
+            OrderLine.cantidad_servida == case(
+                {lid: l.cantidad_servida for lid, l in lines.items()}, value=OrderLine.id
+            ),
+        )
+        .values(**line_values)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != len(line_units):
+        db.rollback()
+        raise StaleSessionError()
+
+    # 2. Asignaciones (tracking multi-ubicación)
+    if assignment_units:
+        db.execute(
+            update(OrderLineStockAssignment)
+            .where(OrderLineStockAssignment.id.in_(assignment_units.keys()))
+            .values(cantidad_servida=OrderLineStockAssignment.cantidad_servida + case(
+                assignment_units, value=OrderLineStockAssignment.id
+            ))
+            .execution_options(synchronize_session=False)
+        )
+
+    # 3. EMPAQUE AUTOMÁTICO en caja activa usando OrderLineBoxDistribution
+    new_distributions = {}
+    if session.caja_activa_id:
+        existing = {
+            lines[lid].box_distribution_id: units
+            for lid, units in line_units.items() if lines[lid].box_distribution_id
+        }
+        if existing:
+            db.execute(
+                update(OrderLineBoxDistribution)
+                .where(OrderLineBoxDistribution.id.in_(existing.keys()))
+                .values(quantity_in_box=OrderLineBoxDistribution.quantity_in_box + case(
+                    existing, value=OrderLineBoxDistribution.id
+                ))
+                .execution_options(synchronize_session=False)
+            )
+        for lid, units in line_units.items():
+            if not lines[lid].box_distribution_id:
+                new_distributions[lid] = OrderLineBoxDistribution(
+                    order_line_id=lid,
+                    packing_box_id=session.caja_activa_id,
+                    quantity_in_box=units,
+                    fecha_empacado=now,
+                )
+        if new_distributions:
+            db.add_all(new_distributions.values())
+            db.flush()
+
+        db.execute(
+            update(PackingBox)
+            .where(PackingBox.id == session.caja_activa_id)
+            .values(total_items=PackingBox.total_items + sum(line_units.values()))
+            .execution_options(synchronize_session=False)
+        )
+
+    # 4. Contadores almacenados de la orden (incremento atómico)
+    newly_completed = sum(
+        1 for lid in line_units
+        if lines[lid].cantidad_servida < lines[lid].cantidad_solicitada <= new_qty[lid]
+    )
+    db.execute(
+        update(Order)
+        .where(Order.id == session.order_id)
+        .values(
+            items_completados=Order.items_completados + sum(line_units.values()),
+            lineas_completadas=Order.lineas_completadas + newly_completed,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    new_distribution_ids = {lid: d.id for lid, d in new_distributions.items()}
+    db.commit()
+
+    # Reflejar en memoria lo ya persistido
+    for lid, line in lines.items():
+        line.cantidad_servida = new_qty[lid]
+        line.estado = new_estado[lid]
+        if lid in new_distribution_ids:
+            line.box_distribution_id = new_distribution_ids[lid]
+    for aid, units in assignment_units.items():
+        assignments[aid].cantidad_servida += units
+    session.items_completados += sum(line_units.values())
+
+
+def apply_scan(db: Session, session: PickingSession, line: PickingLine, ubicacion: Optional[str]) -> None:
+    """
+    Registra +1 unidad servida en la línea escribiendo solo lo imprescindible:
+    línea (con guarda optimista), asignación, distribución y contador de caja.
+
+    El estado en memoria solo se actualiza tras el commit.
+
+    Raises:
+        StaleSessionError: Si la línea cambió en BD desde que se cargó la sesión
+    """
+    assignment = _select_assignment(line, ubicacion, {})
+    _persist_increments(
+        db, session,
+        line_units={line.id: 1},
+        assignment_units={assignment.id: 1} if assignment else {},
+    )
+
+
+class ScanSeqLog:
+    """
+    Seq de escaneo ya procesados por (operario, orden, epoch), con su resultado.
+
+    El epoch lo envía la PDA e identifica su contador de seq: al reiniciarlo
+    (app reinstalada, contador a cero) manda un epoch nuevo y sus seq no se
+    confunden con los anteriores. Solo un seq guardado se responde como
+    duplicado; uno desconocido se aplica como nuevo. Guarda los últimos
+    MAX_RESULTS_PER_KEY resultados por clave y como mucho MAX_KEYS claves (LRU).
+    """
+
+    MAX_RESULTS_PER_KEY = 1000
+    MAX_KEYS = 2000
+
+    def __init__(self):
+        self._entries: "OrderedDict[Tuple[int, int, Hashable], OrderedDict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(
+        self, operator_id: int, order_id: int, seq: Hashable, epoch: Hashable = None
+    ) -> Optional[dict]:
+        """Resultado anterior de un seq ya procesado (None si es nuevo)."""
+        if seq is None:
+            return None
+        with self._lock:
+            results = self._entries.get((operator_id, order_id, epoch))
+            if results and seq in results:
+                return dict(results[seq])
+        return None
+
+    def record(
+        self, operator_id: int, order_id: int, results: List[dict], epoch: Hashable = None
+    ) -> None:
+        """Registra los resultados de un lote ya persistido."""
+        with self._lock:
+            key = (operator_id, order_id, epoch)
+            stored = self._entries.pop(key, OrderedDict())
+            for result in results:
+                seq = result.get("seq")
+                if seq is None:
+                    continue
+                stored[seq] = result
+            while len(stored) > self.MAX_RESULTS_PER_KEY:
+                stored.popitem(last=False)
+            self._entries[key] = stored
+            while len(self._entries) > self.MAX_KEYS:
+                self._entries.popitem(last=False)
+
+
+def apply_scan_batch(
+    db: Session,
+    session: PickingSession,
+    scans: List[dict],
+    seq_log: Optional[ScanSeqLog] = None,
+    epoch: Hashable = None,
+) -> List[dict]:
+    """
+    Aplica N escaneos de una orden en UNA transacción.
+
+    Cada escaneo se valida en memoria en el orden recibido (acumulando las
+    unidades del propio lote), y las unidades aceptadas se persisten con
+    _persist_increments(): un UPDATE por tabla y un único commit.
+
+    Los seq ya procesados (lote reenviado tras perder el ack) no se vuelven
+    a aplicar: se devuelve su resultado anterior marcado con "duplicado".
+
+    Args:
+        scans: [{"seq": id_cliente, "ean": "...", "ubicacion": "..."}]
+        seq_log: Registro de seq procesados (por defecto el global scan_seq_log)
+        epoch: Identificador del contador de seq de la PDA (None si no lo envía)
+
+    Returns:
+        Resultado por escaneo, en el mismo orden:
+        {"seq", "ean", "status": "ok"|"error", "code", "line_id", "cantidad_actual"}
+
+    Raises:
+        StaleSessionError: Si alguna línea cambió en BD (nada se persiste)
+    """
+    seq_log = seq_log or scan_seq_log
+    line_units: Dict[int, int] = {}
+    assignment_units: Dict[int, int] = {}
+    results = []
+    batch_results: Dict[Hashable, dict] = {}
+
+    def add_result(result: dict) -> None:
+        results.append(result)
+        if result["seq"] is not None:
+            batch_results.setdefault(result["seq"], result)
+
+    for scan in scans:
+        seq = scan.get("seq")
+        ean = scan.get("ean")
+        line = session.lines_by_ean.get(ean) if ean else None
+
+        previous = batch_results.get(seq) if seq is not None else None
+        previous = previous or seq_log.lookup(session.operator_id, session.order_id, seq, epoch)
+        if previous:
+            results.append({"ean": ean, **previous, "duplicado": True})
+            continue
+
+        if not ean:
+            add_result({"seq": seq, "ean": ean, "status": "error", "code": "MISSING_EAN"})
+            continue
+        if not line:
+            add_result({"seq": seq, "ean": ean, "status": "error", "code": "EAN_NOT_IN_ORDER"})
+            continue
+
+        servida = line.cantidad_servida + line_units.get(line.id, 0)
+        if servida >= line.cantidad_solicitada:
+            add_result({
+                "seq": seq, "ean": ean, "status": "error", "code": "MAX_QUANTITY_REACHED",
+                "line_id": line.id, "cantidad_actual": servida,
+            })
+            continue
+
+        line_units[line.id] = line_units.get(line.id, 0) + 1
+        assignment = _select_assignment(line, scan.get("ubicacion"), assignment_units)
+        if assignment:
+            assignment_units[assignment.id] = assignment_units.get(assignment.id, 0) + 1
+        add_result({
+            "seq": seq, "ean": ean, "status": "ok", "code": None,
+            "line_id": line.id, "cantidad_actual": servida + 1,
+        })
+
+    if line_units:
+        _persist_increments(db, session, line_units, assignment_units)
+    seq_log.record(
+        session.operator_id, session.order_id,
+        [r for r in results if not r.get("duplicado")], epoch,
+    )
+    return results
+
+
+# Instancias globales (un proceso = una caché)
+picking_sessions = PickingSessionCache()
+scan_seq_log = ScanSeqLog()
@@ -0,0 +1,363 @@
+"""
+Product Search Service
+
+Índice de búsqueda en memoria para GET /products?search=..., que antes hacía
+ILIKE '%term%' sobre nombre_producto, sku, temporada y referencia más un
+EXISTS sobre ean: SQL Server no puede usar índices con comodín inicial y
+cada pulsación en el buscador recorría product_references y ean.
+
+Índice (por proceso):
+    - Texto normalizado por producto: minúsculas y sin acentos de
+      referencia, sku, nombre_producto, temporada y sus EAN.
+    - Bigramas y trigramas de cada campo → posiciones de producto (array de
+      enteros, compacto).
+    - Búsqueda: se toma la lista del n-grama menos frecuente del término y
+      se verifica la subcadena en cada candidato, así el resultado es el
+      mismo que el del ILIKE (con 1 carácter se recorre el catálogo).
+    - Ranking: coincidencia exacta de referencia/sku/EAN, prefijo de
+      referencia/sku/EAN, prefijo del nombre, prefijo de una palabra del
+      nombre, subcadena del nombre, subcadena de un código y de temporada;
+      a igual puntuación, por ID. Cada nivel es una comprobación de subcadena
+      sobre cadenas preparadas al indexar (códigos entre separadores).
+    - Las últimas búsquedas se cachean hasta el siguiente cambio del índice
+      (paginar o cambiar el filtro de estado no repite la búsqueda).
+
+Actualización:
+    - Un listener after_flush/after_commit de la sesión marca los productos
+      cuyo ProductReference o EAN cambió en este proceso; se recargan (una
+      consulta) antes de la siguiente búsqueda.
+    - Los cambios de otros procesos y del ETL entran con la reconstrucción
+      completa en segundo plano cuando el índice tiene más de
+      PRODUCT_SEARCH_MAX_AGE_SECONDS (se sigue sirviendo el anterior).
+    - Los productos recargados sobre el índice anterior mientras se
+      construye el nuevo se vuelven a marcar al sustituirlo: la construcción
+      pudo leerlos antes del cambio.
+    - Hasta que la primera construcción termina, search() devuelve None y el
+      endpoint usa el ILIKE de siempre.
+"""
+
+import logging
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from src.adapters.secondary.database.config import (
+    SessionLocal,
+    PRODUCT_SEARCH_INDEX_ENABLED,
+    PRODUCT_SEARCH_MAX_AGE_SECONDS,
+)
+from src.adapters.secondary.database.orm import EAN, ProductReference
+
+logger = logging.getLogger(__name__)
+
+# Clave en session.info de los productos modificados pendientes de commit
+_PENDING_KEY = "product_search_dirty"
+
+# Productos por IN en las recargas (límite de parámetros de pyodbc ~2100)
+RELOAD_CHUNK_SIZE = 1000
+
+# Puntuación por tipo de coincidencia (mayor = más relevante)
+SCORE_EXACT_CODE = 100
+SCORE_CODE_PREFIX = 80
+SCORE_NAME_PREFIX = 60
+SCORE_WORD_PREFIX = 50
+SCORE_NAME = 30
+SCORE_CODE = 25
+SCORE_OTHER = 10
+
+# Búsquedas recientes cacheadas (se vacía con cada cambio del índice)
+RESULT_CACHE_SIZE = 128
+
+# Separador de códigos: "\x01ref\x01sku\x01ean\x01" (nunca aparece en un término)
+_SEP = "\x01"
+
+
+def normalize(text: Optional[str]) -> str:
+    """Minúsculas, sin acentos y con los espacios colapsados."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.lower().split())
+
+
+def ngrams(text: str) -> Set[str]:
+    """Bigramas y trigramas de un texto."""
+    return {text[i:i + n] for n in (2, 3) for i in range(len(text) - n + 1)}
+
+
+@dataclass(frozen=True)
+class ProductDocument:
+    """Campos normalizados de un producto."""
+    referencia: str
+    sku: str
+    nombre: str
+    temporada: str
+    eans: Tuple[str, ...] = ()
+
+    @property
+    def codes(self) -> Tuple[str, ...]:
+        return tuple(code for code in (self.referencia, self.sku) + self.eans if code)
+
+
+@dataclass
+class _IndexData:
+    """Estructuras del índice (se sustituyen enteras al reconstruir)."""
+    product_ids: List[int] = field(default_factory=list)
+    names: List[str] = field(default_factory=list)
+    codes: List[str] = field(default_factory=list)
+    temporadas: List[str] = field(default_factory=list)
+    postings: Dict[str, array] = field(default_factory=dict)
+    slot_of: Dict[int, int] = field(default_factory=dict)
+
+    def put(self, product_id: int, document: Optional[ProductDocument]):
+        """Añade o sustituye un producto (la posición anterior queda vacía)."""
+        previous = self.slot_of.pop(product_id, None)
+        if previous is not None:
+            self.names[previous] = self.codes[previous] = self.temporadas[previous] = ""
+        if document is None:
+            return
+        slot = len(self.product_ids)
+        self.product_ids.append(product_id)
+        self.names.append(document.nombre)
+        self.codes.append(_SEP + _SEP.join(document.codes) + _SEP)
+        self.temporadas.append(document.temporada)
+        self.slot_of[product_id] = slot
+
+        grams = ngrams(document.nombre) | ngrams(document.temporada)
+        for code in document.codes:
+            grams |= ngrams(code)
+        for gram in grams:
+            postings = self.postings.get(gram)
+            if postings is None:
+                postings = self.postings[gram] = array("i")
+            postings.append(slot)
+
+
+def _load_documents(db: Session, product_ids: Optional[List[int]] = None) -> Dict[int, ProductDocument]:
+    """Documentos de los productos indicados (o de todo el catálogo) en 2 consultas por bloque."""
+    chunks: Iterable[Optional[List[int]]] = (
+        [product_ids[i:i + RELOAD_CHUNK_SIZE] for i in range(0, len(product_ids), RELOAD_CHUNK_SIZE)]
+        if product_ids is not None else [None]
+    )
+    documents: Dict[int, ProductDocument] = {}
+    for chunk in chunks:
+        products = db.query(
+            ProductReference.id, ProductReference.referencia, ProductReference.sku,
+            ProductReference.nombre_producto, ProductReference.temporada,
+        )
+        eans = db.query(EAN.product_reference_id, EAN.ean)
+        if chunk is not None:
+            products = products.filter(ProductReference.id.in_(chunk))
+            eans = eans.filter(EAN.product_reference_id.in_(chunk))
+
+        eans_by_product: Dict[int, List[str]] = {}
+        for product_id, code in eans.all():
+            if product_id is not None:
+                eans_by_product.setdefault(product_id, []).append(normalize(code))
+        for row in products.all():
+            documents[row.id] = ProductDocument(
+                referencia=normalize(row.referencia),
+                sku=normalize(row.sku),
+                nombre=normalize(row.nombre_producto),
+                temporada=normalize(row.temporada),
+                eans=tuple(sorted(eans_by_product.get(row.id, ()))),
+            )
+    return documents
+
+
+class ProductSearchIndex:
+    """Índice de búsqueda de productos del proceso."""
+
+    def __init__(self, max_age_seconds: int = PRODUCT_SEARCH_MAX_AGE_SECONDS):
+        self.max_age_seconds = max_age_seconds
+        self._data: Optional[_IndexData] = None
+        self._built_at = 0.0
+        self._dirty: Set[int] = set()
+        # Productos recargados durante una construcción (None = no hay ninguna en curso)
+        self._refreshed_during_build: Optional[Set[int]] = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._results: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    @property
+    def ready(self) -> bool:
+        return self._data is not None
+
+    def build(self, db: Session) -> None:
+        """Construye el índice completo y lo sustituye de una vez."""
+        start = time.perf_counter()
+        with self._lock:
+            # Lo marcado a partir de aquí se vuelve a cargar sobre el índice nuevo
+            self._dirty.clear()
+            self._refreshed_during_build = set()
+        try:
+            documents = _load_documents(db)
+            data = _IndexData()
+            for product_id in sorted(documents):
+                data.put(product_id, documents[product_id])
+        except Exception:
+            with self._lock:
+                self._refreshed_during_build = None
+            raise
+        with self._lock:
+            self._data = data
+            self._built_at = time.monotonic()
+            self._results.clear()
+            # Lo recargado sobre el índice anterior pudo leerse antes del cambio
+            self._dirty.update(self._refreshed_during_build)
+            self._refreshed_during_build = None
+        logger.info(
+            f"🔎 [PRODUCT SEARCH] Índice construido: {len(documents)} productos, "
+            f"{len(data.postings)} n-gramas en {time.perf_counter() - start:.2f}s"
+        )
+
+    def start_background_build(self) -> bool:
+        """Lanza build() en un hilo con su propia sesión (False si ya hay uno en curso)."""
+        with self._lock:
+            if self._building:
+                return False
+            self._building = True
+
+        def run():
+            db = SessionLocal()
+            try:
+                self.build(db)
+            except Exception as e:
+                logger.error(f"❌ [PRODUCT SEARCH] Error construyendo el índice: {e}")
+            finally:
+                db.close()
+                with self._lock:
+                    self._building = False
+
+        threading.Thread(target=run, name="product-search-build", daemon=True).start()
+        return True
+
+    def mark_dirty(self, product_ids: Iterable[int]) -> None:
+        with self._lock:
+            self._dirty.update(product_ids)
+
+    def _refresh_dirty(self, db: Session) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return
+        documents = _load_documents(db, sorted(dirty))
+        with self._lock:
+            for product_id in dirty:
+                self._data.put(product_id, documents.get(product_id))
+            self._results.clear()
+            if self._refreshed_during_build is not None:
+                self._refreshed_during_build.update(dirty)
+
+    def search(self, db: Session, term: str) -> Optional[List[int]]:
+        """
+        IDs de los productos que contienen el término, por relevancia.
+
+        Args:
+            db: Sesión de base de datos (para recargar productos modificados)
+            term: Texto buscado
+
+        Returns:
+            IDs ordenados por relevancia, o None si el índice no está
+            disponible (el llamador debe usar la búsqueda SQL)
+        """
+        if not PRODUCT_SEARCH_INDEX_ENABLED:
+            return None
+        if self._data is None:
+            self.start_background_build()
+            return None
+        if time.monotonic() - self._built_at > self.max_age_seconds:
+            self.start_background_build()
+
+        self._refresh_dirty(db)
+        term = normalize(term)
+        if not term:
+            return None
+
+        with self._lock:
+            cached = self._results.get(term)
+            if cached is not None:
+                self._results.move_to_end(term)
+                return cached
+            ranked = self._search(self._data, term)
+            self._results[term] = ranked
+            if len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return ranked
+
+    @staticmethod
+    def _search(data: _IndexData, term: str) -> List[int]:
+        if len(term) >= 2:
+            # El término entero si es un bigrama; si no, sus trigramas
+            grams = {term} if len(term) == 2 else {term[i:i + 3] for i in range(len(term) - 2)}
+            postings = []
+            for gram in grams:
+                posting = data.postings.get(gram)
+                if posting is None:
+                    return []
+                postings.append(posting)
+            candidates = min(postings, key=len)
+        else:
+            candidates = range(len(data.product_ids))
+
+        exact, prefix, word = f"{_SEP}{term}{_SEP}", f"{_SEP}{term}", f" {term}"
+        names, codes, temporadas, product_ids = data.names, data.codes, data.temporadas, data.product_ids
+        matches = []
+        append = matches.append
+        for slot in candidates:
+            slot_codes = codes[slot]
+            name = names[slot]
+            if prefix in slot_codes:
+                score = SCORE_EXACT_CODE if exact in slot_codes else SCORE_CODE_PREFIX
+            elif term in name:
+                score = SCORE_NAME_PREFIX if name.startswith(term) else SCORE_WORD_PREFIX if word in name else SCORE_NAME
+            elif term in slot_codes:
+                score = SCORE_CODE
+            elif term in temporadas[slot]:
+                score = SCORE_OTHER
+            else:
+                continue
+            append((-score, product_ids[slot]))
+
+        matches.sort()
+        return [product_id for _, product_id in matches]
+
+
+# Índice global del proceso
+product_search = ProductSearchIndex()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_products(session, flush_context):
+    changed = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, ProductReference):
+            changed.add(obj.id)
+        elif isinstance(obj, EAN):
+            changed.add(obj.product_reference_id)
+            # Un EAN que cambia de producto también deja de estar en el anterior
+            changed.update(get_history(obj, "product_reference_id").deleted or ())
+    changed.discard(None)
+    if changed:
+        session.info.setdefault(_PENDING_KEY, set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_changed_products(session):
+    changed = session.info.pop(_PENDING_KEY, None)
+    if changed:
+        product_search.mark_dirty(changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_products(session):
+    session.info.pop(_PENDING_KEY, None)
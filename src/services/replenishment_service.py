@@ -2,7 +2,7 @@
 Replenishment Service — Shared logic for creating/upgrading replenishment requests.
 
 Used by:
-    - StockReservationCronService (automatic, priority HIGH)
+    - StockReservationCronService (automatic, priority HIGH, batched per cycle)
     - WebSocket PDA handlers (operator-triggered, priority URGENT)
 
 Centralizes:
@@ -11,20 +11,25 @@ Centralizes:
     - Finding/assigning free picking locations
     - Distributing requests across multiple origins → multiple destinations
     - Reserving stock on REPO origins to prevent double allocation
+
+ReplenishmentPlanner preloads all of that for a batch of products in a few
+queries and plans every request in memory; create_or_upgrade_replenishment
+is the single-product entry point on top of it.
 """
 
 import logging
 import math
 from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
-from sqlalchemy import func
+from sqlalchemy import exists, func, update
 from sqlalchemy.orm import Session
 
 from src.adapters.secondary.database.config import (
     ALMACEN_REPOSICION_ID,
     ALMACEN_PICKING_ID,
+    SLOTTING_PREFERRED_SLOTS,
 )
 from src.adapters.secondary.database.orm import (
     Order,
@@ -34,6 +39,7 @@ from src.adapters.secondary.database.orm import (
     ProductFamily,
     ReplenishmentRequest,
 )
+from src.services.slotting_service import SlottingPolicy
 
 DEFAULT_LOCATION_CAPACITY = 20
 
@@ -53,100 +59,6 @@ class ReplenishmentResult:
     warnings: List[str] = field(default_factory=list)
 
 
-def find_all_replenishment_origins(db: Session, product_id: int) -> List[ProductLocation]:
-    """
-    Busca TODAS las ubicaciones con stock disponible en almacén de reposición.
-    Disponible = stock_actual - stock_reservado > 0.
-    Ordenadas por stock disponible descendente.
-    """
-    available_stock = ProductLocation.stock_actual - func.coalesce(ProductLocation.stock_reservado, 0)
-    return (
-        db.query(ProductLocation)
-        .filter(
-            ProductLocation.product_id == product_id,
-            ProductLocation.almacen_id == ALMACEN_REPOSICION_ID,
-            ProductLocation.activa == True,
-            available_stock > 0,
-        )
-        .order_by(available_stock.desc())
-        .all()
-    )
-
-
-def get_product_capacity(db: Session, product_id: int) -> int:
-    """
-    Obtiene la capacidad máxima por ubicación para un producto,
-    basada en su familia. Si no tiene familia, usa DEFAULT_LOCATION_CAPACITY.
-    """
-    product = db.query(ProductReference).filter_by(id=product_id).first()
-    if product and product.familia_id:
-        familia = db.query(ProductFamily).filter_by(id=product.familia_id).first()
-        if familia and familia.capacidad_ubicacion:
-            return familia.capacidad_ubicacion
-    return DEFAULT_LOCATION_CAPACITY
-
-
-def find_free_picking_locations(db: Session, count: int) -> List[ProductLocation]:
-    """
-    Busca ubicaciones disponibles en el almacén de picking.
-
-    Retorna hasta 'count' ubicaciones.
-    """
-    result: List[ProductLocation] = []
-
-    # 1. Ubicaciones sin producto asignado (las más limpias)
-    free_locations = (
-        db.query(ProductLocation)
-        .filter(
-            ProductLocation.almacen_id == ALMACEN_PICKING_ID,
-            ProductLocation.product_id.is_(None),
-            ProductLocation.activa == True,
-        )
-        .order_by(
-            ProductLocation.pasillo.asc(),
-            ProductLocation.ubicacion.asc(),
-            ProductLocation.altura.asc(),
-        )
-        .limit(count)
-        .all()
-    )
-    result.extend(free_locations)
-
-    # 2. Si no hay suficientes, buscar ubicaciones asignadas pero disponibles
-    remaining = count - len(result)
-    if remaining > 0:
-        candidates = (
-            db.query(ProductLocation)
-            .filter(
-                ProductLocation.almacen_id == ALMACEN_PICKING_ID,
-                ProductLocation.product_id.isnot(None),
-                ProductLocation.activa == True,
-                ProductLocation.stock_actual <= 0,
-                ProductLocation.stock_reservado <= 0,
-            )
-            .order_by(
-                ProductLocation.pasillo.asc(),
-                ProductLocation.ubicacion.asc(),
-                ProductLocation.altura.asc(),
-            )
-            .all()
-        )
-
-        for loc in candidates:
-            if len(result) >= count:
-                break
-            if loc.is_available(db):
-                old_product = loc.product_id
-                loc.product_id = None
-                logger.info(
-                    f"    🔄 Ubicación {loc.codigo_ubicacion} liberada "
-                    f"(producto anterior={old_product}, sin stock ni solicitud)"
-                )
-                result.append(loc)
-
-    return result
-
-
 def assign_product_to_location(
     location: ProductLocation, product_id: int, capacity: int
 ):
@@ -166,234 +78,613 @@ def assign_product_to_location(
     )
 
 
-def create_or_upgrade_replenishment(
-    db: Session,
-    product_id: int,
-    requester_id: int,
-    priority: str = "HIGH",
-    order_id: Optional[int] = None,
-    cantidad_needed: int = 0,
-    status_id_list: Optional[List[int]] = None,
-) -> ReplenishmentResult:
-    """
-    Lógica central de creación/escalado de solicitudes de reposición.
-
-    1. Obtener TODAS las ubicaciones origen en REPO con stock disponible
-    2. Calcular demanda total de TODAS las órdenes activas sin reserva
-    3. Asignar ubicaciones destino en picking según demanda
-    4. Distribuir solicitudes: múltiples orígenes → múltiples destinos
-    5. Solo crear solicitudes por la cantidad realmente disponible en REPO
-    6. Reservar stock en REPO para evitar doble asignación
-
-    Args:
-        db: Sesión de base de datos
-        product_id: ID del producto a reponer
-        requester_id: ID del operador que solicita
-        priority: "HIGH" (cron) o "URGENT" (PDA)
-        order_id: ID de la orden que originó la solicitud (opcional)
-        cantidad_needed: Cantidad mínima necesaria
-        status_id_list: IDs de estados de orden activos (para calcular total needed)
-
-    Returns:
-        ReplenishmentResult con el detalle de lo que se creó/actualizó
-    """
-    result = ReplenishmentResult(status="created")
+# Productos por IN en las pre-cargas (límite de parámetros de pyodbc ~2100)
+PRELOAD_CHUNK_SIZE = 1000
+# Ubicaciones libres de picking que se cargan por bloque en el pool
+FREE_SLOT_CHUNK_SIZE = 100
 
-    # Verificar que el producto esté activo
-    product = db.query(ProductReference).filter_by(id=product_id).first()
-    if not product or not product.activo:
-        result.status = "product_inactive"
-        return result
 
-    capacity = get_product_capacity(db, product_id)
+def _chunks(ids: List[int], size: int = PRELOAD_CHUNK_SIZE):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
 
-    # === ORÍGENES: obtener TODAS las ubicaciones con stock en REPO ===
-    origin_locations = find_all_replenishment_origins(db, product_id)
 
-    if not origin_locations:
-        result.status = "no_stock"
-        return result
+class ReplenishmentPlanner:
+    """
+    Planificador de solicitudes de reposición por lotes.
+
+    load() pre-carga para todos los productos, en pocas queries, lo que
+    create_or_upgrade_replenishment consultaba producto a producto:
+        - Producto activo y capacidad por ubicación (familia)
+        - Orígenes en REPO con stock disponible
+        - Ubicaciones de picking del producto
+        - Demanda pendiente en órdenes activas
+        - Solicitudes READY/IN_PROGRESS por destino
+    Las ubicaciones libres de picking salen de un pool compartido que se
+    llena por bloques solo si algún producto las necesita. Con
+    SLOTTING_PREFERRED_SLOTS el pool se ordena por accesibilidad y cada
+    producto toma la libre que le toca por rotación (slotting_service).
+
+    Esas ubicaciones no son de ningún producto, así que otra transacción
+    (otra partición del cron, la PDA) puede estar asignándolas a la vez. Cada
+    una se reclama con un UPDATE condicional (sigue libre, o sigue siendo del
+    dueño anterior sin stock ni solicitud) y solo se usa si afectó a la fila;
+    si no, se pasa a la siguiente. slot_lock permite además serializar la
+    asignación: se llama una vez, antes de reclamar la primera ubicación.
+
+    plan() aplica la misma lógica que antes sobre los datos en memoria, y
+    flush() escribe las solicitudes nuevas de una vez.
+
+    Uso:
+        planner = ReplenishmentPlanner(db, status_id_list)
+        planner.load(product_ids)
+        for product_id in product_ids:
+            result = planner.plan(product_id, requester_id, ...)
+        planner.flush()
+    """
 
-    total_available_in_repo = sum(
-        (loc.stock_actual or 0) - (loc.stock_reservado or 0)
-        for loc in origin_locations
-    )
-    result.total_available_in_repo = total_available_in_repo
-    result.origin_count = len(origin_locations)
-
-    # === DESTINOS: ubicaciones en picking para este producto ===
-    # Ordenadas por stock ASC: primero llenar las que menos stock tienen
-    existing_locations = (
-        db.query(ProductLocation)
-        .filter(
-            ProductLocation.product_id == product_id,
-            ProductLocation.almacen_id == ALMACEN_PICKING_ID,
-            ProductLocation.activa == True,
+    def __init__(
+        self,
+        db: Session,
+        status_id_list: Optional[List[int]] = None,
+        slot_lock: Optional[Callable[[], bool]] = None,
+    ):
+        """
+        Args:
+            db: Sesión de base de datos
+            status_id_list: IDs de estados de orden activos (para calcular total needed)
+            slot_lock: Toma un lock que serializa la asignación de ubicaciones libres
+                       (True si se obtuvo; si no, el lote no asigna ubicaciones nuevas).
+                       Sin él la única protección es el UPDATE condicional
+        """
+        self.db = db
+        self.status_id_list = status_id_list
+        self._slot_lock = slot_lock
+        # None = aún no pedido; False = ocupado (no se asignan ubicaciones libres en este lote)
+        self.slot_lock_held: Optional[bool] = None
+        self.active_products: Dict[int, bool] = {}
+        self.capacities: Dict[int, int] = {}
+        self.origins: Dict[int, List[ProductLocation]] = {}
+        self.picking_locations: Dict[int, List[ProductLocation]] = {}
+        self.pending_demand: Dict[int, int] = {}
+        self.open_requests: Dict[Tuple[int, int], ReplenishmentRequest] = {}
+        # (solicitud, origen, disponible en origen, destino) para el log tras el flush
+        self.created: List[Tuple[ReplenishmentRequest, str, int, str]] = []
+
+        # Pool de ubicaciones libres de picking (se llena bajo demanda)
+        self._free_pool: List[ProductLocation] = []
+        self._free_loaded = 0
+        self._free_exhausted = False
+        self._candidates: Optional[List[ProductLocation]] = None
+        self._taken_ids: Set[int] = set()
+        # Slotting por rotación: IDs libres de la más a la menos accesible
+        self._slotting: Optional[SlottingPolicy] = None
+        self._ranked_free: Optional[List[int]] = None
+
+    def load(self, product_ids: Iterable[int]):
+        """Pre-carga los datos de reposición de los productos indicados."""
+        ids = sorted({pid for pid in product_ids if pid} - set(self.active_products))
+        for chunk in _chunks(ids):
+            self._load_chunk(chunk)
+
+    def _load_chunk(self, ids: List[int]):
+        db = self.db
+
+        # Producto activo + capacidad de su familia
+        rows = (
+            db.query(ProductReference.id, ProductReference.activo, ProductFamily.capacidad_ubicacion)
+            .outerjoin(ProductFamily, ProductFamily.id == ProductReference.familia_id)
+            .filter(ProductReference.id.in_(ids))
+            .all()
         )
-        .order_by(ProductLocation.stock_actual.asc())
-        .all()
-    )
+        for product_id, activo, capacidad in rows:
+            self.active_products[product_id] = bool(activo)
+            self.capacities[product_id] = capacidad or DEFAULT_LOCATION_CAPACITY
+        for product_id in ids:
+            self.active_products.setdefault(product_id, False)
+
+        # Orígenes en REPO con stock disponible (por stock disponible desc)
+        available_stock = ProductLocation.stock_actual - func.coalesce(ProductLocation.stock_reservado, 0)
+        origins = (
+            db.query(ProductLocation)
+            .filter(
+                ProductLocation.product_id.in_(ids),
+                ProductLocation.almacen_id == ALMACEN_REPOSICION_ID,
+                ProductLocation.activa == True,
+                available_stock > 0,
+            )
+            .order_by(ProductLocation.product_id, available_stock.desc())
+            .all()
+        )
+        for loc in origins:
+            self.origins.setdefault(loc.product_id, []).append(loc)
 
-    # Calcular cantidad TOTAL pendiente en TODAS las órdenes activas
-    total_needed = cantidad_needed
-    if status_id_list:
-        total_needed = (
-            db.query(func.sum(OrderLine.cantidad_solicitada))
-            .join(Order, Order.id == OrderLine.order_id)
+        # Destinos: ubicaciones de picking del producto (primero las de menos stock)
+        destinations = (
+            db.query(ProductLocation)
             .filter(
-                OrderLine.product_reference_id == product_id,
-                OrderLine.stock_reserved == False,
-                Order.status_id.in_(status_id_list),
+                ProductLocation.product_id.in_(ids),
+                ProductLocation.almacen_id == ALMACEN_PICKING_ID,
+                ProductLocation.activa == True,
             )
-            .scalar() or 0
+            .order_by(ProductLocation.product_id, ProductLocation.stock_actual.asc())
+            .all()
         )
-        total_needed = max(total_needed, cantidad_needed)
+        for loc in destinations:
+            self.picking_locations.setdefault(loc.product_id, []).append(loc)
+
+        # Cantidad TOTAL pendiente en TODAS las órdenes activas
+        if self.status_id_list:
+            demand = (
+                db.query(OrderLine.product_reference_id, func.sum(OrderLine.cantidad_solicitada))
+                .join(Order, Order.id == OrderLine.order_id)
+                .filter(
+                    OrderLine.product_reference_id.in_(ids),
+                    OrderLine.stock_reserved == False,
+                    Order.status_id.in_(self.status_id_list),
+                )
+                .group_by(OrderLine.product_reference_id)
+                .all()
+            )
+            for product_id, total in demand:
+                self.pending_demand[product_id] = total or 0
 
-    result.total_needed = total_needed
+        # Solicitudes pendientes por (producto, destino)
+        requests = (
+            db.query(ReplenishmentRequest)
+            .filter(
+                ReplenishmentRequest.product_id.in_(ids),
+                ReplenishmentRequest.status.in_(["READY", "IN_PROGRESS"]),
+            )
+            .order_by(ReplenishmentRequest.id)
+            .all()
+        )
+        for req in requests:
+            self.open_requests.setdefault((req.product_id, req.location_destino_id), req)
+
+    def _take_free_locations(self, count: int, product_id: int) -> List[ProductLocation]:
+        """
+        Toma y reclama hasta 'count' ubicaciones libres del pool compartido.
+
+        Primero las que no tienen producto asignado (con slotting, la que le
+        toca al producto por rotación); si no bastan, las asignadas sin stock
+        ni solicitud activa (se liberan al tomarlas). Las que otra transacción
+        reclamó antes se descartan.
+        """
+        if not self._acquire_slot_lock():
+            return []
+
+        result: List[ProductLocation] = []
+        while len(result) < count:
+            if SLOTTING_PREFERRED_SLOTS:
+                batch = self._take_preferred_free_locations(count - len(result), product_id)
+            else:
+                batch = self._take_pooled_free_locations(count - len(result))
+            if not batch:
+                break
+            self._taken_ids.update(loc.id for loc in batch)
+            result.extend(loc for loc in batch if self._claim_location(loc, product_id))
 
-    # Calcular cuántas ubicaciones destino se necesitan
-    locations_needed = math.ceil(total_needed / capacity) if total_needed > 0 else 1
-    locations_needed = max(locations_needed, 1)
+        if len(result) < count:
+            result.extend(self._take_reusable_locations(count - len(result), product_id))
+        return result
 
-    # Asignar ubicaciones libres si faltan
-    new_locations_needed = max(0, locations_needed - len(existing_locations))
+    def _acquire_slot_lock(self) -> bool:
+        if self._slot_lock is None:
+            return True
+        if self.slot_lock_held is None:
+            self.slot_lock_held = bool(self._slot_lock())
+            if not self.slot_lock_held:
+                logger.warning(
+                    "    ⚠️ Asignación de ubicaciones libres ocupada por otra transacción: "
+                    "no se asignan ubicaciones nuevas en este lote"
+                )
+        return self.slot_lock_held
+
+    def _claim_location(
+        self, location: ProductLocation, product_id: int, owner: Optional[int] = None
+    ) -> bool:
+        """
+        Reclama una ubicación para product_id con un UPDATE condicional.
+
+        Args:
+            location: Ubicación candidata (no se modifica en memoria)
+            product_id: Producto al que se asigna
+            owner: Dueño anterior (ubicación reutilizable) o None (ubicación libre)
+
+        Returns:
+            True si la fila seguía libre (o del dueño anterior, vacía y sin
+            solicitud activa) y quedó asignada; False si otra transacción se adelantó
+        """
+        conditions = [ProductLocation.id == location.id, ProductLocation.activa == True]
+        if owner is None:
+            conditions.append(ProductLocation.product_id.is_(None))
+        else:
+            conditions.extend([
+                ProductLocation.product_id == owner,
+                ProductLocation.stock_actual <= 0,
+                ProductLocation.stock_reservado <= 0,
+                ~exists().where(
+                    ReplenishmentRequest.location_destino_id == ProductLocation.id,
+                    ReplenishmentRequest.status.in_(["READY", "IN_PROGRESS"]),
+                ),
+            ])
+        claimed = self.db.execute(
+            update(ProductLocation)
+            .where(*conditions)
+            .values(product_id=product_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount == 1
+        if not claimed:
+            logger.info(
+                f"    ⏭️ Ubicación {location.codigo_ubicacion} ya reclamada por otra transacción"
+            )
+        return claimed
+
+    def _take_pooled_free_locations(self, count: int) -> List[ProductLocation]:
+        # Por pasillo / ubicación / altura, cargadas por bloques
+        while len(self._free_pool) < count and not self._free_exhausted:
+            chunk = (
+                self.db.query(ProductLocation)
+                .filter(
+                    ProductLocation.almacen_id == ALMACEN_PICKING_ID,
+                    ProductLocation.product_id.is_(None),
+                    ProductLocation.activa == True,
+                )
+                .order_by(
+                    ProductLocation.pasillo.asc(),
+                    ProductLocation.ubicacion.asc(),
+                    ProductLocation.altura.asc(),
+                    ProductLocation.id.asc(),
+                )
+                .offset(self._free_loaded)
+                .limit(max(count, FREE_SLOT_CHUNK_SIZE))
+                .all()
+            )
+            self._free_loaded += len(chunk)
+            self._free_exhausted = len(chunk) < max(count, FREE_SLOT_CHUNK_SIZE)
+            self._free_pool.extend(loc for loc in chunk if loc.id not in self._taken_ids)
 
-    if new_locations_needed > 0:
-        free_locations = find_free_picking_locations(db, new_locations_needed)
+        result = self._free_pool[:count]
+        del self._free_pool[:count]
+        return result
 
-        if len(free_locations) < new_locations_needed:
-            result.warnings.append(
-                f"Solo hay {len(free_locations)} ubicaciones libres "
-                f"de {new_locations_needed} necesarias para producto {product_id}"
+    def _take_preferred_free_locations(self, count: int, product_id: Optional[int]) -> List[ProductLocation]:
+        # Una consulta ligera de todas las libres (solo columnas) para ordenarlas
+        # por accesibilidad; las elegidas se cargan por ID
+        if self._ranked_free is None:
+            free = (
+                self.db.query(
+                    ProductLocation.id, ProductLocation.pasillo,
+                    ProductLocation.ubicacion, ProductLocation.altura,
+                )
+                .filter(
+                    ProductLocation.almacen_id == ALMACEN_PICKING_ID,
+                    ProductLocation.product_id.is_(None),
+                    ProductLocation.activa == True,
+                )
+                .all()
             )
-            logger.warning(
-                f"    ⚠️ Solo hay {len(free_locations)} ubicaciones libres "
-                f"de {new_locations_needed} necesarias para producto {product_id}"
+            self._slotting = SlottingPolicy(self.db, ALMACEN_PICKING_ID)
+            self._ranked_free = [
+                location_id for location_id in self._slotting.rank_free(free)
+                if location_id not in self._taken_ids
+            ]
+
+        ids = []
+        while len(ids) < count:
+            location_id = self._slotting.take(self._ranked_free, product_id)
+            if location_id is None:
+                break
+            ids.append(location_id)
+        if not ids:
+            return []
+        by_id = {loc.id: loc for loc in self.db.query(ProductLocation).filter(ProductLocation.id.in_(ids))}
+        return [by_id[location_id] for location_id in ids if location_id in by_id]
+
+    def _take_reusable_locations(self, count: int, product_id: int) -> List[ProductLocation]:
+        # Asignadas pero vacías y sin solicitud activa (una sola carga por lote)
+        if self._candidates is None:
+            candidates = (
+                self.db.query(ProductLocation)
+                .filter(
+                    ProductLocation.almacen_id == ALMACEN_PICKING_ID,
+                    ProductLocation.product_id.isnot(None),
+                    ProductLocation.activa == True,
+                    ProductLocation.stock_actual <= 0,
+                    ProductLocation.stock_reservado <= 0,
+                )
+                .order_by(
+                    ProductLocation.pasillo.asc(),
+                    ProductLocation.ubicacion.asc(),
+                    ProductLocation.altura.asc(),
+                )
+                .all()
             )
+            busy = set()
+            if candidates:
+                busy = {
+                    row[0] for row in self.db.query(ReplenishmentRequest.location_destino_id)
+                    .filter(ReplenishmentRequest.status.in_(["READY", "IN_PROGRESS"]))
+                    .distinct()
+                }
+            self._candidates = [loc for loc in candidates if loc.id not in busy]
+
+        result: List[ProductLocation] = []
+        while self._candidates and len(result) < count:
+            loc = self._candidates.pop(0)
+            if loc.id in self._taken_ids or loc.has_stock:
+                continue
+            self._taken_ids.add(loc.id)
+            old_product = loc.product_id
+            if not self._claim_location(loc, product_id, owner=old_product):
+                continue
+            loc.product_id = None
+            logger.info(
+                f"    🔄 Ubicación {loc.codigo_ubicacion} liberada "
+                f"(producto anterior={old_product}, sin stock ni solicitud)"
+            )
+            # Ya no es destino del producto anterior en este lote
+            previous = self.picking_locations.get(old_product)
+            if previous and loc in previous:
+                previous.remove(loc)
+            result.append(loc)
+        return result
 
-        for loc in free_locations:
-            assign_product_to_location(loc, product_id, capacity)
-            existing_locations.append(loc)
-
-    if not existing_locations:
-        result.status = "no_locations"
-        logger.error(
-            f"    ❌ No hay ubicaciones disponibles para producto {product_id}. "
-            f"Almacén de picking lleno."
+    def plan(
+        self,
+        product_id: int,
+        requester_id: int,
+        priority: str = "HIGH",
+        order_id: Optional[int] = None,
+        cantidad_needed: int = 0,
+    ) -> ReplenishmentResult:
+        """
+        Crea/escala las solicitudes de reposición de un producto ya pre-cargado.
+
+        1. Orígenes en REPO con stock disponible
+        2. Demanda total de todas las órdenes activas sin reserva
+        3. Ubicaciones destino en picking según demanda (del pool de libres si faltan)
+        4. Distribuir solicitudes: múltiples orígenes → múltiples destinos
+        5. Solo crear solicitudes por la cantidad realmente disponible en REPO
+        6. Reservar stock en REPO para evitar doble asignación
+
+        Args:
+            product_id: ID del producto a reponer
+            requester_id: ID del operador que solicita
+            priority: "HIGH" (cron) o "URGENT" (PDA)
+            order_id: ID de la orden que originó la solicitud (opcional)
+            cantidad_needed: Cantidad mínima necesaria
+
+        Returns:
+            ReplenishmentResult con el detalle de lo que se creó/actualizó
+        """
+        if product_id not in self.active_products:
+            self.load([product_id])
+
+        result = ReplenishmentResult(status="created")
+
+        # Verificar que el producto esté activo
+        if not self.active_products.get(product_id):
+            result.status = "product_inactive"
+            return result
+
+        capacity = self.capacities[product_id]
+
+        # === ORÍGENES: ubicaciones con stock disponible en REPO ===
+        origin_locations = [
+            loc for loc in self.origins.get(product_id, [])
+            if (loc.stock_actual or 0) - (loc.stock_reservado or 0) > 0
+        ]
+
+        if not origin_locations:
+            result.status = "no_stock"
+            return result
+
+        total_available_in_repo = sum(
+            (loc.stock_actual or 0) - (loc.stock_reservado or 0)
+            for loc in origin_locations
         )
-        return result
+        result.total_available_in_repo = total_available_in_repo
+        result.origin_count = len(origin_locations)
 
-    result.dest_count = len(existing_locations)
+        # === DESTINOS: ubicaciones en picking para este producto ===
+        existing_locations = self.picking_locations.setdefault(product_id, [])
 
-    # === DISTRIBUCIÓN: múltiples orígenes → múltiples destinos ===
-    origin_remaining = {
-        loc.id: (loc.stock_actual or 0) - (loc.stock_reservado or 0)
-        for loc in origin_locations
-    }
-    origin_map = {loc.id: loc for loc in origin_locations}
-    origin_ids = [loc.id for loc in origin_locations]
-    origin_idx = 0
+        # Cantidad TOTAL pendiente en TODAS las órdenes activas
+        total_needed = cantidad_needed
+        if self.status_id_list:
+            total_needed = max(self.pending_demand.get(product_id, 0), cantidad_needed)
 
-    logger.info(
-        f"    📊 Producto {product_id}: total_needed={total_needed}, "
-        f"repo_disponible={total_available_in_repo}, "
-        f"orígenes={len(origin_locations)}, destinos={len(existing_locations)}"
-    )
+        result.total_needed = total_needed
+
+        # Calcular cuántas ubicaciones destino se necesitan
+        locations_needed = math.ceil(total_needed / capacity) if total_needed > 0 else 1
+        locations_needed = max(locations_needed, 1)
+
+        # Asignar ubicaciones libres si faltan
+        new_locations_needed = max(0, locations_needed - len(existing_locations))
 
-    for dest_location in existing_locations:
-        current_stock = (dest_location.stock_actual or 0)
-        deficit = capacity - current_stock
-
-        if deficit <= 0:
-            continue
-
-        # Verificar si ya existe solicitud pendiente para esta ubicación
-        existing_request = db.query(ReplenishmentRequest).filter(
-            ReplenishmentRequest.product_id == product_id,
-            ReplenishmentRequest.location_destino_id == dest_location.id,
-            ReplenishmentRequest.status.in_(["READY", "IN_PROGRESS"]),
-        ).first()
-
-        if existing_request:
-            # Escalar prioridad si la nueva es mayor
-            escalated = False
-            if priority == "URGENT" and existing_request.priority != "URGENT":
-                existing_request.priority = "URGENT"
-                existing_request.updated_at = datetime.utcnow()
-                escalated = True
-            elif existing_request.priority not in ("HIGH", "URGENT"):
-                existing_request.priority = priority
-                existing_request.updated_at = datetime.utcnow()
-                escalated = True
-
-            if escalated:
-                logger.info(
-                    f"    ⬆ Solicitud #{existing_request.id} escalada a {existing_request.priority} "
-                    f"(producto={product_id})"
+        if new_locations_needed > 0:
+            free_locations = self._take_free_locations(new_locations_needed, product_id)
+
+            if len(free_locations) < new_locations_needed:
+                result.warnings.append(
+                    f"Solo hay {len(free_locations)} ubicaciones libres "
+                    f"de {new_locations_needed} necesarias para producto {product_id}"
+                )
+                logger.warning(
+                    f"    ⚠️ Solo hay {len(free_locations)} ubicaciones libres "
+                    f"de {new_locations_needed} necesarias para producto {product_id}"
                 )
-            result.upgraded_requests.append(existing_request)
-            continue
 
-        # Distribuir el déficit entre ubicaciones origen disponibles
-        remaining_deficit = deficit
+            for loc in free_locations:
+                assign_product_to_location(loc, product_id, capacity)
+                existing_locations.append(loc)
 
-        while remaining_deficit > 0 and origin_idx < len(origin_ids):
-            oid = origin_ids[origin_idx]
-            available = origin_remaining[oid]
+        if not existing_locations:
+            result.status = "no_locations"
+            logger.error(
+                f"    ❌ No hay ubicaciones disponibles para producto {product_id}. "
+                f"Almacén de picking lleno."
+            )
+            return result
+
+        result.dest_count = len(existing_locations)
+
+        # === DISTRIBUCIÓN: múltiples orígenes → múltiples destinos ===
+        origin_remaining = {
+            loc.id: (loc.stock_actual or 0) - (loc.stock_reservado or 0)
+            for loc in origin_locations
+        }
+        origin_map = {loc.id: loc for loc in origin_locations}
+        origin_ids = [loc.id for loc in origin_locations]
+        origin_idx = 0
+
+        logger.info(
+            f"    📊 Producto {product_id}: total_needed={total_needed}, "
+            f"repo_disponible={total_available_in_repo}, "
+            f"orígenes={len(origin_locations)}, destinos={len(existing_locations)}"
+        )
+
+        for dest_location in existing_locations:
+            current_stock = (dest_location.stock_actual or 0)
+            deficit = capacity - current_stock
 
-            if available <= 0:
-                origin_idx += 1
+            if deficit <= 0:
                 continue
 
-            take = min(remaining_deficit, available)
-            origin_remaining[oid] -= take
-            remaining_deficit -= take
-
-            new_request = ReplenishmentRequest(
-                location_origen_id=oid,
-                location_destino_id=dest_location.id,
-                product_id=product_id,
-                requested_quantity=take,
-                status="READY",
-                priority=priority,
-                requester_id=requester_id,
-                requested_at=datetime.utcnow(),
-                order_id=order_id,
-            )
+            # Verificar si ya existe solicitud pendiente para esta ubicación
+            existing_request = self.open_requests.get((product_id, dest_location.id))
+
+            if existing_request:
+                # Escalar prioridad si la nueva es mayor
+                escalated = False
+                if priority == "URGENT" and existing_request.priority != "URGENT":
+                    existing_request.priority = "URGENT"
+                    existing_request.updated_at = datetime.utcnow()
+                    escalated = True
+                elif existing_request.priority not in ("HIGH", "URGENT"):
+                    existing_request.priority = priority
+                    existing_request.updated_at = datetime.utcnow()
+                    escalated = True
+
+                if escalated:
+                    logger.info(
+                        f"    ⬆ Solicitud #{existing_request.id} escalada a {existing_request.priority} "
+                        f"(producto={product_id})"
+                    )
+                result.upgraded_requests.append(existing_request)
+                continue
+
+            # Distribuir el déficit entre ubicaciones origen disponibles
+            remaining_deficit = deficit
+
+            while remaining_deficit > 0 and origin_idx < len(origin_ids):
+                oid = origin_ids[origin_idx]
+                available = origin_remaining[oid]
+
+                if available <= 0:
+                    origin_idx += 1
+                    continue
+
+                take = min(remaining_deficit, available)
+                origin_remaining[oid] -= take
+                remaining_deficit -= take
+
+                new_request = ReplenishmentRequest(
+                    location_origen_id=oid,
+                    location_destino_id=dest_location.id,
+                    product_id=product_id,
+                    requested_quantity=take,
+                    status="READY",
+                    priority=priority,
+                    requester_id=requester_id,
+                    requested_at=datetime.utcnow(),
+                    order_id=order_id,
+                )
+                self.db.add(new_request)
+                self.open_requests.setdefault((product_id, dest_location.id), new_request)
+
+                # Reservar stock en ubicación origen para evitar doble asignación
+                origin_loc = origin_map[oid]
+                self.created.append(
+                    (new_request, origin_loc.codigo_ubicacion, available, dest_location.codigo_ubicacion)
+                )
+                origin_loc.stock_reservado = (origin_loc.stock_reservado or 0) + take
+                result.created_requests.append(new_request)
+
+                if origin_remaining[oid] <= 0:
+                    origin_idx += 1
+
+            # Si no queda stock en REPO, dejar de crear solicitudes
+            if origin_idx >= len(origin_ids):
+                if remaining_deficit > 0:
+                    result.warnings.append(
+                        f"Stock en REPO agotado para producto {product_id}. "
+                        f"Faltan {remaining_deficit} uds para {dest_location.codigo_ubicacion}"
+                    )
+                    logger.warning(
+                        f"    ⚠️ Stock en REPO agotado para producto {product_id}. "
+                        f"Faltan {remaining_deficit} uds para "
+                        f"{dest_location.codigo_ubicacion}"
+                    )
+                break
 
-            db.add(new_request)
-            db.flush()
+        if not result.created_requests and result.upgraded_requests:
+            result.status = "upgraded"
 
-            # Reservar stock en ubicación origen para evitar doble asignación
-            origin_loc = origin_map[oid]
-            origin_loc.stock_reservado = (origin_loc.stock_reservado or 0) + take
+        return result
+
+    def flush(self):
+        """Escribe las solicitudes creadas (un solo flush) y las registra en el log."""
+        if not self.created:
+            return
+        self.db.flush()
+        for req, origen, available, destino in self.created:
             logger.info(
-                f"    🆕 Solicitud #{new_request.id} {priority}/READY "
-                f"(producto={product_id}, "
-                f"origen={origin_loc.codigo_ubicacion}[disp={available}], "
-                f"destino={dest_location.codigo_ubicacion}, "
-                f"cantidad={take})"
+                f"    🆕 Solicitud #{req.id} {req.priority}/READY "
+                f"(producto={req.product_id}, "
+                f"origen={origen}[disp={available}], "
+                f"destino={destino}, "
+                f"cantidad={req.requested_quantity})"
             )
-            result.created_requests.append(new_request)
+        self.created.clear()
 
-            if origin_remaining[oid] <= 0:
-                origin_idx += 1
 
-        # Si no queda stock en REPO, dejar de crear solicitudes
-        if origin_idx >= len(origin_ids):
-            if remaining_deficit > 0:
-                result.warnings.append(
-                    f"Stock en REPO agotado para producto {product_id}. "
-                    f"Faltan {remaining_deficit} uds para {dest_location.codigo_ubicacion}"
-                )
-                logger.warning(
-                    f"    ⚠️ Stock en REPO agotado para producto {product_id}. "
-                    f"Faltan {remaining_deficit} uds para "
-                    f"{dest_location.codigo_ubicacion}"
-                )
-            break
+def create_or_upgrade_replenishment(
+    db: Session,
+    product_id: int,
+    requester_id: int,
+    priority: str = "HIGH",
+    order_id: Optional[int] = None,
+    cantidad_needed: int = 0,
+    status_id_list: Optional[List[int]] = None,
+) -> ReplenishmentResult:
+    """
+    Lógica central de creación/escalado de solicitudes de reposición
+    para un solo producto (PDA). Ver ReplenishmentPlanner.plan().
 
-    if not result.created_requests and result.upgraded_requests:
-        result.status = "upgraded"
+    Args:
+        db: Sesión de base de datos
+        product_id: ID del producto a reponer
+        requester_id: ID del operador que solicita
+        priority: "HIGH" (cron) o "URGENT" (PDA)
+        order_id: ID de la orden que originó la solicitud (opcional)
+        cantidad_needed: Cantidad mínima necesaria
+        status_id_list: IDs de estados de orden activos (para calcular total needed)
 
+    Returns:
+        ReplenishmentResult con el detalle de lo que se creó/actualizó
+    """
+    planner = ReplenishmentPlanner(db, status_id_list)
+    planner.load([product_id])
+    result = planner.plan(
+        product_id,
+        requester_id=requester_id,
+        priority=priority,
+        order_id=order_id,
+        cantidad_needed=cantidad_needed,
+    )
+    planner.flush()
     return result
@@ -0,0 +1,205 @@
+"""
+Reservation Allocation Engine
+
+Motor de asignación de stock puro (sin ORM ni BD) usado por el cron de
+reservas. Recibe una foto en columnas de la demanda y del stock y devuelve
+un plan de asignación que el cron aplica a la BD en una sola pasada.
+
+Entrada (AllocationSnapshot, arrays paralelos):
+    - Líneas: id, orden, producto, cantidad pendiente, prioridad de la orden,
+      secuencia FIFO de la orden
+    - Ubicaciones: id, producto, stock disponible (stock_actual - stock_reservado)
+
+Políticas:
+    - Orden de servicio de las líneas (order_policy):
+        "priority" → URGENT → HIGH → NORMAL → LOW, y dentro de cada una FIFO
+        "fifo"     → por antigüedad de la orden (fecha_importacion)
+    - Elección de ubicaciones (location_policy):
+        "largest_first"    → primero la ubicación con más stock (comportamiento histórico)
+        "fewest_locations" → si una ubicación cubre lo que falta, la más ajustada;
+                             si no, la de más stock. Minimiza ubicaciones tocadas
+                             por línea y deja las grandes para pedidos grandes
+
+El disponible por ubicación se calcula una vez al crear la foto y el total
+por producto se mantiene como acumulado, así comprobar si una línea tiene
+stock es O(1) en lugar de sumar todas sus ubicaciones en cada línea.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+ORDER_POLICY_PRIORITY = "priority"
+ORDER_POLICY_FIFO = "fifo"
+LOCATION_POLICY_LARGEST_FIRST = "largest_first"
+LOCATION_POLICY_FEWEST_LOCATIONS = "fewest_locations"
+
+ORDER_POLICIES = (ORDER_POLICY_PRIORITY, ORDER_POLICY_FIFO)
+LOCATION_POLICIES = (LOCATION_POLICY_LARGEST_FIRST, LOCATION_POLICY_FEWEST_LOCATIONS)
+
+# Rango de Order.prioridad (menor = se sirve antes); valores desconocidos van como NORMAL
+ORDER_PRIORITY_RANK = {"URGENT": 0, "HIGH": 1, "NORMAL": 2, "LOW": 3}
+
+
+def priority_rank(prioridad: str) -> int:
+    """Rango numérico de Order.prioridad."""
+    return ORDER_PRIORITY_RANK.get((prioridad or "NORMAL").upper(), ORDER_PRIORITY_RANK["NORMAL"])
+
+
+@dataclass
+class AllocationSnapshot:
+    """Foto en columnas de la demanda pendiente y del stock disponible."""
+    line_ids: List[int] = field(default_factory=list)
+    line_order_ids: List[int] = field(default_factory=list)
+    line_product_ids: List[int] = field(default_factory=list)
+    line_needed: List[int] = field(default_factory=list)
+    line_priority: List[int] = field(default_factory=list)
+    line_seq: List[int] = field(default_factory=list)
+
+    location_ids: List[int] = field(default_factory=list)
+    location_product_ids: List[int] = field(default_factory=list)
+    location_available: List[int] = field(default_factory=list)
+
+    def add_line(self, line_id: int, order_id: int, product_id: int, needed: int,
+                 priority: int = ORDER_PRIORITY_RANK["NORMAL"], seq: int = 0):
+        """
+        Añade la demanda pendiente de una línea.
+
+        Args:
+            needed: Unidades que faltan por reservar
+            priority: Rango de prioridad de la orden (ver priority_rank)
+            seq: Posición FIFO de la orden (menor = más antigua)
+        """
+        self.line_ids.append(line_id)
+        self.line_order_ids.append(order_id)
+        self.line_product_ids.append(product_id)
+        self.line_needed.append(needed)
+        self.line_priority.append(priority)
+        self.line_seq.append(seq)
+
+    def add_location(self, location_id: int, product_id: int, available: int):
+        """Añade una ubicación con su stock disponible."""
+        self.location_ids.append(location_id)
+        self.location_product_ids.append(product_id)
+        self.location_available.append(available)
+
+
+@dataclass
+class Allocation:
+    """Unidades de una línea reservadas en una ubicación."""
+    line_id: int
+    location_id: int
+    quantity: int
+
+
+@dataclass
+class AllocationPlan:
+    """Resultado del motor: reservas a escribir y déficit a reponer."""
+    allocations: List[Allocation] = field(default_factory=list)
+    # line_id → unidades que no se pudieron reservar
+    shortages: Dict[int, int] = field(default_factory=dict)
+    # Líneas sin ningún stock disponible al llegarles el turno
+    no_stock_line_ids: List[int] = field(default_factory=list)
+    # Líneas en el orden en que se sirvieron
+    line_order: List[int] = field(default_factory=list)
+
+    def allocations_by_line(self) -> Dict[int, List[Allocation]]:
+        """Agrupa las asignaciones por línea (en el orden de uso de ubicaciones)."""
+        grouped: Dict[int, List[Allocation]] = {}
+        for allocation in self.allocations:
+            grouped.setdefault(allocation.line_id, []).append(allocation)
+        return grouped
+
+
+def _line_order(snapshot: AllocationSnapshot, order_policy: str) -> List[int]:
+    n = len(snapshot.line_ids)
+    if order_policy == ORDER_POLICY_FIFO:
+        key = lambda i: (snapshot.line_seq[i], snapshot.line_ids[i])
+    else:
+        key = lambda i: (snapshot.line_priority[i], snapshot.line_seq[i], snapshot.line_ids[i])
+    return sorted(range(n), key=key)
+
+
+def _pick_location(available: List[int], slots: List[int], remaining: int, location_policy: str) -> int:
+    """
+    Elige la siguiente ubicación (índice en slots) de la que tomar stock.
+
+    slots está ordenado por disponible inicial desc; available es el disponible actual.
+    """
+    cover = -1    # La más ajustada que cubre lo que falta
+    largest = -1  # La de más stock
+    for pos, slot in enumerate(slots):
+        avail = available[slot]
+        if avail <= 0:
+            continue
+        if location_policy != LOCATION_POLICY_FEWEST_LOCATIONS:
+            return pos
+        if avail >= remaining and (cover < 0 or avail < available[slots[cover]]):
+            cover = pos
+        if largest < 0 or avail > available[slots[largest]]:
+            largest = pos
+    return cover if cover >= 0 else largest
+
+
+def allocate(
+    snapshot: AllocationSnapshot,
+    order_policy: str = ORDER_POLICY_PRIORITY,
+    location_policy: str = LOCATION_POLICY_LARGEST_FIRST,
+) -> AllocationPlan:
+    """
+    Calcula el plan de reservas de una foto de demanda y stock.
+
+    Args:
+        snapshot: Demanda por línea y disponible por ubicación
+        order_policy: "priority" o "fifo"
+        location_policy: "largest_first" o "fewest_locations"
+
+    Returns:
+        AllocationPlan con las reservas por ubicación y el déficit por línea
+    """
+    if order_policy not in ORDER_POLICIES:
+        raise ValueError(f"order_policy inválida: {order_policy}")
+    if location_policy not in LOCATION_POLICIES:
+        raise ValueError(f"location_policy inválida: {location_policy}")
+
+    # Disponible actual (se consume durante la asignación) y total por producto
+    available = [max(0, a) for a in snapshot.location_available]
+    slots_by_product: Dict[int, List[int]] = {}
+    total_by_product: Dict[int, int] = {}
+    for slot, product_id in enumerate(snapshot.location_product_ids):
+        if available[slot] > 0:
+            slots_by_product.setdefault(product_id, []).append(slot)
+            total_by_product[product_id] = total_by_product.get(product_id, 0) + available[slot]
+    for slots in slots_by_product.values():
+        slots.sort(key=lambda s: (-available[s], snapshot.location_ids[s]))
+
+    plan = AllocationPlan()
+    for i in _line_order(snapshot, order_policy):
+        line_id = snapshot.line_ids[i]
+        product_id = snapshot.line_product_ids[i]
+        needed = snapshot.line_needed[i]
+        if needed <= 0:
+            continue
+        plan.line_order.append(line_id)
+
+        if total_by_product.get(product_id, 0) <= 0:
+            plan.no_stock_line_ids.append(line_id)
+            plan.shortages[line_id] = needed
+            continue
+
+        slots = slots_by_product[product_id]
+        remaining = needed
+        while remaining > 0:
+            pos = _pick_location(available, slots, remaining, location_policy)
+            if pos < 0:
+                break
+            slot = slots[pos]
+            take = min(remaining, available[slot])
+            available[slot] -= take
+            total_by_product[product_id] -= take
+            remaining -= take
+            plan.allocations.append(Allocation(line_id, snapshot.location_ids[slot], take))
+
+        if remaining > 0:
+            plan.shortages[line_id] = remaining
+
+    return plan
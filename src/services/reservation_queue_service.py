@@ -0,0 +1,167 @@
+"""
+Reservation Queue Service
+
+Cola de trabajo con debounce que dispara la reserva de stock cuando ocurre
+un evento que puede desbloquear líneas pendientes, en lugar de esperar al
+siguiente intervalo del cron (hasta CRON_INTERVAL_MINUTES).
+
+Eventos que notifican productos:
+    - Reposición completada (PDA y API)
+    - Movimiento de stock confirmado desde la PDA
+    - Líneas nuevas en órdenes (servicio B2B)
+    - Stock reservado liberado (cancelación) o descontado (fin de picking)
+
+Arquitectura:
+    - notify_products() es thread-safe y no toca la BD: solo añade los IDs
+      al conjunto pendiente y programa un Timer si no hay uno en marcha
+    - Al vencer la ventana (RESERVATION_QUEUE_DEBOUNCE_SECONDS) se reserva
+      solo para esos productos (reserve_stock_for_products), por bloques
+    - Usa el mismo sp_getapplock por partición que el cron: los productos de
+      particiones ocupadas vuelven a la cola y se reintentan tras otra ventana
+    - El cron periódico se mantiene como red de seguridad
+"""
+
+import logging
+import threading
+from typing import Callable, Iterable, List, Optional, Set
+
+from src.adapters.secondary.database.config import (
+    RESERVATION_QUEUE_ENABLED,
+    RESERVATION_QUEUE_DEBOUNCE_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Productos por ejecución (cada uno es un parámetro del IN; límite pyodbc ~2100)
+RESERVATION_BATCH_SIZE = 500
+
+
+class ReservationQueue:
+    """
+    Cola de productos pendientes de reserva con ventana de agrupación.
+
+    Responsabilidades:
+        - Acumular los productos afectados por eventos (sin duplicados)
+        - Lanzar una única reserva dirigida por ventana
+        - Reencolar si otro worker tiene el lock de reservas
+    """
+
+    def __init__(
+        self,
+        debounce_seconds: float = RESERVATION_QUEUE_DEBOUNCE_SECONDS,
+        runner: Optional[Callable[[List[int]], List[int]]] = None,
+    ):
+        """
+        Args:
+            debounce_seconds: Ventana de agrupación de eventos
+            runner: Función que reserva para una lista de productos y retorna los
+                    que no pudo procesar por lock ocupado (por defecto reserve_stock_for_products)
+        """
+        self.debounce_seconds = debounce_seconds
+        self._runner = runner
+        self._pending: Set[int] = set()
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+        self._enabled = False
+
+        # Estadísticas acumuladas
+        self.stats = {
+            "notified": 0,
+            "runs": 0,
+            "products_processed": 0,
+            "requeued": 0,
+            "errors": 0,
+        }
+
+    def start(self):
+        """Activa la cola (llamar en el arranque de la app)."""
+        self._enabled = True
+        logger.info(
+            f"⚡ [RESERVE-QUEUE] Reserva por eventos activa — ventana de {self.debounce_seconds}s"
+        )
+
+    def stop(self):
+        """Desactiva la cola y cancela la ventana en curso (lo pendiente lo recoge el cron)."""
+        with self._lock:
+            self._enabled = False
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            self._pending.clear()
+
+    def notify_products(self, product_ids: Iterable[Optional[int]]):
+        """
+        Registra productos cuyo stock o demanda cambió.
+
+        Args:
+            product_ids: IDs de ProductReference (se ignoran None y duplicados)
+        """
+        ids = {pid for pid in product_ids if pid}
+        if not ids:
+            return
+        with self._lock:
+            if not self._enabled:
+                return
+            self._pending |= ids
+            self.stats["notified"] += len(ids)
+            self._schedule()
+
+    def _schedule(self):
+        # Llamar con self._lock tomado
+        if self._timer is None and self._pending:
+            self._timer = threading.Timer(self.debounce_seconds, self._process)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _process(self):
+        """Vence la ventana: reserva los productos acumulados."""
+        with self._lock:
+            batch = sorted(self._pending)
+            self._pending.clear()
+
+        requeue: List[int] = []
+        try:
+            for i in range(0, len(batch), RESERVATION_BATCH_SIZE):
+                chunk = batch[i:i + RESERVATION_BATCH_SIZE]
+                # Productos de particiones que otro worker está reservando: reintentar
+                busy = self._run(chunk)
+                requeue.extend(busy)
+                self.stats["runs"] += 1
+                self.stats["products_processed"] += len(chunk) - len(busy)
+        except Exception as e:
+            logger.error(f"❌ [RESERVE-QUEUE] Error reservando {len(batch)} productos: {e}", exc_info=True)
+            self.stats["errors"] += 1
+
+        with self._lock:
+            self._timer = None
+            if requeue and self._enabled:
+                logger.info(
+                    f"⏭️  [RESERVE-QUEUE] Lock de reservas ocupado — {len(requeue)} productos reencolados"
+                )
+                self.stats["requeued"] += len(requeue)
+                self._pending |= set(requeue)
+            self._schedule()
+
+    def _run(self, product_ids: List[int]) -> List[int]:
+        if self._runner is not None:
+            return self._runner(product_ids)
+        from src.services.stock_reservation_cron_service import reserve_stock_for_products
+        return reserve_stock_for_products(product_ids)
+
+
+# Instancia global de la cola
+reservation_queue = ReservationQueue()
+
+
+def start_reservation_queue() -> Optional[ReservationQueue]:
+    """
+    Activa la cola de reservas por eventos si RESERVATION_QUEUE_ENABLED.
+
+    Returns:
+        La cola activada (para stop() en lifespan) o None si está desactivada
+    """
+    if not RESERVATION_QUEUE_ENABLED:
+        logger.info("⚡ [RESERVE-QUEUE] Reserva por eventos desactivada")
+        return None
+    reservation_queue.start()
+    return reservation_queue
@@ -0,0 +1,177 @@
+"""
+Slotting Engine
+
+Slotting por rotación: los productos que más se recogen deben estar en las
+ubicaciones más accesibles del almacén de picking. Puro: sin ORM ni BD (la
+carga está en slotting_service.py).
+
+Rotación (picks/día) de un producto: media ponderada de las recogidas
+(movimientos DEDUCT) en varias ventanas, para que pese más lo reciente sin
+olvidar la estacionalidad:
+
+    7 días × 0.4 + 30 días × 0.3 + 90 días × 0.2 + 365 días × 0.1
+
+Coste de una ubicación (segundos por visita): ida y vuelta desde el depósito
+con la matriz de distancias del almacén más el tiempo de recogida por altura
+(WarehouseLayout.pick_seconds). Menor = más accesible.
+
+Recomendaciones de movimiento (voraz, tipo ordenación por selección): los
+productos se ordenan por rotación y las ubicaciones por coste; el producto
+k-ésimo debería estar en la k-ésima ubicación. Si no lo está, se propone
+moverlo allí (o intercambiarlo con el producto que la ocupa) cuando el
+ahorro supera un mínimo:
+
+    ahorro/día = (rotación_a − rotación_b) × (coste_actual − coste_destino)
+
+Política para ubicaciones nuevas: el percentil de rotación del producto
+indica qué parte de las ubicaciones libres (ordenadas por coste) le toca;
+los más rápidos reciben las más accesibles.
+"""
+
+from bisect import bisect_right
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# (días, peso) de las ventanas de rotación
+VELOCITY_WINDOWS: Tuple[Tuple[int, float], ...] = ((7, 0.4), (30, 0.3), (90, 0.2), (365, 0.1))
+
+# Reparto ABC por rotación acumulada
+ABC_A_SHARE = 0.8
+ABC_B_SHARE = 0.95
+
+# Percentil para productos sin historial (mitad de la lista de libres)
+UNKNOWN_PERCENTILE = 0.5
+
+
+def blended_velocity(window_counts: Sequence[float]) -> float:
+    """
+    Rotación (picks/día) a partir de las recogidas de cada ventana.
+
+    Args:
+        window_counts: Recogidas en cada ventana de VELOCITY_WINDOWS (mismo orden)
+    """
+    return sum(weight * (count or 0) / days for (days, weight), count in zip(VELOCITY_WINDOWS, window_counts))
+
+
+def slot_cost(layout, depot_distance_m: float, altura: Optional[int]) -> float:
+    """Segundos por visita a una ubicación: ida y vuelta desde el depósito más la recogida."""
+    walking = 2 * depot_distance_m / layout.config.walk_speed_mps
+    extra_levels = max(0, (altura or 1) - 1)
+    return walking + layout.config.seconds_per_pick + layout.config.seconds_per_level * extra_levels
+
+
+def abc_classes(velocities: Dict[int, float]) -> Dict[int, str]:
+    """Clase A/B/C de cada producto por su rotación acumulada."""
+    total = sum(velocities.values())
+    classes: Dict[int, str] = {}
+    cumulative = 0.0
+    for product_id, velocity in sorted(velocities.items(), key=lambda item: (-item[1], item[0])):
+        share = cumulative / total if total else 1.0
+        classes[product_id] = "A" if share < ABC_A_SHARE else "B" if share < ABC_B_SHARE else "C"
+        cumulative += velocity
+    return classes
+
+
+class VelocityPercentiles:
+    """Percentil de rotación de cada producto (0 = el más rápido)."""
+
+    def __init__(self, velocities: Dict[int, float]):
+        # Rotaciones en negativo y ordenadas: bisect da cuántas son mayores
+        self._sorted = sorted(-v for v in velocities.values() if v > 0)
+        self._velocities = velocities
+
+    def percentile(self, product_id: Optional[int]) -> float:
+        velocity = self._velocities.get(product_id, 0.0) if product_id else 0.0
+        if velocity <= 0 or not self._sorted:
+            return UNKNOWN_PERCENTILE
+        faster = bisect_right(self._sorted, -velocity) - 1
+        return max(0, faster) / len(self._sorted)
+
+
+def preferred_index(percentile: float, free_count: int) -> int:
+    """Índice de la ubicación libre (ordenadas por coste) para un producto de ese percentil."""
+    if free_count <= 0:
+        return -1
+    return min(free_count - 1, int(percentile * free_count))
+
+
+@dataclass
+class SlotAssignment:
+    """Ubicación de picking con su coste y el producto que la ocupa (None = libre)."""
+    location_id: int
+    cost_seconds: float
+    product_id: Optional[int] = None
+
+
+@dataclass
+class SlotMove:
+    """Movimiento recomendado de un producto a una ubicación más accesible."""
+    product_id: int
+    from_location_id: int
+    to_location_id: int
+    # Producto que ocupa el destino y pasa al origen (None = destino libre)
+    swap_product_id: Optional[int]
+    velocity: float
+    saving_seconds_per_day: float
+
+
+def recommend_moves(
+    slots: Sequence[SlotAssignment],
+    velocities: Dict[int, float],
+    max_moves: int = 50,
+    min_saving_seconds_per_day: float = 0.0,
+) -> List[SlotMove]:
+    """
+    Movimientos que acercan cada producto a la ubicación que le corresponde
+    por rotación.
+
+    Args:
+        slots: Ubicaciones de picking (ocupadas y libres)
+        velocities: product_id → picks/día (los que no estén cuentan 0)
+        max_moves: Máximo de movimientos devueltos
+        min_saving_seconds_per_day: Ahorro mínimo para proponer un movimiento
+
+    Returns:
+        Movimientos ordenados por ahorro (mayor primero)
+    """
+    order = sorted(range(len(slots)), key=lambda i: (slots[i].cost_seconds, slots[i].location_id))
+    cost = [slots[i].cost_seconds for i in order]
+    location = [slots[i].location_id for i in order]
+    # Estado de trabajo: cada ubicación ocupada es una unidad (producto, rango inicial)
+    unit_at: List[Optional[Tuple[int, int]]] = [
+        (slots[i].product_id, rank) if slots[i].product_id is not None else None
+        for rank, i in enumerate(order)
+    ]
+    rank_of: Dict[Tuple[int, int], int] = {unit: rank for rank, unit in enumerate(unit_at) if unit}
+
+    def velocity_of(unit: Optional[Tuple[int, int]]) -> float:
+        return velocities.get(unit[0], 0.0) if unit else 0.0
+
+    # Más rotación = debería ocupar una ubicación de menor coste
+    units = sorted(rank_of, key=lambda unit: (-velocity_of(unit), unit[1]))
+
+    moves: List[SlotMove] = []
+    for target, unit in enumerate(units):
+        source = rank_of[unit]
+        if source == target:
+            continue
+        other = unit_at[target]
+        saving = (velocity_of(unit) - velocity_of(other)) * (cost[source] - cost[target])
+        if saving <= 0 or saving < min_saving_seconds_per_day:
+            continue
+        moves.append(SlotMove(
+            product_id=unit[0],
+            from_location_id=location[source],
+            to_location_id=location[target],
+            swap_product_id=other[0] if other else None,
+            velocity=round(velocity_of(unit), 3),
+            saving_seconds_per_day=round(saving, 1),
+        ))
+        # Aplicar el movimiento (o intercambio) en el estado de trabajo
+        unit_at[source], unit_at[target] = other, unit
+        rank_of[unit] = target
+        if other:
+            rank_of[other] = source
+
+    moves.sort(key=lambda m: -m.saving_seconds_per_day)
+    return moves[:max_moves]
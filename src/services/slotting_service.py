@@ -0,0 +1,190 @@
+"""
+Slotting Service
+
+Carga de datos para el motor de slotting (services/slotting_engine.py):
+
+    - product_velocities(): rotación por producto con UNA consulta agregada
+      sobre el último año de movimientos DEDUCT del almacén (un SUM(CASE)
+      por ventana; la BD recorre los movimientos con el índice
+      idx_stock_mov_tipo_created y Python solo recibe una fila por producto).
+      Cacheada SLOTTING_VELOCITY_TTL_SECONDS por almacén.
+    - rank_locations(): coste por ubicación con la matriz de distancias del
+      almacén (warehouse_layout.get_layout).
+    - slotting_recommendations(): movimientos recomendados para
+      GET /products/slotting/recommendations.
+    - SlottingPolicy: ubicación libre preferida para un producto nuevo en
+      picking (la usa ReplenishmentPlanner al asignar ubicaciones libres).
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.config import (
+    ALMACEN_PICKING_ID,
+    SLOTTING_VELOCITY_TTL_SECONDS,
+)
+from src.adapters.secondary.database.orm import ProductLocation, StockMovement
+from src.services.slotting_engine import (
+    VELOCITY_WINDOWS,
+    SlotAssignment,
+    VelocityPercentiles,
+    abc_classes,
+    blended_velocity,
+    preferred_index,
+    recommend_moves,
+    slot_cost,
+)
+from src.services.warehouse_layout import get_layout
+
+logger = logging.getLogger(__name__)
+
+_velocity_cache: Dict[int, Tuple[float, Dict[int, float]]] = {}
+_velocity_lock = threading.Lock()
+
+
+def product_velocities(db: Session, almacen_id: int = ALMACEN_PICKING_ID, now: Optional[datetime] = None) -> Dict[int, float]:
+    """
+    Rotación (picks/día) de cada producto con recogidas en el almacén.
+
+    Args:
+        db: Sesión de base de datos
+        almacen_id: Almacén de las ubicaciones de los movimientos
+        now: Instante de referencia (por defecto, ahora; sin caché si se indica)
+
+    Returns:
+        product_id → picks/día
+    """
+    use_cache = now is None
+    if use_cache:
+        with _velocity_lock:
+            cached = _velocity_cache.get(almacen_id)
+            if cached and time.monotonic() - cached[0] < SLOTTING_VELOCITY_TTL_SECONDS:
+                return cached[1]
+
+    now = now or datetime.utcnow()
+    cutoffs = [now - timedelta(days=days) for days, _ in VELOCITY_WINDOWS]
+    windows = [func.sum(case((StockMovement.created_at >= cutoff, 1), else_=0)) for cutoff in cutoffs]
+    rows = (
+        db.query(StockMovement.product_id, *windows)
+        .join(ProductLocation, ProductLocation.id == StockMovement.product_location_id)
+        .filter(
+            StockMovement.tipo == "DEDUCT",
+            StockMovement.created_at >= min(cutoffs),
+            ProductLocation.almacen_id == almacen_id,
+        )
+        .group_by(StockMovement.product_id)
+        .all()
+    )
+    velocities = {row[0]: blended_velocity(row[1:]) for row in rows}
+
+    if use_cache:
+        with _velocity_lock:
+            _velocity_cache[almacen_id] = (time.monotonic(), velocities)
+    return velocities
+
+
+def rank_locations(db: Session, almacen_id: int, locations: Sequence) -> Dict[int, float]:
+    """
+    Coste (segundos por visita) de cada ubicación.
+
+    Args:
+        locations: Filas con id, pasillo, ubicacion y altura (ORM o tuplas con nombre)
+
+    Returns:
+        location_id → coste
+    """
+    layout = get_layout(db, almacen_id)
+    costs = {}
+    for loc in locations:
+        distance = layout.depot_distance(loc.id)
+        if distance is None:
+            distance = layout.distance(layout.depot, layout.point(loc.pasillo, loc.ubicacion))
+        costs[loc.id] = slot_cost(layout, distance, loc.altura)
+    return costs
+
+
+def slotting_recommendations(
+    db: Session,
+    almacen_id: int = ALMACEN_PICKING_ID,
+    max_moves: int = 50,
+    min_saving_seconds_per_day: float = 0.0,
+) -> dict:
+    """
+    Movimientos recomendados para acercar los productos de más rotación a
+    las ubicaciones más accesibles.
+
+    Returns:
+        {"productos_con_rotacion", "ubicaciones", "ahorro_total_segundos_dia", "moves": [...]}
+        con cada movimiento enriquecido con códigos de ubicación y clase ABC
+    """
+    locations = (
+        db.query(
+            ProductLocation.id, ProductLocation.product_id, ProductLocation.pasillo,
+            ProductLocation.ubicacion, ProductLocation.altura, ProductLocation.codigo,
+        )
+        .filter(ProductLocation.almacen_id == almacen_id, ProductLocation.activa == True)
+        .all()
+    )
+    velocities = product_velocities(db, almacen_id)
+    costs = rank_locations(db, almacen_id, locations)
+    slots = [SlotAssignment(loc.id, costs[loc.id], loc.product_id) for loc in locations]
+    moves = recommend_moves(slots, velocities, max_moves, min_saving_seconds_per_day)
+
+    classes = abc_classes(velocities)
+    codes = {loc.id: loc.codigo for loc in locations}
+    return {
+        "productos_con_rotacion": len(velocities),
+        "ubicaciones": len(locations),
+        "ahorro_total_segundos_dia": round(sum(m.saving_seconds_per_day for m in moves), 1),
+        "moves": [
+            {
+                "product_id": m.product_id,
+                "clase": classes.get(m.product_id, "C"),
+                "picks_dia": m.velocity,
+                "from_location_id": m.from_location_id,
+                "from_codigo": codes.get(m.from_location_id),
+                "to_location_id": m.to_location_id,
+                "to_codigo": codes.get(m.to_location_id),
+                "swap_product_id": m.swap_product_id,
+                "ahorro_segundos_dia": m.saving_seconds_per_day,
+            }
+            for m in moves
+        ],
+    }
+
+
+class SlottingPolicy:
+    """
+    Ubicación libre preferida para un producto: las libres se ordenan por
+    coste y cada producto toma la de su percentil de rotación.
+    """
+
+    def __init__(self, db: Session, almacen_id: int = ALMACEN_PICKING_ID):
+        self.db = db
+        self.almacen_id = almacen_id
+        self.percentiles = VelocityPercentiles(product_velocities(db, almacen_id))
+
+    def rank_free(self, locations: Sequence) -> List[int]:
+        """IDs de las ubicaciones libres de la más a la menos accesible."""
+        costs = rank_locations(self.db, self.almacen_id, locations)
+        return sorted(costs, key=lambda location_id: (costs[location_id], location_id))
+
+    def take(self, ranked_free: List[int], product_id: Optional[int]) -> Optional[int]:
+        """Saca de ranked_free la ubicación que le toca al producto (None si no quedan)."""
+        index = preferred_index(self.percentiles.percentile(product_id), len(ranked_free))
+        return ranked_free.pop(index) if index >= 0 else None
+
+
+def invalidate_velocities(almacen_id: Optional[int] = None):
+    """Descarta las rotaciones cacheadas de un almacén (o de todos)."""
+    with _velocity_lock:
+        if almacen_id is None:
+            _velocity_cache.clear()
+        else:
+            _velocity_cache.pop(almacen_id, None)
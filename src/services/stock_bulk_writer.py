@@ -0,0 +1,203 @@
+"""
+Stock Bulk Writer
+
+Ruta de escritura en bloque para las operaciones de stock que generan muchas
+filas: reservas del cron, descuentos al completar picking y liberaciones al
+cancelar.
+
+Antes cada ubicación usada hacía db.add() de un OrderLineStockAssignment y de
+un StockMovement, y cada cambio de stock_reservado marcaba la ubicación como
+modificada: un ciclo grande terminaba en miles de INSERT/UPDATE de una fila
+por round trip de pyodbc.
+
+StockWriteBatch acumula:
+    - Filas de OrderLineStockAssignment y StockMovement (dicts) → un INSERT
+      executemany por tabla (fast_executemany en el engine, ver DB_FAST_EXECUTEMANY)
+    - Deltas de stock_reservado / stock_actual por ubicación → UPDATE por
+      bloques con CASE (set-based). Cada ajuste se recorta a 0 en memoria como
+      hacía el código anterior, y lo que se acumula es el delta ya recortado:
+      con 3 unidades, -5 y luego +5 dejan 5 en memoria y en BD (sumar los
+      deltas en bruto y recortar una vez daría 3). El UPDATE vuelve a recortar
+      a 0 solo como salvaguarda
+
+Los objetos ProductLocation en memoria se actualizan con set_committed_value
+(sin marcarlos como modificados), así el resto del ciclo ve el stock nuevo y
+el flush del ORM no repite el UPDATE. Como estas escrituras no pasan por el
+flush del ORM, sus deltas se registran en los contadores del dashboard con
+dashboard_counters.stage() y en product_stock_summary con
+stock_summary_service.apply_summary_deltas().
+"""
+
+import logging
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from sqlalchemy import case, func, insert, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.adapters.secondary.database.orm import (
+    OrderLineStockAssignment,
+    ProductLocation,
+    StockMovement,
+)
+from src.services.dashboard_counters import stage as stage_dashboard_deltas
+from src.services.stock_summary_service import apply_summary_deltas
+
+logger = logging.getLogger(__name__)
+
+# Ubicaciones por UPDATE: 1 parámetro en el IN + 2 por CASE (límite pyodbc ~2100)
+LOCATION_UPDATE_CHUNK = 300
+
+
+def _clamped(expr):
+    """Nunca dejar stock negativo (equivalente SQL de max(0, valor))."""
+    return case((expr < 0, 0), else_=expr)
+
+
+class StockWriteBatch:
+    """
+    Acumulador de escrituras de stock para persistirlas en bloque.
+
+    Uso:
+        batch = StockWriteBatch()
+        batch.add_assignment(order_line_id=..., product_location_id=..., ...)
+        batch.add_movement(product_location_id=..., tipo="RESERVE", ...)
+        batch.adjust_location(location, reservado=+take)
+        batch.flush(db)   # antes del commit
+    """
+
+    def __init__(self):
+        self.assignments: List[dict] = []
+        self.movements: List[dict] = []
+        self._reservado_delta: Dict[int, int] = defaultdict(int)
+        self._actual_delta: Dict[int, int] = defaultdict(int)
+        # Stock efectivo (tras recortar a 0) por almacén, solo ubicaciones activas
+        self._almacen_stock_delta: Dict[int, int] = defaultdict(int)
+        # (producto, almacén) → [Δ stock_actual, Δ stock_reservado] efectivos, solo activas
+        self._summary_delta: Dict[Tuple[int, int], List[int]] = defaultdict(lambda: [0, 0])
+
+    def __len__(self) -> int:
+        return len(self.assignments) + len(self.movements) + len(self._location_ids())
+
+    def add_assignment(self, **values):
+        """Añade una fila de OrderLineStockAssignment (columnas como kwargs)."""
+        self.assignments.append(values)
+
+    def add_movement(self, **values):
+        """Añade una fila de StockMovement (columnas como kwargs)."""
+        self.movements.append(values)
+
+    def adjust_location(self, location: ProductLocation, reservado: int = 0, actual: int = 0):
+        """
+        Registra un cambio de stock de una ubicación.
+
+        Args:
+            location: Ubicación (se actualiza en memoria sin marcarla como modificada)
+            reservado: Delta de stock_reservado (se recorta para no bajar de 0)
+            actual: Delta de stock_actual (se recorta para no bajar de 0)
+        """
+        summary_key = (location.product_id, location.almacen_id)
+        tracked = location.activa and location.product_id is not None
+        if reservado:
+            before = location.stock_reservado or 0
+            after = max(0, before + reservado)
+            # Delta efectivo (tras recortar a 0): es lo que el UPDATE suma en BD
+            self._reservado_delta[location.id] += after - before
+            set_committed_value(location, "stock_reservado", after)
+            if tracked:
+                self._summary_delta[summary_key][1] += after - before
+        if actual:
+            before = location.stock_actual or 0
+            after = max(0, before + actual)
+            self._actual_delta[location.id] += after - before
+            set_committed_value(location, "stock_actual", after)
+            if location.activa:
+                self._almacen_stock_delta[location.almacen_id] += after - before
+            if tracked:
+                self._summary_delta[summary_key][0] += after - before
+
+    def _location_ids(self) -> List[int]:
+        ids = {
+            loc_id for loc_id, delta in self._reservado_delta.items() if delta
+        } | {
+            loc_id for loc_id, delta in self._actual_delta.items() if delta
+        }
+        return sorted(ids)
+
+    def flush(self, db: Session) -> Dict[str, int]:
+        """
+        Ejecuta las escrituras acumuladas en la transacción de db (sin commit).
+
+        Args:
+            db: Sesión de base de datos
+
+        Returns:
+            Número de filas escritas por tipo
+        """
+        written = {"assignments": 0, "movements": 0, "locations": 0}
+
+        if self.assignments:
+            db.execute(insert(OrderLineStockAssignment), self.assignments)
+            written["assignments"] = len(self.assignments)
+
+        if self.movements:
+            db.execute(insert(StockMovement), self.movements)
+            written["movements"] = len(self.movements)
+
+        location_ids = self._location_ids()
+        for i in range(0, len(location_ids), LOCATION_UPDATE_CHUNK):
+            chunk = location_ids[i:i + LOCATION_UPDATE_CHUNK]
+            values = {}
+            reservado = {k: self._reservado_delta[k] for k in chunk if self._reservado_delta.get(k)}
+            actual = {k: self._actual_delta[k] for k in chunk if self._actual_delta.get(k)}
+            if reservado:
+                values["stock_reservado"] = _clamped(
+                    func.coalesce(ProductLocation.stock_reservado, 0)
+                    + case(reservado, value=ProductLocation.id, else_=0)
+                )
+            if actual:
+                values["stock_actual"] = _clamped(
+                    func.coalesce(ProductLocation.stock_actual, 0)
+                    + case(actual, value=ProductLocation.id, else_=0)
+                )
+            db.execute(
+                update(ProductLocation)
+                .where(ProductLocation.id.in_(chunk))
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            written["locations"] += len(chunk)
+
+        if self._summary_delta:
+            apply_summary_deltas(db, {
+                key: (actual, reservado, 0) for key, (actual, reservado) in self._summary_delta.items()
+            })
+
+        dashboard_deltas = [
+            ("location", almacen_id, None, 0, delta)
+            for almacen_id, delta in self._almacen_stock_delta.items() if delta
+        ]
+        movement_totals = defaultdict(lambda: [0, 0])
+        for movement in self.movements:
+            movement_totals[movement["tipo"]][0] += 1
+            movement_totals[movement["tipo"]][1] += movement.get("cantidad") or 0
+        dashboard_deltas.extend(
+            ("movement", tipo, n, cantidad) for tipo, (n, cantidad) in movement_totals.items()
+        )
+        if dashboard_deltas:
+            stage_dashboard_deltas(db, dashboard_deltas)
+
+        self.assignments.clear()
+        self.movements.clear()
+        self._reservado_delta.clear()
+        self._actual_delta.clear()
+        self._almacen_stock_delta.clear()
+        self._summary_delta.clear()
+
+        if any(written.values()):
+            logger.debug(
+                f"  [STOCK-BULK] {written['assignments']} assignments, "
+                f"{written['movements']} movimientos, {written['locations']} ubicaciones"
+            )
+        return written
@@ -8,42 +8,109 @@ Arquitectura:
     - Se ejecuta cada N minutos via APScheduler
     - Usa sesión de BD independiente por ejecución
     - Busca órdenes sin stock reservado
+    - Reparte el stock disponible con el motor de asignación
+      (reservation_allocation: prioridad de la orden, FIFO, menos ubicaciones)
     - Asigna product_location_id a cada order_line
     - Incrementa stock_reservado en ProductLocation
     - Crea registro de auditoría en StockMovement
+
+Modo incremental (STOCK_CRON_INCREMENTAL):
+    Guarda en cron_watermarks el instante de la última pasada y solo revisa
+    las órdenes importadas/modificadas desde entonces, las que tienen líneas
+    modificadas y las que piden productos cuyo stock de picking cambió
+    (ubicación actualizada o reposición completada). El coste de cada ciclo
+    depende del volumen de cambios, no del backlog. Cada
+    STOCK_CRON_FULL_INTERVAL_MINUTES se hace una pasada completa como red de
+    seguridad (cambios hechos con SQL directo que no tocan updated_at).
+
+    SQL para crear la tabla y los índices en BD existentes:
+        CREATE TABLE cron_watermarks (
+            job_name VARCHAR(100) NOT NULL PRIMARY KEY,
+            watermark DATETIME NULL,
+            last_full_run DATETIME NULL,
+            updated_at DATETIME NOT NULL DEFAULT GETUTCDATE()
+        );
+        CREATE INDEX idx_order_updated_at ON orders (updated_at);
+        CREATE INDEX idx_order_line_updated_at ON order_lines (updated_at);
+        CREATE INDEX idx_location_almacen_updated ON product_locations (almacen_id, updated_at);
+        CREATE INDEX idx_replenishment_completed_at ON replenishment_requests (completed_at);
+
+Particiones por producto (STOCK_CRON_PARTITIONS / STOCK_CRON_WORKERS):
+    Las líneas se reparten por product_reference_id % STOCK_CRON_PARTITIONS.
+    Dos particiones nunca reservan sobre las mismas order_lines ni sobre las
+    mismas ubicaciones (cada una solo toca las de sus productos), así que cada una:
+        - Toma su propio sp_getapplock ('stock_reservation_cron:<i>/<n>') con
+          @LockOwner = 'Transaction' (se libera solo en el commit/rollback)
+        - Corre en su propia sesión y transacción corta
+        - Guarda su propia marca de agua en cron_watermarks
+    Las particiones se procesan en paralelo con un pool de hilos. Si la app
+    corre con varios workers de uvicorn, cada uno salta las particiones que
+    otro ya tiene tomadas, y el trabajo se reparte. Un error en una partición
+    solo revierte esa partición.
+
+    Lo que sí comparten es el pool de ubicaciones de picking libres
+    (product_id NULL) y reutilizables (vacías, de otro producto) que
+    ReplenishmentPlanner asigna al crear reposiciones. Esa asignación se
+    serializa con un tercer sp_getapplock ('stock_reservation_cron:slots',
+    también de transacción) que la partición solo pide si necesita una
+    ubicación nueva, esperando hasta STOCK_CRON_SLOT_LOCK_TIMEOUT_MS. Además
+    cada ubicación se reclama con un UPDATE condicional que comprueba el
+    rowcount (ver ReplenishmentPlanner._claim_location), así que tampoco se
+    pisa con la PDA. Si el lock no llega a tiempo la partición no asigna
+    ubicaciones nuevas y cuenta un error (la marca de agua no avanza).
 """
 
 import logging
-from datetime import datetime
-from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import func
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm import Session, selectinload
 
 from src.adapters.secondary.database.config import (
     SessionLocal,
     ALMACEN_PICKING_ID,
     CRON_INTERVAL_MINUTES,
-    SYSTEM_OPERATOR_CODE
+    SYSTEM_OPERATOR_CODE,
+    STOCK_CRON_INCREMENTAL,
+    STOCK_CRON_FULL_INTERVAL_MINUTES,
+    STOCK_CRON_WATERMARK_OVERLAP_SECONDS,
+    STOCK_CRON_PARTITIONS,
+    STOCK_CRON_WORKERS,
+    STOCK_CRON_SLOT_LOCK_TIMEOUT_MS,
+    STOCK_RESERVATION_ORDER_POLICY,
+    STOCK_RESERVATION_LOCATION_POLICY,
 )
 from src.adapters.secondary.database.orm import (
+    CronWatermark,
     Order,
     OrderLine,
     OrderLineStockAssignment,
     OrderStatus,
     ProductLocation,
     ProductReference,
-    StockMovement,
     ReplenishmentRequest,
     Operator,
 )
-from src.services.replenishment_service import create_or_upgrade_replenishment
+from src.services.job_registry import job_registry
+from src.services.replenishment_service import ReplenishmentPlanner
+from src.services.reservation_allocation import (
+    Allocation,
+    AllocationSnapshot,
+    allocate,
+    priority_rank,
+)
+from src.services.stock_bulk_writer import StockWriteBatch
 
 logger = logging.getLogger(__name__)
 
 # Estados de orden donde se reserva stock
 RESERVATION_STATUS_CODES = ["PENDING", "ASSIGNED"]
 
+# Clave de la marca de agua del cron en cron_watermarks
+WATERMARK_JOB_NAME = "stock_reservation_cron"
+
 
 class StockReservationCronService:
     """
@@ -56,9 +123,32 @@ class StockReservationCronService:
         - Crear registros de auditoría (StockMovement)
     """
 
-    def __init__(self, db_session: Optional[Session] = None):
+    def __init__(
+        self,
+        db_session: Optional[Session] = None,
+        incremental: bool = STOCK_CRON_INCREMENTAL,
+        product_ids: Optional[Iterable[int]] = None,
+        partition: Optional[Tuple[int, int]] = None,
+        order_policy: str = STOCK_RESERVATION_ORDER_POLICY,
+        location_policy: str = STOCK_RESERVATION_LOCATION_POLICY,
+    ):
         # db_session se acepta para tests; en producción se crea en run()
         self._external_session = db_session
+        self.incremental = incremental
+        # Reserva dirigida (cola de eventos): solo líneas de estos productos, sin marca de agua
+        self.product_ids: Optional[List[int]] = sorted(set(product_ids)) if product_ids is not None else None
+        # Partición (índice, total): solo productos con product_id % total == índice
+        self.partition = partition if partition and partition[1] > 1 else None
+        self.watermark_job_name = (
+            f"{WATERMARK_JOB_NAME}:{partition[0]}/{partition[1]}" if self.partition else WATERMARK_JOB_NAME
+        )
+        # Políticas del motor de asignación (ver reservation_allocation)
+        self.order_policy = order_policy
+        self.location_policy = location_policy
+        # Assignments, movimientos y stock_reservado se escriben en bloque al final del ciclo
+        self.batch = StockWriteBatch()
+        # Solo se revisan cambios posteriores a este instante (None = pasada completa)
+        self.since: Optional[datetime] = None
 
         # Estadísticas de ejecución
         self.stats = {
@@ -69,6 +159,8 @@ class StockReservationCronService:
             "replenishment_upgraded": 0,
             "orders_processed": 0,
             "errors": 0,
+            "rows_written": 0,
+            "mode": None,
             "start_time": None,
             "end_time": None,
         }
@@ -86,7 +178,13 @@ class StockReservationCronService:
         owns_session = self._external_session is None
 
         try:
-            self._reserve_stock_for_orders()
+            if self.product_ids is not None:
+                self.stats["mode"] = "products"
+                self._reserve_stock_for_orders()
+            else:
+                watermark = self._load_watermark()
+                self._reserve_stock_for_orders()
+                self._save_watermark(watermark)
             self.db.commit()
 
         except Exception as e:
@@ -100,14 +198,100 @@ class StockReservationCronService:
         self._log_stats()
         return self.stats
     
+    def _load_watermark(self) -> Optional[CronWatermark]:
+        """
+        Lee la marca de agua y decide el modo de esta ejecución.
+
+        Pasada completa si el modo incremental está desactivado, si no hay marca
+        previa o si la última pasada completa es más antigua que
+        STOCK_CRON_FULL_INTERVAL_MINUTES. En modo incremental self.since es la
+        marca menos un solape de seguridad.
+        """
+        watermark = self.db.get(CronWatermark, self.watermark_job_name)
+        full_due = (
+            not self.incremental
+            or watermark is None
+            or watermark.watermark is None
+            or watermark.last_full_run is None
+            or self.stats["start_time"] - watermark.last_full_run
+            >= timedelta(minutes=STOCK_CRON_FULL_INTERVAL_MINUTES)
+        )
+        if full_due:
+            self.since = None
+            self.stats["mode"] = "full"
+        else:
+            self.since = watermark.watermark - timedelta(seconds=STOCK_CRON_WATERMARK_OVERLAP_SECONDS)
+            self.stats["mode"] = "incremental"
+        return watermark
+
+    def _save_watermark(self, watermark: Optional[CronWatermark]):
+        """
+        Avanza la marca de agua al inicio de esta ejecución (en la misma transacción
+        que las reservas). Si alguna orden falló no se avanza, para reintentarla.
+        """
+        if self.stats["errors"]:
+            logger.warning("  [STOCK-CRON] Hubo errores: la marca de agua no avanza")
+            return
+        if watermark is None:
+            watermark = CronWatermark(job_name=self.watermark_job_name)
+            self.db.add(watermark)
+        watermark.watermark = self.stats["start_time"]
+        if self.since is None:
+            watermark.last_full_run = self.stats["start_time"]
+
+    def _changed_orders_filter(self):
+        """
+        Condición sobre Order que limita la pasada a lo cambiado desde self.since.
+
+        Una orden entra si se importó o modificó, si alguna de sus líneas se
+        modificó, o si pide un producto cuyo stock de picking cambió (ubicación
+        actualizada o reposición completada).
+
+        Returns:
+            Expresión SQLAlchemy, o None en una pasada completa
+        """
+        if self.since is None:
+            return None
+        since = self.since
+        stock_changed_products = select(ProductLocation.product_id).where(
+            ProductLocation.almacen_id == ALMACEN_PICKING_ID,
+            ProductLocation.product_id.isnot(None),
+            or_(
+                ProductLocation.updated_at > since,
+                ProductLocation.ultima_actualizacion_stock > since,
+            ),
+        )
+        replenished_products = select(ReplenishmentRequest.product_id).where(
+            ReplenishmentRequest.completed_at > since
+        )
+        changed_line_orders = select(OrderLine.order_id).where(
+            or_(
+                OrderLine.updated_at > since,
+                OrderLine.product_reference_id.in_(stock_changed_products),
+                OrderLine.product_reference_id.in_(replenished_products),
+            )
+        )
+        return or_(
+            Order.fecha_importacion > since,
+            Order.updated_at > since,
+            Order.id.in_(changed_line_orders),
+        )
+
     def _reserve_stock_for_orders(self):
         """
         Busca órdenes en estados PENDING/ASSIGNED y reserva stock para líneas
         que aún no tienen reserva completa.
 
+        En modo incremental solo se cargan las órdenes afectadas por cambios
+        desde la última ejecución (ver _changed_orders_filter).
+
         Optimización: pre-carga assignments y ubicaciones en 3 queries totales
-        en lugar de una query por línea (evita N+1).
+        en lugar de una query por línea (evita N+1). El reparto del stock lo
+        calcula el motor puro (allocate) sobre una foto en memoria y el plan
+        se aplica en una sola pasada.
         """
+        self._product_id_set = set(self.product_ids or [])
+
         # Query 1: estados objetivo
         status_ids = self.db.query(OrderStatus.id).filter(
             OrderStatus.codigo.in_(RESERVATION_STATUS_CODES)
@@ -118,31 +302,56 @@ class StockReservationCronService:
             logger.warning("  [STOCK-CRON] No se encontraron estados de reserva en BD")
             return
 
+        # Filtro común de órdenes objetivo (+ alcance incremental si aplica)
+        order_filters = [
+            Order.status_id.in_(self.status_id_list),
+            Order.almacen_id == ALMACEN_PICKING_ID,
+        ]
+        line_filters = []
+        if self.product_ids is not None:
+            line_filters.append(OrderLine.product_reference_id.in_(self.product_ids))
+        if self.partition is not None:
+            index, total = self.partition
+            line_filters.append(OrderLine.product_reference_id % total == index)
+        if line_filters:
+            order_filters.append(
+                Order.id.in_(select(OrderLine.order_id).where(*line_filters))
+            )
+        if self.product_ids is None:
+            changed_filter = self._changed_orders_filter()
+            if changed_filter is not None:
+                order_filters.append(changed_filter)
+
         # Query 2: órdenes + líneas (selectinload = 2 SELECTs planos, sin subqueries gigantes)
         orders = (
             self.db.query(Order)
-            .filter(
-                Order.status_id.in_(self.status_id_list),
-                Order.almacen_id == ALMACEN_PICKING_ID,
-            )
+            .filter(*order_filters)
             .options(selectinload(Order.order_lines))
             .all()
         )
 
         if not orders:
-            logger.info("  [STOCK-CRON] No hay órdenes pendientes de reserva")
+            if self.since is None or self.product_ids is not None:
+                logger.info("  [STOCK-CRON] No hay órdenes pendientes de reserva")
+            else:
+                logger.info(f"  [STOCK-CRON] Sin cambios desde {self.since.isoformat()}")
             return
 
-        logger.info(f"  [STOCK-CRON] Procesando {len(orders)} órdenes en {RESERVATION_STATUS_CODES}")
+        if self.product_ids is not None:
+            scope = f"dirigida a {len(self.product_ids)} productos"
+        elif self.since is None:
+            scope = "completa"
+        else:
+            scope = f"incremental desde {self.since.isoformat()}"
+        if self.partition is not None:
+            scope += f", partición {self.partition[0]}/{self.partition[1]}"
+        logger.info(f"  [STOCK-CRON] Procesando {len(orders)} órdenes en {RESERVATION_STATUS_CODES} (pasada {scope})")
 
         # Subquery de líneas activas — evita pasar miles de IDs como parámetros (límite pyodbc ~2100)
         active_lines_sq = (
             self.db.query(OrderLine.id)
             .join(Order, OrderLine.order_id == Order.id)
-            .filter(
-                Order.status_id.in_(self.status_id_list),
-                Order.almacen_id == ALMACEN_PICKING_ID,
-            )
+            .filter(*order_filters, *line_filters)
             .subquery()
         )
 
@@ -151,8 +360,8 @@ class StockReservationCronService:
             self.db.query(OrderLine.product_reference_id)
             .join(Order, OrderLine.order_id == Order.id)
             .filter(
-                Order.status_id.in_(self.status_id_list),
-                Order.almacen_id == ALMACEN_PICKING_ID,
+                *order_filters,
+                *line_filters,
                 OrderLine.product_reference_id.isnot(None),
             )
             .distinct()
@@ -187,15 +396,34 @@ class StockReservationCronService:
             .order_by(ProductLocation.product_id, available_stock_expr.desc())
             .all()
         )
-        # Índice: product_id → lista de ubicaciones ordenadas por stock desc
-        locations_by_product: dict[int, list] = {}
-        for loc in location_rows:
-            locations_by_product.setdefault(loc.product_id, []).append(loc)
+        # Motor de asignación puro: foto en columnas → plan (ver reservation_allocation)
+        snapshot = self._build_snapshot(orders, reserved_by_line, location_rows)
+        plan = allocate(snapshot, self.order_policy, self.location_policy)
+        needed_by_line = dict(zip(snapshot.line_ids, snapshot.line_needed))
+        allocations_by_line = plan.allocations_by_line()
+        no_stock_lines = set(plan.no_stock_line_ids)
+        locations_by_id = {loc.id: loc for loc in location_rows}
+        # Déficit agregado por producto → (unidades, orden que lo originó primero)
+        deficits: Dict[int, List[int]] = {}
 
-        # Procesar cada orden usando los datos ya cargados en memoria
+        # Aplicar el plan en una sola pasada usando los datos ya cargados en memoria
         for order in orders:
             try:
-                self._reserve_order_lines(order, reserved_by_line, locations_by_product)
+                for line in order.order_lines:
+                    cantidad_needed = needed_by_line.get(line.id)
+                    if cantidad_needed is None:
+                        continue
+                    allocations = allocations_by_line.get(line.id)
+                    if allocations:
+                        self._apply_line_allocations(
+                            order, line, allocations, locations_by_id, cantidad_needed
+                        )
+                    if line.id in no_stock_lines:
+                        self.stats["lines_skipped_no_stock"] += 1
+                    deficit = plan.shortages.get(line.id)
+                    if deficit:
+                        entry = deficits.setdefault(line.product_reference_id, [0, order.id])
+                        entry[0] += deficit
                 self.stats["orders_processed"] += 1
             except Exception as e:
                 logger.error(
@@ -204,105 +432,105 @@ class StockReservationCronService:
                 )
                 self.stats["errors"] += 1
 
-    def _reserve_order_lines(
+        # Reposiciones de todo el ciclo en un único lote
+        if deficits:
+            self._plan_replenishments(deficits)
+
+        # Persistir todas las reservas del ciclo en bloque (misma transacción)
+        written = self.batch.flush(self.db)
+        self.stats["rows_written"] += sum(written.values())
+
+    def _build_snapshot(
         self,
-        order: Order,
+        orders: List[Order],
         reserved_by_line: dict,
-        locations_by_product: dict,
-    ):
+        location_rows: List[ProductLocation],
+    ) -> AllocationSnapshot:
         """
-        Reserva stock para cada línea de la orden que no tenga reserva completa.
+        Construye la foto de demanda y stock para el motor de asignación.
 
-        Recibe los datos de assignments y ubicaciones ya pre-cargados en memoria
-        para evitar queries adicionales por línea.
+        Solo entran las líneas con producto, dentro del alcance de la ejecución
+        y sin reserva completa. La secuencia FIFO es la antigüedad de la orden
+        (fecha_importacion).
         """
-        for line in order.order_lines:
-            # Saltar líneas sin producto asociado
-            if not line.product_reference_id:
-                self.stats["lines_skipped_no_product"] += 1
-                continue
+        snapshot = AllocationSnapshot()
+        fifo = sorted(orders, key=lambda o: (o.fecha_importacion or datetime.min, o.id))
+        for seq, order in enumerate(fifo):
+            rank = priority_rank(order.prioridad)
+            for line in order.order_lines:
+                # Saltar líneas sin producto asociado
+                if not line.product_reference_id:
+                    self.stats["lines_skipped_no_product"] += 1
+                    continue
 
-            # Cuánto ya está reservado (de la pre-carga en memoria)
-            total_already_reserved = reserved_by_line.get(line.id, 0)
+                # Reserva dirigida o particionada: las demás líneas de la orden no se tocan
+                if not self._line_in_scope(line):
+                    continue
 
-            cantidad_needed = line.cantidad_solicitada - total_already_reserved
-            if cantidad_needed <= 0:
-                continue  # Ya completamente reservada
+                # Cuánto falta (puede ser < cantidad_solicitada tras una reposición)
+                cantidad_needed = line.cantidad_solicitada - reserved_by_line.get(line.id, 0)
+                if cantidad_needed <= 0:
+                    continue  # Ya completamente reservada
 
-            # Ubicaciones disponibles (de la pre-carga en memoria)
-            locations = locations_by_product.get(line.product_reference_id, [])
+                snapshot.add_line(
+                    line.id, order.id, line.product_reference_id, cantidad_needed,
+                    priority=rank, seq=seq,
+                )
 
-            total_available = sum(
-                (loc.stock_actual or 0) - (loc.stock_reservado or 0)
-                for loc in locations
+        for loc in location_rows:
+            snapshot.add_location(
+                loc.id, loc.product_id, (loc.stock_actual or 0) - (loc.stock_reservado or 0)
             )
+        return snapshot
 
-            if total_available > 0:
-                reserved = self._reserve_line_multi(order, line, locations, cantidad_needed)
+    def _line_in_scope(self, line: OrderLine) -> bool:
+        """True si la línea pertenece a los productos/partición de esta ejecución."""
+        if self.product_ids is not None and line.product_reference_id not in self._product_id_set:
+            return False
+        if self.partition is not None:
+            index, total = self.partition
+            return line.product_reference_id % total == index
+        return True
 
-                deficit = cantidad_needed - reserved
-                if deficit > 0:
-                    self._create_or_upgrade_replenishment_request(
-                        line.product_reference_id, deficit, order
-                    )
-            else:
-                self.stats["lines_skipped_no_stock"] += 1
-                self._create_or_upgrade_replenishment_request(
-                    line.product_reference_id, cantidad_needed, order
-                )
-    
-    def _reserve_line_multi(
-        self, order: Order, line: OrderLine,
-        locations: List[ProductLocation], cantidad_needed: int
-    ) -> int:
+    def _apply_line_allocations(
+        self, order: Order, line: OrderLine, allocations: List[Allocation],
+        locations_by_id: Dict[int, ProductLocation], cantidad_needed: int,
+    ):
         """
-        Reserva stock distribuyendo entre múltiples ubicaciones.
-        
-        - product_location_id apunta a la ubicación con más stock (la primera)
-        - stock_reservado se incrementa proporcionalmente en cada ubicación
+        Aplica a una línea las reservas del plan.
+
+        - product_location_id apunta a la primera ubicación usada
+        - stock_reservado se incrementa en cada ubicación
         - Crea un OrderLineStockAssignment por cada ubicación usada
         - Crea un StockMovement de auditoría por cada ubicación usada
-        
+        - Todo se acumula en self.batch y se escribe en bloque al final del ciclo
+
         Args:
-            cantidad_needed: Cantidad que falta por reservar (puede ser < cantidad_solicitada
+            cantidad_needed: Cantidad que faltaba por reservar (puede ser < cantidad_solicitada
                            si es una reserva complementaria tras reposición)
-        
-        Returns:
-            Total de unidades efectivamente reservadas
         """
         # Asignar ubicación principal si no tiene una
         if not line.product_location_id:
-            line.product_location_id = locations[0].id
+            line.product_location_id = allocations[0].location_id
         line.stock_reserved = True
-        
-        remaining = cantidad_needed
-        total_reserved = 0
-        
-        for loc in locations:
-            if remaining <= 0:
-                break
-            
-            disponible = (loc.stock_actual or 0) - (loc.stock_reservado or 0)
-            take = min(remaining, disponible)
-            if take <= 0:
-                continue
-            
+
+        for allocation in allocations:
+            loc = locations_by_id[allocation.location_id]
+            take = allocation.quantity
+
             stock_reservado_antes = loc.stock_reservado or 0
-            loc.stock_reservado = stock_reservado_antes + take
-            remaining -= take
-            total_reserved += take
-            
+            self.batch.adjust_location(loc, reservado=take)
+
             # Crear assignment para trazabilidad multi-ubicación
-            assignment = OrderLineStockAssignment(
+            self.batch.add_assignment(
                 order_line_id=line.id,
                 product_location_id=loc.id,
                 cantidad_reservada=take,
                 cantidad_servida=0,
             )
-            self.db.add(assignment)
-            
+
             # Auditoría por cada ubicación
-            movement = StockMovement(
+            self.batch.add_movement(
                 product_location_id=loc.id,
                 product_id=line.product_reference_id,
                 order_id=order.id,
@@ -315,18 +543,16 @@ class StockReservationCronService:
                       f"línea #{line.id}, cantidad: {take}/{cantidad_needed}, "
                       f"ubicación: {loc.codigo_ubicacion}",
             )
-            self.db.add(movement)
-            
+
             logger.info(
                 f"    ✓ Reserva: orden={order.numero_orden} línea={line.id} "
                 f"producto={line.product_reference_id} ubicación={loc.codigo_ubicacion} "
                 f"cantidad={take}/{cantidad_needed} "
                 f"stock_reservado: {stock_reservado_antes}→{loc.stock_reservado}"
             )
-        
+
         self.stats["lines_reserved"] += 1
-        return total_reserved
-    
+
     def _find_picking_destination(self, product_id: int) -> Optional[ProductLocation]:
         """
         Busca la ubicación destino en picking para un producto.
@@ -343,45 +569,63 @@ class StockReservationCronService:
             .first()
         )
     
-    def _create_or_upgrade_replenishment_request(
-        self,
-        product_id: int,
-        cantidad_needed: int,
-        order: Order,
-    ):
+    def _plan_replenishments(self, deficits: Dict[int, List[int]]):
         """
-        Delega la creación de solicitudes de reposición al servicio compartido.
-        Actualiza las estadísticas del cron con el resultado.
+        Crea/escala las solicitudes de reposición de todos los productos con
+        déficit del ciclo en un solo lote (ReplenishmentPlanner): orígenes,
+        capacidades, destinos y demanda se pre-cargan una vez para todos.
+
+        Args:
+            deficits: product_id → [unidades sin reservar, ID de la primera orden afectada]
         """
         # Obtener operador SYSTEM
         system_operator = self.db.query(Operator).filter(
             Operator.codigo == SYSTEM_OPERATOR_CODE
         ).first()
-        
+
         if not system_operator:
             logger.error(
                 f"    ❌ Operador '{SYSTEM_OPERATOR_CODE}' no encontrado. "
-                f"No se puede crear solicitud de reposición."
+                f"No se pueden crear {len(deficits)} solicitudes de reposición."
             )
             return
-        
-        result = create_or_upgrade_replenishment(
-            db=self.db,
-            product_id=product_id,
-            requester_id=system_operator.id,
-            priority="HIGH",
-            order_id=order.id,
-            cantidad_needed=cantidad_needed,
+
+        planner = ReplenishmentPlanner(
+            self.db,
             status_id_list=self.status_id_list,
+            slot_lock=lambda: _acquire_slot_lock(self.db),
         )
-        
-        # Actualizar estadísticas del cron
-        self.stats["replenishment_created"] += len(result.created_requests)
-        self.stats["replenishment_upgraded"] += len(result.upgraded_requests)
-        
-        if result.status == "no_locations":
+        planner.load(deficits.keys())
+
+        for product_id, (cantidad_needed, order_id) in deficits.items():
+            try:
+                result = planner.plan(
+                    product_id,
+                    requester_id=system_operator.id,
+                    priority="HIGH",
+                    order_id=order_id,
+                    cantidad_needed=cantidad_needed,
+                )
+            except Exception as e:
+                logger.error(
+                    f"  [STOCK-CRON] Error planificando reposición del producto {product_id}: {e}",
+                    exc_info=True
+                )
+                self.stats["errors"] += 1
+                continue
+
+            # Actualizar estadísticas del cron
+            self.stats["replenishment_created"] += len(result.created_requests)
+            self.stats["replenishment_upgraded"] += len(result.upgraded_requests)
+
+            if result.status == "no_locations":
+                self.stats["errors"] += 1
+
+        planner.flush()
+        if planner.slot_lock_held is False:
+            # Sin ubicaciones nuevas en este ciclo: reintentar sin avanzar la marca de agua
             self.stats["errors"] += 1
-    
+
     def _log_stats(self):
         """Log de estadísticas del ciclo."""
         self.stats["end_time"] = datetime.utcnow()
@@ -394,7 +638,8 @@ class StockReservationCronService:
         ).total_seconds()
         
         logger.info("=" * 60)
-        logger.info("📦 [STOCK-CRON] CICLO COMPLETADO")
+        partition = f", partición {self.partition[0]}/{self.partition[1]}" if self.partition else ""
+        logger.info(f"📦 [STOCK-CRON] CICLO COMPLETADO (pasada {self.stats['mode']}{partition})")
         logger.info(f"   Órdenes procesadas: {self.stats['orders_processed']}")
         logger.info(f"   Líneas reservadas: {self.stats['lines_reserved']}")
         logger.info(f"   Sin producto: {self.stats['lines_skipped_no_product']}")
@@ -410,96 +655,97 @@ class StockReservationCronService:
 # Funciones de descuento y liberación (usadas desde order_router.py)
 # =============================================================================
 
-def deduct_stock_for_order(order: Order, db: Session) -> List[Dict]:
+def _load_stock_targets(order: Order, db: Session):
+    """
+    Pre-carga en 2 queries los assignments y ubicaciones de las líneas reservadas
+    de una orden (en lugar de una query por línea y un db.get por ubicación).
+
+    Returns:
+        (assignments_by_line, locations_by_id)
+    """
+    reserved_lines = [line for line in order.order_lines if line.stock_reserved]
+    line_ids = [line.id for line in reserved_lines]
+
+    assignments_by_line: Dict[int, List[OrderLineStockAssignment]] = {}
+    if line_ids:
+        for a in (
+            db.query(OrderLineStockAssignment)
+            .filter(OrderLineStockAssignment.order_line_id.in_(line_ids))
+            .order_by(OrderLineStockAssignment.id)
+            .all()
+        ):
+            assignments_by_line.setdefault(a.order_line_id, []).append(a)
+
+    location_ids = {a.product_location_id for rows in assignments_by_line.values() for a in rows}
+    location_ids |= {
+        line.product_location_id for line in reserved_lines
+        if line.id not in assignments_by_line and line.product_location_id
+    }
+    locations_by_id: Dict[int, ProductLocation] = {}
+    if location_ids:
+        locations_by_id = {
+            loc.id: loc
+            for loc in db.query(ProductLocation).filter(ProductLocation.id.in_(location_ids)).all()
+        }
+    return assignments_by_line, locations_by_id
+
+
+def deduct_stock_for_order(order: Order, db: Session, batch: Optional[StockWriteBatch] = None) -> List[Dict]:
     """
     Descuenta stock_actual y libera stock_reservado al pasar orden a READY.
     
     Usa stock_assignments para saber exactamente cuánto descontar de cada ubicación.
     Fallback: si no hay assignments, usa product_location_id (compatibilidad).
+
+    Los movimientos y cambios de stock se escriben en bloque (StockWriteBatch).
+    Si se pasa batch, el llamador hace el flush (p.ej. para varias órdenes).
     
     Returns:
         Lista de diccionarios con detalle de cada descuento realizado
     """
     deductions = []
+    own_batch = batch is None
+    batch = batch or StockWriteBatch()
+    assignments_by_line, locations_by_id = _load_stock_targets(order, db)
     
     for line in order.order_lines:
         if not line.stock_reserved:
             continue
         
-        assignments = (
-            db.query(OrderLineStockAssignment)
-            .filter_by(order_line_id=line.id)
-            .all()
-        )
+        assignments = assignments_by_line.get(line.id, [])
         
         if assignments:
             # Multi-ubicación: descontar por assignment
-            for assignment in assignments:
-                location = db.get(ProductLocation, assignment.product_location_id)
-                if not location:
+            targets = [
+                (assignment.product_location_id, assignment.cantidad_servida or 0,
+                 assignment.cantidad_reservada, f"Reservada: {assignment.cantidad_reservada}", "")
+                for assignment in assignments
+            ]
+        elif line.product_location_id:
+            # Fallback: compatibilidad con reservas sin assignments
+            targets = [
+                (line.product_location_id, line.cantidad_servida or 0,
+                 line.cantidad_solicitada, f"Solicitada: {line.cantidad_solicitada}", " (fallback sin assignments)")
+            ]
+        else:
+            targets = []
+        
+        for location_id, cantidad_deducir, cantidad_reservada, detalle, sufijo in targets:
+            location = locations_by_id.get(location_id)
+            if not location:
+                if assignments:
                     logger.warning(
-                        f"  [DEDUCT] Ubicación {assignment.product_location_id} no encontrada "
+                        f"  [DEDUCT] Ubicación {location_id} no encontrada "
                         f"para línea #{line.id} de orden {order.numero_orden}"
                     )
-                    continue
-                
-                cantidad_deducir = assignment.cantidad_servida or 0
-                stock_antes = location.stock_actual or 0
-                reservado_antes = location.stock_reservado or 0
-                
-                location.stock_actual = max(0, stock_antes - cantidad_deducir)
-                location.stock_reservado = max(0, reservado_antes - assignment.cantidad_reservada)
-                
-                db.add(StockMovement(
-                    product_location_id=location.id,
-                    product_id=line.product_reference_id,
-                    order_id=order.id,
-                    order_line_id=line.id,
-                    tipo="DEDUCT",
-                    cantidad=-cantidad_deducir,
-                    stock_antes=stock_antes,
-                    stock_despues=location.stock_actual,
-                    notas=f"Descuento por orden {order.numero_orden} completada (READY). "
-                          f"Servida: {cantidad_deducir}, Reservada: {assignment.cantidad_reservada}, "
-                          f"Ubicación: {location.codigo_ubicacion}",
-                ))
-                
-                deductions.append({
-                    "order_line_id": line.id,
-                    "product_location_id": location.id,
-                    "ubicacion": location.codigo_ubicacion,
-                    "cantidad_deducida": cantidad_deducir,
-                    "stock_antes": stock_antes,
-                    "stock_despues": location.stock_actual,
-                    "reservado_antes": reservado_antes,
-                    "reservado_despues": location.stock_reservado,
-                })
-                
-                logger.info(
-                    f"  [DEDUCT] orden={order.numero_orden} línea={line.id} "
-                    f"ubicación={location.codigo_ubicacion} "
-                    f"stock: {stock_antes}→{location.stock_actual} "
-                    f"reservado: {reservado_antes}→{location.stock_reservado}"
-                )
-                
-                _check_release_location(db, location, order)
-        else:
-            # Fallback: compatibilidad con reservas sin assignments
-            if not line.product_location_id:
-                continue
-            
-            location = db.get(ProductLocation, line.product_location_id)
-            if not location:
                 continue
             
-            cantidad_deducir = line.cantidad_servida or 0
             stock_antes = location.stock_actual or 0
             reservado_antes = location.stock_reservado or 0
             
-            location.stock_actual = max(0, stock_antes - cantidad_deducir)
-            location.stock_reservado = max(0, reservado_antes - line.cantidad_solicitada)
+            batch.adjust_location(location, reservado=-cantidad_reservada, actual=-cantidad_deducir)
             
-            db.add(StockMovement(
+            batch.add_movement(
                 product_location_id=location.id,
                 product_id=line.product_reference_id,
                 order_id=order.id,
@@ -509,9 +755,9 @@ def deduct_stock_for_order(order: Order, db: Session) -> List[Dict]:
                 stock_antes=stock_antes,
                 stock_despues=location.stock_actual,
                 notas=f"Descuento por orden {order.numero_orden} completada (READY). "
-                      f"Servida: {cantidad_deducir}, Solicitada: {line.cantidad_solicitada}, "
-                      f"Ubicación: {location.codigo_ubicacion} (fallback sin assignments)",
-            ))
+                      f"Servida: {cantidad_deducir}, {detalle}, "
+                      f"Ubicación: {location.codigo_ubicacion}{sufijo}",
+            )
             
             deductions.append({
                 "order_line_id": line.id,
@@ -535,6 +781,8 @@ def deduct_stock_for_order(order: Order, db: Session) -> List[Dict]:
         
         line.stock_reserved = False
     
+    if own_batch:
+        batch.flush(db)
     return deductions
 
 
@@ -583,96 +831,68 @@ def _check_release_location(db: Session, location: ProductLocation, order: Order
                 )
 
 
-def release_stock_for_order(order: Order, db: Session) -> List[Dict]:
+def release_stock_for_order(order: Order, db: Session, batch: Optional[StockWriteBatch] = None) -> List[Dict]:
     """
     Libera stock_reservado al cancelar una orden.
     
     Usa stock_assignments para liberar de cada ubicación correctamente.
     Fallback: si no hay assignments, usa product_location_id (compatibilidad).
+
+    Los movimientos y cambios de stock se escriben en bloque (StockWriteBatch).
+    Si se pasa batch, el llamador hace el flush.
     
     Returns:
         Lista de diccionarios con detalle de cada liberación realizada
     """
     releases = []
+    own_batch = batch is None
+    batch = batch or StockWriteBatch()
+    assignments_by_line, locations_by_id = _load_stock_targets(order, db)
     
     for line in order.order_lines:
         if not line.stock_reserved:
             continue
         
-        assignments = (
-            db.query(OrderLineStockAssignment)
-            .filter_by(order_line_id=line.id)
-            .all()
-        )
+        assignments = assignments_by_line.get(line.id, [])
         
         if assignments:
-            for assignment in assignments:
-                location = db.get(ProductLocation, assignment.product_location_id)
-                if not location:
-                    continue
-                
-                reservado_antes = location.stock_reservado or 0
-                location.stock_reservado = max(0, reservado_antes - assignment.cantidad_reservada)
-                
-                db.add(StockMovement(
-                    product_location_id=location.id,
-                    product_id=line.product_reference_id,
-                    order_id=order.id,
-                    order_line_id=line.id,
-                    tipo="RELEASE",
-                    cantidad=assignment.cantidad_reservada,
-                    stock_antes=location.stock_actual or 0,
-                    stock_despues=location.stock_actual or 0,
-                    notas=f"Liberación por cancelación de orden {order.numero_orden}. "
-                          f"Cantidad liberada: {assignment.cantidad_reservada}, "
-                          f"Ubicación: {location.codigo_ubicacion}",
-                ))
-                
-                releases.append({
-                    "order_line_id": line.id,
-                    "product_location_id": location.id,
-                    "ubicacion": location.codigo_ubicacion,
-                    "cantidad_liberada": assignment.cantidad_reservada,
-                    "reservado_antes": reservado_antes,
-                    "reservado_despues": location.stock_reservado,
-                })
-                
-                logger.info(
-                    f"  [RELEASE] orden={order.numero_orden} línea={line.id} "
-                    f"ubicación={location.codigo_ubicacion} "
-                    f"reservado: {reservado_antes}→{location.stock_reservado}"
-                )
-        else:
+            targets = [
+                (assignment.product_location_id, assignment.cantidad_reservada, "")
+                for assignment in assignments
+            ]
+        elif line.product_location_id:
             # Fallback: compatibilidad con reservas sin assignments
-            if not line.product_location_id:
-                continue
-            
-            location = db.get(ProductLocation, line.product_location_id)
+            targets = [(line.product_location_id, line.cantidad_solicitada, " (fallback sin assignments)")]
+        else:
+            targets = []
+        
+        for location_id, cantidad_liberada, sufijo in targets:
+            location = locations_by_id.get(location_id)
             if not location:
                 continue
             
             reservado_antes = location.stock_reservado or 0
-            location.stock_reservado = max(0, reservado_antes - line.cantidad_solicitada)
+            batch.adjust_location(location, reservado=-cantidad_liberada)
             
-            db.add(StockMovement(
+            batch.add_movement(
                 product_location_id=location.id,
                 product_id=line.product_reference_id,
                 order_id=order.id,
                 order_line_id=line.id,
                 tipo="RELEASE",
-                cantidad=line.cantidad_solicitada,
+                cantidad=cantidad_liberada,
                 stock_antes=location.stock_actual or 0,
                 stock_despues=location.stock_actual or 0,
                 notas=f"Liberación por cancelación de orden {order.numero_orden}. "
-                      f"Cantidad liberada: {line.cantidad_solicitada}, "
-                      f"Ubicación: {location.codigo_ubicacion} (fallback sin assignments)",
-            ))
+                      f"Cantidad liberada: {cantidad_liberada}, "
+                      f"Ubicación: {location.codigo_ubicacion}{sufijo}",
+            )
             
             releases.append({
                 "order_line_id": line.id,
                 "product_location_id": location.id,
                 "ubicacion": location.codigo_ubicacion,
-                "cantidad_liberada": line.cantidad_solicitada,
+                "cantidad_liberada": cantidad_liberada,
                 "reservado_antes": reservado_antes,
                 "reservado_despues": location.stock_reservado,
             })
@@ -685,6 +905,8 @@ def release_stock_for_order(order: Order, db: Session) -> List[Dict]:
         
         line.stock_reserved = False
     
+    if own_batch:
+        batch.flush(db)
     return releases
 
 
@@ -692,80 +914,255 @@ def release_stock_for_order(order: Order, db: Session) -> List[Dict]:
 # Scheduler
 # =============================================================================
 
-def _run_stock_reservation_cron():
+def partition_of(product_id: int, partitions: int = STOCK_CRON_PARTITIONS) -> int:
+    """Partición de reserva a la que pertenece un producto."""
+    return product_id % partitions
+
+
+def _partition_lock_resource(index: int, partitions: int) -> str:
+    # Con una sola partición se mantiene el nombre histórico del lock
+    if partitions <= 1:
+        return WATERMARK_JOB_NAME
+    return f"{WATERMARK_JOB_NAME}:{index}/{partitions}"
+
+
+def _get_applock(db: Session, resource: str, timeout_ms: int = 0) -> bool:
     """
-    Función ejecutada por APScheduler en cada intervalo.
+    Toma un sp_getapplock exclusivo de transacción (se libera en el commit/rollback).
 
-    Usa un bloqueo en BD para evitar ejecuciones paralelas cuando la app
-    corre con múltiples workers de uvicorn (cada worker tiene su propio
-    scheduler, pero solo uno debe ejecutar el cron a la vez).
+    Args:
+        db: Sesión cuya transacción será dueña del lock
+        resource: Nombre del recurso
+        timeout_ms: Espera máxima (0 = no esperar)
+
+    Returns:
+        True si se adquirió, False si otra transacción lo tiene
     """
     from sqlalchemy import text
 
-    db = SessionLocal()
-    try:
-        # sp_getapplock usa RETURN value (no result set), hay que capturarlo con DECLARE.
-        # Devuelve 0 = lock adquirido, -1/-2/-3 = timeout/cancelado/error (otro worker activo).
-        row = db.execute(
-            text(
-                "DECLARE @ret INT; "
-                "EXEC @ret = sp_getapplock "
-                "  @Resource = 'stock_reservation_cron', "
-                "  @LockMode = 'Exclusive', "
-                "  @LockOwner = 'Session', "
-                "  @LockTimeout = 0; "
-                "SELECT @ret AS lock_result;"
-            )
-        ).fetchone()
+    # sp_getapplock usa RETURN value (no result set), hay que capturarlo con DECLARE.
+    # Devuelve 0/1 = lock adquirido, -1/-2/-3 = timeout/cancelado/error (otro worker activo).
+    row = db.execute(
+        text(
+            "DECLARE @ret INT; "
+            "EXEC @ret = sp_getapplock "
+            "  @Resource = :resource, "
+            "  @LockMode = 'Exclusive', "
+            "  @LockOwner = 'Transaction', "
+            "  @LockTimeout = :timeout; "
+            "SELECT @ret AS lock_result;"
+        ),
+        {"resource": resource, "timeout": timeout_ms},
+    ).fetchone()
 
-        lock_result = row[0] if row is not None else -1
-        if lock_result < 0:
-            logger.info("⏭️  [STOCK-CRON] Otro worker ya está ejecutando el cron — saltando")
-            return
+    lock_result = row[0] if row is not None else -1
+    return lock_result >= 0
+
+
+def _acquire_reservation_lock(db: Session, index: int = 0, partitions: int = 1) -> bool:
+    """
+    Intenta tomar el lock de aplicación de una partición de reservas.
+
+    El lock es de transacción: se libera solo en el commit/rollback de db,
+    así dura exactamente lo que la transacción corta de la partición (y nunca
+    queda retenido en una conexión devuelta al pool).
+
+    Args:
+        db: Sesión en la que se va a reservar
+        index: Índice de la partición
+        partitions: Número total de particiones
+
+    Returns:
+        True si se adquirió, False si otro hilo/proceso está reservando esa partición
+    """
+    return _get_applock(db, _partition_lock_resource(index, partitions))
+
+
+def _acquire_slot_lock(db: Session) -> bool:
+    """
+    Serializa entre particiones la asignación de ubicaciones libres de picking.
+
+    Se pide dentro de la transacción de la partición, justo antes de reclamar
+    la primera ubicación libre, y se libera con su commit/rollback.
+
+    Returns:
+        True si se adquirió antes de STOCK_CRON_SLOT_LOCK_TIMEOUT_MS
+    """
+    return _get_applock(db, f"{WATERMARK_JOB_NAME}:slots", STOCK_CRON_SLOT_LOCK_TIMEOUT_MS)
 
-        # Lock adquirido: ejecutar el servicio con esta misma sesión
-        service = StockReservationCronService(db_session=db)
-        service.run()
-        # No llamar sp_releaseapplock explícitamente: después de service.run()
-        # SQLAlchemy puede haber devuelto la conexión al pool (distinto SPID),
-        # lo que causaría error 1223. El lock @LockOwner='Session' se libera
-        # automáticamente cuando db.close() cierra la conexión en el finally.
 
+def _run_partition(
+    index: int,
+    partitions: int,
+    product_ids: Optional[List[int]] = None,
+) -> Optional[Dict]:
+    """
+    Reserva una partición en su propia sesión y transacción.
+
+    Args:
+        index: Índice de la partición
+        partitions: Número total de particiones
+        product_ids: Limitar a estos productos (reserva dirigida) o None (cron)
+
+    Returns:
+        Estadísticas del servicio, o None si la partición estaba tomada
+    """
+    db = SessionLocal()
+    try:
+        if not _acquire_reservation_lock(db, index, partitions):
+            return None
+        service = StockReservationCronService(
+            db_session=db,
+            product_ids=product_ids,
+            partition=(index, partitions) if product_ids is None else None,
+        )
+        # run() hace commit/rollback: el lock de transacción se libera ahí
+        return service.run()
     except Exception as e:
-        logger.error(f"❌ [STOCK-CRON] Error en launcher: {e}", exc_info=True)
+        logger.error(f"❌ [STOCK-CRON] Error en partición {index}/{partitions}: {e}", exc_info=True)
         try:
             db.rollback()
         except Exception:
             pass
+        return {"errors": 1}
+    finally:
+        db.close()
+
+
+def run_partitioned_reservation(
+    partitions: int = STOCK_CRON_PARTITIONS,
+    workers: int = STOCK_CRON_WORKERS,
+) -> Dict[str, int]:
+    """
+    Ejecuta todas las particiones de reserva en paralelo.
+
+    Args:
+        partitions: Número de particiones (product_id % partitions)
+        workers: Hilos del pool
+
+    Returns:
+        Totales agregados: particiones procesadas/saltadas, órdenes, líneas, errores
+    """
+    with ThreadPoolExecutor(max_workers=min(workers, partitions), thread_name_prefix="stock-cron") as pool:
+        results = list(pool.map(_run_partition, range(partitions), [partitions] * partitions))
+
+    summary = {"partitions_run": 0, "partitions_skipped": 0, "orders_processed": 0,
+               "lines_reserved": 0, "errors": 0}
+    for stats in results:
+        if stats is None:
+            summary["partitions_skipped"] += 1
+            continue
+        summary["partitions_run"] += 1
+        for key in ("orders_processed", "lines_reserved", "errors"):
+            summary[key] += stats.get(key, 0)
+
+    if summary["partitions_skipped"]:
+        logger.info(
+            f"⏭️  [STOCK-CRON] {summary['partitions_skipped']}/{partitions} particiones "
+            f"tomadas por otro worker — saltadas"
+        )
+    logger.info(
+        f"📦 [STOCK-CRON] {summary['partitions_run']} particiones procesadas: "
+        f"{summary['orders_processed']} órdenes, {summary['lines_reserved']} líneas reservadas, "
+        f"{summary['errors']} errores"
+    )
+    return summary
+
+
+def reserve_stock_for_products(
+    product_ids: Iterable[int],
+    partitions: int = STOCK_CRON_PARTITIONS,
+) -> List[int]:
+    """
+    Reserva stock solo para las líneas pendientes de los productos indicados.
+
+    La usa la cola de reservas por eventos (reservation_queue_service). Los
+    productos se agrupan por partición y cada grupo toma el mismo lock que el
+    cron para esa partición, así nunca corre en paralelo con él sobre los
+    mismos productos. Si crea reposiciones que necesitan ubicaciones libres,
+    también toma el lock de ubicaciones (ver _acquire_slot_lock).
+
+    Args:
+        product_ids: IDs de ProductReference afectados
+        partitions: Número total de particiones
+
+    Returns:
+        Productos que no se pudieron procesar porque su partición estaba tomada
+        (hay que reintentarlos)
+    """
+    by_partition: Dict[int, List[int]] = {}
+    for pid in sorted(set(product_ids)):
+        by_partition.setdefault(partition_of(pid, partitions), []).append(pid)
+
+    busy: List[int] = []
+    for index, group in by_partition.items():
+        if _run_partition(index, partitions, product_ids=group) is None:
+            busy.extend(group)
+    return busy
+
+
+def _run_stock_reservation_cron():
+    """
+    Función ejecutada por APScheduler en cada intervalo.
+
+    Cada partición toma su propio lock en BD: cuando la app corre con
+    múltiples workers de uvicorn (cada uno con su scheduler), las particiones
+    que ya procesa otro worker se saltan y el resto se reparte.
+    """
+    try:
+        run_partitioned_reservation()
+    except Exception as e:
+        logger.error(f"❌ [STOCK-CRON] Error en launcher: {e}", exc_info=True)
+
+
+def count_reservation_backlog() -> int:
+    """
+    Líneas pendientes de reserva (sin stock_reserved) en órdenes PENDING/ASSIGNED
+    de picking. Es la métrica de backlog de la tarea en el registro de jobs.
+    """
+    db = SessionLocal()
+    try:
+        return (
+            db.query(func.count(OrderLine.id))
+            .join(Order, Order.id == OrderLine.order_id)
+            .join(OrderStatus, OrderStatus.id == Order.status_id)
+            .filter(
+                OrderStatus.codigo.in_(RESERVATION_STATUS_CODES),
+                Order.almacen_id == ALMACEN_PICKING_ID,
+                OrderLine.product_reference_id.isnot(None),
+                OrderLine.stock_reserved == False,
+            )
+            .scalar() or 0
+        )
     finally:
         db.close()
 
 
+job_registry.register(
+    WATERMARK_JOB_NAME,
+    _run_stock_reservation_cron,
+    minutes=CRON_INTERVAL_MINUTES,
+    description="Stock Reservation Check",
+    backlog=count_reservation_backlog,
+)
+
+
 def start_stock_reservation_scheduler():
     """
-    Configura e inicia APScheduler con el cron de reserva de stock.
-    
+    Configura e inicia APScheduler con las tareas del registro de jobs
+    (cron de reserva de stock incluido) dentro del proceso web.
+
+    Solo se usa con SCHEDULER_MODE=embedded; con SCHEDULER_MODE=worker las
+    tareas corren en el proceso dedicado (python -m src.worker).
+
     Returns:
         BackgroundScheduler instance (para shutdown en lifespan)
     """
-    from apscheduler.schedulers.background import BackgroundScheduler
-    
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(
-        _run_stock_reservation_cron,
-        "interval",
-        minutes=CRON_INTERVAL_MINUTES,
-        id="stock_reservation_cron",
-        name="Stock Reservation Check",
-        max_instances=1,
-        replace_existing=True,
-        coalesce=True,           # Si se acumulan disparos perdidos, ejecutar solo una vez
-        misfire_grace_time=60,   # Tolerar hasta 60s de retraso antes de cancelar el disparo
-    )
+    scheduler = job_registry.build_scheduler()
     scheduler.start()
-    
+
     logger.info(
         f"⏰ [STOCK-CRON] Scheduler iniciado — cada {CRON_INTERVAL_MINUTES} minutos"
     )
-    
+
     return scheduler
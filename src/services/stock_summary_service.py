@@ -0,0 +1,393 @@
+"""
+Stock Summary Service
+
+Mantiene product_stock_summary: stock_actual, stock_reservado y número de
+ubicaciones activas por (producto, almacén). Antes el listado de productos,
+el resumen de stock de un producto, los productos sin stock para órdenes y
+las estadísticas por almacén sumaban product_locations en cada petición, y
+los filtros de estado (low, out) filtraban sobre esa subconsulta agrupada.
+Ahora leen la tabla materializada y el filtro de stock es un rango sobre
+idx_stock_summary_almacen_stock.
+
+Mantenimiento, en la misma transacción que el cambio de stock:
+    - Escrituras por el ORM (mover stock, confirmar reposiciones, alta y
+      baja de ubicaciones...): un listener after_flush calcula la aportación
+      antes/después de cada ProductLocation nuevo, modificado o borrado y
+      aplica los deltas con un UPDATE incremental por (producto, almacén).
+    - Escrituras set-based (StockWriteBatch: reservas del cron, descuentos al
+      completar picking, liberaciones) llaman a apply_summary_deltas().
+    - Si la fila de resumen no existe todavía, o el valor anterior de una
+      ubicación no estaba cargado, la fila se recalcula desde product_locations.
+      Si otra transacción crea la misma fila a la vez, el recálculo se repite
+      clave a clave (cada una en su SAVEPOINT) y la clave en conflicto se
+      recalcula de nuevo sobre la fila ya confirmada.
+    - Cualquier deriva (ETL externo, UPDATEs manuales): reconcile_stock_summary(),
+      tarea periódica del registro de jobs (STOCK_SUMMARY_RECONCILE_MINUTES).
+
+Migración (SQL Server):
+
+    CREATE TABLE product_stock_summary (
+        product_id      INT NOT NULL REFERENCES product_references(id) ON DELETE CASCADE,
+        almacen_id      INT NOT NULL REFERENCES almacenes(id) ON DELETE CASCADE,
+        stock_actual    INT NOT NULL CONSTRAINT DF_pss_stock_actual DEFAULT 0,
+        stock_reservado INT NOT NULL CONSTRAINT DF_pss_stock_reservado DEFAULT 0,
+        num_ubicaciones INT NOT NULL CONSTRAINT DF_pss_num_ubicaciones DEFAULT 0,
+        updated_at      DATETIME NOT NULL CONSTRAINT DF_pss_updated_at DEFAULT GETUTCDATE(),
+        CONSTRAINT PK_product_stock_summary PRIMARY KEY (product_id, almacen_id)
+    );
+    CREATE INDEX idx_stock_summary_almacen_stock ON product_stock_summary (almacen_id, stock_actual);
+    CREATE INDEX idx_stock_summary_stock ON product_stock_summary (stock_actual);
+
+    INSERT INTO product_stock_summary (product_id, almacen_id, stock_actual, stock_reservado, num_ubicaciones, updated_at)
+    SELECT product_id, almacen_id,
+           COALESCE(SUM(stock_actual), 0), COALESCE(SUM(stock_reservado), 0), COUNT(*), GETUTCDATE()
+    FROM product_locations
+    WHERE activa = 1 AND product_id IS NOT NULL
+    GROUP BY product_id, almacen_id;
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, bindparam, delete, event, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from src.adapters.secondary.database.config import (
+    SessionLocal,
+    STOCK_SUMMARY_RECONCILE_MINUTES,
+)
+from src.adapters.secondary.database.orm import ProductLocation, ProductStockSummary
+from src.services.job_registry import job_registry
+
+logger = logging.getLogger(__name__)
+
+# (product_id, almacen_id)
+SummaryKey = Tuple[int, int]
+
+# Tamaño de los IN (SQL Server admite ~2100 parámetros por sentencia)
+_CHUNK_SIZE = 1000
+
+RECONCILE_JOB_NAME = "stock_summary_reconcile"
+
+# Atributos de ProductLocation que determinan su aportación al resumen
+_TRACKED = ("activa", "product_id", "almacen_id", "stock_actual", "stock_reservado")
+
+_summary = ProductStockSummary.__table__
+
+
+class _UnknownPreviousValue(Exception):
+    """El valor anterior de un atributo modificado no estaba cargado."""
+
+
+def stock_totals_subquery(almacen_id: Optional[int] = None):
+    """
+    Stock total por producto desde el resumen: columnas (product_id, total_stock).
+
+    Con almacen_id es una lectura directa por (almacen_id, stock_actual); sin
+    él, la suma de las filas de cada producto en todos los almacenes. Solo
+    aparecen productos con alguna ubicación activa (como la suma anterior
+    sobre product_locations).
+    """
+    if almacen_id:
+        return (
+            select(ProductStockSummary.product_id, ProductStockSummary.stock_actual.label("total_stock"))
+            .where(ProductStockSummary.almacen_id == almacen_id, ProductStockSummary.num_ubicaciones > 0)
+            .subquery()
+        )
+    return (
+        select(ProductStockSummary.product_id, func.sum(ProductStockSummary.stock_actual).label("total_stock"))
+        .where(ProductStockSummary.num_ubicaciones > 0)
+        .group_by(ProductStockSummary.product_id)
+        .subquery()
+    )
+
+
+def _source_totals():
+    """Agregado de las ubicaciones activas por (producto, almacén)."""
+    return select(
+        ProductLocation.product_id,
+        ProductLocation.almacen_id,
+        func.coalesce(func.sum(ProductLocation.stock_actual), 0).label("stock_actual"),
+        func.coalesce(func.sum(ProductLocation.stock_reservado), 0).label("stock_reservado"),
+        func.count(ProductLocation.id).label("num_ubicaciones"),
+    ).where(ProductLocation.activa == True, ProductLocation.product_id.isnot(None))
+
+
+def _chunks_by_almacen(keys: Iterable[SummaryKey]):
+    by_almacen: Dict[int, List[int]] = defaultdict(list)
+    for product_id, almacen_id in sorted(set(keys)):
+        by_almacen[almacen_id].append(product_id)
+    for almacen_id, product_ids in by_almacen.items():
+        for start in range(0, len(product_ids), _CHUNK_SIZE):
+            yield almacen_id, product_ids[start:start + _CHUNK_SIZE]
+
+
+def _recompute(connection, keys: Iterable[SummaryKey]) -> None:
+    """Reemplaza las filas de resumen de esas claves por el agregado de product_locations."""
+    now = datetime.utcnow()
+    for almacen_id, product_ids in _chunks_by_almacen(keys):
+        connection.execute(
+            delete(_summary).where(
+                _summary.c.almacen_id == almacen_id, _summary.c.product_id.in_(product_ids)
+            )
+        )
+        totals = _source_totals().where(
+            ProductLocation.almacen_id == almacen_id, ProductLocation.product_id.in_(product_ids)
+        ).group_by(ProductLocation.product_id, ProductLocation.almacen_id).subquery()
+        connection.execute(
+            insert(_summary).from_select(
+                ["product_id", "almacen_id", "stock_actual", "stock_reservado", "num_ubicaciones", "updated_at"],
+                select(
+                    totals.c.product_id, totals.c.almacen_id, totals.c.stock_actual,
+                    totals.c.stock_reservado, totals.c.num_ubicaciones, bindparam("now", now),
+                ),
+            )
+        )
+
+
+def _add_deltas(connection, deltas: Dict[SummaryKey, Tuple[int, int, int]]) -> None:
+    """UPDATE incremental (executemany) de filas de resumen existentes."""
+    if not deltas:
+        return
+    connection.execute(
+        update(_summary)
+        .where(
+            _summary.c.product_id == bindparam("key_product_id"),
+            _summary.c.almacen_id == bindparam("key_almacen_id"),
+        )
+        .values(
+            stock_actual=_summary.c.stock_actual + bindparam("d_actual"),
+            stock_reservado=_summary.c.stock_reservado + bindparam("d_reservado"),
+            num_ubicaciones=_summary.c.num_ubicaciones + bindparam("d_ubicaciones"),
+            updated_at=bindparam("now"),
+        ),
+        [
+            {
+                "key_product_id": product_id, "key_almacen_id": almacen_id,
+                "d_actual": actual, "d_reservado": reservado, "d_ubicaciones": n,
+                "now": datetime.utcnow(),
+            }
+            for (product_id, almacen_id), (actual, reservado, n) in deltas.items()
+        ],
+    )
+
+
+def _existing_keys(connection, keys: Iterable[SummaryKey]) -> Set[SummaryKey]:
+    existing = set()
+    for almacen_id, product_ids in _chunks_by_almacen(keys):
+        existing.update(
+            (row.product_id, row.almacen_id)
+            for row in connection.execute(
+                select(_summary.c.product_id, _summary.c.almacen_id).where(
+                    _summary.c.almacen_id == almacen_id, _summary.c.product_id.in_(product_ids)
+                )
+            )
+        )
+    return existing
+
+
+def apply_summary_deltas(
+    db: Session,
+    deltas: Dict[SummaryKey, Tuple[int, int, int]],
+    recompute: Iterable[SummaryKey] = (),
+) -> None:
+    """
+    Aplica cambios de stock ya escritos en product_locations (misma
+    transacción, sin commit).
+
+    Args:
+        db: Sesión de base de datos (se usa su conexión: no dispara autoflush)
+        deltas: (producto, almacén) → (Δ stock_actual, Δ stock_reservado, Δ ubicaciones activas)
+        recompute: Claves a recalcular desde product_locations en lugar de por delta
+    """
+    recompute = {key for key in recompute if key[0] is not None}
+    deltas = {
+        key: delta for key, delta in deltas.items()
+        if key[0] is not None and key not in recompute and any(delta)
+    }
+    if not deltas and not recompute:
+        return
+
+    connection = db.connection()
+    existing = _existing_keys(connection, deltas)
+    _add_deltas(connection, {key: delta for key, delta in deltas.items() if key in existing})
+    # Sin fila todavía: el agregado ya incluye este cambio (escrito antes)
+    missing = [key for key in deltas if key not in existing]
+    _recompute_isolated(connection, recompute | set(missing))
+
+
+def _recompute_isolated(connection, keys: Set[SummaryKey]) -> None:
+    """
+    _recompute() tolerante a filas creadas en paralelo por otra transacción.
+
+    Primero todas las claves en un SAVEPOINT; si alguna choca con la PK se
+    deshace ese intento entero y se recalcula clave a clave, cada una en su
+    SAVEPOINT, así un conflicto no deja a medias ni salta las claves
+    siguientes. La clave en conflicto se vuelve a recalcular: la fila de la
+    otra transacción ya está confirmada y el DELETE la ve.
+    """
+    if not keys:
+        return
+    try:
+        with connection.begin_nested():
+            _recompute(connection, keys)
+        return
+    except IntegrityError:
+        logger.debug("  [STOCK-SUMMARY] Fila creada en paralelo, recalculando clave a clave")
+
+    for key in sorted(keys):
+        try:
+            with connection.begin_nested():
+                _recompute(connection, [key])
+        except IntegrityError:
+            _recompute(connection, [key])
+
+
+def refresh_stock_summary(db: Session, keys: Iterable[SummaryKey]) -> None:
+    """
+    Recalcula las filas de resumen indicadas desde product_locations.
+
+    Dentro de la transacción del llamador (no hace commit). Hace flush antes
+    para incluir los cambios pendientes de las ubicaciones.
+
+    Args:
+        db: Sesión de base de datos
+        keys: (product_id, almacen_id) a recalcular
+    """
+    keys = {key for key in keys if key[0] is not None}
+    if not keys:
+        return
+    db.flush()
+    _recompute(db.connection(), keys)
+
+
+def find_drifted_summaries(db: Session) -> List[SummaryKey]:
+    """
+    Claves cuyo resumen no coincide con product_locations (fila que falta,
+    sobra o con otros totales).
+
+    Returns:
+        Lista de (product_id, almacen_id) a recalcular
+    """
+    totals = _source_totals().group_by(ProductLocation.product_id, ProductLocation.almacen_id).subquery()
+    same_key = and_(
+        ProductStockSummary.product_id == totals.c.product_id,
+        ProductStockSummary.almacen_id == totals.c.almacen_id,
+    )
+    wrong_or_missing = db.execute(
+        select(totals.c.product_id, totals.c.almacen_id)
+        .outerjoin(ProductStockSummary, same_key)
+        .where(or_(
+            ProductStockSummary.product_id.is_(None),
+            ProductStockSummary.stock_actual != totals.c.stock_actual,
+            ProductStockSummary.stock_reservado != totals.c.stock_reservado,
+            ProductStockSummary.num_ubicaciones != totals.c.num_ubicaciones,
+        ))
+    ).all()
+    orphaned = db.execute(
+        select(ProductStockSummary.product_id, ProductStockSummary.almacen_id)
+        .outerjoin(totals, same_key)
+        .where(totals.c.product_id.is_(None))
+    ).all()
+    return [(row.product_id, row.almacen_id) for row in wrong_or_missing + orphaned]
+
+
+def reconcile_stock_summary(db: Optional[Session] = None) -> int:
+    """
+    Corrige las filas de resumen que se hayan desviado de product_locations.
+
+    Args:
+        db: Sesión opcional (si no se pasa, se abre y se cierra una propia)
+
+    Returns:
+        Número de filas (producto, almacén) corregidas
+    """
+    owns_session = db is None
+    db = db or SessionLocal()
+    try:
+        keys = find_drifted_summaries(db)
+        if keys:
+            refresh_stock_summary(db, keys)
+        db.commit()
+        if keys:
+            logger.info(f"📦 [STOCK-SUMMARY] Resumen de stock corregido en {len(keys)} productos/almacén")
+        return len(keys)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if owns_session:
+            db.close()
+
+
+job_registry.register(
+    RECONCILE_JOB_NAME,
+    reconcile_stock_summary,
+    minutes=STOCK_SUMMARY_RECONCILE_MINUTES,
+    description="Stock Summary Reconciliation",
+)
+
+
+# === Mantenimiento desde el flush del ORM ===
+
+def _location_values(obj: ProductLocation, previous: bool) -> tuple:
+    """Valores de los atributos rastreados antes (previous) o después del flush."""
+    values = []
+    for attr in _TRACKED:
+        history = get_history(obj, attr)
+        if previous and history.has_changes():
+            if not history.deleted:
+                raise _UnknownPreviousValue()
+            values.append(history.deleted[0])
+        elif history.added and not previous:
+            values.append(history.added[0])
+        elif history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(obj, attr))
+    return tuple(values)
+
+
+def _add_contribution(deltas: Dict[SummaryKey, List[int]], values: Optional[tuple], n: int) -> None:
+    if values is None:
+        return
+    activa, product_id, almacen_id, stock_actual, stock_reservado = values
+    if activa and product_id is not None:
+        delta = deltas[(product_id, almacen_id)]
+        delta[0] += n * (stock_actual or 0)
+        delta[1] += n * (stock_reservado or 0)
+        delta[2] += n
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_stock_summary(session, flush_context):
+    deltas: Dict[SummaryKey, List[int]] = defaultdict(lambda: [0, 0, 0])
+    recompute: Set[SummaryKey] = set()
+
+    for obj in session.new:
+        if isinstance(obj, ProductLocation):
+            _add_contribution(deltas, _location_values(obj, previous=False), 1)
+    for obj in session.dirty:
+        if isinstance(obj, ProductLocation) and session.is_modified(obj, include_collections=False):
+            after = _location_values(obj, previous=False)
+            try:
+                before = _location_values(obj, previous=True)
+            except _UnknownPreviousValue:
+                recompute.add((after[1], after[2]))
+                continue
+            if before != after:
+                _add_contribution(deltas, before, -1)
+                _add_contribution(deltas, after, 1)
+    for obj in session.deleted:
+        if isinstance(obj, ProductLocation):
+            try:
+                _add_contribution(deltas, _location_values(obj, previous=True), -1)
+            except _UnknownPreviousValue:
+                recompute.add((obj.product_id, obj.almacen_id))
+
+    if deltas or recompute:
+        apply_summary_deltas(session, {key: tuple(delta) for key, delta in deltas.items()}, recompute)
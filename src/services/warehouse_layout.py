@@ -0,0 +1,251 @@
+"""
+Warehouse Layout
+
+Modelo geométrico del almacén de picking construido a partir de las
+ubicaciones (ProductLocation.pasillo / ubicacion / altura), para calcular
+distancias reales de recorrido en lugar de ordenar cadenas.
+
+Modelo (almacén de pasillos paralelos, el más habitual en picking manual):
+
+    detrás   ══════════════════════════════   pasillo transversal trasero
+              ║ 1 ║   ║ 2 ║   ║ 3 ║   ...
+              ║   ║   ║   ║   ║   ║           ubicaciones a lo largo de
+              ║   ║   ║   ║   ║   ║           cada pasillo (ambos lados se
+    delante  ══════════════════════════════   recogen desde el eje)
+             ▲ salida / depósito
+
+    - Los pasillos se ordenan físicamente con la misma regla que el listado
+      de líneas: numéricos (1, 2, ... N) y luego alfabéticos (A, B, ...).
+      x = índice del pasillo × PICKING_AISLE_PITCH_M
+    - La posición dentro del pasillo sale de `ubicacion`: si todas las del
+      pasillo son numéricas se usa el número (se respetan los huecos); si no,
+      su rango en orden natural ("A1" < "A2" < "A10").
+      y = PICKING_CROSS_AISLE_M / 2 + (posición - 0.5) × PICKING_SLOT_WIDTH_M
+    - La altura no cambia el recorrido, solo el tiempo de la recogida
+      (PICKING_SECONDS_PER_LEVEL por nivel por encima de 1).
+
+Distancia entre dos puntos: en el mismo pasillo, la diferencia de y; en
+pasillos distintos, el desplazamiento lateral más salir y entrar por el
+pasillo transversal (delantero o trasero) que resulte más corto.
+
+get_layout() cachea el modelo por almacén durante WAREHOUSE_LAYOUT_TTL_SECONDS
+y le conecta la matriz de distancias precalculada del almacén
+(services/distance_matrix_service.py): los puntos de huecos conocidos llevan
+su nodo y distance() entre ellos es una consulta a la matriz. Los modelos
+construidos a mano (tests, benchmarks) usan la geometría directamente.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.config import (
+    PICKING_AISLE_PITCH_M,
+    PICKING_SLOT_WIDTH_M,
+    PICKING_CROSS_AISLE_M,
+    PICKING_WALK_SPEED_MPS,
+    PICKING_SECONDS_PER_PICK,
+    PICKING_SECONDS_PER_LEVEL,
+    WAREHOUSE_LAYOUT_TTL_SECONDS,
+)
+from src.adapters.secondary.database.orm import ProductLocation
+from src.services.distance_matrix_service import DistanceMatrix, distance_matrices
+
+logger = logging.getLogger(__name__)
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+@dataclass(frozen=True)
+class LayoutConfig:
+    """Geometría y tiempos del almacén (por defecto, los de config.py)."""
+    aisle_pitch_m: float = PICKING_AISLE_PITCH_M
+    slot_width_m: float = PICKING_SLOT_WIDTH_M
+    cross_aisle_m: float = PICKING_CROSS_AISLE_M
+    walk_speed_mps: float = PICKING_WALK_SPEED_MPS
+    seconds_per_pick: float = PICKING_SECONDS_PER_PICK
+    seconds_per_level: float = PICKING_SECONDS_PER_LEVEL
+
+
+@dataclass(frozen=True)
+class PickPoint:
+    """Punto de recogida en coordenadas del almacén (metros)."""
+    aisle: int
+    x: float
+    y: float
+    altura: int = 1
+    # Nodo en la matriz de distancias del almacén (-1 = sin matriz)
+    node: int = -1
+
+
+def aisle_sort_key(pasillo: Optional[str]) -> tuple:
+    """Orden físico de pasillos: numéricos primero (1, 2, 3...), luego alfabéticos (A, B...)."""
+    pasillo = (pasillo or "").strip()
+    return (0, int(pasillo), "") if pasillo.isdigit() else (1, 0, pasillo.upper())
+
+
+def _natural_key(value: str) -> tuple:
+    return tuple(int(part) if part.isdigit() else part.upper() for part in _DIGITS.split(value) if part)
+
+
+class WarehouseLayout:
+    """Modelo de pasillos paralelos de un almacén."""
+
+    def __init__(self, slots: Iterable[Tuple[Optional[str], Optional[str]]], config: Optional[LayoutConfig] = None):
+        """
+        Args:
+            slots: Pares (pasillo, ubicacion) de las ubicaciones del almacén
+            config: Geometría (por defecto la de config.py)
+        """
+        self.config = config or LayoutConfig()
+        by_aisle: Dict[str, set] = defaultdict(set)
+        for pasillo, ubicacion in slots:
+            by_aisle[(pasillo or "").strip()].add((ubicacion or "").strip())
+
+        self._aisle_index: Dict[str, int] = {
+            pasillo: index for index, pasillo in enumerate(sorted(by_aisle, key=aisle_sort_key))
+        }
+        self._positions: Dict[Tuple[str, str], int] = {}
+        slots_per_aisle = 1
+        for pasillo, ubicaciones in by_aisle.items():
+            if all(u.isdigit() for u in ubicaciones):
+                positions = {u: max(int(u), 1) for u in ubicaciones}
+            else:
+                positions = {u: rank for rank, u in enumerate(sorted(ubicaciones, key=_natural_key), start=1)}
+            for ubicacion, position in positions.items():
+                self._positions[(pasillo, ubicacion)] = position
+            slots_per_aisle = max(slots_per_aisle, max(positions.values(), default=1))
+
+        self.slots_per_aisle = slots_per_aisle
+        # y del eje del pasillo transversal trasero (el delantero está en y = 0)
+        self.length_m = self.config.cross_aisle_m + slots_per_aisle * self.config.slot_width_m
+        self.depot = PickPoint(aisle=-1, x=0.0, y=0.0)
+        self.matrix: Optional[DistanceMatrix] = None
+        self._location_nodes: Dict[int, int] = {}
+
+    @property
+    def aisles(self) -> int:
+        return len(self._aisle_index)
+
+    def use_matrix(self, matrix: DistanceMatrix, locations: Optional[Dict[int, Tuple[str, str]]] = None):
+        """
+        Conecta una matriz de distancias calculada con este mismo modelo.
+
+        Args:
+            matrix: Matriz de los huecos del almacén
+            locations: ProductLocation.id → (pasillo, ubicacion), para las
+                consultas por ID de ubicación
+        """
+        self.matrix = matrix
+        self.depot = PickPoint(aisle=-1, x=0.0, y=0.0, node=0)
+        self._location_nodes = {
+            location_id: matrix.node(pasillo, ubicacion)
+            for location_id, (pasillo, ubicacion) in (locations or {}).items()
+        }
+
+    def point(self, pasillo: Optional[str], ubicacion: Optional[str], altura: Optional[int] = None) -> PickPoint:
+        """
+        Punto de recogida de una ubicación. Las que no estaban al construir el
+        modelo se colocan tras el último pasillo / al principio del pasillo.
+        """
+        pasillo = (pasillo or "").strip()
+        ubicacion = (ubicacion or "").strip()
+        aisle = self._aisle_index.get(pasillo, len(self._aisle_index))
+        position = self._positions.get((pasillo, ubicacion))
+        if position is None:
+            position = min(int(ubicacion), self.slots_per_aisle) if ubicacion.isdigit() else 1
+        y = self.config.cross_aisle_m / 2 + (position - 0.5) * self.config.slot_width_m
+        node = self.matrix.node(pasillo, ubicacion) if self.matrix is not None else -1
+        return PickPoint(aisle=aisle, x=aisle * self.config.aisle_pitch_m, y=y, altura=altura or 1, node=node)
+
+    def distance(self, a: PickPoint, b: PickPoint) -> float:
+        """Metros a pie entre dos puntos."""
+        if a.node >= 0 and b.node >= 0 and self.matrix is not None:
+            return self.matrix.distance(a.node, b.node)
+        if a.aisle == b.aisle:
+            return abs(a.y - b.y)
+        return abs(a.x - b.x) + min(a.y + b.y, 2 * self.length_m - a.y - b.y)
+
+    def pick_seconds(self, point: PickPoint) -> float:
+        """Segundos de recogida en un punto (más tiempo en niveles altos)."""
+        return self.config.seconds_per_pick + self.config.seconds_per_level * max(0, point.altura - 1)
+
+    def location_distance(self, location_a: int, location_b: int) -> Optional[float]:
+        """Metros entre dos ProductLocation por ID (None si alguna no está en la matriz)."""
+        a = self._location_nodes.get(location_a, -1)
+        b = self._location_nodes.get(location_b, -1)
+        if a < 0 or b < 0 or self.matrix is None:
+            return None
+        return self.matrix.distance(a, b)
+
+    def depot_distance(self, location_id: int) -> Optional[float]:
+        """Metros desde el depósito hasta una ProductLocation por ID (None si no está en la matriz)."""
+        node = self._location_nodes.get(location_id, -1)
+        if node < 0 or self.matrix is None:
+            return None
+        return self.matrix.distance(0, node)
+
+
+_cache: Dict[int, Tuple[float, WarehouseLayout]] = {}
+_cache_lock = threading.Lock()
+
+
+def get_layout(db: Session, almacen_id: int) -> WarehouseLayout:
+    """
+    Modelo del almacén a partir de sus ubicaciones activas, con su matriz de
+    distancias (cacheado por WAREHOUSE_LAYOUT_TTL_SECONDS; la matriz solo se
+    recalcula si cambian los huecos o la geometría).
+
+    Args:
+        db: Sesión de base de datos
+        almacen_id: ID del almacén
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(almacen_id)
+        if cached and now - cached[0] < WAREHOUSE_LAYOUT_TTL_SECONDS:
+            return cached[1]
+
+    rows = db.query(ProductLocation.id, ProductLocation.pasillo, ProductLocation.ubicacion).filter(
+        ProductLocation.almacen_id == almacen_id,
+        ProductLocation.activa == True,
+    ).all()
+    locations = {row.id: ((row.pasillo or "").strip(), (row.ubicacion or "").strip()) for row in rows}
+    slot_keys = sorted(set(locations.values()))
+    layout = WarehouseLayout(slot_keys)
+    layout.use_matrix(distance_matrices.get(almacen_id, layout, slot_keys), locations)
+
+    with _cache_lock:
+        _cache[almacen_id] = (now, layout)
+    return layout
+
+
+def invalidate_layout(almacen_id: Optional[int] = None):
+    """Descarta el modelo cacheado de un almacén (o de todos)."""
+    with _cache_lock:
+        if almacen_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(almacen_id, None)
+
+
+def warm_layouts(almacen_ids: Iterable[int]):
+    """Construye (o abre de disco) el modelo y la matriz de los almacenes al arrancar."""
+    from src.adapters.secondary.database.config import SessionLocal
+
+    db = SessionLocal()
+    try:
+        for almacen_id in almacen_ids:
+            layout = get_layout(db, almacen_id)
+            logger.info(
+                f"📐 [LAYOUT] Almacén {almacen_id}: {layout.aisles} pasillos, "
+                f"{len(layout.matrix) - 1 if layout.matrix else 0} huecos en la matriz de distancias"
+            )
+    finally:
+        db.close()
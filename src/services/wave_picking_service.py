@@ -0,0 +1,410 @@
+"""
+Wave Picking Service
+
+Picking por oleadas: un operario recoge varias órdenes ASSIGNED a la vez
+en un solo recorrido, con un carro de cubetas (una cubeta por orden).
+
+    1. GET  /operators/{codigo}/waves/plan  → propone oleadas con
+       wave_planner.plan_waves() (mismo almacén, ubicaciones en común,
+       capacidad del carro)
+    2. POST /operators/{codigo}/waves       → inicia una oleada: las órdenes
+       pasan a IN_PICKING, se les asigna wave_id y su cubeta (wave_tote), y
+       se devuelve la ruta combinada (picking_route_engine) con la orden y la
+       cubeta de cada parada
+    3. WebSocket scan_wave_product          → la PDA escanea un EAN y el
+       servidor decide a qué orden de la oleada se imputa (cubeta indicada
+       por la PDA, o la orden con esa ubicación asignada, o la primera
+       cubeta con unidades pendientes). La respuesta dice en qué cubeta /
+       caja dejar la unidad.
+
+La pertenencia a la oleada se guarda en la orden (wave_id, wave_tote), así
+sobrevive a reinicios y funciona con varios workers. Cada escaneo reutiliza
+la escritura del picking individual (picking_session_service.apply_scan)
+sobre la sesión de la orden elegida, con una sola lectura de validación para
+toda la oleada.
+
+SQL para añadir las columnas en la BD existente:
+
+    ALTER TABLE orders ADD wave_id NVARCHAR(36) NULL, wave_tote INT NULL;
+    CREATE INDEX ix_orders_wave_id ON orders (wave_id);
+"""
+
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session, joinedload
+
+from src.adapters.secondary.database.orm import (
+    Operator,
+    Order,
+    OrderHistory,
+    OrderLine,
+    OrderLineStockAssignment,
+    OrderStatus,
+    ProductLocation,
+)
+from src.services.picking_route_engine import plan_route
+from src.services.picking_session_service import (
+    PickingLine,
+    PickingSession,
+    StaleSessionError,
+    build_session,
+)
+from src.services.reservation_allocation import priority_rank
+from src.services.warehouse_layout import get_layout
+from src.services.wave_planner import Wave, WaveCandidate, plan_waves
+
+logger = logging.getLogger(__name__)
+
+# Estados desde los que una orden puede entrar en una oleada
+WAVE_STARTABLE_STATUSES = ("ASSIGNED", "STOPPED", "IN_PICKING")
+
+
+@dataclass
+class WaveStop:
+    """Parada pendiente de una orden (ubicación y unidades por recoger)."""
+    order_id: int
+    line: OrderLine
+    location: ProductLocation
+    cantidad: int
+
+
+def pending_stops(db: Session, order_ids: Sequence[int]) -> Dict[int, List[WaveStop]]:
+    """
+    Paradas pendientes de varias órdenes en 2 consultas: por asignación de
+    stock con unidades por servir o, si la línea no tiene asignaciones, por
+    su ubicación principal (misma regla que optimize-picking-route).
+
+    Returns:
+        order_id → paradas
+    """
+    stops: Dict[int, List[WaveStop]] = defaultdict(list)
+    if not order_ids:
+        return stops
+
+    lines = (
+        db.query(OrderLine)
+        .options(joinedload(OrderLine.product_reference), joinedload(OrderLine.product_location))
+        .filter(OrderLine.order_id.in_(order_ids))
+        .order_by(OrderLine.id)
+        .all()
+    )
+    lines_by_id = {line.id: line for line in lines}
+    assigned = set()
+    if lines_by_id:
+        rows = (
+            db.query(OrderLineStockAssignment, ProductLocation)
+            .join(ProductLocation, ProductLocation.id == OrderLineStockAssignment.product_location_id)
+            .join(OrderLine, OrderLine.id == OrderLineStockAssignment.order_line_id)
+            .filter(OrderLine.order_id.in_(order_ids))
+            .order_by(OrderLineStockAssignment.id)
+            .all()
+        )
+        for assignment, location in rows:
+            line = lines_by_id[assignment.order_line_id]
+            assigned.add(line.id)
+            pendiente = assignment.cantidad_reservada - (assignment.cantidad_servida or 0)
+            if location.activa and pendiente > 0:
+                stops[line.order_id].append(WaveStop(line.order_id, line, location, pendiente))
+
+    for line in lines:
+        pendiente = line.cantidad_solicitada - (line.cantidad_servida or 0)
+        location = line.product_location
+        if line.id not in assigned and location and location.activa and pendiente > 0:
+            stops[line.order_id].append(WaveStop(line.order_id, line, location, pendiente))
+    return stops
+
+
+def propose_waves(db: Session, operator_id: int, almacen_id: Optional[int] = None) -> Tuple[List[Wave], Dict[int, Order]]:
+    """
+    Propone oleadas con las órdenes ASSIGNED del operario.
+
+    Args:
+        db: Sesión de base de datos
+        operator_id: ID del operario
+        almacen_id: Limitar a paradas de este almacén (opcional)
+
+    Returns:
+        (oleadas, order_id → Order)
+    """
+    orders = (
+        db.query(Order)
+        .join(OrderStatus, OrderStatus.id == Order.status_id)
+        .filter(Order.operator_id == operator_id, OrderStatus.codigo == "ASSIGNED")
+        .order_by(Order.fecha_importacion, Order.id)
+        .all()
+    )
+    orders_by_id = {order.id: order for order in orders}
+    stops = pending_stops(db, list(orders_by_id))
+
+    candidates = []
+    for seq, order in enumerate(orders):
+        order_stops = stops.get(order.id)
+        if not order_stops:
+            continue
+        almacenes = {stop.location.almacen_id for stop in order_stops}
+        # Una oleada es un único recorrido: órdenes con paradas en un solo almacén
+        if len(almacenes) != 1 or (almacen_id and almacen_id not in almacenes):
+            continue
+        candidates.append(WaveCandidate(
+            order_id=order.id,
+            almacen_id=almacenes.pop(),
+            location_ids=frozenset(stop.location.id for stop in order_stops),
+            aisles=frozenset(stop.location.pasillo or "" for stop in order_stops),
+            units=sum(stop.cantidad for stop in order_stops),
+            priority=priority_rank(order.prioridad),
+            seq=seq,
+        ))
+    return plan_waves(candidates), orders_by_id
+
+
+def wave_route(db: Session, stops_by_order: Dict[int, List[WaveStop]], totes: Dict[int, int]) -> dict:
+    """
+    Ruta combinada de las paradas de varias órdenes.
+
+    Args:
+        stops_by_order: order_id → paradas pendientes
+        totes: order_id → cubeta
+
+    Returns:
+        {"stops": [...], "total_distance_m", "estimated_time_minutes", "routing_method"}
+    """
+    stops = [stop for order_id in sorted(totes, key=totes.get) for stop in stops_by_order.get(order_id, [])]
+    if not stops:
+        return {"stops": [], "total_distance_m": 0.0, "estimated_time_minutes": 0.0, "routing_method": None}
+
+    layout = get_layout(db, stops[0].location.almacen_id)
+    points = [layout.point(s.location.pasillo, s.location.ubicacion, s.location.altura) for s in stops]
+    plan = plan_route(layout, points)
+
+    route = []
+    for secuencia, index in enumerate(plan.sequence, start=1):
+        stop = stops[index]
+        product = stop.line.product_reference
+        route.append({
+            "secuencia": secuencia,
+            "order_id": stop.order_id,
+            "tote": totes[stop.order_id],
+            "order_line_id": stop.line.id,
+            "producto": product.nombre_producto if product else "Producto desconocido",
+            "ean": stop.line.ean,
+            "cantidad": stop.cantidad,
+            "ubicacion": stop.location.codigo_ubicacion,
+            "pasillo": stop.location.pasillo,
+            "lado": stop.location.lado,
+            "altura": stop.location.altura,
+        })
+    return {
+        "stops": route,
+        "total_distance_m": round(plan.distance_m, 1),
+        "estimated_time_minutes": round(plan.estimated_seconds / 60, 1),
+        "routing_method": plan.method,
+    }
+
+
+def start_wave(db: Session, operator: Operator, order_ids: Sequence[int]) -> str:
+    """
+    Inicia una oleada: valida las órdenes, las pasa a IN_PICKING y les asigna
+    wave_id y cubeta (en el orden recibido). Hace commit.
+
+    Raises:
+        HTTPException 404/403/400: Orden inexistente, de otro operario o en
+        un estado que no permite picking
+
+    Returns:
+        wave_id
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    if len(order_ids) < 2:
+        raise HTTPException(status_code=400, detail="Una oleada necesita al menos 2 órdenes")
+
+    orders = {o.id: o for o in db.query(Order).filter(Order.id.in_(order_ids)).all()}
+    for order_id in order_ids:
+        order = orders.get(order_id)
+        if not order:
+            raise HTTPException(status_code=404, detail=f"Orden con ID {order_id} no encontrada")
+        if order.operator_id != operator.id:
+            raise HTTPException(status_code=403, detail=f"La orden {order.numero_orden} no está asignada a este operario")
+        if order.status.codigo not in WAVE_STARTABLE_STATUSES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"La orden {order.numero_orden} está en estado {order.status.codigo}. "
+                       f"Estados válidos: {', '.join(WAVE_STARTABLE_STATUSES)}"
+            )
+
+    in_picking_status = db.query(OrderStatus).filter(OrderStatus.codigo == "IN_PICKING").first()
+    if not in_picking_status:
+        raise HTTPException(status_code=500, detail="Estado IN_PICKING no encontrado en el sistema")
+
+    wave_id = uuid.uuid4().hex[:12].upper()
+    now = datetime.utcnow()
+    for tote, order_id in enumerate(order_ids, start=1):
+        order = orders[order_id]
+        old_status_id = order.status_id
+        order.wave_id = wave_id
+        order.wave_tote = tote
+        if old_status_id != in_picking_status.id:
+            order.status_id = in_picking_status.id
+            if not order.fecha_inicio_picking:
+                order.fecha_inicio_picking = now
+        db.add(OrderHistory(
+            order_id=order.id,
+            status_id=in_picking_status.id,
+            operator_id=operator.id,
+            event_type="STATUS_CHANGE",
+            accion="STATUS_CHANGE",
+            status_anterior=old_status_id,
+            status_nuevo=in_picking_status.id,
+            notas=f"Picking iniciado en oleada {wave_id} (cubeta {tote})",
+            fecha=now,
+            event_metadata={"wave_id": wave_id, "tote": tote},
+        ))
+    db.commit()
+    logger.info(f"🌊 [WAVE] Oleada {wave_id} iniciada por {operator.codigo}: {len(order_ids)} órdenes")
+    return wave_id
+
+
+def wave_orders(db: Session, wave_id: str, operator_id: int) -> List[Order]:
+    """Órdenes de una oleada del operario, por cubeta."""
+    return (
+        db.query(Order)
+        .filter(Order.wave_id == wave_id, Order.operator_id == operator_id)
+        .order_by(Order.wave_tote)
+        .all()
+    )
+
+
+# === Escaneo (WebSocket) ===
+
+@dataclass
+class WaveSession:
+    """Sesiones de picking de las órdenes IN_PICKING de una oleada, por cubeta."""
+    wave_id: str
+    operator_id: int
+    sessions_by_tote: Dict[int, PickingSession] = field(default_factory=dict)
+    box_codes: Dict[int, Optional[str]] = field(default_factory=dict)
+
+    @property
+    def total_items(self) -> int:
+        return sum(s.total_items for s in self.sessions_by_tote.values())
+
+    @property
+    def items_completados(self) -> int:
+        return sum(s.items_completados for s in self.sessions_by_tote.values())
+
+
+class WaveSessionCache:
+    """Sesión de oleada por código de operario (mismo patrón que picking_sessions)."""
+
+    def __init__(self):
+        self._sessions: Dict[str, WaveSession] = {}
+        self._lock = threading.Lock()
+
+    def get(self, codigo_operario: str, wave_id: str) -> Optional[WaveSession]:
+        with self._lock:
+            session = self._sessions.get(codigo_operario)
+        return session if session and session.wave_id == wave_id else None
+
+    def invalidate_operator(self, codigo_operario: str) -> None:
+        with self._lock:
+            self._sessions.pop(codigo_operario, None)
+
+    def load(self, db: Session, codigo_operario: str, operator_id: int, wave_id: str) -> Optional[WaveSession]:
+        """
+        Carga la oleada desde BD (órdenes IN_PICKING del operario con ese
+        wave_id). None si no queda ninguna.
+        """
+        session = WaveSession(wave_id=wave_id, operator_id=operator_id)
+        for order in wave_orders(db, wave_id, operator_id):
+            if order.status.codigo != "IN_PICKING":
+                continue
+            session.sessions_by_tote[order.wave_tote] = build_session(db, order)
+            session.box_codes[order.wave_tote] = order.caja_activa.codigo_caja if order.caja_activa else None
+        if not session.sessions_by_tote:
+            return None
+        with self._lock:
+            self._sessions[codigo_operario] = session
+        return session
+
+
+def validate_wave_session(db: Session, wave: WaveSession) -> None:
+    """
+    Lectura de validación de toda la oleada (1 round trip): estado, operario,
+    caja activa y oleada de cada orden. Refresca items_completados.
+
+    Raises:
+        StaleSessionError: Si alguna orden cambió
+    """
+    sessions = {s.order_id: s for s in wave.sessions_by_tote.values()}
+    rows = db.query(
+        Order.id, Order.status_id, Order.operator_id, Order.caja_activa_id,
+        Order.items_completados, Order.wave_id,
+    ).filter(Order.id.in_(sessions.keys())).all()
+    if len(rows) != len(sessions):
+        raise StaleSessionError()
+    for row in rows:
+        session = sessions[row.id]
+        if (
+            row.status_id != session.in_picking_status_id
+            or row.operator_id != session.operator_id
+            or row.caja_activa_id != session.caja_activa_id
+            or row.wave_id != wave.wave_id
+        ):
+            raise StaleSessionError()
+        session.items_completados = row.items_completados or 0
+
+
+def select_wave_target(
+    wave: WaveSession,
+    ean: str,
+    ubicacion: Optional[str] = None,
+    tote: Optional[int] = None,
+) -> Tuple[Optional[int], Optional[PickingLine], Optional[str]]:
+    """
+    Decide a qué orden (cubeta) de la oleada se imputa una unidad escaneada.
+
+    Preferencia: la cubeta indicada por la PDA; si no, la orden que tiene
+    reservada la ubicación escaneada con unidades pendientes; si no, la
+    primera cubeta con unidades pendientes de ese EAN.
+
+    Returns:
+        (cubeta, línea, None) o (None, None, código de error):
+        EAN_NOT_IN_WAVE, TOTE_NOT_IN_WAVE, EAN_NOT_IN_TOTE, MAX_QUANTITY_REACHED
+    """
+    if tote is not None and tote not in wave.sessions_by_tote:
+        return None, None, "TOTE_NOT_IN_WAVE"
+
+    matches = []
+    for tote_number in sorted(wave.sessions_by_tote):
+        line = wave.sessions_by_tote[tote_number].lines_by_ean.get(ean)
+        if line:
+            matches.append((tote_number, line))
+    if not matches:
+        return None, None, "EAN_NOT_IN_WAVE"
+    if tote is not None:
+        matches = [(t, line) for t, line in matches if t == tote]
+        if not matches:
+            return None, None, "EAN_NOT_IN_TOTE"
+
+    pending = [(t, line) for t, line in matches if line.cantidad_servida < line.cantidad_solicitada]
+    if not pending:
+        return None, matches[0][1], "MAX_QUANTITY_REACHED"
+
+    if ubicacion:
+        for t, line in pending:
+            if any(
+                a.location_code == ubicacion and a.cantidad_servida < a.cantidad_reservada
+                for a in line.assignments
+            ):
+                return t, line, None
+    return pending[0][0], pending[0][1], None
+
+
+# Sesiones de oleada globales del proceso
+wave_sessions = WaveSessionCache()
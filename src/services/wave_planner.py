@@ -0,0 +1,130 @@
+"""
+Wave Planner
+
+Agrupación de órdenes en oleadas (batch picking) para que un operario recoja
+varias órdenes pequeñas en un solo recorrido con un carro de cubetas. Puro:
+sin ORM ni BD (la carga y la ejecución están en wave_picking_service.py).
+
+Compatibilidad:
+    - Mismo almacén (un recorrido no cruza almacenes)
+    - Capacidad del carro: como mucho WAVE_MAX_ORDERS órdenes (una cubeta por
+      orden) y WAVE_MAX_UNITS unidades pendientes en total
+    - Las órdenes de más de WAVE_MAX_ORDER_UNITS unidades no se agrupan (no
+      caben en una cubeta; se recogen solas)
+
+Algoritmo (semilla y crecimiento, voraz):
+    1. Las órdenes se recorren por prioridad y antigüedad; la primera sin
+       oleada es la semilla.
+    2. Se añade repetidamente la orden compatible con mayor afinidad con la
+       oleada: media entre la fracción de sus ubicaciones y la fracción de sus
+       pasillos que la oleada ya visita (0 = nada en común, 1 = todo).
+       Empates → prioridad y antigüedad.
+    3. Se para al llenar el carro o si no queda ninguna orden con afinidad
+       ≥ WAVE_MIN_AFFINITY.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import FrozenSet, List, Sequence
+
+from src.adapters.secondary.database.config import (
+    WAVE_MAX_ORDERS,
+    WAVE_MAX_UNITS,
+    WAVE_MAX_ORDER_UNITS,
+    WAVE_MIN_AFFINITY,
+)
+
+
+@dataclass
+class WaveCandidate:
+    """Orden candidata con sus paradas pendientes."""
+    order_id: int
+    almacen_id: int
+    location_ids: FrozenSet[int]
+    aisles: FrozenSet[str]
+    units: int
+    # Rango de prioridad (menor = antes) y secuencia FIFO
+    priority: int = 2
+    seq: int = 0
+
+
+@dataclass
+class Wave:
+    """Oleada planificada: órdenes en orden de cubeta (1..N)."""
+    almacen_id: int
+    order_ids: List[int] = field(default_factory=list)
+    units: int = 0
+    location_ids: set = field(default_factory=set)
+    aisles: set = field(default_factory=set)
+    # (prioridad, secuencia) de la orden semilla, para ordenar las oleadas
+    seed: tuple = ()
+
+    def add(self, candidate: WaveCandidate):
+        self.order_ids.append(candidate.order_id)
+        self.units += candidate.units
+        self.location_ids |= candidate.location_ids
+        self.aisles |= candidate.aisles
+
+
+def affinity(wave: Wave, candidate: WaveCandidate) -> float:
+    """Fracción (0..1) de las ubicaciones y pasillos de la orden que la oleada ya visita."""
+    location_share = (
+        len(candidate.location_ids & wave.location_ids) / len(candidate.location_ids)
+        if candidate.location_ids else 0.0
+    )
+    aisle_share = len(candidate.aisles & wave.aisles) / len(candidate.aisles) if candidate.aisles else 0.0
+    return (location_share + aisle_share) / 2
+
+
+def plan_waves(
+    candidates: Sequence[WaveCandidate],
+    max_orders: int = WAVE_MAX_ORDERS,
+    max_units: int = WAVE_MAX_UNITS,
+    max_order_units: int = WAVE_MAX_ORDER_UNITS,
+    min_affinity: float = WAVE_MIN_AFFINITY,
+) -> List[Wave]:
+    """
+    Agrupa órdenes en oleadas.
+
+    Args:
+        candidates: Órdenes candidatas (con al menos una parada)
+        max_orders: Cubetas del carro
+        max_units: Unidades máximas por oleada
+        max_order_units: Unidades máximas de una orden para agruparla
+        min_affinity: Afinidad mínima para añadir una orden a una oleada
+
+    Returns:
+        Oleadas de 2 o más órdenes, en orden de la orden semilla. Las órdenes
+        que no se agrupan con ninguna otra no aparecen (picking individual).
+    """
+    by_almacen = defaultdict(list)
+    for candidate in candidates:
+        if 0 < candidate.units <= min(max_order_units, max_units):
+            by_almacen[candidate.almacen_id].append(candidate)
+
+    waves: List[Wave] = []
+    for almacen_id, pool in by_almacen.items():
+        pool.sort(key=lambda c: (c.priority, c.seq, c.order_id))
+        while pool:
+            seed = pool.pop(0)
+            wave = Wave(almacen_id=almacen_id, seed=(seed.priority, seed.seq))
+            wave.add(seed)
+            while len(wave.order_ids) < max_orders:
+                best_index, best_key = None, None
+                for index, candidate in enumerate(pool):
+                    if wave.units + candidate.units > max_units:
+                        continue
+                    score = affinity(wave, candidate)
+                    if score < min_affinity:
+                        continue
+                    key = (-score, candidate.priority, candidate.seq, candidate.order_id)
+                    if best_key is None or key < best_key:
+                        best_index, best_key = index, key
+                if best_index is None:
+                    break
+                wave.add(pool.pop(best_index))
+            if len(wave.order_ids) > 1:
+                waves.append(wave)
+
+    waves.sort(key=lambda w: w.seed)
+    return waves
@@ -0,0 +1,162 @@
+"""
+Worker de tareas programadas
+
+Proceso dedicado que ejecuta las tareas del registro de jobs (cron de
+reserva de stock y futuras tareas periódicas) fuera de los workers de
+uvicorn, para que su CPU y su trabajo de BD no compitan con las peticiones
+HTTP/WebSocket (mismo proceso, mismo GIL).
+
+Despliegue:
+    SCHEDULER_MODE=worker en la API (los workers web no arrancan scheduler)
+    python -m src.worker   # una o varias réplicas
+
+Con varias réplicas solo el líder ejecuta tareas (ver leader_election.py);
+las demás quedan en espera y toman el relevo si el líder cae.
+
+Métricas (WORKER_METRICS_PORT, 0 = desactivado):
+    GET /metrics → formato de texto de Prometheus (duración, fallos, backlog...)
+    GET /health  → JSON con el estado de líder y las métricas por tarea
+"""
+
+import json
+import logging
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import text
+
+from src.adapters.secondary.database.config import (
+    engine,
+    WORKER_LEADER_RETRY_SECONDS,
+    WORKER_METRICS_PORT,
+)
+from src.core.logging_config import setup_logging
+from src.services.job_registry import job_registry
+from src.services.leader_election import LeaderLock
+# Los servicios registran sus tareas en job_registry al importarse
+import src.services.stock_reservation_cron_service  # noqa: F401
+import src.services.order_counters_service  # noqa: F401
+import src.services.stock_summary_service  # noqa: F401
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerWorker:
+    """
+    Bucle del worker: elección de líder → scheduler del registro → heartbeat.
+
+    Responsabilidades:
+        - Ejecutar las tareas solo mientras se es líder
+        - Parar el scheduler si se pierde el liderazgo y volver a competir
+        - Exponer estado y métricas
+    """
+
+    def __init__(self, retry_seconds: float = WORKER_LEADER_RETRY_SECONDS):
+        self.retry_seconds = retry_seconds
+        self.leader = LeaderLock(engine)
+        self.stop_event = threading.Event()
+        self.scheduler = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.leader.held
+
+    def run(self):
+        """Bucle principal (bloquea hasta stop())."""
+        logger.info(
+            f"🗓️  [WORKER] Worker de tareas iniciado — {len(job_registry.jobs())} tareas registradas: "
+            f"{', '.join(job.name for job in job_registry.jobs())}"
+        )
+        while not self.stop_event.is_set():
+            if not self.leader.acquire():
+                logger.debug("  [WORKER] Otra réplica es líder — en espera")
+                self.stop_event.wait(self.retry_seconds)
+                continue
+
+            logger.info("👑 [WORKER] Liderazgo adquirido — arrancando scheduler")
+            self.scheduler = job_registry.build_scheduler()
+            self.scheduler.start()
+
+            # Heartbeat: seguir siendo líder mientras el lock siga en la conexión
+            while not self.stop_event.wait(self.retry_seconds):
+                if not self.leader.is_held():
+                    break
+
+            self._stop_scheduler()
+            if not self.stop_event.is_set():
+                logger.warning("⚠️  [WORKER] Liderazgo perdido — scheduler detenido, reintentando")
+
+        self.leader.release()
+        logger.info("🛑 [WORKER] Worker de tareas detenido")
+
+    def stop(self, *_):
+        self.stop_event.set()
+
+    def _stop_scheduler(self):
+        if self.scheduler is not None:
+            # Esperar a que termine la tarea en curso (commit/rollback limpio)
+            self.scheduler.shutdown(wait=True)
+            self.scheduler = None
+
+    def health(self) -> dict:
+        return {"leader": self.is_leader, "jobs": job_registry.snapshot()}
+
+
+def _metrics_handler(worker: SchedulerWorker):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = job_registry.metrics_text({"worker_is_leader": int(worker.is_leader)})
+                content_type = "text/plain; version=0.0.4"
+            elif self.path == "/health":
+                body = json.dumps(worker.health())
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            # Sin log por scrape
+            pass
+
+    return MetricsHandler
+
+
+def start_metrics_server(worker: SchedulerWorker, port: int = WORKER_METRICS_PORT):
+    """Arranca el servidor HTTP de métricas en un hilo (None si port=0)."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _metrics_handler(worker))
+    threading.Thread(target=server.serve_forever, name="worker-metrics", daemon=True).start()
+    logger.info(f"📈 [WORKER] Métricas en http://0.0.0.0:{port}/metrics")
+    return server
+
+
+def main():
+    setup_logging()
+
+    # Verificar conexión a la base de datos antes de arrancar
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    worker = SchedulerWorker()
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+
+    server = start_metrics_server(worker)
+    try:
+        worker.run()
+    finally:
+        if server:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -42,11 +42,16 @@ def setup_test_database():
 def test_db():
     """
     Sesión de BD limpia para cada test
-    Usa transacciones con rollback automático para aislamiento
+    Usa transacciones con rollback automático para aislamiento; los
+    commit/rollback del código bajo test usan SAVEPOINTs dentro de ella
     """
     connection = test_engine.connect()
     transaction = connection.begin()
-    session = TestSessionLocal(bind=connection)
+    # pysqlite no abre la transacción hasta el primer DML: abrirla ya, para que
+    # los SAVEPOINT de la sesión queden dentro y el rollback final lo deshaga todo
+    connection.exec_driver_sql("BEGIN")
+    # commit/rollback del código bajo test → RELEASE/ROLLBACK TO SAVEPOINT
+    session = TestSessionLocal(bind=connection, join_transaction_mode="create_savepoint")
     
     yield session
     
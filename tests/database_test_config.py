@@ -23,7 +23,11 @@ from src.adapters.secondary.database.orm import (
     ProductLocation,
     Operator,
     APIStockHistorico,
-    APIMatricula
+    APIMatricula,
+    StockMovement,
+    ReplenishmentRequest,
+    OrderLineStockAssignment,
+    ProductStockSummary
 )
 
 
@@ -85,6 +89,15 @@ def create_test_database():
         except:
             pass  # Si ya existe, ignorar
 
+    # create_all se detiene en el primer índice con nombre repetido (en SQLite
+    # los nombres de índice son globales): crear las tablas que usan los tests
+    for model in (StockMovement, ReplenishmentRequest, OrderLineStockAssignment, ProductStockSummary):
+        if model.__tablename__ not in existing_tables:
+            try:
+                model.__table__.create(test_engine, checkfirst=True)
+            except OperationalError:
+                pass
+
 
 def drop_test_database():
     """
@@ -0,0 +1,85 @@
+"""
+Tests for the in-memory dashboard counters.
+
+Tests cover:
+- Reconciliation from the source tables
+- Committed ORM changes are applied incrementally, rolled back ones are not
+- Deltas staged by set-based writers
+- Warehouse stats count free slots (no product) as locations, not as products
+"""
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.orm import OrderStatus, ProductLocation
+import src.services.stock_summary_service  # noqa: F401  (mantiene product_stock_summary)
+from src.services.dashboard_counters import dashboard_counters, stage
+
+
+def _location(db, ubicacion, product_id=None, stock=0):
+    db.add(ProductLocation(
+        product_id=product_id, almacen_id=1, pasillo="A", lado="IZQUIERDA",
+        ubicacion=ubicacion, altura=1, stock_actual=stock, stock_minimo=0,
+    ))
+
+
+class TestDashboardCounters:
+    """Test suite for dashboard_counters"""
+
+    def test_status_change_is_applied_on_commit(self, test_db: Session, pending_order):
+        """Test: A committed status change moves the order between counters without a new GROUP BY"""
+        dashboard_counters.reconcile(test_db)
+        assert dashboard_counters.order_counts(test_db) == {"PENDING": 1}
+
+        assigned = test_db.query(OrderStatus).filter_by(codigo="ASSIGNED").first()
+        pending_order.status_id = assigned.id
+        test_db.commit()
+
+        assert dashboard_counters.order_counts(test_db) == {"ASSIGNED": 1}
+        assert dashboard_counters.order_counts(test_db, almacen_id=999) == {}
+
+    def test_rolled_back_changes_are_discarded(self, test_db: Session, pending_order):
+        """Test: Deltas of a rolled back transaction never reach the counters"""
+        dashboard_counters.reconcile(test_db)
+
+        cancelled = test_db.query(OrderStatus).filter_by(codigo="CANCELLED").first()
+        pending_order.status_id = cancelled.id
+        test_db.flush()
+        test_db.rollback()
+
+        assert dashboard_counters.order_counts(test_db) == {"PENDING": 1}
+
+    def test_staged_movements_apply_on_commit(self, test_db: Session, pending_order):
+        """Test: Movements written outside the ORM flush are counted via stage()"""
+        dashboard_counters.reconcile(test_db)
+
+        stage(test_db, [("movement", "RESERVE", 3, 12)])
+        test_db.commit()
+
+        assert dashboard_counters.movement_stats(test_db) == {
+            "RESERVE": {"count": 3, "total_cantidad": 12}
+        }
+
+    def test_reconcile_counts_free_slots(self, test_db: Session, test_warehouse, sample_product):
+        """Test: Reconciled location count includes active slots without product"""
+        _location(test_db, "1", product_id=sample_product.id, stock=5)
+        _location(test_db, "2")
+        test_db.commit()
+
+        dashboard_counters.reconcile(test_db)
+
+        assert dashboard_counters.almacen_stats(test_db, 1) == {
+            "total_ubicaciones": 2, "total_productos": 1, "total_stock": 5
+        }
+
+    def test_free_slot_is_not_a_product(self, test_db: Session, test_warehouse, sample_product):
+        """Test: An incrementally added free slot counts as a location but not as a product"""
+        _location(test_db, "1", product_id=sample_product.id, stock=5)
+        test_db.commit()
+        dashboard_counters.reconcile(test_db)
+
+        _location(test_db, "2")
+        test_db.commit()
+
+        expected = {"total_ubicaciones": 2, "total_productos": 1, "total_stock": 5}
+        assert dashboard_counters.almacen_stats(test_db, 1) == expected
+        dashboard_counters.reconcile(test_db)
+        assert dashboard_counters.almacen_stats(test_db, 1) == expected
@@ -0,0 +1,52 @@
+"""
+Tests for the precomputed location distance matrix.
+
+Tests cover:
+- Matrix lookups match the layout geometry (depot and slots)
+- Disk round trip through mmap and rebuild on fingerprint mismatch
+"""
+import random
+
+from src.services.distance_matrix_service import DistanceMatrix, slots_fingerprint
+from src.services.warehouse_layout import LayoutConfig, WarehouseLayout
+
+CONFIG = LayoutConfig(aisle_pitch_m=3.0, slot_width_m=1.0, cross_aisle_m=2.0)
+SLOTS = [(str(a), str(s)) for a in range(1, 6) for s in range(1, 11)] + [("B", "A1"), ("B", "A2")]
+
+
+def build_layout():
+    layout = WarehouseLayout(SLOTS, CONFIG)
+    matrix = DistanceMatrix.build(layout, SLOTS, slots_fingerprint(SLOTS, CONFIG))
+    return layout, matrix
+
+
+class TestDistanceMatrix:
+    """Test suite for DistanceMatrix"""
+
+    def test_lookups_match_layout_geometry(self):
+        """Test: Every pair (and the depot) has the same distance as the geometric model"""
+        geometric, matrix = build_layout()
+        layout = WarehouseLayout(SLOTS, CONFIG)
+        layout.use_matrix(matrix, {100 + i: key for i, key in enumerate(SLOTS)})
+
+        rng = random.Random(3)
+        for _ in range(200):
+            a, b = rng.choice(SLOTS), rng.choice(SLOTS)
+            expected = geometric.distance(geometric.point(*a), geometric.point(*b))
+            assert abs(layout.distance(layout.point(*a), layout.point(*b)) - expected) < 1e-4
+        assert abs(layout.depot_distance(100) - geometric.distance(geometric.depot, geometric.point(*SLOTS[0]))) < 1e-4
+        assert layout.location_distance(100, 999) is None
+
+    def test_disk_round_trip_and_fingerprint_mismatch(self, tmp_path):
+        """Test: A saved matrix reopens through mmap and is rejected if the slots changed"""
+        _, matrix = build_layout()
+        path = str(tmp_path / "almacen_1.ldm")
+        matrix.save(path)
+
+        opened = DistanceMatrix.open(path, matrix.fingerprint)
+        assert opened is not None and len(opened) == len(matrix)
+        assert opened.distance(opened.node("3", "7"), opened.node("B", "A2")) == matrix.distance(
+            matrix.node("3", "7"), matrix.node("B", "A2")
+        )
+        assert DistanceMatrix.open(path, slots_fingerprint(SLOTS[:-1], CONFIG)) is None
+        assert DistanceMatrix.open(str(tmp_path / "missing.ldm")) is None
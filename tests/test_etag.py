@@ -0,0 +1,76 @@
+"""
+Tests for conditional GET (ETag / If-None-Match).
+
+Tests cover:
+- 304 on the order detail when the client's copy is current
+- The ETag changes when a line of the order changes
+- If-None-Match parsing (lists, weak validators)
+- Write endpoints return the updated detail (built without the ETag wrapper)
+"""
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from src.adapters.primary.api.order_router import (
+    assign_operator_to_order,
+    get_order_detail,
+    update_order_priority,
+)
+from src.adapters.secondary.database.orm import Operator, OrderLine
+from src.core.domain.models import AssignOperatorRequest, UpdateOrderPriorityRequest
+from src.services.etag_service import etag_matches, make_etag
+
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+class TestConditionalGet:
+    """Test suite for etag_service"""
+
+    def test_order_detail_not_modified_until_a_line_changes(self, test_db: Session, pending_order):
+        """Test: The same ETag yields 304 without a body; updating a line invalidates it"""
+        response = Response()
+        detail = get_order_detail(pending_order.id, _request(), response, test_db)
+        etag = response.headers["ETag"]
+        assert len(detail.productos) == 3
+
+        cached = get_order_detail(pending_order.id, _request(etag), Response(), test_db)
+        assert cached.status_code == 304
+        assert cached.body == b""
+
+        line = test_db.query(OrderLine).filter_by(order_id=pending_order.id).first()
+        line.cantidad_servida = 1
+        test_db.commit()
+
+        response = Response()
+        get_order_detail(pending_order.id, _request(etag), response, test_db)
+        assert response.headers["ETag"] != etag
+
+    def test_if_none_match_uses_weak_comparison(self):
+        """Test: Any validator of the list matches, with or without the W/ prefix"""
+        etag = make_etag("order-detail", 1, "v1")
+        opaque = etag[2:]
+
+        assert etag_matches(_request(f'"other", {opaque}'), etag)
+        assert etag_matches(_request("*"), etag)
+        assert not etag_matches(_request(make_etag("order-detail", 1, "v2")), etag)
+
+
+class TestWriteEndpointsDetail:
+    """Test suite for the order detail returned by write endpoints"""
+
+    def test_priority_and_assign_return_updated_detail(self, test_db: Session, pending_order):
+        """Test: The write commits and the response is the detail of the updated order"""
+        test_db.add(Operator(id=1, codigo="OP-T1", nombre="Operario Test", activo=True))
+        test_db.commit()
+        order_id = pending_order.id
+
+        detail = update_order_priority(order_id, UpdateOrderPriorityRequest(prioridad="urgent"), test_db)
+        assert (detail.id, detail.prioridad, len(detail.productos)) == (order_id, "URGENT", 3)
+
+        # Sin cambios: devuelve el detalle igualmente
+        assert update_order_priority(order_id, UpdateOrderPriorityRequest(prioridad="URGENT"), test_db).id == order_id
+
+        detail = assign_operator_to_order(order_id, AssignOperatorRequest(operator_id=1), test_db)
+        assert (detail.operario_asignado, detail.estado_codigo) == ("Operario Test", "ASSIGNED")
@@ -0,0 +1,58 @@
+"""
+Tests for the scheduled job registry used by the API and the dedicated worker.
+
+Tests cover:
+- Run metrics (duration, runs, backlog) on success
+- Failures are recorded without propagating
+- Prometheus text export
+"""
+from src.services.job_registry import JobRegistry
+
+
+class TestJobRegistry:
+    """Test suite for JobRegistry"""
+
+    def test_run_job_records_metrics_and_backlog(self):
+        """Test: A successful run updates counters, duration and the reported backlog"""
+        registry = JobRegistry()
+        calls = []
+        registry.register("reserve", lambda: calls.append(1), minutes=10, backlog=lambda: 42)
+
+        registry.run_job("reserve")
+        registry.run_job("reserve")
+
+        metrics = registry.snapshot()["reserve"]
+        assert calls == [1, 1]
+        assert metrics["runs"] == 2
+        assert metrics["failures"] == 0
+        assert metrics["backlog"] == 42
+        assert metrics["running"] is False
+        assert metrics["last_started_at"] is not None
+
+    def test_failed_job_is_recorded_not_raised(self):
+        """Test: An exception inside a job counts as a failure and keeps the scheduler alive"""
+        registry = JobRegistry()
+
+        def broken():
+            raise RuntimeError("deadlock")
+
+        registry.register("broken", broken, minutes=1)
+        registry.run_job("broken")
+
+        metrics = registry.snapshot()["broken"]
+        assert metrics["runs"] == 1
+        assert metrics["failures"] == 1
+        assert metrics["last_error"] == "deadlock"
+
+    def test_metrics_text_is_prometheus_format(self):
+        """Test: Metrics export one labelled series per job plus extra gauges"""
+        registry = JobRegistry()
+        registry.register("reserve", lambda: None, minutes=10, backlog=lambda: 7)
+        registry.run_job("reserve")
+
+        text = registry.metrics_text({"worker_is_leader": 1})
+
+        assert 'job_runs_total{job="reserve"} 1' in text
+        assert 'job_backlog{job="reserve"} 7' in text
+        assert "# TYPE job_last_duration_seconds gauge" in text
+        assert "worker_is_leader 1" in text
@@ -0,0 +1,45 @@
+"""
+Tests for the stored order counters (total_items, items_completados,
+total_lineas, lineas_completadas).
+
+Tests cover:
+- Recalculation from order_lines inside the caller's transaction
+- Periodic reconciliation only touches drifted orders
+"""
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.orm import OrderLine
+from src.services.order_counters_service import (
+    refresh_order_counters,
+    reconcile_order_counters,
+)
+
+
+class TestOrderCounters:
+    """Test suite for order_counters_service"""
+
+    def test_refresh_counts_units_and_lines(self, test_db: Session, pending_order):
+        """Test: Counters are rebuilt from the lines and visible on the loaded order"""
+        line = test_db.query(OrderLine).filter_by(order_id=pending_order.id).order_by(OrderLine.id).first()
+        line.cantidad_servida = line.cantidad_solicitada
+
+        refresh_order_counters(test_db, [pending_order.id])
+
+        # Líneas de 10, 11 y 12 unidades; la primera servida completa
+        assert pending_order.total_items == 33
+        assert pending_order.items_completados == 10
+        assert pending_order.total_lineas == 3
+        assert pending_order.lineas_completadas == 1
+
+    def test_reconcile_fixes_only_drifted_orders(self, test_db: Session, pending_order):
+        """Test: Lines written outside the instrumented paths are picked up by the reconciliation"""
+        assert reconcile_order_counters(test_db) == 1
+        assert pending_order.total_items == 33
+
+        # Escritura directa (como el ETL externo) sin tocar los contadores
+        test_db.query(OrderLine).filter_by(order_id=pending_order.id).update(
+            {OrderLine.cantidad_servida: 1}, synchronize_session=False
+        )
+        assert reconcile_order_counters(test_db) == 1
+        assert pending_order.items_completados == 3
+        assert reconcile_order_counters(test_db) == 0
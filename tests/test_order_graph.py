@@ -0,0 +1,81 @@
+"""
+Tests for the batch-loaded order graph.
+
+Tests cover:
+- Assignments grouped per line with their location, in a fixed number of queries
+- Best picking location per product in a single query
+"""
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.orm import (
+    OrderLine,
+    OrderLineStockAssignment,
+    ProductLocation,
+    ProductReference,
+)
+from src.services.order_graph_service import best_picking_locations, load_order_graph
+
+
+def _location(test_db, almacen_id, product_id, pasillo, prioridad, stock):
+    location = ProductLocation(
+        almacen_id=almacen_id,
+        product_id=product_id,
+        pasillo=pasillo,
+        lado="IZQUIERDA",
+        ubicacion="01",
+        altura=1,
+        prioridad=prioridad,
+        stock_actual=stock,
+        activa=True,
+    )
+    test_db.add(location)
+    test_db.flush()
+    return location
+
+
+class TestOrderGraph:
+    """Test suite for order_graph_service"""
+
+    def test_graph_loads_assignments_without_per_line_queries(self, test_db: Session, pending_order):
+        """Test: Every line's assignments come with their location, and the query count does not grow with lines"""
+        lines = test_db.query(OrderLine).filter_by(order_id=pending_order.id).order_by(OrderLine.id).all()
+        loc_a = _location(test_db, pending_order.almacen_id, None, "1", 1, 50)
+        loc_b = _location(test_db, pending_order.almacen_id, None, "2", 1, 50)
+        for line, loc in zip(lines, (loc_a, loc_b, loc_a)):
+            test_db.add(OrderLineStockAssignment(
+                order_line_id=line.id, product_location_id=loc.id, cantidad_reservada=line.cantidad_solicitada
+            ))
+        test_db.commit()
+        order_id = pending_order.id
+        test_db.expire_all()
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(test_db.get_bind(), "before_cursor_execute", listener)
+        try:
+            graph = load_order_graph(test_db, order_id, boxes=True)
+            pasillos = [loc.pasillo for line in graph.lines for _, loc in graph.assignments(line.id)]
+        finally:
+            event.remove(test_db.get_bind(), "before_cursor_execute", listener)
+
+        assert pasillos == ["1", "2", "1"]
+        assert len(statements) == 4
+
+    def test_best_picking_locations_prefers_priority_then_stock(self, test_db: Session, test_warehouse):
+        """Test: The lowest prioridad wins, ties broken by the highest stock"""
+        for pid in (501, 502):
+            test_db.add(ProductReference(
+                id=pid, sku=f"GRAPH-SKU-{pid}", referencia=f"GRAPH-{pid}", nombre_producto="Producto",
+                color_id="C1", talla="M", activo=True,
+            ))
+        test_db.flush()
+        _location(test_db, test_warehouse.id, 501, "1", 2, 100)
+        best_501 = _location(test_db, test_warehouse.id, 501, "2", 1, 5)
+        _location(test_db, test_warehouse.id, 502, "3", 1, 5)
+        best_502 = _location(test_db, test_warehouse.id, 502, "4", 1, 20)
+        test_db.commit()
+
+        best = best_picking_locations(test_db, [501, 502, 501], test_warehouse.id)
+
+        assert best == {501: best_501, 502: best_502}
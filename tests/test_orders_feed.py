@@ -0,0 +1,108 @@
+"""
+Tests for the live order change feed (/ws/orders/events).
+
+Tests cover:
+- Coalescing of events of the same order inside the debounce window
+- Resume from a cursor and resync when the cursor is not resumable
+- Emission from worker threads
+"""
+import asyncio
+import threading
+
+from src.adapters.primary.websocket.bus import InMemoryBus
+from src.adapters.primary.websocket.orders_websocket import (
+    OrdersConnectionManager,
+    EVENT_PROGRESS,
+    EVENT_PICKING_COMPLETED,
+    EVENT_STATUS_CHANGED,
+)
+from tests.test_websocket_manager import FakeWebSocket, run
+
+
+def make_feed(**kwargs):
+    return OrdersConnectionManager(bus=InMemoryBus(), debounce_ms=10, **kwargs)
+
+
+class TestOrdersFeed:
+    """Test suite for the order event feed"""
+
+    def test_events_of_same_order_are_coalesced(self):
+        """Test: A burst of scans on one order produces a single event with the latest data"""
+        async def scenario():
+            feed = make_feed()
+            await feed.start()
+            ws = FakeWebSocket()
+            await feed.connect(ws)
+            for i in range(1, 31):
+                feed.emit(EVENT_PROGRESS, 7, {"items_completados": i})
+            feed.emit(EVENT_PICKING_COMPLETED, 7, {"estado_codigo": "PICKED"})
+            feed.emit(EVENT_STATUS_CHANGED, 8, {"estado_codigo": "ASSIGNED"})
+            await asyncio.sleep(0.05)
+            await feed.drain()
+            await feed.stop()
+            return ws
+
+        ws = run(scenario())
+        assert ws.sent[0]["type"] == "subscribed"
+        events = ws.sent[1:]
+        assert [e["order_id"] for e in events] == [7, 8]
+        assert events[0]["type"] == EVENT_PICKING_COMPLETED
+        assert events[0]["events"] == [EVENT_PROGRESS, EVENT_PICKING_COMPLETED]
+        assert events[0]["data"] == {"items_completados": 30, "estado_codigo": "PICKED"}
+
+    def test_resume_from_cursor(self):
+        """Test: Reconnecting with a cursor replays only the missed events"""
+        async def scenario():
+            feed = make_feed()
+            await feed.start()
+            feed.emit(EVENT_STATUS_CHANGED, 1)
+            await feed.flush()
+            cursor = feed.cursor
+            feed.emit(EVENT_STATUS_CHANGED, 2)
+            feed.emit(EVENT_STATUS_CHANGED, 3)
+            await feed.flush()
+            ws = FakeWebSocket()
+            await feed.connect(ws, cursor)
+            await feed.drain()
+            await feed.stop()
+            return ws
+
+        ws = run(scenario())
+        assert [e["order_id"] for e in ws.sent] == [2, 3]
+
+    def test_unknown_or_expired_cursor_requires_resync(self):
+        """Test: A cursor from another process or outside the history gets resync_required"""
+        async def scenario():
+            feed = make_feed(history_size=2)
+            await feed.start()
+            for order_id in range(5):
+                feed.emit(EVENT_STATUS_CHANGED, order_id)
+                await feed.flush()
+            other_epoch, expired = FakeWebSocket(), FakeWebSocket()
+            await feed.connect(other_epoch, "deadbeef:3")
+            await feed.connect(expired, f"{feed.epoch}:1")
+            await feed.drain()
+            await feed.stop()
+            return other_epoch, expired
+
+        other_epoch, expired = run(scenario())
+        assert other_epoch.sent[0]["type"] == "resync_required"
+        assert expired.sent[0]["type"] == "resync_required"
+
+    def test_emit_from_worker_thread(self):
+        """Test: Events emitted from the DB thread pool reach the clients"""
+        async def scenario():
+            feed = make_feed()
+            await feed.start()
+            ws = FakeWebSocket()
+            await feed.connect(ws)
+            worker = threading.Thread(target=feed.emit, args=(EVENT_PROGRESS, 42, {"items_completados": 1}))
+            worker.start()
+            worker.join()
+            await asyncio.sleep(0.05)
+            await feed.drain()
+            await feed.stop()
+            return ws
+
+        ws = run(scenario())
+        assert ws.sent[-1]["order_id"] == 42
@@ -0,0 +1,74 @@
+"""
+Tests for keyset (cursor) pagination.
+
+Tests cover:
+- Walking all pages by cursor with ties on the sort column
+- Count modes (exact, none)
+- Invalid cursors are rejected
+"""
+from datetime import date, datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from src.adapters.secondary.database.orm import Order
+from src.services.pagination import encode_cursor, paginate
+
+KEYS = [(Order.fecha_importacion, True), (Order.id, True)]
+
+
+@pytest.fixture
+def many_orders(test_db: Session, order_statuses, test_warehouse):
+    """Crea 7 órdenes, varias con la misma fecha de importación"""
+    fechas = [datetime(2026, 1, 1 + i // 3) for i in range(7)]
+    for i, fecha in enumerate(fechas):
+        test_db.add(Order(
+            numero_orden=f"PAG-{i:03d}",
+            type="B2B",
+            cliente="TEST_CLIENT",
+            status_id=1,
+            fecha_orden=date(2026, 1, 1),
+            fecha_importacion=fecha,
+            almacen_id=test_warehouse.id,
+            prioridad="NORMAL",
+        ))
+    test_db.commit()
+    return test_db.query(Order).filter(Order.numero_orden.like("PAG-%"))
+
+
+class TestKeysetPagination:
+    """Test suite for paginate()"""
+
+    def test_cursor_walk_matches_offset_order(self, many_orders):
+        """Test: Following next_cursor returns every row once, in the same order as offset paging"""
+        expected = [o.id for o in paginate(many_orders, KEYS, limit=100).rows]
+
+        seen, cursor = [], None
+        while True:
+            page = paginate(many_orders, KEYS, limit=2, cursor=cursor, count="none")
+            seen.extend(o.id for o in page.rows)
+            assert page.total is None
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+
+        assert seen == expected
+        assert len(seen) == 7
+
+    def test_offset_mode_keeps_exact_total(self, many_orders):
+        """Test: Offset mode still reports the exact total and a cursor to continue"""
+        page = paginate(many_orders, KEYS, limit=3, skip=3)
+
+        assert page.total == 7
+        assert page.total_is_estimate is False
+        assert len(page.rows) == 3
+        assert page.next_cursor is not None
+
+    def test_cursor_from_other_listing_is_rejected(self, many_orders):
+        """Test: A cursor built for a different sort key returns 400"""
+        foreign = encode_cursor([(Order.created_at, True), (Order.id, True)], [datetime(2026, 1, 1), 5])
+
+        with pytest.raises(HTTPException) as exc:
+            paginate(many_orders, KEYS, limit=2, cursor=foreign)
+        assert exc.value.status_code == 400
@@ -0,0 +1,42 @@
+"""
+Tests for the warehouse layout model and the picking route engine.
+
+Tests cover:
+- Physical aisle order and in-aisle positions from ProductLocation fields
+- Routes visit every stop once and 2-opt never lengthens them
+"""
+import random
+
+from src.services.picking_route_engine import plan_route, route_distance, s_shape
+from src.services.warehouse_layout import LayoutConfig, WarehouseLayout
+
+CONFIG = LayoutConfig(aisle_pitch_m=3.0, slot_width_m=1.0, cross_aisle_m=2.0)
+
+
+class TestWarehouseLayout:
+    """Test suite for WarehouseLayout"""
+
+    def test_aisles_numeric_first_and_natural_positions(self):
+        """Test: Numeric aisles come before alphabetic ones and "A10" sits after "A2" """
+        layout = WarehouseLayout([("B", "A1"), ("B", "A10"), ("B", "A2"), ("2", "5"), ("10", "1")], CONFIG)
+
+        assert [layout.point(p, "1").aisle for p in ("2", "10", "B")] == [0, 1, 2]
+        assert layout.point("B", "A10").y > layout.point("B", "A2").y > layout.point("B", "A1").y
+        # Distancia en el mismo pasillo = diferencia de posición
+        assert layout.distance(layout.point("2", "1"), layout.point("2", "5")) == 4.0
+
+
+class TestPickingRouteEngine:
+    """Test suite for plan_route"""
+
+    def test_plan_visits_every_stop_and_beats_s_shape_on_sparse_orders(self):
+        """Test: The planned route is a permutation of the stops and no longer than S-shape"""
+        rng = random.Random(7)
+        layout = WarehouseLayout(((str(a), str(s)) for a in range(1, 11) for s in range(1, 31)), CONFIG)
+        points = [layout.point(str(rng.randint(1, 10)), str(rng.randint(1, 30))) for _ in range(12)]
+
+        plan = plan_route(layout, points)
+
+        assert sorted(plan.sequence) == list(range(len(points)))
+        assert plan.distance_m <= round(route_distance(layout, points, s_shape(layout, points)), 2)
+        assert plan.estimated_seconds > plan.distance_m / CONFIG.walk_speed_mps
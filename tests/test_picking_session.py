@@ -0,0 +1,250 @@
+"""
+Tests for the in-memory picking session (PDA scan_product write path).
+
+Tests cover:
+- A scan increments the line, its assignment, the box distribution, the box and the order counters
+- The optimistic guard raises StaleSessionError when a line changed underneath
+- The WebSocket handler reloads the session and retries once
+- Cache invalidation by order (reset) and by operator (disconnect)
+- scan_batch: mixed ok/error scans, MAX_QUANTITY_REACHED inside one batch, resent batches
+  and seq counter resets
+"""
+from datetime import date, datetime, timezone
+
+import pytest
+from sqlalchemy import update
+
+from src.adapters.secondary.database import config
+from src.adapters.secondary.database.orm import (
+    Operator,
+    Order,
+    OrderLine,
+    OrderLineBoxDistribution,
+    OrderLineStockAssignment,
+    OrderStatus,
+    PackingBox,
+    ProductLocation,
+)
+from src.adapters.primary.websocket.operator_websocket import _handle_scan_product_sync
+from src.services.picking_session_service import (
+    PickingSessionCache,
+    ScanSeqLog,
+    StaleSessionError,
+    apply_scan,
+    apply_scan_batch,
+    build_session,
+    picking_sessions,
+    validate_session,
+)
+
+
+@pytest.fixture
+def picking_order(test_db, order_statuses, test_warehouse):
+    """Orden IN_PICKING de OP-T1 con caja activa: EAN-A (2 uds, reservadas en una ubicación) y EAN-B (1 ud)"""
+    operator = Operator(id=1, codigo="OP-T1", nombre="Operario Test", activo=True)
+    test_db.add(operator)
+    in_picking = test_db.query(OrderStatus).filter_by(codigo="IN_PICKING").first()
+    order = Order(
+        numero_orden="TEST-PICK-001", type="B2B", cliente="TEST_CLIENT", nombre_cliente="Cliente",
+        status_id=in_picking.id, operator_id=operator.id, fecha_orden=date.today(),
+        fecha_importacion=datetime.now(timezone.utc), almacen_id=test_warehouse.id, prioridad="NORMAL",
+        total_items=3, total_lineas=2,
+    )
+    test_db.add(order)
+    test_db.flush()
+    box = PackingBox(order_id=order.id, numero_caja=1, codigo_caja="TEST-PICK-001-C1", estado="OPEN", total_items=0)
+    test_db.add(box)
+    test_db.flush()
+    order.caja_activa_id = box.id
+    line_a = OrderLine(order_id=order.id, ean="EAN-A", cantidad_solicitada=2, cantidad_servida=0, estado="PENDING")
+    line_b = OrderLine(order_id=order.id, ean="EAN-B", cantidad_solicitada=1, cantidad_servida=0, estado="PENDING")
+    location = ProductLocation(
+        almacen_id=test_warehouse.id, pasillo="A", lado="IZQUIERDA", ubicacion="1", altura=1,
+        stock_actual=10, stock_reservado=2,
+    )
+    test_db.add_all([line_a, line_b, location])
+    test_db.flush()
+    test_db.add(OrderLineStockAssignment(
+        order_line_id=line_a.id, product_location_id=location.id, cantidad_reservada=2, cantidad_servida=0,
+    ))
+    test_db.commit()
+    return order
+
+
+@pytest.fixture
+def handler_db(test_db, monkeypatch):
+    """El handler del WebSocket abre su sesión con SessionLocal: usar la del test"""
+    monkeypatch.setattr(config, "SessionLocal", lambda: test_db)
+    yield test_db
+    picking_sessions.invalidate_operator("OP-T1")
+
+
+def _line(db, order, ean):
+    db.expire_all()
+    return db.query(OrderLine).filter_by(order_id=order.id, ean=ean).one()
+
+
+class TestApplyScan:
+    """Test suite for apply_scan / _persist_increments"""
+
+    def test_scan_increments_line_assignment_box_and_order(self, test_db, picking_order):
+        """Test: Each scan writes the line, the assignment, the box distribution and the stored counters"""
+        session = build_session(test_db, picking_order)
+        line = session.lines_by_ean["EAN-A"]
+
+        apply_scan(test_db, session, line, "A-IZQ-1-H1")
+        apply_scan(test_db, session, line, None)
+
+        db_line = _line(test_db, picking_order, "EAN-A")
+        assert (db_line.cantidad_servida, db_line.estado, db_line.packing_box_id) == (2, "COMPLETED", picking_order.caja_activa_id)
+        assignment = test_db.query(OrderLineStockAssignment).filter_by(order_line_id=db_line.id).one()
+        assert assignment.cantidad_servida == 2
+        distribution = test_db.query(OrderLineBoxDistribution).filter_by(order_line_id=db_line.id).one()
+        assert distribution.quantity_in_box == 2
+        assert test_db.get(PackingBox, picking_order.caja_activa_id).total_items == 2
+        order = test_db.get(Order, picking_order.id)
+        assert (order.items_completados, order.lineas_completadas) == (2, 1)
+        # La sesión en memoria refleja lo persistido
+        assert (line.cantidad_servida, line.estado, line.box_distribution_id) == (2, "COMPLETED", distribution.id)
+        assert session.items_completados == 2
+
+    def test_guard_raises_when_line_changed_underneath(self, test_db, picking_order):
+        """Test: A line changed by another process makes the write fail without persisting anything"""
+        session = build_session(test_db, picking_order)
+        test_db.execute(
+            update(OrderLine).where(OrderLine.order_id == picking_order.id, OrderLine.ean == "EAN-A")
+            .values(cantidad_servida=1)
+        )
+        test_db.commit()
+
+        validate_session(test_db, session)  # la orden no cambió: la sesión parece válida
+        with pytest.raises(StaleSessionError):
+            apply_scan(test_db, session, session.lines_by_ean["EAN-A"], None)
+
+        assert _line(test_db, picking_order, "EAN-A").cantidad_servida == 1
+        assert test_db.get(Order, picking_order.id).items_completados == 0
+        assert test_db.get(PackingBox, picking_order.caja_activa_id).total_items == 0
+
+
+class TestScanHandlerRetry:
+    """Test suite for the scan_product handler with a cached session"""
+
+    def test_stale_line_reloads_session_and_retries(self, handler_db, picking_order):
+        """Test: After a concurrent change the handler reloads the session and applies the scan once"""
+        order_id = picking_order.id  # el handler cierra la sesión: la instancia queda desasociada
+        data = {"order_id": order_id, "ean": "EAN-A"}
+        status, payload = _handle_scan_product_sync(1, "OP-T1", data)
+        assert status == "ok" and payload["data"]["cantidad_actual"] == 1
+        cached = picking_sessions.get("OP-T1", order_id)
+
+        # Reset de la línea desde otro proceso (la sesión en caché aún cree 1)
+        handler_db.execute(
+            update(OrderLine).where(OrderLine.order_id == order_id, OrderLine.ean == "EAN-A")
+            .values(cantidad_servida=0, estado="PENDING")
+        )
+        handler_db.commit()
+
+        status, payload = _handle_scan_product_sync(1, "OP-T1", data)
+
+        assert status == "ok"
+        assert payload["data"]["cantidad_actual"] == 1
+        assert handler_db.query(OrderLine).filter_by(order_id=order_id, ean="EAN-A").one().cantidad_servida == 1
+        assert picking_sessions.get("OP-T1", order_id) is not cached
+
+
+class TestApplyScanBatch:
+    """Test suite for apply_scan_batch"""
+
+    def test_mixed_ok_and_error_scans(self, test_db, picking_order):
+        """Test: Valid scans are persisted together; invalid ones are reported without aborting the batch"""
+        session = build_session(test_db, picking_order)
+
+        results = apply_scan_batch(test_db, session, [
+            {"seq": 1, "ean": "EAN-A"},
+            {"seq": 2, "ean": "NO-EXISTE"},
+            {"seq": 3},
+            {"seq": 4, "ean": "EAN-B"},
+        ], seq_log=ScanSeqLog())
+
+        assert [(r["seq"], r["status"], r["code"]) for r in results] == [
+            (1, "ok", None), (2, "error", "EAN_NOT_IN_ORDER"), (3, "error", "MISSING_EAN"), (4, "ok", None),
+        ]
+        assert _line(test_db, picking_order, "EAN-A").cantidad_servida == 1
+        assert _line(test_db, picking_order, "EAN-B").cantidad_servida == 1
+        assert test_db.get(Order, picking_order.id).items_completados == 2
+
+    def test_max_quantity_reached_within_one_batch(self, test_db, picking_order):
+        """Test: Units of the same batch count toward the requested quantity"""
+        session = build_session(test_db, picking_order)
+
+        results = apply_scan_batch(
+            test_db, session, [{"seq": seq, "ean": "EAN-A"} for seq in (1, 2, 3)], seq_log=ScanSeqLog()
+        )
+
+        assert [r["code"] for r in results] == [None, None, "MAX_QUANTITY_REACHED"]
+        assert results[2]["cantidad_actual"] == 2
+        line = _line(test_db, picking_order, "EAN-A")
+        assert (line.cantidad_servida, line.estado) == (2, "COMPLETED")
+        assert test_db.query(OrderLineStockAssignment).filter_by(order_line_id=line.id).one().cantidad_servida == 2
+
+    def test_resent_batch_is_not_applied_twice(self, test_db, picking_order):
+        """Test: A batch resent after a lost ack (even with a reloaded session) returns the earlier results"""
+        seq_log = ScanSeqLog()
+        batch = [{"seq": 10, "ean": "EAN-A"}, {"seq": 11, "ean": "NO-EXISTE"}]
+        first = apply_scan_batch(test_db, build_session(test_db, picking_order), batch, seq_log=seq_log)
+
+        # Reconexión: sesión nueva, mismo registro de seq
+        resent = apply_scan_batch(
+            test_db, build_session(test_db, picking_order), batch + [{"seq": 12, "ean": "EAN-A"}], seq_log=seq_log
+        )
+
+        assert [r["duplicado"] for r in resent[:2]] == [True, True]
+        assert [(r["status"], r["code"], r.get("cantidad_actual")) for r in resent[:2]] == [
+            (r["status"], r["code"], r.get("cantidad_actual")) for r in first
+        ]
+        assert (resent[2]["status"], resent[2]["cantidad_actual"]) == ("ok", 2)
+        assert _line(test_db, picking_order, "EAN-A").cantidad_servida == 2
+        assert test_db.get(Order, picking_order.id).items_completados == 2
+
+    def test_reset_seq_counter_is_applied(self, test_db, picking_order):
+        """Test: Lower seqs after a PDA counter reset are applied, and a new epoch does not reuse old results"""
+        seq_log = ScanSeqLog()
+        apply_scan_batch(
+            test_db, build_session(test_db, picking_order),
+            [{"seq": 5, "ean": "EAN-A"}, {"seq": 6, "ean": "EAN-A"}], seq_log=seq_log,
+        )
+
+        # Contador reiniciado sin epoch: seq 1 nunca se procesó
+        restarted = apply_scan_batch(
+            test_db, build_session(test_db, picking_order), [{"seq": 1, "ean": "EAN-B"}], seq_log=seq_log
+        )
+        # Epoch nuevo: el seq 5 de antes no cuenta como duplicado
+        new_epoch = apply_scan_batch(
+            test_db, build_session(test_db, picking_order), [{"seq": 5, "ean": "EAN-A"}],
+            seq_log=seq_log, epoch="pda-2",
+        )
+
+        assert (restarted[0]["status"], restarted[0].get("duplicado")) == ("ok", None)
+        assert (new_epoch[0]["code"], new_epoch[0].get("duplicado")) == ("MAX_QUANTITY_REACHED", None)
+        assert _line(test_db, picking_order, "EAN-B").cantidad_servida == 1
+        assert test_db.get(Order, picking_order.id).items_completados == 3
+
+
+class TestPickingSessionCache:
+    """Test suite for PickingSessionCache invalidation"""
+
+    def test_invalidate_by_order_and_by_operator(self, test_db, picking_order):
+        """Test: A reset drops every session of the order; a disconnect drops the operator's session"""
+        cache = PickingSessionCache()
+        session = cache.load(test_db, "OP-T1", picking_order)
+        cache.put("OP-T2", session)
+        assert cache.get("OP-T1", numero_orden="TEST-PICK-001") is session
+        assert cache.get("OP-T1", order_id=999) is None
+
+        cache.invalidate_order(picking_order.id)
+        assert cache.get("OP-T1", picking_order.id) is None
+        assert cache.get("OP-T2", picking_order.id) is None
+
+        cache.load(test_db, "OP-T1", picking_order)
+        cache.invalidate_operator("OP-T1")
+        assert cache.get("OP-T1", picking_order.id) is None
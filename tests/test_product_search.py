@@ -0,0 +1,112 @@
+"""
+Tests for the in-memory product search index.
+
+Tests cover:
+- Same matches as a case/accent-insensitive substring search, ranked by relevance
+- Products changed through the ORM are re-indexed before the next search
+- Products refreshed while a rebuild is running are re-applied after the swap
+- GET /products keeps the relevance order when filtering by stock status
+"""
+from src.adapters.primary.api import product_router
+from src.adapters.primary.api.product_router import ProductStatusFilter, list_products
+from src.adapters.secondary.database.orm import EAN, ProductLocation, ProductReference
+from src.services import product_search_service
+from src.services.product_search_service import ProductSearchIndex, product_search
+
+
+def add_product(test_db, product_id, referencia, nombre, sku=None, temporada="2024", ean=None):
+    test_db.add(ProductReference(
+        id=product_id, referencia=referencia, nombre_producto=nombre, sku=sku,
+        temporada=temporada, color_id="C1", talla="M", activo=True,
+    ))
+    test_db.flush()
+    if ean:
+        test_db.add(EAN(ean=ean, product_reference_id=product_id))
+        test_db.flush()
+
+
+class TestProductSearchIndex:
+    """Test suite for ProductSearchIndex"""
+
+    def test_ranks_exact_code_then_name_prefix_and_ignores_accents(self, test_db):
+        """Test: Exact SKU/EAN first, then name prefix; 'camion' finds 'Camión'"""
+        add_product(test_db, 1, "REF-001", "Pantalón camión azul", sku="CAMION-2")
+        add_product(test_db, 2, "REF-002", "Camión de juguete")
+        add_product(test_db, 3, "REF-003", "Camiseta", sku="camion", ean="8400000000017")
+        add_product(test_db, 4, "REF-004", "Sudadera")
+        index = ProductSearchIndex()
+        index.build(test_db)
+
+        assert index.search(test_db, "camion") == [3, 1, 2]
+        assert index.search(test_db, "CAMIÓN") == [3, 1, 2]
+        assert index.search(test_db, "8400000000017") == [3]
+        assert index.search(test_db, "ref-00") == [1, 2, 3, 4]
+        assert index.search(test_db, "xyz") == []
+
+    def test_reindexes_products_changed_through_the_orm(self, test_db):
+        """Test: A renamed product is found by its new name after commit"""
+        add_product(test_db, 5, "REF-005", "Chaqueta")
+        test_db.commit()
+        index = ProductSearchIndex()
+        index.build(test_db)
+        assert index.search(test_db, "abrigo") == []
+
+        product = test_db.get(ProductReference, 5)
+        product.nombre_producto = "Abrigo largo"
+        test_db.commit()
+        # El listener marca el producto en el índice global del proceso
+        assert 5 in product_search._dirty
+        index.mark_dirty([5])
+
+        assert index.search(test_db, "abrigo") == [5]
+        assert index.search(test_db, "chaqueta") == []
+
+    def test_refresh_during_build_survives_the_swap(self, test_db, monkeypatch):
+        """Test: A product renamed and refreshed while a rebuild reads stale data is re-indexed afterwards"""
+        add_product(test_db, 6, "REF-006", "Chaqueta")
+        test_db.commit()
+        index = ProductSearchIndex()
+        index.build(test_db)
+        load_documents = product_search_service._load_documents
+
+        def stale_full_load(db, product_ids=None):
+            documents = load_documents(db, product_ids)
+            if product_ids is None:
+                # Cambio confirmado (y recargado sobre el índice viejo) tras la lectura completa
+                test_db.get(ProductReference, 6).nombre_producto = "Abrigo"
+                test_db.commit()
+                index.mark_dirty([6])
+                assert index.search(test_db, "abrigo") == [6]
+            return documents
+
+        monkeypatch.setattr(product_search_service, "_load_documents", stale_full_load)
+        index.build(test_db)
+        monkeypatch.setattr(product_search_service, "_load_documents", load_documents)
+
+        assert index.search(test_db, "abrigo") == [6]
+        assert index.search(test_db, "chaqueta") == []
+
+
+class TestListProductsSearch:
+    """Test suite for GET /products with the search index"""
+
+    def test_status_filter_keeps_relevance_order_over_all_results(self, test_db, test_warehouse, monkeypatch):
+        """Test: Every ranked result is filtered (no top-N cut) and the page keeps the ranking"""
+        for product_id in range(1, 6):
+            add_product(test_db, product_id, f"REF-{product_id:03d}", f"Producto {product_id}")
+        test_db.add(ProductLocation(
+            product_id=2, almacen_id=test_warehouse.id, pasillo="A", lado="IZQUIERDA",
+            ubicacion="1", altura=1, stock_actual=10, stock_reservado=0,
+        ))
+        test_db.commit()
+        monkeypatch.setattr(product_router.product_search, "search", lambda db, term: [5, 2, 4, 1, 3])
+
+        response = list_products(
+            status=ProductStatusFilter.OUT, search="producto", almacen_id=None, page=1, per_page=2, db=test_db,
+        )
+        assert (response.total, [p.id for p in response.products]) == (4, [5, 4])
+
+        response = list_products(
+            status=ProductStatusFilter.OUT, search="producto", almacen_id=None, page=2, per_page=2, db=test_db,
+        )
+        assert [p.id for p in response.products] == [1, 3]
@@ -0,0 +1,276 @@
+"""
+Tests for the batched replenishment planner (ReplenishmentPlanner).
+
+Tests cover:
+- Free picking slots are claimed with a conditional UPDATE; slots taken by
+  another transaction are skipped
+- Reusable slots are only claimed while still empty, owned by the previous
+  product and without an active request
+- Without the slot lock no free slots are assigned
+- A batched load/plan/flush gives the same requests, upgrades, origin
+  reservations and slot assignments as one create_or_upgrade_replenishment
+  call per product
+- The cron aggregates the deficits of a product into one planner call
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from src.adapters.secondary.database.orm import (
+    Almacen,
+    Operator,
+    Order,
+    OrderLine,
+    OrderStatus,
+    ProductLocation,
+    ProductReference,
+    ReplenishmentRequest,
+)
+from src.services import replenishment_service, stock_reservation_cron_service
+from src.services.replenishment_service import ReplenishmentPlanner, create_or_upgrade_replenishment
+from src.services.stock_reservation_cron_service import StockReservationCronService
+
+PICKING_ID = 1
+REPO_ID = 2
+
+
+@pytest.fixture
+def warehouses(test_db, test_warehouse, monkeypatch):
+    """Almacén de test como picking y un segundo almacén como reposición"""
+    test_db.add(Almacen(id=REPO_ID, codigo="TEST-REPO", descripciones="Reposición de Prueba"))
+    test_db.add(Operator(id=1, codigo="SYSTEM", nombre="Sistema", activo=True))
+    test_db.add(ProductReference(
+        id=101, sku="REPL-SKU-101", referencia="REPL-101", nombre_producto="Otro",
+        color_id="C1", talla="M", activo=True,
+    ))
+    test_db.commit()
+    monkeypatch.setattr(replenishment_service, "ALMACEN_PICKING_ID", PICKING_ID)
+    monkeypatch.setattr(replenishment_service, "ALMACEN_REPOSICION_ID", REPO_ID)
+    monkeypatch.setattr(replenishment_service, "SLOTTING_PREFERRED_SLOTS", False)
+
+
+def _location(db, almacen_id, ubicacion, product_id=None, actual=0, reservado=0):
+    location = ProductLocation(
+        product_id=product_id, almacen_id=almacen_id, pasillo="A", lado="IZQUIERDA",
+        ubicacion=ubicacion, altura=1, stock_actual=actual, stock_minimo=0, stock_reservado=reservado,
+    )
+    db.add(location)
+    db.flush()
+    return location
+
+
+def _owner(db, location):
+    db.expire(location)
+    return location.product_id
+
+
+class TestSlotClaims:
+    """Test suite for the conditional claim of free and reusable picking slots"""
+
+    def test_slot_taken_by_another_transaction_is_skipped(self, test_db, warehouses, sample_product):
+        """Test: A free slot assigned behind the planner's back is not overwritten; the next one is used"""
+        _location(test_db, REPO_ID, "R1", product_id=100, actual=50)
+        first = _location(test_db, PICKING_ID, "1")
+        second = _location(test_db, PICKING_ID, "2")
+        test_db.commit()
+
+        planner = ReplenishmentPlanner(test_db)
+        load_pool = planner._take_pooled_free_locations
+
+        def rival_claims_first(count):
+            batch = load_pool(count)
+            test_db.execute(
+                update(ProductLocation).where(ProductLocation.id == first.id).values(product_id=101)
+                .execution_options(synchronize_session=False)
+            )
+            return batch
+
+        planner._take_pooled_free_locations = rival_claims_first
+        planner.load([100])
+        result = planner.plan(100, requester_id=1, cantidad_needed=5)
+        planner.flush()
+        test_db.commit()
+
+        assert [r.location_destino_id for r in result.created_requests] == [second.id]
+        assert (_owner(test_db, first), _owner(test_db, second)) == (101, 100)
+
+    def test_reusable_slot_claim_checks_owner_stock_and_requests(self, test_db, warehouses, sample_product):
+        """Test: A reusable slot that got stock, a request or a new owner is not claimed"""
+        origin = _location(test_db, REPO_ID, "R1", product_id=101, actual=50)
+        slot = _location(test_db, PICKING_ID, "1", product_id=101)
+        test_db.commit()
+        planner = ReplenishmentPlanner(test_db)
+
+        assert planner._claim_location(slot, 100, owner=100) is False
+
+        test_db.execute(update(ProductLocation).where(ProductLocation.id == slot.id).values(stock_actual=5))
+        assert planner._claim_location(slot, 100, owner=101) is False
+
+        test_db.execute(update(ProductLocation).where(ProductLocation.id == slot.id).values(stock_actual=0))
+        request = ReplenishmentRequest(
+            location_origen_id=origin.id, location_destino_id=slot.id, product_id=101,
+            requested_quantity=5, status="READY", priority="HIGH", requester_id=1,
+        )
+        test_db.add(request)
+        test_db.flush()
+        assert planner._claim_location(slot, 100, owner=101) is False
+
+        request.status = "COMPLETED"
+        test_db.flush()
+        assert planner._claim_location(slot, 100, owner=101) is True
+        assert _owner(test_db, slot) == 100
+
+    def test_busy_slot_lock_assigns_no_free_slots(self, test_db, warehouses, sample_product):
+        """Test: If the slot lock is not granted the product gets no new location and no request"""
+        _location(test_db, REPO_ID, "R1", product_id=100, actual=50)
+        free = _location(test_db, PICKING_ID, "1")
+        test_db.commit()
+        calls = []
+
+        planner = ReplenishmentPlanner(test_db, slot_lock=lambda: calls.append(1) or False)
+        planner.load([100])
+        result = planner.plan(100, requester_id=1, cantidad_needed=5)
+        planner.plan(100, requester_id=1, cantidad_needed=5)
+
+        assert result.status == "no_locations"
+        assert (planner.slot_lock_held, len(calls)) == (False, 1)
+        assert _owner(test_db, free) is None
+
+
+@pytest.fixture
+def planning_scenario(test_db, warehouses, sample_product):
+    """
+    Producto 100 sin ubicación de picking (necesita 2 libres) con tres orígenes:
+    3 uds, 30 uds y uno sin disponible. Producto 101 con ubicación de picking y
+    una solicitud READY de prioridad NORMAL.
+    """
+    loc = {
+        "o1": _location(test_db, REPO_ID, "R1", product_id=100, actual=5, reservado=2),
+        "o2": _location(test_db, REPO_ID, "R2", product_id=100, actual=30),
+        "o3": _location(test_db, REPO_ID, "R3", product_id=100, actual=4, reservado=4),
+        "o4": _location(test_db, REPO_ID, "R4", product_id=101, actual=10),
+        "p101": _location(test_db, PICKING_ID, "9", product_id=101, actual=5),
+        "f1": _location(test_db, PICKING_ID, "1"),
+        "f2": _location(test_db, PICKING_ID, "2"),
+        "f3": _location(test_db, PICKING_ID, "3"),
+    }
+    test_db.add(ReplenishmentRequest(
+        location_origen_id=loc["o4"].id, location_destino_id=loc["p101"].id, product_id=101,
+        requested_quantity=5, status="READY", priority="NORMAL", requester_id=1,
+    ))
+    test_db.commit()
+    return {name: location.id for name, location in loc.items()}
+
+
+def _state(db):
+    """Solicitudes, reservas en orígenes y dueños de ubicaciones (comparables entre ejecuciones)"""
+    db.flush()
+    db.expire_all()
+    requests = sorted(
+        (r.product_id, r.location_origen_id, r.location_destino_id, r.requested_quantity, r.priority, r.status)
+        for r in db.query(ReplenishmentRequest)
+    )
+    locations = {
+        loc.id: (loc.product_id, loc.stock_reservado, loc.stock_minimo) for loc in db.query(ProductLocation)
+    }
+    return requests, locations
+
+
+def _summary(result):
+    return (
+        result.status, len(result.created_requests), len(result.upgraded_requests),
+        result.total_needed, result.total_available_in_repo, result.origin_count, result.dest_count,
+        result.warnings,
+    )
+
+
+class TestPlannerMatchesSingleProduct:
+    """Test suite comparing ReplenishmentPlanner batches with create_or_upgrade_replenishment"""
+
+    DEMAND = [(100, 25), (101, 5)]
+
+    def test_batch_equals_one_call_per_product(self, test_db, planning_scenario):
+        """Test: Same requests, upgrades, origin reservations and slots as the per-product entry point"""
+        single = [
+            _summary(create_or_upgrade_replenishment(test_db, pid, requester_id=1, cantidad_needed=needed))
+            for pid, needed in self.DEMAND
+        ]
+        expected = _state(test_db)
+        test_db.rollback()
+        assert _state(test_db)[0] == sorted([(101, planning_scenario["o4"], planning_scenario["p101"], 5, "NORMAL", "READY")])
+
+        planner = ReplenishmentPlanner(test_db)
+        planner.load(pid for pid, _ in self.DEMAND)
+        batch = [_summary(planner.plan(pid, requester_id=1, cantidad_needed=needed)) for pid, needed in self.DEMAND]
+        planner.flush()
+
+        assert batch == single
+        assert _state(test_db) == expected
+
+    def test_origin_selection_and_upgrade(self, test_db, planning_scenario):
+        """Test: Origins are used by available stock desc and only while they have stock; open requests are upgraded"""
+        ids = planning_scenario
+        planner = ReplenishmentPlanner(test_db)
+        planner.load([100, 101])
+        created = planner.plan(100, requester_id=1, cantidad_needed=25)
+        upgraded = planner.plan(101, requester_id=1, cantidad_needed=5)
+        planner.flush()
+
+        requests, locations = _state(test_db)
+        assert requests == sorted([
+            (100, ids["o2"], ids["f1"], 20, "HIGH", "READY"),
+            (100, ids["o2"], ids["f2"], 10, "HIGH", "READY"),
+            (100, ids["o1"], ids["f2"], 3, "HIGH", "READY"),
+            (101, ids["o4"], ids["p101"], 5, "HIGH", "READY"),
+        ])
+        assert (created.status, created.origin_count, created.total_available_in_repo) == ("created", 2, 33)
+        assert len(created.warnings) == 1  # faltan 7 uds para la segunda ubicación
+        assert (locations[ids["o1"]][1], locations[ids["o2"]][1], locations[ids["o3"]][1]) == (5, 30, 4)
+        assert [locations[ids[name]][:1] for name in ("f1", "f2", "f3")] == [(100,), (100,), (None,)]
+        assert locations[ids["f1"]][2] == replenishment_service.DEFAULT_LOCATION_CAPACITY
+        assert (upgraded.status, len(upgraded.created_requests)) == ("upgraded", 0)
+
+
+class TestCronDeficitAggregation:
+    """Test suite for the per-cycle deficit aggregation of the reservation cron"""
+
+    def test_deficits_of_a_product_are_planned_once(self, test_db, order_statuses, warehouses, sample_product, monkeypatch):
+        """Test: Two orders short of the same product give one plan with the summed units and the oldest order"""
+        monkeypatch.setattr(stock_reservation_cron_service, "ALMACEN_PICKING_ID", PICKING_ID)
+        origin = _location(test_db, REPO_ID, "R1", product_id=100, actual=50)
+        for ubicacion in ("1", "2"):
+            _location(test_db, PICKING_ID, ubicacion)
+        pending = test_db.query(OrderStatus).filter_by(codigo="PENDING").one()
+        orders = []
+        for i, cantidad in enumerate((15, 10)):
+            order = Order(
+                numero_orden=f"TEST-REPL-{i}", type="B2B", cliente="TEST_CLIENT", nombre_cliente="Cliente",
+                status_id=pending.id, fecha_orden=date.today(), almacen_id=PICKING_ID, prioridad="NORMAL",
+                fecha_importacion=datetime(2026, 1, 1) + timedelta(hours=i),
+            )
+            test_db.add(order)
+            test_db.flush()
+            test_db.add(OrderLine(
+                order_id=order.id, ean=f"REPL-EAN-{i}", product_reference_id=100,
+                cantidad_solicitada=cantidad, cantidad_servida=0, estado="PENDING",
+            ))
+            orders.append(order)
+        test_db.commit()
+
+        calls = []
+        plan = ReplenishmentPlanner.plan
+
+        def recording_plan(planner, product_id, **kwargs):
+            calls.append((product_id, kwargs["cantidad_needed"], kwargs["order_id"]))
+            return plan(planner, product_id, **kwargs)
+
+        monkeypatch.setattr(ReplenishmentPlanner, "plan", recording_plan)
+        monkeypatch.setattr(stock_reservation_cron_service, "_acquire_slot_lock", lambda db: True)
+        stats = StockReservationCronService(db_session=test_db, incremental=False).run()
+
+        assert calls == [(100, 25, orders[0].id)]
+        assert stats["replenishment_created"] == 2
+        requests = test_db.query(ReplenishmentRequest).filter_by(product_id=100).all()
+        assert sorted(r.requested_quantity for r in requests) == [20, 20]  # cada ubicación se llena hasta su capacidad
+        assert {(r.location_origen_id, r.order_id) for r in requests} == {(origin.id, orders[0].id)}
@@ -0,0 +1,86 @@
+"""
+Tests for the pure reservation allocation engine.
+
+Tests cover:
+- Order priority and FIFO policies when stock is scarce
+- Fewest-locations policy vs largest-first
+- Shortages and lines without stock
+"""
+from src.services.reservation_allocation import (
+    AllocationSnapshot,
+    allocate,
+    priority_rank,
+)
+
+
+def make_snapshot(lines, locations):
+    snapshot = AllocationSnapshot()
+    for line in lines:
+        snapshot.add_line(*line)
+    for location in locations:
+        snapshot.add_location(*location)
+    return snapshot
+
+
+class TestReservationAllocation:
+    """Test suite for allocate()"""
+
+    def test_priority_policy_serves_urgent_orders_first(self):
+        """Test: With scarce stock the URGENT order gets it even if it is newer"""
+        snapshot = make_snapshot(
+            lines=[
+                (1, 10, 100, 5, priority_rank("NORMAL"), 0),
+                (2, 20, 100, 5, priority_rank("URGENT"), 1),
+            ],
+            locations=[(1000, 100, 5)],
+        )
+
+        plan = allocate(snapshot, order_policy="priority")
+
+        assert [(a.line_id, a.quantity) for a in plan.allocations] == [(2, 5)]
+        assert plan.shortages == {1: 5}
+        assert plan.no_stock_line_ids == [1]
+
+    def test_fifo_policy_serves_oldest_order_first(self):
+        """Test: FIFO ignores priority and serves by order age"""
+        snapshot = make_snapshot(
+            lines=[
+                (1, 10, 100, 5, priority_rank("NORMAL"), 0),
+                (2, 20, 100, 5, priority_rank("URGENT"), 1),
+            ],
+            locations=[(1000, 100, 5)],
+        )
+
+        plan = allocate(snapshot, order_policy="fifo")
+
+        assert [(a.line_id, a.quantity) for a in plan.allocations] == [(1, 5)]
+        assert plan.shortages == {2: 5}
+
+    def test_fewest_locations_picks_tightest_single_location(self):
+        """Test: A line that fits in one location uses the tightest one instead of splitting"""
+        locations = [(1000, 100, 10), (1001, 100, 4), (1002, 100, 3)]
+        lines = [(1, 10, 100, 3, 2, 0), (2, 20, 100, 12, 2, 1)]
+
+        largest = allocate(make_snapshot(lines, locations), location_policy="largest_first")
+        fewest = allocate(make_snapshot(lines, locations), location_policy="fewest_locations")
+
+        assert [(a.line_id, a.location_id) for a in largest.allocations] == [
+            (1, 1000), (2, 1000), (2, 1001), (2, 1002),
+        ]
+        assert [(a.line_id, a.location_id) for a in fewest.allocations] == [
+            (1, 1002), (2, 1000), (2, 1001),
+        ]
+        assert fewest.shortages == {}
+
+    def test_partial_allocation_reports_deficit(self):
+        """Test: Stock spread over several locations is used and the rest is a shortage"""
+        snapshot = make_snapshot(
+            lines=[(1, 10, 100, 10, 2, 0)],
+            locations=[(1000, 100, 3), (1001, 100, 4), (1002, 200, 50), (1003, 100, 0)],
+        )
+
+        plan = allocate(snapshot)
+
+        assert [(a.location_id, a.quantity) for a in plan.allocations] == [(1001, 4), (1000, 3)]
+        assert plan.shortages == {1: 3}
+        assert plan.no_stock_line_ids == []
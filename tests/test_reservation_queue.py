@@ -0,0 +1,86 @@
+"""
+Tests for the event-triggered reservation queue.
+
+Tests cover:
+- Debounce: events inside the window produce one targeted run
+- Requeue of the products whose partition lock is held by another worker
+- Disabled queue ignores events
+- Grouping of targeted reservations by product partition
+"""
+import threading
+import time
+
+from src.services import stock_reservation_cron_service
+from src.services.reservation_queue_service import ReservationQueue
+
+
+class RecordingRunner:
+    """Runner double that records the product batches it receives."""
+
+    def __init__(self, busy_times: int = 0, busy_products=()):
+        self.calls = []
+        self.busy_times = busy_times
+        self.busy_products = set(busy_products)
+        self.done = threading.Event()
+
+    def __call__(self, product_ids):
+        self.calls.append(list(product_ids))
+        if self.busy_times > 0:
+            self.busy_times -= 1
+            return [pid for pid in product_ids if pid in self.busy_products]
+        self.done.set()
+        return []
+
+
+class TestReservationQueue:
+    """Test suite for ReservationQueue"""
+
+    def test_events_are_debounced_into_one_run(self):
+        """Test: Several notifications inside the window reserve once for the union of products"""
+        runner = RecordingRunner()
+        queue = ReservationQueue(debounce_seconds=0.05, runner=runner)
+        queue.start()
+        queue.notify_products([3, 1])
+        queue.notify_products([1, None, 2])
+        assert runner.done.wait(timeout=2)
+        time.sleep(0.05)
+        queue.stop()
+        assert runner.calls == [[1, 2, 3]]
+
+    def test_requeue_when_lock_is_busy(self):
+        """Test: Only the products of a busy partition are retried after another window"""
+        runner = RecordingRunner(busy_times=1, busy_products=[7])
+        queue = ReservationQueue(debounce_seconds=0.02, runner=runner)
+        queue.start()
+        queue.notify_products([7, 8])
+        assert runner.done.wait(timeout=2)
+        queue.stop()
+        assert runner.calls == [[7, 8], [7]]
+        assert queue.stats["requeued"] == 1
+        assert queue.stats["products_processed"] == 2
+
+    def test_disabled_queue_ignores_events(self):
+        """Test: Before start() (scripts, tests) notifications are ignored"""
+        runner = RecordingRunner()
+        queue = ReservationQueue(debounce_seconds=0.01, runner=runner)
+        queue.notify_products([1])
+        time.sleep(0.05)
+        assert runner.calls == []
+
+
+class TestPartitionedReservation:
+    """Test suite for product-partitioned targeted reservation"""
+
+    def test_products_grouped_by_partition_and_busy_ones_returned(self, monkeypatch):
+        """Test: Each partition runs once with its products; busy partitions are returned for retry"""
+        calls = []
+
+        def fake_run_partition(index, partitions, product_ids=None):
+            calls.append((index, product_ids))
+            return None if index == 1 else {"lines_reserved": len(product_ids)}
+
+        monkeypatch.setattr(stock_reservation_cron_service, "_run_partition", fake_run_partition)
+        busy = stock_reservation_cron_service.reserve_stock_for_products([5, 2, 4, 1, 2], partitions=3)
+
+        assert sorted(calls) == [(1, [1, 4]), (2, [2, 5])]
+        assert busy == [1, 4]
@@ -0,0 +1,82 @@
+"""
+Tests for velocity-based slotting.
+
+Tests cover:
+- Fast movers in far slots are moved to near free slots or swapped with slow movers
+- Pick velocity from DEDUCT movements with recent windows weighted higher
+"""
+from datetime import datetime, timedelta
+
+from src.adapters.secondary.database.orm import ProductLocation, ProductReference, StockMovement
+from src.services.slotting_engine import (
+    SlotAssignment,
+    VelocityPercentiles,
+    preferred_index,
+    recommend_moves,
+)
+from src.services.slotting_service import product_velocities
+
+
+class TestSlottingEngine:
+    """Test suite for recommend_moves and the preferred-slot policy"""
+
+    def test_fast_mover_swaps_with_slow_mover_and_uses_free_slot(self):
+        """Test: The fastest product gets the nearest slot; the next one takes the free slot"""
+        slots = [
+            SlotAssignment(location_id=1, cost_seconds=20, product_id=10),   # lento en la mejor
+            SlotAssignment(location_id=2, cost_seconds=30, product_id=None),  # libre
+            SlotAssignment(location_id=3, cost_seconds=90, product_id=11),   # rápido lejos
+            SlotAssignment(location_id=4, cost_seconds=95, product_id=12),   # medio lejos
+        ]
+        velocities = {10: 0.1, 11: 5.0, 12: 2.0}
+
+        moves = recommend_moves(slots, velocities)
+
+        by_product = {m.product_id: m for m in moves}
+        assert (by_product[11].from_location_id, by_product[11].to_location_id, by_product[11].swap_product_id) == (3, 1, 10)
+        assert by_product[11].saving_seconds_per_day == round((5.0 - 0.1) * 70, 1)
+        assert (by_product[12].to_location_id, by_product[12].swap_product_id) == (2, None)
+        assert moves[0].product_id == 11
+
+    def test_preferred_slot_follows_velocity_percentile(self):
+        """Test: Fast movers take the most accessible free slot, slow ones the least"""
+        percentiles = VelocityPercentiles({1: 10.0, 2: 1.0, 3: 0.1})
+
+        assert preferred_index(percentiles.percentile(1), 9) == 0
+        assert preferred_index(percentiles.percentile(3), 9) > preferred_index(percentiles.percentile(2), 9)
+        assert preferred_index(percentiles.percentile(999), 9) == 4  # sin historial: en medio
+
+
+class TestProductVelocities:
+    """Test suite for product_velocities"""
+
+    def test_counts_only_deducts_in_the_almacen_weighting_recent_picks(self, test_db, test_warehouse):
+        """Test: Recent DEDUCT picks weigh more than old ones; other types and almacenes are ignored"""
+        now = datetime(2026, 6, 1)
+        for product_id in (1, 2, 3):
+            test_db.add(ProductReference(
+                id=product_id, sku=f"SLOT-SKU-{product_id}", referencia=f"SLOT-{product_id}",
+                nombre_producto=f"Producto {product_id}", color_id="C1", talla="M", activo=True,
+            ))
+        location = ProductLocation(almacen_id=test_warehouse.id, product_id=1, pasillo="1", ubicacion="01", altura=1, activa=True)
+        test_db.add(location)
+        test_db.flush()
+
+        def movement(product_id, tipo, days_ago):
+            test_db.add(StockMovement(
+                product_location_id=location.id, product_id=product_id, tipo=tipo, cantidad=-1,
+                stock_antes=10, stock_despues=9, created_at=now - timedelta(days=days_ago),
+            ))
+
+        for _ in range(3):
+            movement(1, "DEDUCT", 2)      # recientes
+            movement(2, "DEDUCT", 200)    # antiguas
+        movement(1, "RESERVE", 1)
+        movement(3, "DEDUCT", 400)        # fuera del año
+        test_db.flush()
+
+        velocities = product_velocities(test_db, test_warehouse.id, now=now)
+
+        assert set(velocities) == {1, 2}
+        assert velocities[1] > velocities[2] > 0
+        assert product_velocities(test_db, test_warehouse.id + 1, now=now) == {}
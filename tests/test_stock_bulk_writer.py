@@ -0,0 +1,90 @@
+"""
+Tests for the set-based stock write path (StockWriteBatch).
+
+Tests cover:
+- flush inserts the accumulated assignments and movements in one go
+- Stock deltas are clamped per adjustment, so memory and DB agree after a sign change
+- Locations whose clamped deltas cancel out are not updated
+"""
+from src.adapters.secondary.database.orm import (
+    OrderLineStockAssignment,
+    ProductLocation,
+    StockMovement,
+)
+from src.services.stock_bulk_writer import StockWriteBatch
+
+
+def _location(db, ubicacion, actual, reservado=0):
+    location = ProductLocation(
+        product_id=100, almacen_id=1, pasillo="A", lado="IZQUIERDA",
+        ubicacion=ubicacion, altura=1, stock_actual=actual, stock_minimo=0, stock_reservado=reservado,
+    )
+    db.add(location)
+    db.flush()
+    return location
+
+
+def _stored(db, location):
+    db.expire(location)
+    return location.stock_actual, location.stock_reservado
+
+
+class TestStockWriteBatch:
+    """Test suite for StockWriteBatch.flush"""
+
+    def test_flush_writes_rows_and_location_deltas(self, test_db, test_warehouse, sample_product, pending_order):
+        """Test: Assignments, movements and reservado deltas of several locations are written together"""
+        a = _location(test_db, "1", 10)
+        b = _location(test_db, "2", 10, reservado=2)
+        test_db.commit()
+        line = pending_order.order_lines[0]
+
+        batch = StockWriteBatch()
+        for location, take in ((a, 4), (b, 3)):
+            batch.adjust_location(location, reservado=take)
+            batch.add_assignment(
+                order_line_id=line.id, product_location_id=location.id,
+                cantidad_reservada=take, cantidad_servida=0,
+            )
+            batch.add_movement(
+                product_location_id=location.id, product_id=100, order_id=pending_order.id,
+                order_line_id=line.id, tipo="RESERVE", cantidad=take, stock_antes=10, stock_despues=10,
+            )
+        assert len(batch) == 6
+
+        written = batch.flush(test_db)
+        test_db.commit()
+
+        assert written == {"assignments": 2, "movements": 2, "locations": 2}
+        assert len(batch) == 0
+        assert (_stored(test_db, a), _stored(test_db, b)) == ((10, 4), (10, 5))
+        assert test_db.query(OrderLineStockAssignment).filter_by(order_line_id=line.id).count() == 2
+        assert test_db.query(StockMovement).filter_by(order_line_id=line.id, tipo="RESERVE").count() == 2
+
+    def test_clamped_deltas_keep_memory_and_db_in_step(self, test_db, test_warehouse, sample_product):
+        """Test: 3 units, -5 then +5 end at 5 both in memory and in the database"""
+        location = _location(test_db, "1", 3, reservado=1)
+        test_db.commit()
+
+        batch = StockWriteBatch()
+        batch.adjust_location(location, actual=-5, reservado=-4)
+        batch.adjust_location(location, actual=5, reservado=2)
+        in_memory = (location.stock_actual, location.stock_reservado)
+
+        batch.flush(test_db)
+        test_db.commit()
+
+        assert in_memory == (5, 2)
+        assert _stored(test_db, location) == (5, 2)
+
+    def test_cancelled_deltas_skip_the_update(self, test_db, test_warehouse, sample_product):
+        """Test: A location whose adjustments cancel out is not written"""
+        location = _location(test_db, "1", 8)
+        test_db.commit()
+
+        batch = StockWriteBatch()
+        batch.adjust_location(location, actual=-3)
+        batch.adjust_location(location, actual=3)
+
+        assert batch.flush(test_db)["locations"] == 0
+        assert _stored(test_db, location) == (8, 0)
@@ -0,0 +1,199 @@
+"""
+Tests for the incremental mode of the stock reservation cron (cron_watermarks).
+
+Tests cover:
+- _changed_orders_filter selects orders imported/modified, with modified lines or
+  with picking stock changes after the watermark, and skips the rest
+- _load_watermark chooses full/incremental mode and applies the overlap
+- _save_watermark does not advance after errors
+- A failed or uncommitted partition keeps its watermark; other partitions advance
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from src.adapters.secondary.database.orm import (
+    CronWatermark,
+    Order,
+    OrderLine,
+    OrderStatus,
+    ProductLocation,
+)
+from src.services import stock_reservation_cron_service
+from src.services.stock_reservation_cron_service import (
+    WATERMARK_JOB_NAME,
+    StockReservationCronService,
+)
+from src.adapters.secondary.database.config import (
+    STOCK_CRON_FULL_INTERVAL_MINUTES,
+    STOCK_CRON_WATERMARK_OVERLAP_SECONDS,
+)
+
+SINCE = datetime(2026, 1, 1, 12, 0, 0)
+BEFORE = SINCE - timedelta(hours=1)
+AFTER = SINCE + timedelta(minutes=1)
+
+
+@pytest.fixture
+def picking_warehouse(test_warehouse, monkeypatch):
+    """El almacén de test hace de almacén de picking del cron"""
+    monkeypatch.setattr(stock_reservation_cron_service, "ALMACEN_PICKING_ID", test_warehouse.id)
+    return test_warehouse
+
+
+def _order(db, numero, imported, updated=None, line_updated=None, product_id=None):
+    pending = db.query(OrderStatus).filter_by(codigo="PENDING").one()
+    order = Order(
+        numero_orden=numero, type="B2B", cliente="TEST_CLIENT", nombre_cliente="Cliente",
+        status_id=pending.id, fecha_orden=date.today(), fecha_importacion=imported,
+        updated_at=updated or imported, almacen_id=1, prioridad="NORMAL",
+    )
+    db.add(order)
+    db.flush()
+    db.add(OrderLine(
+        order_id=order.id, ean=f"{numero}-EAN", product_reference_id=product_id,
+        cantidad_solicitada=1, cantidad_servida=0, estado="PENDING",
+        updated_at=line_updated or imported,
+    ))
+    db.flush()
+    return order
+
+
+def _selected(db, service):
+    return {
+        numero for (numero,) in db.query(Order.numero_orden).filter(service._changed_orders_filter())
+    }
+
+
+def _watermark(db, job_name, watermark=SINCE, last_full_run=None):
+    row = CronWatermark(
+        job_name=job_name, watermark=watermark,
+        last_full_run=last_full_run or datetime.utcnow() - timedelta(minutes=1),
+    )
+    db.add(row)
+    db.commit()
+    return row
+
+
+class TestChangedOrdersFilter:
+    """Test suite for StockReservationCronService._changed_orders_filter"""
+
+    def test_only_orders_changed_after_since_are_selected(
+        self, test_db, order_statuses, picking_warehouse, sample_product
+    ):
+        """Test: New imports, modified orders/lines and picking stock changes enter; the rest does not"""
+        _order(test_db, "OLD", BEFORE)
+        _order(test_db, "IMPORTED", AFTER)
+        _order(test_db, "ORDER-UPDATED", BEFORE, updated=AFTER)
+        _order(test_db, "LINE-UPDATED", BEFORE, line_updated=AFTER)
+        _order(test_db, "STOCK-CHANGED", BEFORE, product_id=sample_product.id)
+        test_db.add(ProductLocation(
+            product_id=sample_product.id, almacen_id=picking_warehouse.id, pasillo="A", lado="IZQUIERDA",
+            ubicacion="1", altura=1, stock_actual=5, stock_reservado=0, updated_at=AFTER,
+        ))
+        test_db.commit()
+
+        service = StockReservationCronService(db_session=test_db)
+        service.since = SINCE
+
+        assert _selected(test_db, service) == {"IMPORTED", "ORDER-UPDATED", "LINE-UPDATED", "STOCK-CHANGED"}
+
+        # La misma ubicación sin cambios recientes ya no arrastra la orden
+        test_db.query(ProductLocation).update({"updated_at": BEFORE}, synchronize_session=False)
+        assert "STOCK-CHANGED" not in _selected(test_db, service)
+
+    def test_full_pass_has_no_filter(self, test_db):
+        """Test: Without a watermark (since=None) every order is reviewed"""
+        service = StockReservationCronService(db_session=test_db)
+        assert service._changed_orders_filter() is None
+
+
+class TestWatermark:
+    """Test suite for _load_watermark / _save_watermark"""
+
+    def _service(self, db, **kwargs):
+        service = StockReservationCronService(db_session=db, incremental=True, **kwargs)
+        service.db = db
+        service.stats["start_time"] = datetime.utcnow()
+        return service
+
+    def test_load_chooses_mode_and_applies_overlap(self, test_db):
+        """Test: No row or a stale full run → full pass; otherwise since = watermark - overlap"""
+        service = self._service(test_db)
+        assert service._load_watermark() is None
+        assert (service.stats["mode"], service.since) == ("full", None)
+
+        row = _watermark(test_db, WATERMARK_JOB_NAME)
+        service._load_watermark()
+        assert service.stats["mode"] == "incremental"
+        assert service.since == SINCE - timedelta(seconds=STOCK_CRON_WATERMARK_OVERLAP_SECONDS)
+
+        row.last_full_run = service.stats["start_time"] - timedelta(minutes=STOCK_CRON_FULL_INTERVAL_MINUTES)
+        test_db.commit()
+        service._load_watermark()
+        assert (service.stats["mode"], service.since) == ("full", None)
+
+    def test_save_advances_only_without_errors(self, test_db):
+        """Test: The watermark moves to the run start; a run with errors leaves it where it was"""
+        row = _watermark(test_db, WATERMARK_JOB_NAME)
+        service = self._service(test_db)
+        service._load_watermark()
+
+        service.stats["errors"] = 1
+        service._save_watermark(row)
+        assert row.watermark == SINCE
+
+        service.stats["errors"] = 0
+        full_run = row.last_full_run
+        service._save_watermark(row)
+        assert row.watermark == service.stats["start_time"]
+        assert row.last_full_run == full_run  # pasada incremental: no cuenta como completa
+
+    def test_new_row_is_created_on_first_full_pass(self, test_db):
+        """Test: The first successful full pass stores both the watermark and the full-run time"""
+        service = self._service(test_db)
+        service._save_watermark(service._load_watermark())
+        test_db.commit()
+
+        row = test_db.get(CronWatermark, WATERMARK_JOB_NAME)
+        assert row.watermark == row.last_full_run == service.stats["start_time"]
+
+
+class TestPartitionWatermarks:
+    """Test suite for per-partition watermarks in run()"""
+
+    def test_failed_partition_keeps_its_watermark(self, test_db, order_statuses, picking_warehouse, monkeypatch):
+        """Test: A partition that raises is rolled back with its watermark; the other one advances"""
+        _watermark(test_db, f"{WATERMARK_JOB_NAME}:0/2")
+        _watermark(test_db, f"{WATERMARK_JOB_NAME}:1/2")
+
+        ok = StockReservationCronService(db_session=test_db, incremental=True, partition=(0, 2))
+        ok.run()
+
+        failing = StockReservationCronService(db_session=test_db, incremental=True, partition=(1, 2))
+
+        def boom():
+            raise RuntimeError("fallo de BD")
+
+        monkeypatch.setattr(failing, "_reserve_stock_for_orders", boom)
+        stats = failing.run()
+
+        test_db.expire_all()
+        assert stats["errors"] == 1
+        assert test_db.get(CronWatermark, f"{WATERMARK_JOB_NAME}:0/2").watermark == ok.stats["start_time"]
+        assert test_db.get(CronWatermark, f"{WATERMARK_JOB_NAME}:1/2").watermark == SINCE
+
+    def test_uncommitted_partition_does_not_advance(self, test_db, order_statuses, picking_warehouse, monkeypatch):
+        """Test: The watermark is written in the reservation transaction, so a failed commit discards it"""
+        _watermark(test_db, f"{WATERMARK_JOB_NAME}:1/2")
+        service = StockReservationCronService(db_session=test_db, incremental=True, partition=(1, 2))
+
+        def failing_commit():
+            raise RuntimeError("commit fallido")
+
+        monkeypatch.setattr(test_db, "commit", failing_commit)
+        stats = service.run()
+
+        test_db.expire_all()
+        assert stats["errors"] == 1
+        assert test_db.get(CronWatermark, f"{WATERMARK_JOB_NAME}:1/2").watermark == SINCE
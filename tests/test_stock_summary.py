@@ -0,0 +1,138 @@
+"""
+Tests for the materialized stock totals (product_stock_summary).
+
+Tests cover:
+- ORM stock changes keep the summary in step with product_locations
+- Set-based writes from StockWriteBatch update the summary
+- Reconciliation fixes drifted and orphaned rows
+- A row created concurrently does not leave the remaining recompute keys stale
+"""
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from src.adapters.secondary.database.orm import Almacen, ProductLocation, ProductReference, ProductStockSummary
+from src.services import stock_summary_service
+from src.services.stock_bulk_writer import StockWriteBatch
+from src.services.stock_summary_service import (
+    apply_summary_deltas,
+    find_drifted_summaries,
+    reconcile_stock_summary,
+)
+
+
+def _summary(db):
+    return {
+        (row.product_id, row.almacen_id): (row.stock_actual, row.stock_reservado, row.num_ubicaciones)
+        for row in db.query(ProductStockSummary).filter(ProductStockSummary.num_ubicaciones > 0)
+    }
+
+
+def _source(db):
+    return {
+        (row.product_id, row.almacen_id): (int(row.actual), int(row.reservado), row.n)
+        for row in db.query(
+            ProductLocation.product_id,
+            ProductLocation.almacen_id,
+            func.sum(ProductLocation.stock_actual).label("actual"),
+            func.sum(ProductLocation.stock_reservado).label("reservado"),
+            func.count(ProductLocation.id).label("n"),
+        ).filter(ProductLocation.activa == True).group_by(ProductLocation.product_id, ProductLocation.almacen_id)
+    }
+
+
+def _location(db, product_id, almacen_id, ubicacion, stock):
+    location = ProductLocation(
+        product_id=product_id, almacen_id=almacen_id, pasillo="A", lado="IZQUIERDA",
+        ubicacion=ubicacion, altura=1, stock_actual=stock, stock_minimo=0, stock_reservado=0,
+    )
+    db.add(location)
+    db.flush()
+    return location
+
+
+class TestStockSummary:
+    """Test suite for stock_summary_service"""
+
+    def test_orm_and_bulk_writes_keep_summary_in_step(self, test_db, test_warehouse, sample_product):
+        """Test: Creating, moving, deactivating and bulk-deducting stock updates the summary rows"""
+        other = ProductReference(
+            id=101, sku="SUM-SKU-101", referencia="SUM-101", nombre_producto="Otro",
+            color_id="C1", talla="M", activo=True,
+        )
+        test_db.add(other)
+        a = _location(test_db, 100, test_warehouse.id, "1", 30)
+        b = _location(test_db, 100, test_warehouse.id, "2", 20)
+        test_db.commit()
+        assert _summary(test_db) == {(100, test_warehouse.id): (50, 0, 2)}
+
+        # Mover stock entre ubicaciones y pasar una al otro producto
+        a.stock_actual -= 10
+        b.stock_actual += 10
+        b.product_id = 101
+        test_db.commit()
+        assert _summary(test_db) == {(100, test_warehouse.id): (20, 0, 1), (101, test_warehouse.id): (30, 0, 1)}
+
+        # Reserva y descuento set-based (cron / completar picking), recortado a 0
+        batch = StockWriteBatch()
+        batch.adjust_location(a, reservado=5)
+        batch.adjust_location(b, actual=-50)
+        batch.flush(test_db)
+        test_db.commit()
+        assert _summary(test_db) == {(100, test_warehouse.id): (20, 5, 1), (101, test_warehouse.id): (0, 0, 1)}
+
+        a.activa = False
+        test_db.commit()
+        assert _summary(test_db) == _source(test_db) == {(101, test_warehouse.id): (0, 0, 1)}
+
+    def test_reconcile_fixes_drifted_and_orphaned_rows(self, test_db, test_warehouse, sample_product):
+        """Test: Rows changed or removed behind the ORM's back are recomputed from product_locations"""
+        test_db.add(ProductReference(
+            id=101, sku="SUM-SKU-101", referencia="SUM-101", nombre_producto="Sin ubicaciones",
+            color_id="C1", talla="M", activo=True,
+        ))
+        _location(test_db, 100, test_warehouse.id, "1", 30)
+        test_db.commit()
+        test_db.query(ProductStockSummary).update({"stock_actual": 999}, synchronize_session=False)
+        test_db.add(ProductStockSummary(product_id=101, almacen_id=test_warehouse.id, stock_actual=5, num_ubicaciones=1))
+        test_db.commit()
+
+        assert len(find_drifted_summaries(test_db)) == 2
+        assert reconcile_stock_summary(test_db) == 2
+        assert _summary(test_db) == {(100, test_warehouse.id): (30, 0, 1)}
+        assert find_drifted_summaries(test_db) == []
+
+    def test_conflicting_key_does_not_skip_the_rest(self, test_db, test_warehouse, sample_product, monkeypatch):
+        """Test: If one key hits a concurrently created row, it and every other key are still recomputed"""
+        test_db.add(Almacen(id=2, codigo="TEST-WH2", descripciones="Segundo almacén"))
+        test_db.add(ProductReference(
+            id=101, sku="SUM-SKU-101", referencia="SUM-101", nombre_producto="Otro",
+            color_id="C1", talla="M", activo=True,
+        ))
+        _location(test_db, 100, test_warehouse.id, "1", 30)
+        _location(test_db, 101, test_warehouse.id, "2", 20)
+        _location(test_db, 100, 2, "3", 10)
+        test_db.commit()
+        test_db.query(ProductStockSummary).update({"stock_actual": 999}, synchronize_session=False)
+        keys = {(100, test_warehouse.id), (101, test_warehouse.id), (100, 2)}
+        conflicting = (101, test_warehouse.id)
+
+        recompute = stock_summary_service._recompute
+        conflicts = []
+
+        def recompute_with_conflict(connection, chunk_keys):
+            chunk_keys = set(chunk_keys)
+            if conflicting in chunk_keys and len(conflicts) < 2:
+                # Las demás claves se escriben antes de chocar con la fila de la otra transacción
+                conflicts.append(sorted(chunk_keys))
+                recompute(connection, chunk_keys - {conflicting})
+                raise IntegrityError("INSERT INTO product_stock_summary", {}, Exception("PK duplicada"))
+            recompute(connection, chunk_keys)
+
+        monkeypatch.setattr(stock_summary_service, "_recompute", recompute_with_conflict)
+        apply_summary_deltas(test_db, {}, recompute=keys)
+        test_db.commit()
+
+        assert conflicts == [sorted(keys), [conflicting]]
+        assert _summary(test_db) == _source(test_db) == {
+            (100, test_warehouse.id): (30, 0, 1), (101, test_warehouse.id): (20, 0, 1), (100, 2): (10, 0, 1),
+        }
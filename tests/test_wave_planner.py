@@ -0,0 +1,51 @@
+"""
+Tests for the wave (batch picking) planner.
+
+Tests cover:
+- Orders sharing locations are grouped; other almacenes and big orders are not
+- Cart capacity (orders and units) is respected
+"""
+from src.services.wave_planner import WaveCandidate, plan_waves
+
+
+def candidate(order_id, locations, units=5, almacen_id=1, priority=2):
+    return WaveCandidate(
+        order_id=order_id,
+        almacen_id=almacen_id,
+        location_ids=frozenset(locations),
+        aisles=frozenset(str(loc // 100) for loc in locations),
+        units=units,
+        priority=priority,
+        seq=order_id,
+    )
+
+
+class TestWavePlanner:
+    """Test suite for plan_waves"""
+
+    def test_groups_overlapping_orders_of_same_almacen(self):
+        """Test: Orders with common locations share a wave; other almacén and oversized orders stay alone"""
+        candidates = [
+            candidate(1, [101, 102]),
+            candidate(2, [102, 103]),
+            candidate(3, [901], almacen_id=2),
+            candidate(4, [101], units=500),
+            candidate(5, [101, 103]),
+        ]
+
+        waves = plan_waves(candidates, max_orders=8, max_units=120, max_order_units=30, min_affinity=0.1)
+
+        assert len(waves) == 1
+        assert waves[0].almacen_id == 1
+        assert sorted(waves[0].order_ids) == [1, 2, 5]
+        assert waves[0].order_ids[0] == 1  # semilla = cubeta 1
+
+    def test_respects_cart_capacity(self):
+        """Test: No wave exceeds the number of totes or the unit limit"""
+        candidates = [candidate(i, [101, 102], units=10) for i in range(1, 11)]
+
+        waves = plan_waves(candidates, max_orders=3, max_units=25, max_order_units=30, min_affinity=0.0)
+
+        assert waves
+        assert all(len(w.order_ids) <= 3 and w.units <= 25 for w in waves)
+        assert sum(len(w.order_ids) for w in waves) == 10
@@ -0,0 +1,203 @@
+"""
+Tests for the operator WebSocket ConnectionManager and its message bus.
+
+Tests cover:
+- Local send and broadcast
+- Cross-node delivery through a shared in-memory bus (simulated workers)
+- Presence across nodes
+- Incomplete bus implementations are rejected at construction
+- Per-connection outbound queues (overflow policies, slow consumers)
+"""
+import asyncio
+import json
+
+import pytest
+
+from src.adapters.primary.websocket.bus import InMemoryBus, InMemoryHub, MessageBus
+from src.adapters.primary.websocket.manager import ConnectionManager
+
+
+class FakeWebSocket:
+    """Minimal WebSocket double that records sent JSON messages."""
+
+    def __init__(self, fail: bool = False, block: asyncio.Event = None):
+        self.sent = []
+        self.accepted = False
+        self.closed_code = None
+        self.fail = fail
+        self.block = block
+
+    async def accept(self):
+        self.accepted = True
+
+    async def send_text(self, text):
+        if self.block is not None:
+            await self.block.wait()
+        if self.fail:
+            raise RuntimeError("socket closed")
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=None):
+        self.closed_code = code
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def make_nodes(count: int = 2):
+    hub = InMemoryHub()
+    return [ConnectionManager(bus=InMemoryBus(hub)) for _ in range(count)]
+
+
+class TestConnectionManagerBus:
+    """Test suite for cross-worker fan-out and presence"""
+
+    def test_send_message_local(self):
+        """Test: Message to an operator connected on the same node"""
+        async def scenario():
+            node = ConnectionManager(bus=InMemoryBus())
+            await node.start()
+            ws = FakeWebSocket()
+            await node.connect(ws, "OP001")
+            await node.send_message("OP001", {"action": "ping"})
+            await node.drain()
+            return ws
+
+        ws = run(scenario())
+        assert ws.accepted
+        assert ws.sent == [{"action": "ping"}]
+
+    def test_send_message_reaches_other_node(self):
+        """Test: Message to an operator connected on another node goes through the bus"""
+        async def scenario():
+            node_a, node_b = make_nodes()
+            await node_a.start()
+            await node_b.start()
+            ws = FakeWebSocket()
+            await node_b.connect(ws, "OP002")
+            await node_a.send_message("OP002", {"action": "hello"})
+            await node_b.drain()
+            return ws
+
+        ws = run(scenario())
+        assert ws.sent == [{"action": "hello"}]
+
+    def test_broadcast_reaches_all_nodes_once(self):
+        """Test: Broadcast is delivered once per operator on every node, honoring exclude"""
+        async def scenario():
+            node_a, node_b = make_nodes()
+            await node_a.start()
+            await node_b.start()
+            ws_a1, ws_a2, ws_b1 = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+            await node_a.connect(ws_a1, "OP1")
+            await node_a.connect(ws_a2, "OP2")
+            await node_b.connect(ws_b1, "OP3")
+            await node_a.broadcast({"action": "alert"}, exclude="OP1")
+            await node_a.drain()
+            await node_b.drain()
+            return ws_a1, ws_a2, ws_b1
+
+        ws_a1, ws_a2, ws_b1 = run(scenario())
+        assert ws_a1.sent == []
+        assert ws_a2.sent == [{"action": "alert"}]
+        assert ws_b1.sent == [{"action": "alert"}]
+
+    def test_presence_across_nodes(self):
+        """Test: An operator connected on one node is online for every node"""
+        async def scenario():
+            node_a, node_b = make_nodes()
+            await node_a.start()
+            await node_b.start()
+            await node_b.connect(FakeWebSocket(), "OP009")
+            online_before = await node_a.is_online("OP009")
+            node_b.disconnect("OP009")
+            await asyncio.sleep(0)  # dejar correr la limpieza de presencia
+            online_after = await node_a.is_online("OP009")
+            return online_before, online_after
+
+        online_before, online_after = run(scenario())
+        assert online_before is True
+        assert online_after is False
+
+    def test_failed_socket_is_disconnected(self):
+        """Test: A socket that fails on send is removed from the node"""
+        async def scenario():
+            node = ConnectionManager(bus=InMemoryBus())
+            await node.start()
+            await node.connect(FakeWebSocket(fail=True), "OP010")
+            await node.broadcast({"action": "alert"})
+            for _ in range(3):
+                await asyncio.sleep(0)
+            return node
+
+        node = run(scenario())
+        assert not node.is_connected("OP010")
+
+    def test_partial_bus_fails_at_construction(self):
+        """Test: A bus that does not implement the whole interface cannot be instantiated"""
+        class PublishOnlyBus(MessageBus):
+            async def publish(self, envelope: dict) -> None:
+                pass
+
+        with pytest.raises(TypeError):
+            PublishOnlyBus()
+
+
+class TestOutboundQueues:
+    """Test suite for per-connection bounded outbound queues"""
+
+    def test_slow_consumer_does_not_delay_others(self):
+        """Test: A stalled socket does not block broadcast delivery to the rest"""
+        async def scenario():
+            node = ConnectionManager(bus=InMemoryBus())
+            await node.start()
+            stalled = FakeWebSocket(block=asyncio.Event())
+            healthy = FakeWebSocket()
+            await node.connect(stalled, "SLOW")
+            await node.connect(healthy, "FAST")
+            await asyncio.wait_for(node.broadcast({"action": "alert"}), timeout=1)
+            await asyncio.wait_for(node.drain("FAST"), timeout=1)
+            return stalled, healthy
+
+        stalled, healthy = run(scenario())
+        assert healthy.sent == [{"action": "alert"}]
+        assert stalled.sent == []
+
+    def test_drop_oldest_policy(self):
+        """Test: drop_oldest keeps the most recent messages when the queue is full"""
+        async def scenario():
+            node = ConnectionManager(bus=InMemoryBus(), max_queue=2, overflow_policy="drop_oldest")
+            await node.start()
+            gate = asyncio.Event()
+            ws = FakeWebSocket(block=gate)
+            await node.connect(ws, "OP1")
+            await node.send_message("OP1", {"n": 0})
+            await asyncio.sleep(0)  # el escritor queda bloqueado enviando n=0
+            for i in range(1, 5):
+                await node.send_message("OP1", {"n": i})
+            gate.set()
+            await node.drain("OP1")
+            return ws, node
+
+        ws, node = run(scenario())
+        # n=0 ya estaba en vuelo; de 1..4 solo caben los 2 más recientes
+        assert ws.sent == [{"n": 0}, {"n": 3}, {"n": 4}]
+        assert node.is_connected("OP1")
+
+    def test_disconnect_policy(self):
+        """Test: disconnect policy closes the slow consumer when its queue overflows"""
+        async def scenario():
+            node = ConnectionManager(bus=InMemoryBus(), max_queue=1, overflow_policy="disconnect")
+            await node.start()
+            ws = FakeWebSocket(block=asyncio.Event())
+            await node.connect(ws, "OP1")
+            await asyncio.sleep(0)
+            for i in range(3):
+                await node.send_message("OP1", {"n": i})
+            await asyncio.sleep(0)
+            return ws, node
+
+        ws, node = run(scenario())
+        assert not node.is_connected("OP1")
+        assert ws.closed_code == 1013